@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 24/7 Automated Email Response System
-Monitors Gmail every 5 seconds
+Monitors Gmail every 5 seconds, or on Gmail push notifications when
+GMAIL_PUSH_TOPIC / GMAIL_PUSH_TOKEN are set (see scripts/services/inbox_push.py)
 Auto-replies to interested customers
 Sends appropriate attachments based on pipeline stage
 """
@@ -19,7 +20,6 @@ sys.path.append('scripts')
 from dotenv import load_dotenv
 load_dotenv('config/.env')
 
-from anthropic import Anthropic
 import gspread
 from google.oauth2.service_account import Credentials
 from google.auth.transport.requests import Request
@@ -31,12 +31,20 @@ from email.mime.base import MIMEBase
 from email import encoders
 import base64
 
+from services.inbox_sync import InboxSync
+from services.inbox_push import (push_notifications, watch_mailbox, PUSH_TOPIC, PUSH_TOKEN,
+                                 FALLBACK_POLL_SECONDS, WATCH_RENEW_SECONDS)
+from services.gmail_fetch import sender_address
+from services.rate_limit import RateLimitedHTTPClient
+from services.retry import anthropic_client, authorized_http, execute
+from services.reply_rules import SPAM_DOMAINS
+
 # Configuration
 ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
 SPREADSHEET_ID = os.getenv('GOOGLE_SHEETS_ID')
 SENDER_EMAIL = os.getenv('SENDER_EMAIL')
 SENDER_NAME = os.getenv('SENDER_NAME')
-CHECK_INTERVAL = 5  # Check every 5 seconds
+CHECK_INTERVAL = 5  # Check every 5 seconds (without push notifications)
 
 # Pipeline stages with attachments
 PIPELINE_STAGES = {
@@ -97,11 +105,16 @@ class AutoReplyDaemon:
 
     def __init__(self):
         self.gmail_service = None
+        self.inbox = None
         self.anthropic_client = None
         self.sheets_client = None
         self.workbook = None
-        self.processed_emails = set()  # Track processed email IDs
+        self.processed_emails = set()  # Emails handled this run (InboxSync dedupes across restarts)
         self.last_check_time = None
+        self.limit_key = f"gmail:{SENDER_EMAIL or 'me'}"
+        self.mailbox = (SENDER_EMAIL or '').lower()
+        self.push_active = False
+        self.watch_renewed = 0
 
     def authenticate_gmail(self):
         """Authenticate with Gmail API"""
@@ -121,7 +134,9 @@ class AutoReplyDaemon:
                 print("❌ Gmail not authenticated. Run: python3 authenticate_gmail.py")
                 return False
 
-        self.gmail_service = build('gmail', 'v1', credentials=creds)
+        self.gmail_service = build('gmail', 'v1', http=authorized_http(creds))
+        self.inbox = InboxSync(self.gmail_service, f"auto_reply_daemon:{SENDER_EMAIL or 'me'}",
+                               resync_query='is:unread in:inbox', limit_key=self.limit_key)
         print("✅ Gmail authenticated")
         return True
 
@@ -133,71 +148,105 @@ class AutoReplyDaemon:
             'https://www.googleapis.com/auth/drive'
         ]
         creds = Credentials.from_service_account_file('service_account.json', scopes=scope)
-        self.sheets_client = gspread.authorize(creds)
+        self.sheets_client = gspread.authorize(creds, http_client=RateLimitedHTTPClient)
         self.workbook = self.sheets_client.open_by_key(SPREADSHEET_ID)
         print("✅ Google Sheets authenticated")
 
     def initialize_anthropic(self):
         """Initialize Anthropic client"""
         print("🤖 Initializing AI...")
-        self.anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY)
+        self.anthropic_client = anthropic_client(ANTHROPIC_API_KEY)
         print("✅ AI initialized")
 
-    def get_unread_emails(self) -> List[Dict]:
-        """Fetch unread emails from inbox"""
+    def check_inbox(self) -> int:
+        """Process emails added to the inbox since the last check. Returns how many were new."""
         try:
-            # Get unread messages
-            results = self.gmail_service.users().messages().list(
-                userId='me',
-                q='is:unread in:inbox',
-                maxResults=10
-            ).execute()
-
-            messages = results.get('messages', [])
-
-            unread_emails = []
-            for msg in messages:
-                msg_id = msg['id']
-
-                # Skip if already processed
-                if msg_id in self.processed_emails:
-                    continue
-
-                # Get full message
-                message = self.gmail_service.users().messages().get(
-                    userId='me',
-                    id=msg_id,
-                    format='full'
-                ).execute()
-
-                # Extract details
-                headers = message['payload']['headers']
-                subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
-                from_email = next((h['value'] for h in headers if h['name'] == 'From'), '')
-
-                # Extract email address from "Name <email>" format
-                if '<' in from_email:
-                    email_addr = from_email.split('<')[1].split('>')[0]
-                else:
-                    email_addr = from_email
-
-                # Get body
-                body = self._get_email_body(message)
-
-                unread_emails.append({
-                    'id': msg_id,
-                    'thread_id': message['threadId'],
-                    'from': from_email,
-                    'email': email_addr,
-                    'subject': subject,
-                    'body': body
-                })
-
-            return unread_emails
-
+            # One history.list call when nothing arrived; a full search only
+            # on first start or when the stored cursor has expired
+            batch = self.inbox.fetch(keep=self._worth_answering)
         except Exception as e:
             print(f"⚠️  Error fetching emails: {e}")
-            return []
+            return 0
+
+        if batch['full_resync']:
+            print("🔄 Inbox cursor missing or expired - ran a full resync")
+
+        messages = batch['messages']
+        if messages:
+            print(f"\n📬 Found {len(messages)} unread email(s)")
+
+        failed = []
+        for message in messages:
+            try:
+                self.process_email(self._parse_email(message))
+            except Exception as e:
+                print(f"   ❌ Error processing email: {e}")
+                # Retried on the next check
+                failed.append(message['id'])
+
+        self.inbox.commit(batch, failed)
+        if messages:
+            print()  # Blank line after processing
+        return len(messages)
+
+    def start_push(self):
+        """Register (or renew) Gmail push notifications for the inbox"""
+        if not (PUSH_TOPIC or PUSH_TOKEN):
+            return
+        try:
+            # Notifications name the account address, which may differ from SENDER_EMAIL
+            profile = execute(self.gmail_service.users().getProfile(userId='me'), limit_key=self.limit_key)
+            self.mailbox = profile['emailAddress'].lower()
+            if PUSH_TOPIC:
+                watch = watch_mailbox(self.gmail_service, PUSH_TOPIC, limit_key=self.limit_key)
+                expires = datetime.fromtimestamp(int(watch['expiration']) / 1000)
+                print(f"📡 Gmail push active until {expires:%Y-%m-%d %H:%M}")
+            self.push_active = True
+        except Exception as e:
+            print(f"⚠️  Gmail push unavailable, polling every {CHECK_INTERVAL}s: {e}")
+            self.push_active = False
+        self.watch_renewed = time.time()
+
+    def wait_for_mail(self, seq: int) -> int:
+        """Sleep until the next check is due. Returns the last push notification seen."""
+        if not self.push_active:
+            time.sleep(CHECK_INTERVAL)
+            return seq
+        # Idle until Gmail reports a change past our cursor; the timeout is the slow fallback poll
+        while True:
+            seq, history_id = push_notifications.wait(self.mailbox, seq, FALLBACK_POLL_SECONDS)
+            if history_id is None or self.inbox.needs_sync(history_id):
+                return seq
+
+    def _worth_answering(self, message: Dict) -> bool:
+        """Decide from headers alone, before the body is downloaded"""
+        # Already read by someone in Gmail: leave it to them
+        if 'UNREAD' not in message.get('labelIds', []):
+            return False
+        sender = sender_address(message)
+        return not any(d in sender for d in SPAM_DOMAINS)
+
+    def _parse_email(self, message: Dict) -> Dict:
+        """Extract the fields process_email needs from a full message"""
+        headers = message['payload']['headers']
+        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
+        from_email = next((h['value'] for h in headers if h['name'] == 'From'), '')
+
+        # Extract email address from "Name <email>" format
+        if '<' in from_email:
+            email_addr = from_email.split('<')[1].split('>')[0]
+        else:
+            email_addr = from_email
+
+        return {
+            'id': message['id'],
+            'thread_id': message['threadId'],
+            'from': from_email,
+            'email': email_addr,
+            'subject': subject,
+            # Messages over GMAIL_MAX_BODY_BYTES come without a payload body
+            'body': self._get_email_body(message) or message.get('snippet', '')
+        }
 
     def _get_email_body(self, message):
         """Extract email body from message"""
@@ -358,10 +407,10 @@ Best regards,
 
             # Send via Gmail API
             raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
-            sent_message = self.gmail_service.users().messages().send(
+            sent_message = execute(self.gmail_service.users().messages().send(
                 userId='me',
                 body={'raw': raw, 'threadId': thread_id}
-            ).execute()
+            ), limit_key=self.limit_key, idempotent=False)
 
             return True
 
@@ -372,11 +421,11 @@ Best regards,
     def mark_as_read(self, message_id: str):
         """Mark email as read"""
         try:
-            self.gmail_service.users().messages().modify(
+            execute(self.gmail_service.users().messages().modify(
                 userId='me',
                 id=message_id,
                 body={'removeLabelIds': ['UNREAD']}
-            ).execute()
+            ), limit_key=self.limit_key)
         except:
             pass
 
@@ -462,7 +511,8 @@ Best regards,
         print("\n" + "="*70)
         print("  🤖 AUTO-REPLY DAEMON STARTING")
         print("="*70)
-        print(f"  Check interval: {CHECK_INTERVAL} seconds")
+        print(f"  Check interval: {CHECK_INTERVAL} seconds "
+              f"({FALLBACK_POLL_SECONDS} seconds with push notifications)")
         print(f"  Sender: {SENDER_NAME} <{SENDER_EMAIL}>")
         print("="*70 + "\n")
 
@@ -473,43 +523,38 @@ Best regards,
 
         self.authenticate_sheets()
         self.initialize_anthropic()
+        self.start_push()
 
         print("\n✅ All systems ready!")
-        print("🔄 Monitoring inbox every 5 seconds...")
+        if self.push_active:
+            print(f"🔔 Waiting for Gmail push notifications (fallback check every {FALLBACK_POLL_SECONDS}s)...")
+        else:
+            print("🔄 Monitoring inbox every 5 seconds...")
         print("📧 Will auto-reply to interested customers")
         print("🛑 Press Ctrl+C to stop\n")
         print("-" * 70 + "\n")
 
         check_count = 0
+        seq, _ = push_notifications.latest(self.mailbox)
 
         try:
             while True:
                 check_count += 1
                 self.last_check_time = datetime.now()
 
-                # Status update every 60 checks (5 minutes)
+                # Status update every 60 checks (5 minutes when polling)
                 if check_count % 60 == 0:
                     print(f"💚 System running | Checks: {check_count} | "
                           f"Processed: {len(self.processed_emails)} emails")
 
                 # Check for new emails
-                unread_emails = self.get_unread_emails()
-
-                if unread_emails:
-                    print(f"\n📬 Found {len(unread_emails)} unread email(s)")
-
-                    for email_data in unread_emails:
-                        try:
-                            self.process_email(email_data)
-                        except Exception as e:
-                            print(f"   ❌ Error processing email: {e}")
-                            # Continue with next email
-                            continue
+                self.check_inbox()
 
-                    print()  # Blank line after processing
+                if PUSH_TOPIC and time.time() - self.watch_renewed > WATCH_RENEW_SECONDS:
+                    self.start_push()  # watches expire after 7 days
 
                 # Wait before next check
-                time.sleep(CHECK_INTERVAL)
+                seq = self.wait_for_mail(seq)
 
         except KeyboardInterrupt:
             print("\n\n🛑 Stopping daemon...")
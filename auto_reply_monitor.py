@@ -26,7 +26,8 @@ from dotenv import load_dotenv
 load_dotenv('config/.env')
 
 from main_automation import EmailTracker, GoogleSheetsManager, EmailPersonalizationEngine, PIPELINE_STAGES
-from app_core import classify_reply
+from services.reply_rules import classify_reply, SPAM_DOMAINS
+from services.gmail_fetch import sender_address, reply_match_keys
 
 # Configuration
 CHECK_INTERVAL_HOURS = int(os.getenv('EMAIL_CHECK_INTERVAL_HOURS', '24'))
@@ -117,7 +118,7 @@ class AutoReplyMonitor:
         """Initialize connections"""
         monitor_logger.info("Initializing Auto Reply Monitor...")
 
-        self.tracker = EmailTracker('gmail_credentials.json')
+        self.tracker = EmailTracker('gmail_credentials.json', f"gmail:{SENDER_EMAIL or 'me'}")
         self.tracker.authenticate()
         monitor_logger.info("Gmail authenticated")
 
@@ -143,9 +144,30 @@ class AutoReplyMonitor:
         monitor_logger.info(f"Checking for replies...")
 
         try:
-            replies = self.tracker.check_new_replies(since_hours=CHECK_INTERVAL_HOURS)
+            # Only messages added since the last completed check; the search
+            # query is used for the first check or when the cursor expired
+            time_threshold = datetime.now() - timedelta(hours=CHECK_INTERVAL_HOURS)
+            inbox = self.tracker.inbox_sync('auto_reply_monitor', SENDER_EMAIL or 'me',
+                                            f'is:unread after:{time_threshold.strftime("%Y/%m/%d")}')
+            tracking = self.sheets.get_snapshot('Email_Tracking', max_age=0)
+
+            def is_open(record):
+                return record.get('status') in ['sent', 'queued']
+
+            def keep(message):
+                # Headers only: skip spam and replies to no open outreach before downloading bodies
+                sender = sender_address(message)
+                if any(domain in sender for domain in SPAM_DOMAINS):
+                    return False
+                return tracking.for_reply(sender=sender, where=is_open, **reply_match_keys(message)) is not None
+
+            batch = inbox.fetch(keep=keep)
+            if batch['full_resync']:
+                monitor_logger.info("Inbox cursor missing or expired, ran a full resync")
+            replies = [self.tracker.parse_reply(msg) for msg in batch['messages']]
 
             if not replies:
+                inbox.commit(batch)
                 monitor_logger.info("No new replies found")
                 log_activity('check_replies', {'found': 0, 'updated': 0})
                 self.last_check = datetime.now()
@@ -154,39 +176,30 @@ class AutoReplyMonitor:
             monitor_logger.info(f"Found {len(replies)} reply(ies)")
             self.stats['replies_found'] += len(replies)
 
-            tracking_sheet = self.sheets.get_worksheet('Email_Tracking')
-            tracking_records = tracking_sheet.get_all_records()
-            headers = tracking_sheet.row_values(1)
+            headers = self.sheets.ensure_columns('Email_Tracking', ['replied', 'reply_date', 'reply_content_summary',
+                                                                    'next_action', 'detected_stage'])
 
-            for col_name in ['replied', 'reply_date', 'reply_content_summary', 'next_action', 'detected_stage']:
-                if col_name not in headers:
-                    tracking_sheet.update_cell(1, len(headers) + 1, col_name)
-                    headers.append(col_name)
+            with self.sheets.batch_writes():
+                customers = self.sheets.get_snapshot('Customers', max_age=0)
+                customer_headers = self.sheets.get_headers('Customers')
 
-            customers_sheet = self.sheets.get_worksheet('Customers')
-            customers = customers_sheet.get_all_records()
-            customer_headers = customers_sheet.row_values(1)
+                updated_count = 0
 
-            updated_count = 0
-            known_spam = ['@accounts.google.com', '@indeed.com', '@pinterest.com',
-                          '@discover.pinterest.com', '@email.shopify.com',
-                          '@englishgrammar.org', '@360alumni.com']
+                for reply in replies:
+                    from_email = reply['from']
+                    if '<' in from_email:
+                        from_email = from_email.split('<')[1].split('>')[0].strip()
 
-            for reply in replies:
-                from_email = reply['from']
-                if '<' in from_email:
-                    from_email = from_email.split('<')[1].split('>')[0].strip()
+                    monitor_logger.info(f"Processing reply from: {from_email}")
+                    reply_body = reply.get('body', '')
+                    request_type = classify_request(reply_body)
+                    monitor_logger.info(f"  Request Type: {request_type}")
 
-                if any(domain in from_email for domain in known_spam):
-                    continue
-
-                monitor_logger.info(f"Processing reply from: {from_email}")
-                reply_body = reply.get('body', '')
-                request_type = classify_request(reply_body)
-                monitor_logger.info(f"  Request Type: {request_type}")
-
-                for idx, record in enumerate(tracking_records, start=2):
-                    if record.get('contact_email') == from_email and record.get('status') in ['sent', 'queued']:
+                    # The exact email replied to (thread / In-Reply-To), else the sender's first open one
+                    hit = tracking.for_reply(reply.get('thread_id', ''), reply.get('message_ids', ()),
+                                             from_email, where=is_open)
+                    if hit:
+                        idx, record = hit
                         current_stage = int(record.get('pipeline_stage', 1)) if str(record.get('pipeline_stage', '1')).isdigit() else 1
                         detected_stage = detect_pipeline_stage(reply_body, reply['subject'], current_stage)
                         stage_info = PIPELINE_STAGES.get(detected_stage, {})
@@ -209,9 +222,7 @@ class AutoReplyMonitor:
                             'detected_stage': str(detected_stage)
                         }
 
-                        for col_name, value in updates.items():
-                            if col_name in headers:
-                                tracking_sheet.update_cell(idx, headers.index(col_name) + 1, value)
+                        self.sheets.update_row('Email_Tracking', idx, updates, headers)
 
                         updated_count += 1
                         self.stats['updated'] += 1
@@ -230,9 +241,10 @@ class AutoReplyMonitor:
                         customer_id = record.get('customer_id')
                         if customer_id:
                             self.update_customer(customer_id, from_email, detected_stage, request_type,
-                                                 customers_sheet, customer_headers, customers)
-                        break
+                                                 customer_headers, customers)
 
+            # Tracking writes are flushed; these messages are now handled
+            inbox.commit(batch)
             monitor_logger.info(f"Updated {updated_count} email tracking record(s)")
             log_activity('check_replies', {'found': len(replies), 'updated': updated_count})
             self.last_check = datetime.now()
@@ -244,34 +256,31 @@ class AutoReplyMonitor:
             import traceback
             traceback.print_exc()
 
-    def update_customer(self, customer_id, email, new_stage, request_type, sheet, headers, customers):
+    def update_customer(self, customer_id, email, new_stage, request_type, headers, customers):
         """Update customer engagement level and pipeline stage"""
         try:
-            for idx, customer in enumerate(customers, start=2):
-                if str(customer.get('id')) == str(customer_id) or customer.get('contact_email') == email:
-                    engagement_map = {
-                        'Quotation Request': 'HOT',
-                        'Sample Request': 'HOT',
-                        'Contract Request': 'HOT',
-                        'Technical Info Request': 'WARM',
-                        'Info Request': 'INTERESTED',
-                        'Shipping Inquiry': 'HOT',
-                        'Repeat Order': 'HOT',
-                        'Declined': 'COLD',
-                        'General Reply': 'INTERESTED'
-                    }
-                    new_engagement = engagement_map.get(request_type, 'INTERESTED')
-
-                    if 'engagement_level' in headers:
-                        col = headers.index('engagement_level') + 1
-                        sheet.update_cell(idx, col, new_engagement)
-
-                    if 'pipeline_stage' in headers:
-                        col = headers.index('pipeline_stage') + 1
-                        sheet.update_cell(idx, col, new_stage)
-
-                    monitor_logger.info(f"  Customer updated: engagement={new_engagement}, stage={new_stage}")
-                    break
+            hit = customers.find('id', customer_id) or customers.find('contact_email', email)
+            if hit:
+                idx, customer = hit
+                engagement_map = {
+                    'Quotation Request': 'HOT',
+                    'Sample Request': 'HOT',
+                    'Contract Request': 'HOT',
+                    'Technical Info Request': 'WARM',
+                    'Info Request': 'INTERESTED',
+                    'Shipping Inquiry': 'HOT',
+                    'Repeat Order': 'HOT',
+                    'Declined': 'COLD',
+                    'General Reply': 'INTERESTED'
+                }
+                new_engagement = engagement_map.get(request_type, 'INTERESTED')
+
+                self.sheets.update_row('Customers', idx, {
+                    'engagement_level': new_engagement,
+                    'pipeline_stage': new_stage,
+                }, headers)
+
+                monitor_logger.info(f"  Customer updated: engagement={new_engagement}, stage={new_stage}")
         except Exception as e:
             monitor_logger.warning(f"Could not update customer: {e}")
 
@@ -281,42 +290,41 @@ class AutoReplyMonitor:
         monitor_logger.info("Checking for stale emails needing follow-up...")
 
         try:
-            tracking_sheet = self.sheets.get_worksheet('Email_Tracking')
-            emails = tracking_sheet.get_all_records()
-            headers = tracking_sheet.row_values(1)
+            emails = self.sheets.get_records('Email_Tracking')
+            headers = self.sheets.get_headers('Email_Tracking')
 
             now = datetime.now()
             stale_count = 0
 
-            for idx, e in enumerate(emails, start=2):
-                if e.get('status') != 'sent' or e.get('replied', 'no') == 'yes':
-                    continue
+            with self.sheets.batch_writes():
+                for idx, e in enumerate(emails, start=2):
+                    if e.get('status') != 'sent' or e.get('replied', 'no') == 'yes':
+                        continue
 
-                sent_date_str = e.get('sent_date', '')
-                if not sent_date_str:
-                    continue
-                try:
-                    sent_date = datetime.strptime(sent_date_str, '%Y-%m-%d')
-                except ValueError:
-                    continue
+                    sent_date_str = e.get('sent_date', '')
+                    if not sent_date_str:
+                        continue
+                    try:
+                        sent_date = datetime.strptime(sent_date_str, '%Y-%m-%d')
+                    except ValueError:
+                        continue
 
-                current_stage = int(e.get('pipeline_stage', 1)) if str(e.get('pipeline_stage', '1')).isdigit() else 1
-                delay_days = PIPELINE_STAGES.get(current_stage, {}).get('followup_days', FOLLOWUP_DAYS)
+                    current_stage = int(e.get('pipeline_stage', 1)) if str(e.get('pipeline_stage', '1')).isdigit() else 1
+                    delay_days = PIPELINE_STAGES.get(current_stage, {}).get('followup_days', FOLLOWUP_DAYS)
 
-                if delay_days == 0:
-                    continue
+                    if delay_days == 0:
+                        continue
 
-                if (now - sent_date).days >= delay_days:
-                    next_stage = min(current_stage + 1, max(PIPELINE_STAGES.keys()))
-                    stage_info = PIPELINE_STAGES.get(next_stage, {})
+                    if (now - sent_date).days >= delay_days:
+                        next_stage = min(current_stage + 1, max(PIPELINE_STAGES.keys()))
+                        stage_info = PIPELINE_STAGES.get(next_stage, {})
 
-                    next_action = f'Follow-up needed: Stage {next_stage} ({stage_info.get("name", "")}) - {delay_days}d delay exceeded'
-                    if 'next_action' in headers:
-                        tracking_sheet.update_cell(idx, headers.index('next_action') + 1, next_action)
+                        next_action = f'Follow-up needed: Stage {next_stage} ({stage_info.get("name", "")}) - {delay_days}d delay exceeded'
+                        self.sheets.update_row('Email_Tracking', idx, {'next_action': next_action}, headers)
 
-                    monitor_logger.info(f"  Stale: {e.get('company_name', '')} - sent {sent_date_str}, "
-                                        f"stage {current_stage} ({delay_days}d delay) -> needs Stage {next_stage}")
-                    stale_count += 1
+                        monitor_logger.info(f"  Stale: {e.get('company_name', '')} - sent {sent_date_str}, "
+                                            f"stage {current_stage} ({delay_days}d delay) -> needs Stage {next_stage}")
+                        stale_count += 1
 
             self.stats['stale_found'] += stale_count
             monitor_logger.info(f"Found {stale_count} email(s) needing follow-up")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Outbox worker: sends queued outbound email for all users.
+
+The web app only queues mail. One web process also drains the outbox in
+a background thread (OUTBOX_DRAIN_SECONDS). Run this worker as well, or
+instead with OUTBOX_DRAIN_SECONDS=0 on the web processes, to keep sending
+while the web app is idle or restarting. Several workers can run at once.
+
+Usage:
+    python3 outbox_worker.py            # drain every OUTBOX_WORKER_SECONDS
+    python3 outbox_worker.py --once     # drain what is due and exit
+"""
+
+import os
+import sys
+import time
+
+# Add scripts directory to path
+sys.path.append('scripts')
+
+from dotenv import load_dotenv
+load_dotenv('config/.env')
+
+from app_core import drain_outbox, OUTBOX_DRAIN_BATCH
+from services.outbox import outbox
+
+# Separate from OUTBOX_DRAIN_SECONDS, which turns the web processes' drain off
+INTERVAL = max(1, int(os.getenv('OUTBOX_WORKER_SECONDS', '10')))
+
+
+def drain_due():
+    """Drain until no full batch is left. Returns the summed summary."""
+    total = {'sent': 0, 'retrying': 0, 'dead': 0, 'applied': 0}
+    while True:
+        summary = drain_outbox()
+        for key, value in summary.items():
+            total[key] += value
+        if summary['sent'] < OUTBOX_DRAIN_BATCH:
+            return total
+
+
+def main():
+    once = '--once' in sys.argv
+    print(f"📤 Outbox worker started ({'single pass' if once else f'every {INTERVAL}s'})")
+    last_prune = 0
+    while True:
+        try:
+            total = drain_due()
+            if any(total.values()):
+                print(f"[{time.strftime('%H:%M:%S')}] sent {total['sent']}, retrying {total['retrying']}, "
+                      f"dead {total['dead']}, tracking updates {total['applied']}")
+            if time.time() - last_prune > 86400:
+                outbox.prune()
+                last_prune = time.time()
+        except Exception as e:
+            print(f"❌ Outbox drain failed: {e}")
+        if once:
+            return
+        time.sleep(INTERVAL)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n👋 Outbox worker stopped")
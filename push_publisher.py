@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for Gmail + Pub/Sub push notifications.
+
+Posts the same envelope Pub/Sub would deliver to the web app's
+/webhooks/gmail endpoint, so the push path of auto_reply_daemon.py can be
+exercised without a Google Cloud project. Needs GMAIL_PUSH_TOKEN in
+config/.env (the web app and the daemon read the same value).
+
+Usage:
+    python3 push_publisher.py you@gmail.com 123456
+    python3 push_publisher.py you@gmail.com 123456 --url http://localhost:5000/webhooks/gmail
+"""
+
+import os
+import sys
+
+# Add scripts directory to path
+sys.path.append('scripts')
+
+from dotenv import load_dotenv
+load_dotenv('config/.env')
+
+from services.inbox_push import LocalPublisher, PUSH_TOKEN
+
+DEFAULT_URL = os.getenv('GMAIL_PUSH_URL', 'http://localhost:5000/webhooks/gmail')
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    url = sys.argv[sys.argv.index('--url') + 1] if '--url' in sys.argv else DEFAULT_URL
+    args = [a for a in args if a != url]
+    if len(args) != 2:
+        print(__doc__)
+        sys.exit(1)
+    if not PUSH_TOKEN:
+        print("❌ GMAIL_PUSH_TOKEN is not set; the webhook is disabled")
+        sys.exit(1)
+    email_address, history_id = args
+    status = LocalPublisher(url).publish(email_address, history_id)
+    print(f"📡 Published change for {email_address} at history {history_id} -> HTTP {status}")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,8 @@ import json
 import logging
 from typing import Dict, List, Optional, Any
 
+from services.ai_cache import ai_cache, cached_prefix
+
 logger = logging.getLogger('quartz_web')
 
 
@@ -28,11 +30,69 @@ class SmartIntentDetectionEngine:
         'declined': 10,
     }
 
+    # Role, instructions, output format and examples: identical for every email,
+    # so they are sent as a cached system prefix
+    INTENT_INSTRUCTIONS = """You are an expert B2B sales intelligence assistant for a high-purity quartz mining and export company.
+
+**Your Task:** Analyze the customer email you are given and extract ALL intents, sentiment, urgency, and buying signals.
+
+**Instructions:**
+1. **Primary Intent**: The main request/question (choose from: info_request, technical_info_request, sample_request, quotation_request, contract_request, shipping_inquiry, repeat_order, declined)
+2. **Secondary Intents**: All other intents detected (list all, even if subtle)
+3. **Urgency Level**: high (ASAP, urgent, deadline <7 days), medium (within 2 weeks), low (no urgency)
+4. **Sentiment**: positive (enthusiastic, interested), neutral, negative (frustrated, declining), mixed
+5. **Buying Signals**: Explicit signs of purchase intent ("budget approved", "ready to order", "need quote by Friday", "expanding production")
+6. **Objections**: Any concerns raised ("price too high", "not ready", "using competitor", "need approval")
+7. **Timeline Mentioned**: Any specific dates/timeframes mentioned
+8. **Decision Maker**: confirmed (they explicitly state authority), suspected (title/role suggests it), unknown
+9. **Recommended Stage**: Based on the strongest intent and buying signals, what pipeline stage (1-10) should this customer be in?
+10. **Confidence Score**: Your confidence in this analysis (0.0-1.0)
+11. **Reasoning**: Brief explanation of your analysis (1-2 sentences)
+
+**Output Format (JSON only, no other text):**
+{
+  "primary_intent": "sample_request",
+  "secondary_intents": ["pricing_inquiry", "timeline_question"],
+  "urgency_level": "high",
+  "sentiment": "positive",
+  "buying_signals": ["budget approved", "ready to order"],
+  "objections": ["delivery timeline concern"],
+  "timeline_mentioned": "need by March 15",
+  "decision_maker_status": "confirmed",
+  "recommended_stage": 5,
+  "confidence_score": 0.92,
+  "detected_keywords": {
+    "sample": ["sample", "trial"],
+    "pricing": ["price", "quote"],
+    "urgency": ["ASAP", "urgent"]
+  },
+  "reasoning": "Customer explicitly requests sample and pricing with urgent deadline, strong buying signals present.",
+  "next_best_action": "send_priority_sample_with_volume_pricing"
+}
+
+**Few-Shot Examples:**
+
+**Example 1:**
+Email: "Hi, we're interested in learning more about your high-purity quartz. Can you send a brochure?"
+Analysis: {"primary_intent": "info_request", "secondary_intents": [], "urgency_level": "low", "sentiment": "neutral", "buying_signals": [], "objections": [], "timeline_mentioned": null, "decision_maker_status": "unknown", "recommended_stage": 2, "confidence_score": 0.95, "detected_keywords": {"info": ["interested", "brochure"]}, "reasoning": "Basic information request with no urgency or buying signals.", "next_best_action": "send_company_overview_brochure"}
+
+**Example 2:**
+Email: "We need a 5kg sample ASAP for our new semiconductor fab. Also, what's your pricing for 10-ton monthly orders? Our purchasing manager wants quotes from 2-3 suppliers before Q3. Current supplier raised prices 15%."
+Analysis: {"primary_intent": "sample_request", "secondary_intents": ["quotation_request", "supplier_evaluation"], "urgency_level": "high", "sentiment": "positive", "buying_signals": ["new semiconductor fab", "10-ton monthly orders", "Q3 deadline", "purchasing manager involved"], "objections": ["competitor evaluation", "current supplier price increase"], "timeline_mentioned": "ASAP for sample, Q3 for decision", "decision_maker_status": "confirmed", "recommended_stage": 5, "confidence_score": 0.96, "detected_keywords": {"sample": ["5kg sample", "ASAP"], "pricing": ["pricing", "quotes"], "urgency": ["ASAP", "before Q3"]}, "reasoning": "Multi-intent with strong buying signals, competitive context, and confirmed decision maker involvement. Skip directly to quotation stage.", "next_best_action": "send_priority_sample_with_volume_pricing_and_competitive_positioning"}
+
+**Example 3:**
+Email: "Thanks but we've decided to go with another supplier. Please remove us from your mailing list."
+Analysis: {"primary_intent": "declined", "secondary_intents": ["unsubscribe"], "urgency_level": "low", "sentiment": "negative", "buying_signals": [], "objections": ["chose competitor"], "timeline_mentioned": null, "decision_maker_status": "unknown", "recommended_stage": 10, "confidence_score": 0.98, "detected_keywords": {"decline": ["decided to go with another", "remove from mailing list"]}, "reasoning": "Clear rejection with competitor selection. Move to closed/lost stage.", "next_best_action": "mark_as_lost_and_unsubscribe"}
+
+**Example 4:**
+Email: "Can you provide the technical specs and ICP analysis report for your HPQ-99.99 grade? We need SiO2 purity data."
+Analysis: {"primary_intent": "technical_info_request", "secondary_intents": [], "urgency_level": "medium", "sentiment": "neutral", "buying_signals": ["specific product grade interest"], "objections": [], "timeline_mentioned": null, "decision_maker_status": "suspected", "recommended_stage": 3, "confidence_score": 0.90, "detected_keywords": {"technical": ["technical specs", "ICP analysis", "SiO2 purity"]}, "reasoning": "Technical evaluation phase, likely technical buyer. Provide detailed specs.", "next_best_action": "send_technical_data_sheet_and_icp_report"}"""
+
     def __init__(self, api_key: str):
         """Initialize with Anthropic API key."""
         try:
-            import anthropic
-            self.client = anthropic.Anthropic(api_key=api_key)
+            from services.retry import anthropic_client
+            self.client = anthropic_client(api_key)
             self.model = "claude-sonnet-4-20250514"
         except ImportError:
             logger.error("anthropic package not installed")
@@ -89,8 +149,10 @@ class SmartIntentDetectionEngine:
                 model=self.model,
                 max_tokens=2000,
                 temperature=0.1,  # Low temp for consistent classification
+                system=cached_prefix(self.INTENT_INSTRUCTIONS),
                 messages=[{"role": "user", "content": prompt}]
             )
+            ai_cache.record_usage('intent', message)
 
             response_text = message.content[0].text
 
@@ -111,7 +173,7 @@ class SmartIntentDetectionEngine:
         email_history: Optional[List[Dict]],
         customer_context: Optional[Dict]
     ) -> str:
-        """Build comprehensive prompt for intent analysis."""
+        """Build the per-email part of the intent prompt (the instructions are ``INTENT_INSTRUCTIONS``)."""
 
         context_info = ""
         if customer_context:
@@ -128,11 +190,7 @@ class SmartIntentDetectionEngine:
             for i, email in enumerate(email_history[-3:]):  # Last 3 emails
                 history_info += f"{i+1}. {email.get('subject', '')[:100]}\n"
 
-        prompt = f"""You are an expert B2B sales intelligence assistant for a high-purity quartz mining and export company.
-
-**Your Task:** Analyze this customer email and extract ALL intents, sentiment, urgency, and buying signals.
-
-{context_info}
+        prompt = f"""{context_info}
 {history_info}
 
 **Email Subject:** {subject}
@@ -142,59 +200,7 @@ class SmartIntentDetectionEngine:
 
 ---
 
-**Instructions:**
-1. **Primary Intent**: The main request/question (choose from: info_request, technical_info_request, sample_request, quotation_request, contract_request, shipping_inquiry, repeat_order, declined)
-2. **Secondary Intents**: All other intents detected (list all, even if subtle)
-3. **Urgency Level**: high (ASAP, urgent, deadline <7 days), medium (within 2 weeks), low (no urgency)
-4. **Sentiment**: positive (enthusiastic, interested), neutral, negative (frustrated, declining), mixed
-5. **Buying Signals**: Explicit signs of purchase intent ("budget approved", "ready to order", "need quote by Friday", "expanding production")
-6. **Objections**: Any concerns raised ("price too high", "not ready", "using competitor", "need approval")
-7. **Timeline Mentioned**: Any specific dates/timeframes mentioned
-8. **Decision Maker**: confirmed (they explicitly state authority), suspected (title/role suggests it), unknown
-9. **Recommended Stage**: Based on the strongest intent and buying signals, what pipeline stage (1-10) should this customer be in?
-10. **Confidence Score**: Your confidence in this analysis (0.0-1.0)
-11. **Reasoning**: Brief explanation of your analysis (1-2 sentences)
-
-**Output Format (JSON only, no other text):**
-{{
-  "primary_intent": "sample_request",
-  "secondary_intents": ["pricing_inquiry", "timeline_question"],
-  "urgency_level": "high",
-  "sentiment": "positive",
-  "buying_signals": ["budget approved", "ready to order"],
-  "objections": ["delivery timeline concern"],
-  "timeline_mentioned": "need by March 15",
-  "decision_maker_status": "confirmed",
-  "recommended_stage": 5,
-  "confidence_score": 0.92,
-  "detected_keywords": {{
-    "sample": ["sample", "trial"],
-    "pricing": ["price", "quote"],
-    "urgency": ["ASAP", "urgent"]
-  }},
-  "reasoning": "Customer explicitly requests sample and pricing with urgent deadline, strong buying signals present.",
-  "next_best_action": "send_priority_sample_with_volume_pricing"
-}}
-
-**Few-Shot Examples:**
-
-**Example 1:**
-Email: "Hi, we're interested in learning more about your high-purity quartz. Can you send a brochure?"
-Analysis: {{"primary_intent": "info_request", "secondary_intents": [], "urgency_level": "low", "sentiment": "neutral", "buying_signals": [], "objections": [], "timeline_mentioned": null, "decision_maker_status": "unknown", "recommended_stage": 2, "confidence_score": 0.95, "detected_keywords": {{"info": ["interested", "brochure"]}}, "reasoning": "Basic information request with no urgency or buying signals.", "next_best_action": "send_company_overview_brochure"}}
-
-**Example 2:**
-Email: "We need a 5kg sample ASAP for our new semiconductor fab. Also, what's your pricing for 10-ton monthly orders? Our purchasing manager wants quotes from 2-3 suppliers before Q3. Current supplier raised prices 15%."
-Analysis: {{"primary_intent": "sample_request", "secondary_intents": ["quotation_request", "supplier_evaluation"], "urgency_level": "high", "sentiment": "positive", "buying_signals": ["new semiconductor fab", "10-ton monthly orders", "Q3 deadline", "purchasing manager involved"], "objections": ["competitor evaluation", "current supplier price increase"], "timeline_mentioned": "ASAP for sample, Q3 for decision", "decision_maker_status": "confirmed", "recommended_stage": 5, "confidence_score": 0.96, "detected_keywords": {{"sample": ["5kg sample", "ASAP"], "pricing": ["pricing", "quotes"], "urgency": ["ASAP", "before Q3"]}}, "reasoning": "Multi-intent with strong buying signals, competitive context, and confirmed decision maker involvement. Skip directly to quotation stage.", "next_best_action": "send_priority_sample_with_volume_pricing_and_competitive_positioning"}}
-
-**Example 3:**
-Email: "Thanks but we've decided to go with another supplier. Please remove us from your mailing list."
-Analysis: {{"primary_intent": "declined", "secondary_intents": ["unsubscribe"], "urgency_level": "low", "sentiment": "negative", "buying_signals": [], "objections": ["chose competitor"], "timeline_mentioned": null, "decision_maker_status": "unknown", "recommended_stage": 10, "confidence_score": 0.98, "detected_keywords": {{"decline": ["decided to go with another", "remove from mailing list"]}}, "reasoning": "Clear rejection with competitor selection. Move to closed/lost stage.", "next_best_action": "mark_as_lost_and_unsubscribe"}}
-
-**Example 4:**
-Email: "Can you provide the technical specs and ICP analysis report for your HPQ-99.99 grade? We need SiO2 purity data."
-Analysis: {{"primary_intent": "technical_info_request", "secondary_intents": [], "urgency_level": "medium", "sentiment": "neutral", "buying_signals": ["specific product grade interest"], "objections": [], "timeline_mentioned": null, "decision_maker_status": "suspected", "recommended_stage": 3, "confidence_score": 0.90, "detected_keywords": {{"technical": ["technical specs", "ICP analysis", "SiO2 purity"]}}, "reasoning": "Technical evaluation phase, likely technical buyer. Provide detailed specs.", "next_best_action": "send_technical_data_sheet_and_icp_report"}}
-
-Now analyze the email above and return ONLY the JSON object:"""
+Analyze this email and return ONLY the JSON object:"""
 
         return prompt
 
@@ -30,12 +30,25 @@ load_dotenv(os.path.join(PROJECT_ROOT, 'config', '.env'))
 from main_automation import (
     GoogleSheetsManager,
     AIResearchEngine,
+    RESEARCH_FAILED,
     EmailPersonalizationEngine,
     EmailTracker,
     AutoReplyEngine,
     PIPELINE_STAGES as DEFAULT_PIPELINE_STAGES
 )
 from automated_workflow import CustomerSegmentationEngine
+from services.sheet_mirror import (SheetMirror, SYNC_INTERVAL as MIRROR_SYNC_INTERVAL,
+                                   MAX_AGE as MIRROR_MAX_AGE)
+from services.shared_cache import SharedCache
+from services.gmail_pool import gmail_pool
+from services.outbox import outbox
+from services.sqlite_storage import SQLiteStorage
+from services.record_index import RecordSnapshot, REPLY_MATCH_COLUMNS
+from services.ai_generation import AsyncGenerationEngine, AI_CONCURRENCY
+from services.ai_batches import (ai_batches, batch_client, collect_batch,
+                                 POLL_SECONDS as AI_BATCH_POLL_INTERVAL)
+from services.retry import classify, PERMANENT
+from services.reply_rules import SPAM_DOMAINS, REPLY_RULES as _REPLY_RULES, classify_reply
 
 # Load pipeline config
 config_path = os.path.join(PROJECT_ROOT, 'config', 'pipeline_config.json')
@@ -51,9 +64,6 @@ APP_USERNAME = os.getenv('APP_USERNAME', 'admin')
 APP_PASSWORD = os.getenv('APP_PASSWORD', 'quartz2024')
 GMAIL_CREDS = os.getenv('GMAIL_CREDENTIALS_PATH', 'gmail_credentials.json')
 
-SPAM_DOMAINS = [d.strip().lower() for d in os.getenv('SPAM_DOMAINS',
-    '@accounts.google.com,@indeed.com,@pinterest.com,@discover.pinterest.com,@email.shopify.com,@englishgrammar.org,@360alumni.com,@inspire.pinterest.com,mailer-daemon@,noreply@,no-reply@,@shutterstock.com,@coursera.org,@discord.com,@malwarebytes.com,@dropbox.com'
-).split(',')]
 
 # ── Logging ────────────────────────────────────────────
 log_dir = os.path.join(PROJECT_ROOT, 'logs')
@@ -99,9 +109,9 @@ def get_user_config(key, default=None):
     return val if val is not None else default
 
 
-def get_api_key():
-    """Get the Anthropic API key for the current user."""
-    user = get_current_user()
+def get_api_key(user=None):
+    """Get the Anthropic API key for the current user (or ``user``)."""
+    user = user or get_current_user()
     if not user:
         return os.getenv('ANTHROPIC_API_KEY', '')
     key = user.get_credential('anthropic_api_key')
@@ -134,7 +144,7 @@ def get_sender_info():
 
 # ── Per-user Sheets service ──────────────────────────────
 def get_sheets():
-    """Get GoogleSheetsManager for the current user."""
+    """Get the storage backend (Sheets or local SQLite) for the current user."""
     user = get_current_user()
     if not user:
         raise RuntimeError("No authenticated user")
@@ -143,6 +153,17 @@ def get_sheets():
     if hasattr(g, cache_key):
         return getattr(g, cache_key)
 
+    mgr = build_sheets_manager(user)
+    setattr(g, cache_key, mgr)
+    return mgr
+
+
+def build_sheets_manager(user):
+    """Storage backend for a user: local SQLite, or an authenticated
+    GoogleSheetsManager backed by their local mirror."""
+    if user.storage_backend == 'sqlite':
+        return SQLiteStorage.for_user(user.id)
+
     sheets_id = user.google_sheets_id
     if not sheets_id:
         raise RuntimeError("Google Sheets not configured. Please complete setup.")
@@ -153,10 +174,289 @@ def get_sheets():
 
     mgr = GoogleSheetsManager(sheets_id)
     mgr.authenticate_from_json(sa_json)
-    setattr(g, cache_key, mgr)
+    mgr.attach_mirror(SheetMirror.for_user(user.id))
     return mgr
 
 
+# ── Background mirror sync ────────────────────────────
+_mirror_sync_thread = None
+
+
+def _mirror_sync_loop(interval):
+    from models import User
+    while True:
+        time.sleep(interval)
+        for user in User.get_all():
+            if (not user.is_active or user.storage_backend != 'sheets' or not user.google_sheets_id
+                    or not user.has_credential('service_account')):
+                continue
+            try:
+                results = build_sheets_manager(user).sync_mirror()
+                pulled = {k: v for k, v in results.items() if not v.get('skipped')}
+                if pulled:
+                    logger.info(f"Mirror sync user {user.id}: {pulled}")
+            except Exception as e:
+                logger.warning(f"Mirror sync failed for user {user.id}: {e}")
+
+
+def start_mirror_sync(interval=None):
+    """Start the background Sheets mirror sync thread (once per process)."""
+    global _mirror_sync_thread
+    interval = MIRROR_SYNC_INTERVAL if interval is None else interval
+    if interval <= 0 or _mirror_sync_thread is not None:
+        return
+    _mirror_sync_thread = threading.Thread(target=_mirror_sync_loop, args=(interval,),
+                                           name='sheets-mirror-sync', daemon=True)
+    _mirror_sync_thread.start()
+
+
+# ── Outbox drain ──────────────────────────────────────
+OUTBOX_DRAIN_INTERVAL = int(os.getenv('OUTBOX_DRAIN_SECONDS', '10'))
+OUTBOX_DRAIN_BATCH = 20
+_outbox_thread = None
+_outbox_wakeup = threading.Event()
+
+
+def apply_outbox_effects(sheets, item):
+    """Tracking writes recorded with an outbox item, applied once it was sent.
+
+    Safe to repeat: a log row whose email_id already exists is not appended again.
+    The sent row records the Gmail thread id and Message-ID that replies are
+    matched on.
+    """
+    effects = item['effects']
+    now = datetime.now()
+    sent = {'status': 'sent', 'sent_date': now.strftime('%Y-%m-%d'), 'sent_time': now.strftime('%H:%M:%S'),
+            'gmail_msg_id': item.get('gmail_msg_id') or '', 'gmail_thread_id': item.get('gmail_thread_id') or '',
+            'rfc_message_id': item.get('message_id') or ''}
+    tracking = sheets.get_snapshot('Email_Tracking', max_age=0)
+    headers = sheets.ensure_columns('Email_Tracking', list(REPLY_MATCH_COLUMNS))
+    updates = {email_id: dict(fields) for email_id, fields in effects.get('tracking', {}).items()}
+    if effects.get('mark_sent'):
+        updates.setdefault(effects['mark_sent'], {}).update(
+            {k: sent[k] for k in ('status', 'sent_time') + REPLY_MATCH_COLUMNS})
+    with sheets.batch_writes():
+        log = effects.get('log')
+        if log and not tracking.find('email_id', log['email_id']):
+            sheets.log_email({**log, **sent})
+        for email_id, fields in updates.items():
+            hit = tracking.find('email_id', email_id)
+            if hit:
+                sheets.update_row('Email_Tracking', hit[0], fields, headers)
+        for customer_id, fields in effects.get('customer', {}).items():
+            sheets.update_customer(customer_id, fields)
+
+
+def drain_outbox(limit=OUTBOX_DRAIN_BATCH):
+    """Send due outbox items for all users. Usable outside a request."""
+    from models import User
+    from services.email_service import build_raw_message, deliver_raw, find_sent_message
+
+    users, backends = {}, {}
+
+    def user_for(item):
+        if item['user_id'] not in users:
+            users[item['user_id']] = User.get_by_id(item['user_id'])
+        user = users[item['user_id']]
+        if user is None:
+            raise RuntimeError(f"User {item['user_id']} no longer exists")
+        return user
+
+    def deliver(item):
+        service = get_gmail_service_for_user(user_for(item))
+        if item['recovered'] or item['attempts']:
+            # A drainer that died, or a 5xx/timeout, may still have delivered it
+            existing = find_sent_message(service, item['message_id'], item['sender_email'])
+            if existing:
+                return existing
+        raw = build_raw_message(item['to_email'], item['subject'], item['body'], item['attachments'],
+                                item['sender_name'], item['sender_email'], message_id=item['message_id'])
+        sent = deliver_raw(service, raw, item['sender_email'])
+        logger.info(f"Email sent to {item['to_email']}: {sent['id']}")
+        return sent
+
+    def apply(item):
+        user = user_for(item)
+        if user.id not in backends:
+            backends[user.id] = build_sheets_manager(user)
+        apply_outbox_effects(backends[user.id], item)
+        shared_cache.invalidate(f"user_{user.id}")
+
+    summary = outbox.drain(deliver, apply, limit)
+    if any(summary.values()):
+        logger.info(f"Outbox drain: {summary}")
+    return summary
+
+
+def _outbox_drain_loop(interval):
+    while True:
+        _outbox_wakeup.wait(interval)
+        _outbox_wakeup.clear()
+        try:
+            while drain_outbox()['sent'] >= OUTBOX_DRAIN_BATCH:
+                pass
+        except Exception as e:
+            logger.warning(f"Outbox drain failed: {e}")
+
+
+def start_outbox_drain(interval=None):
+    """Start the background outbox drain thread (once per process)."""
+    global _outbox_thread
+    interval = OUTBOX_DRAIN_INTERVAL if interval is None else interval
+    if interval <= 0 or _outbox_thread is not None:
+        return
+    _outbox_thread = threading.Thread(target=_outbox_drain_loop, args=(interval,),
+                                      name='outbox-drain', daemon=True)
+    _outbox_thread.start()
+
+
+def wake_outbox_drain():
+    """Ask the drain thread to run now instead of at its next interval."""
+    _outbox_wakeup.set()
+
+
+def enqueue_email(customer_id, stage, email_id, to_email, subject, body, attachment_files=(), effects=None,
+                  user=None, sender=None):
+    """Queue an email from the current user (or ``user``) for the outbox drainer.
+
+    ``(customer_id, stage, email_id)`` is the idempotency key. Returns the
+    outbox item; ``created`` is False when that key was already queued.
+    Pass ``user`` and ``sender`` when calling outside the request thread.
+    """
+    from services.outbox import idempotency_key
+    user = user or get_current_user()
+    if not user:
+        raise RuntimeError("No authenticated user")
+    sender = sender or get_sender_info()
+    item = outbox.enqueue(idempotency_key(customer_id, stage, email_id), to_email.strip(), subject, body,
+                          list(attachment_files), sender_name=sender['sender_name'],
+                          sender_email=sender['sender_email'], user_id=user.id, effects=effects)
+    wake_outbox_drain()
+    return item
+
+
+# ── Batch generation drafts ───────────────────────────
+_ai_batch_thread = None
+
+
+def import_batch_drafts(sheets, batch, results):
+    """Append an ended generation batch's emails to Email_Tracking as drafts for review.
+
+    Returns ``(imported, failed)``. Safe to repeat: a draft whose email_id
+    already exists is not appended again.
+    """
+    stage = batch['stage']
+    attachments = ';'.join(PIPELINE_STAGES.get(stage, {}).get('attachments', []))
+    tracking = sheets.get_snapshot('Email_Tracking', max_age=0)
+    drafts, failed = [], 0
+    for custom_id, job in batch['jobs'].items():
+        customer = job['customer']
+        text = results.get(custom_id)
+        try:
+            email_data = EmailPersonalizationEngine.parse_email(text, customer, stage) if text else None
+        except ValueError:
+            email_data = None
+        if not email_data:
+            failed += 1
+            continue
+        draft = create_email_log(customer.get('id', ''), customer, email_data.get('subject', ''),
+                                 email_data.get('body', ''), stage, attachments=attachments, status='draft',
+                                 email_type='batch_generated', reviewed_by='pending_review',
+                                 confidence=email_data.get('confidence_score', ''))
+        draft['email_id'] = f"BATCH{batch['id']}_{custom_id}"
+        draft['body'] = email_data.get('body', '')
+        if not tracking.find('email_id', draft['email_id']):
+            drafts.append(draft)
+    if drafts:
+        headers = sheets.ensure_columns('Email_Tracking', list(drafts[0].keys()))
+        sheets.append_rows('Email_Tracking', [[d.get(h, '') for h in headers] for d in drafts])
+    return len(batch['jobs']) - failed, failed
+
+
+def poll_ai_batches():
+    """Import the drafts of every ended generation batch, for all users. Usable outside a request."""
+    from models import User
+
+    summary = {'imported': 0, 'failed': 0, 'pending': 0}
+    for batch in ai_batches.claim_due():
+        try:
+            user = User.get_by_id(batch['user_id'])
+            if user is None:
+                ai_batches.finish(batch['id'], 'failed', error=f"User {batch['user_id']} no longer exists")
+                continue
+            results = collect_batch(batch_client(get_api_key(user)), batch['batch_id'])
+            if results is None:
+                summary['pending'] += 1
+                continue
+            imported, failed = import_batch_drafts(build_sheets_manager(user), batch, results)
+            ai_batches.finish(batch['id'], 'imported', imported, failed)
+            shared_cache.invalidate(f"user_{user.id}")
+            summary['imported'] += imported
+            summary['failed'] += failed
+        except Exception as e:
+            logger.warning(f"AI batch {batch['batch_id']} check failed: {e}")
+            if classify(e) == PERMANENT:
+                ai_batches.finish(batch['id'], 'failed', error=str(e))
+            else:
+                ai_batches.note_error(batch['id'], str(e))
+    if summary['imported'] or summary['failed']:
+        logger.info(f"AI batch poll: {summary}")
+    return summary
+
+
+def _ai_batch_poll_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            poll_ai_batches()
+        except Exception as e:
+            logger.warning(f"AI batch poll failed: {e}")
+
+
+def start_ai_batch_poll(interval=None):
+    """Start the background thread that imports finished generation batches (once per process)."""
+    global _ai_batch_thread
+    interval = AI_BATCH_POLL_INTERVAL if interval is None else interval
+    if interval <= 0 or _ai_batch_thread is not None:
+        return
+    _ai_batch_thread = threading.Thread(target=_ai_batch_poll_loop, args=(interval,),
+                                        name='ai-batch-poll', daemon=True)
+    _ai_batch_thread.start()
+
+
+# ── Background threads ────────────────────────────────
+BACKGROUND_THREADS = os.getenv('WEB_BACKGROUND_THREADS', '1') != '0'
+_background_lock = None
+
+
+def start_background_threads():
+    """Start mirror sync, outbox drain and batch polling in one web process per host.
+
+    Gunicorn workers race for a lock file under data/; the winner runs the
+    threads until it exits and the others only serve requests. Returns True
+    in the process that runs them.
+    """
+    global _background_lock
+    if _background_lock is None:
+        path = os.path.join(PROJECT_ROOT, 'data', 'background.lock')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lock = open(path, 'w')
+        try:
+            import fcntl
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except ImportError:
+            pass  # no flock (Windows dev server): a single process anyway
+        except OSError:
+            lock.close()
+            logger.info("Background threads run in another web process")
+            return False
+        _background_lock = lock
+    start_mirror_sync()
+    start_outbox_drain()
+    start_ai_batch_poll()
+    return True
+
+
 def get_segmentation_engine():
     """Get AI segmentation engine for current user."""
     api_key = get_api_key()
@@ -165,50 +465,100 @@ def get_segmentation_engine():
     return CustomerSegmentationEngine(api_key)
 
 
-def get_gmail_service_for_user():
-    """Get Gmail API service for the current user."""
-    from services.email_service import get_gmail_service
-    user = get_current_user()
+def get_generation_engine():
+    """Batch AI generation for the current user, drawing on their Anthropic rate-limit bucket."""
+    api_key = get_api_key()
+    if not api_key:
+        raise RuntimeError("Anthropic API key not configured.")
+    return AsyncGenerationEngine(api_key, concurrency=AI_CONCURRENCY,
+                                 limit_key=f"anthropic:{session.get('user_id', 'default')}")
+
+
+def get_gmail_service_for_user(user=None):
+    """Get Gmail API service for the current user (or ``user``).
+
+    Served from the process-wide pool: the token is decrypted and the
+    service built once per user and thread, not on every request.
+    """
+    user = user or get_current_user()
     if not user:
         raise RuntimeError("No authenticated user")
-    token_json = user.get_credential('gmail_token')
-    if not token_json:
+    service = gmail_pool.get(user.id, lambda: user.get_credential('gmail_token'),
+                             lambda token: user.set_credential('gmail_token', token))
+    if service is None and not user.has_credential('gmail_token'):
         raise RuntimeError("Gmail not configured. Please complete setup.")
-    result = get_gmail_service(token_json_str=token_json)
-    if isinstance(result, tuple):
-        service, updated_creds = result
-        if updated_creds and hasattr(updated_creds, 'token') and updated_creds.token:
-            updated_token = json.dumps({
-                'token': updated_creds.token,
-                'refresh_token': updated_creds.refresh_token,
-                'token_uri': updated_creds.token_uri,
-                'client_id': updated_creds.client_id,
-                'client_secret': updated_creds.client_secret,
-                'scopes': list(updated_creds.scopes) if updated_creds.scopes else [],
-            })
-            user.set_credential('gmail_token', updated_token)
-        return service
-    return result
-
-
-# ── Simple cache (per-user) ───────────────────────────
-_cache = {}
-CACHE_TTL = 60
-
-def cached_get_customers():
-    user_id = session.get('user_id', 'default')
-    key = f'customers_{user_id}'
-    if key in _cache and time.time() - _cache[key]['time'] < CACHE_TTL:
-        return _cache[key]['data']
-    data = get_sheets().get_customers()
-    _cache[key] = {'data': data, 'time': time.time()}
-    return data
-
-def invalidate_cache():
+    return service
+
+
+# ── Shared cache (per-user, all workers) ──────────────
+CACHE_TTL = int(os.getenv('SHARED_CACHE_TTL_SECONDS', '60'))
+shared_cache = SharedCache(ttl=CACHE_TTL)
+
+def _cache_namespace():
+    return f"user_{session.get('user_id', 'default')}"
+
+def cached_customer_snapshot(max_staleness=None):
+    """Indexed Customers snapshot, shared across workers for CACHE_TTL seconds.
+
+    With ``max_staleness`` the records are read stale-while-revalidate (see
+    ``GoogleSheetsManager.get_records_stale``); stale copies are not put in
+    the shared cache.
+    """
+    if 'customer_snapshot' not in g:
+        namespace = _cache_namespace()
+        entry = shared_cache.get(namespace, 'customers')
+        if entry is None:
+            version = shared_cache.version(namespace)
+            sheets = get_sheets()
+            if max_staleness is None:
+                entry = {'records': sheets.get_snapshot('Customers').records, 'as_of': time.time()}
+            else:
+                records, as_of = sheets.get_records_stale('Customers', max_staleness)
+                entry = {'records': records, 'as_of': as_of}
+            if time.time() - entry['as_of'] <= MIRROR_MAX_AGE:
+                shared_cache.set(namespace, 'customers', entry, version=version)
+        g.customer_snapshot = RecordSnapshot(entry['records'])
+        note_data_age(entry['as_of'])
+    return g.customer_snapshot
+
+def cached_get_customers(max_staleness=None):
+    return cached_customer_snapshot(max_staleness).records
+
+# ── Stale-while-revalidate reads ──────────────────────
+# Seconds a route may show an old mirror copy while it refreshes in the background
+ROUTE_MAX_STALENESS = {
+    'dashboard': int(os.getenv('DASHBOARD_MAX_STALENESS_SECONDS', '900')),
+    'tracking': int(os.getenv('TRACKING_MAX_STALENESS_SECONDS', '600')),
+}
+
+def get_stale_records(sheet_name, route):
+    """Records for a read-only page, allowing the route's configured staleness."""
+    records, as_of = get_sheets().get_records_stale(sheet_name, ROUTE_MAX_STALENESS[route])
+    note_data_age(as_of)
+    return records
+
+def note_data_age(as_of):
+    """Remember the oldest data timestamp used while rendering this request."""
+    g.data_as_of = min(g.get('data_as_of', as_of), as_of)
+
+def data_age():
+    """Age in seconds of stale data on the current page, or None if it is fresh."""
+    as_of = g.get('data_as_of')
+    if as_of is None:
+        return None
+    age = time.time() - as_of
+    return int(age) if age > MIRROR_MAX_AGE else None
+
+def invalidate_cache(mirror=False):
+    """Drop the user's cached reads; ``mirror=True`` also re-pulls the mirror after an out-of-band edit."""
     user_id = session.get('user_id', 'default')
-    keys_to_remove = [k for k in _cache if k.endswith(f'_{user_id}')]
-    for k in keys_to_remove:
-        del _cache[k]
+    shared_cache.invalidate(_cache_namespace())
+    g.pop('customer_snapshot', None)
+    g.pop('data_as_of', None)
+    # Writes through the sheets manager already reach the mirror; only an
+    # edit made outside the app needs the next read to re-pull Sheets.
+    if mirror and user_id != 'default':
+        SheetMirror.for_user(user_id).invalidate()
 
 # ── Workflow state (per-user, thread-safe) ─────────────
 workflow_lock = threading.Lock()
@@ -313,33 +663,8 @@ def is_valid_email(email):
     return bool(email and EMAIL_REGEX.match(email.strip()))
 
 # ── Reply classification ─────────────────────────────
-_REPLY_RULES = [
-    ('Declined', 10, ['not interested', 'unsubscribe', 'remove me', 'stop email',
-                       'no thank', 'no thanks', 'pass on', r'\bdecline\b']),
-    ('Quotation Request', 5, ['price', 'quote', 'quotation', r'\bcost\b', r'\bfob\b',
-                               r'\bcif\b', 'pricing']),
-    ('Sample Request', 4, ['sample', 'trial', r'\btest\b', r'\blab\b', '2-5kg', 'testing']),
-    ('Technical Info Request', 3, ['specification', 'technical', 'data sheet', 'purity',
-                                    r'\bsio2\b', 'boron', 'analysis', r'\bicp\b']),
-    ('Contract Request', 6, ['contract', 'agreement', r'\bterms\b', 'payment']),
-    ('Repeat Order', 9, ['repeat', 'reorder', 'bulk order', 'container']),
-    ('Shipping Inquiry', 7, ['delivery', 'shipping', 'invoice', r'\bcoa\b']),
-    ('Info Request', 2, ['interested', 'more info', 'tell me more', 'brochure']),
-]
-
-def classify_reply(reply_body):
-    """Classify a customer reply by type and detect pipeline stage (keyword-based)."""
-    text = reply_body.lower()
-    for label, stage, patterns in _REPLY_RULES:
-        for p in patterns:
-            if p.startswith(r'\b'):
-                if re.search(p, text):
-                    return label, stage
-            else:
-                if p in text:
-                    return label, stage
-    return 'General Reply', None
-
+# Keyword rules, classify_reply and SPAM_DOMAINS live in services.reply_rules
+# so the reply daemons can use them without importing the web app.
 
 def classify_reply_smart(
     reply_body,
@@ -554,6 +879,7 @@ def create_user_sheet_template(user):
     """
     from googleapiclient.discovery import build
     from google.oauth2.service_account import Credentials
+    from services.retry import authorized_http, execute
     import json
 
     # Get user's service account
@@ -568,7 +894,7 @@ def create_user_sheet_template(user):
     )
 
     # Create Sheets API service
-    service = build('sheets', 'v4', credentials=credentials)
+    service = build('sheets', 'v4', http=authorized_http(credentials))
 
     # Create spreadsheet with formatted header row
     spreadsheet = {
@@ -652,7 +978,8 @@ def create_user_sheet_template(user):
         }]
     }
 
-    result = service.spreadsheets().create(body=spreadsheet, fields='spreadsheetId').execute()
+    result = execute(service.spreadsheets().create(body=spreadsheet, fields='spreadsheetId'),
+                     service='sheets', idempotent=False)
     sheet_id = result['spreadsheetId']
 
     logger.info(f"Created Google Sheet {sheet_id} for user {user.email}")
@@ -14,7 +14,6 @@ from typing import Dict, List, Optional, Tuple
 import gspread
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-import anthropic
 import requests
 from bs4 import BeautifulSoup
 import base64
@@ -23,6 +22,10 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 
+from services.rate_limit import RateLimitedHTTPClient
+from services.retry import anthropic_client, authorized_http, execute
+from services.ai_generation import AIJob
+
 # Configuration
 ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY', '')
 GOOGLE_SHEETS_ID = os.environ.get('GOOGLE_SHEETS_ID', '')
@@ -66,13 +69,28 @@ class CustomerSegmentationEngine:
     """Analyze customer behavior and segment by engagement"""
     
     def __init__(self, api_key: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.client = anthropic_client(api_key)
     
     def analyze_customer_engagement(self, customer: Dict, email_history: List[Dict]) -> Dict:
         """Analyze customer's engagement level and intent"""
-        
-        # Collect engagement signals
-        signals = {
+        signals = self._engagement_signals(customer, email_history)
+        try:
+            message = self.client.messages.create(**self._engagement_request(customer, signals))
+            return self._parse_engagement(message.content[0].text, signals)
+
+        except Exception as e:
+            print(f"⚠️ Engagement analysis failed: {e}")
+            return self.default_analysis()
+
+    def engagement_job(self, key, customer: Dict, email_history: List[Dict]) -> AIJob:
+        """``analyze_customer_engagement`` as a job for ``AsyncGenerationEngine`` (not cached)"""
+        signals = self._engagement_signals(customer, email_history)
+        return AIJob(key, lambda: self._engagement_request(customer, signals),
+                     lambda text: self._parse_engagement(text, signals))
+
+    def _engagement_signals(self, customer: Dict, email_history: List[Dict]) -> Dict:
+        """Collect engagement signals"""
+        return {
             'emails_sent': len(email_history),
             'emails_opened': sum(1 for e in email_history if e.get('opened') == 'yes'),
             'emails_replied': sum(1 for e in email_history if e.get('replied') == 'yes'),
@@ -80,8 +98,9 @@ class CustomerSegmentationEngine:
             'reply_content': self._extract_reply_content(email_history),
             'current_stage': customer.get('pipeline_stage', 1)
         }
-        
-        # AI analysis of engagement
+
+    @staticmethod
+    def _engagement_request(customer: Dict, signals: Dict) -> Dict:
         analysis_prompt = f"""Analyze this B2B customer's engagement level for quartz export business.
 
 Customer: {customer.get('company_name')}
@@ -107,34 +126,26 @@ Analyze and provide:
 7. key_interests: What they've shown interest in
 
 Format as JSON."""
+        return {
+            'model': "claude-sonnet-4-20250514",
+            'max_tokens': 1000,
+            'messages': [{"role": "user", "content": analysis_prompt}],
+        }
+
+    def _parse_engagement(self, response_text: str, signals: Dict) -> Dict:
+        # Extract JSON
+        if '{' in response_text and '}' in response_text:
+            json_start = response_text.index('{')
+            json_end = response_text.rindex('}') + 1
+            analysis = json.loads(response_text[json_start:json_end])
+        else:
+            analysis = self.default_analysis()
+
+        # Add raw signals
+        analysis['signals'] = signals
+        analysis['analysis_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return analysis
 
-        try:
-            message = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=1000,
-                messages=[{"role": "user", "content": analysis_prompt}]
-            )
-            
-            response_text = message.content[0].text
-            
-            # Extract JSON
-            if '{' in response_text and '}' in response_text:
-                json_start = response_text.index('{')
-                json_end = response_text.rindex('}') + 1
-                analysis = json.loads(response_text[json_start:json_end])
-            else:
-                analysis = self._default_analysis()
-            
-            # Add raw signals
-            analysis['signals'] = signals
-            analysis['analysis_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            return analysis
-            
-        except Exception as e:
-            print(f"⚠️ Engagement analysis failed: {e}")
-            return self._default_analysis()
-    
     def _get_last_interaction_date(self, email_history: List[Dict]) -> str:
         """Get last interaction date"""
         if not email_history:
@@ -161,8 +172,8 @@ Format as JSON."""
                 replies.append(email['reply_content_summary'])
         return ' | '.join(replies) if replies else ""
     
-    def _default_analysis(self) -> Dict:
-        """Default analysis structure"""
+    def default_analysis(self) -> Dict:
+        """Default analysis structure, also used when an analysis job fails"""
         return {
             'engagement_level': 'INTERESTED',
             'buying_intent': 'medium',
@@ -200,7 +211,7 @@ class AutomatedEmailSender:
             with open('token.json', 'w') as token:
                 token.write(creds.to_json())
         
-        self.service = build('gmail', 'v1', credentials=creds)
+        self.service = build('gmail', 'v1', http=authorized_http(creds))
     
     def send_email(self, to: str, subject: str, body: str, attachments: List[str] = None) -> bool:
         """Send email via Gmail API"""
@@ -222,7 +233,7 @@ class AutomatedEmailSender:
             raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
             send_message = {'raw': raw_message}
             
-            self.service.users().messages().send(userId='me', body=send_message).execute()
+            execute(self.service.users().messages().send(userId='me', body=send_message), idempotent=False)
             print(f"✅ Email sent to {to}")
             return True
             
@@ -244,7 +255,7 @@ class FollowUpManager:
     """Manage automated follow-up sequences"""
     
     def __init__(self, api_key: str, sheets_manager, email_sender):
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.client = anthropic_client(api_key)
         self.sheets = sheets_manager
         self.sender = email_sender
     
@@ -608,7 +619,7 @@ class GoogleSheetsManager:
             'https://www.googleapis.com/auth/drive'
         ]
         creds = Credentials.from_service_account_file('google_credentials.json', scopes=scope)
-        self.client = gspread.authorize(creds)
+        self.client = gspread.authorize(creds, http_client=RateLimitedHTTPClient)
         self.workbook = self.client.open_by_key(self.spreadsheet_id)
     
     def get_worksheet(self, sheet_name: str):
@@ -6,19 +6,39 @@ Handles AI Research, Email Tracking, and Auto-Reply Generation
 import os
 import json
 import time
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import gspread
+from gspread.utils import rowcol_to_a1, ValueInputOption
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-import anthropic
 import requests
 from bs4 import BeautifulSoup
 
+from services.sheet_writes import SheetWriteBuffer, append_rows_chunked
+from services.sheet_mirror import MIRRORED_SHEETS
+from services.storage import StorageBackend
+from services.sheet_meta import metadata_cache
+from services.single_flight import sheet_reads
+from services.rate_limit import RateLimitedHTTPClient
+from services.retry import anthropic_client, authorized_http
+from services.gmail_fetch import list_message_ids, batch_get_messages, fetch_relevant_messages, reply_match_keys
+from services.inbox_sync import InboxSync
+from services.ai_cache import ai_cache, cached_prefix, RESEARCH_TTL, EMAIL_TTL
+from services.ai_generation import AIJob
+
 # Configuration
 ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY', '')
 GOOGLE_SHEETS_ID = os.environ.get('GOOGLE_SHEETS_ID', '')
 GMAIL_CREDENTIALS_PATH = os.environ.get('GMAIL_CREDENTIALS_PATH', 'gmail_credentials.json')
+APPEND_FLUSH_ROWS = 25  # buffered log rows written before the end of a batch_writes block
+# Small model for the one personalised sentence in a segment template email
+PERSONAL_LINE_MODEL = os.environ.get('PERSONAL_LINE_MODEL', 'claude-haiku-4-5-20251001')
+
+# (spreadsheet_id, sheet) pairs with a background mirror refresh running
+_refreshing = set()
+_refreshing_lock = threading.Lock()
 
 # Pipeline stage configurations
 PIPELINE_STAGES = {
@@ -85,14 +105,21 @@ PIPELINE_STAGES = {
 }
 
 
-class GoogleSheetsManager:
+class GoogleSheetsManager(StorageBackend):
     """Manages interactions with Google Sheets"""
+
+    name = 'sheets'
     
     def __init__(self, spreadsheet_id: str):
+        super().__init__()
         self.spreadsheet_id = spreadsheet_id
         self.client = None
+        self.identity = None  # service account the client reads as
         self.sheets = {}
-        
+        self.writes = SheetWriteBuffer()
+        self.mirror = None
+        self._pending_appends = {}
+
     def authenticate(self):
         """Authenticate with Google Sheets API using service account file."""
         scope = [
@@ -101,7 +128,8 @@ class GoogleSheetsManager:
         ]
         sa_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'service_account.json')
         creds = Credentials.from_service_account_file(sa_path, scopes=scope)
-        self.client = gspread.authorize(creds)
+        self.identity = creds.service_account_email
+        self.client = gspread.authorize(creds, http_client=RateLimitedHTTPClient)
         self.workbook = self.client.open_by_key(self.spreadsheet_id)
 
     def authenticate_from_json(self, service_account_json: str):
@@ -112,75 +140,276 @@ class GoogleSheetsManager:
         ]
         sa_info = json.loads(service_account_json) if isinstance(service_account_json, str) else service_account_json
         creds = Credentials.from_service_account_info(sa_info, scopes=scope)
-        self.client = gspread.authorize(creds)
+        self.identity = creds.service_account_email
+        self.client = gspread.authorize(creds, http_client=RateLimitedHTTPClient)
         self.workbook = self.client.open_by_key(self.spreadsheet_id)
         
     def get_worksheet(self, sheet_name: str):
-        """Get or create worksheet"""
+        """Get or create worksheet.
+
+        Handles are built from worksheet properties cached per spreadsheet, so
+        metadata is fetched once per METADATA_TTL rather than on every call.
+        """
+        if sheet_name in self.sheets:
+            return self.sheets[sheet_name]
+        props = metadata_cache.get_properties(self.spreadsheet_id, sheet_name)
+        if props is None:
+            metadata_cache.set_metadata(self.spreadsheet_id, self.workbook.fetch_sheet_metadata())
+            props = metadata_cache.get_properties(self.spreadsheet_id, sheet_name)
+        if props is not None:
+            sheet = gspread.Worksheet(self.workbook, dict(props), self.spreadsheet_id, self.workbook.client)
+        else:
+            sheet = self.workbook.add_worksheet(title=sheet_name, rows=1000, cols=20)
+            metadata_cache.add_properties(self.spreadsheet_id, dict(sheet._properties))
+        self.sheets[sheet_name] = sheet
+        return sheet
+
+    def get_headers(self, sheet_name: str) -> List[str]:
+        """Header row of a worksheet, from the shared cache when possible."""
+        headers = metadata_cache.get_headers(self.spreadsheet_id, sheet_name)
+        if headers is None:
+            headers = self.get_worksheet(sheet_name).row_values(1)
+            metadata_cache.set_headers(self.spreadsheet_id, sheet_name, headers)
+        return headers
+
+    def ensure_columns(self, sheet_name: str, columns: List[str]) -> List[str]:
+        """Append any missing header columns and return the (possibly extended) header row.
+
+        Only touches Sheets when a column is actually missing; the header cache
+        version is bumped so every manager in the process sees the new row.
+        """
+        headers = self.get_headers(sheet_name)
+        if all(c in headers for c in columns):
+            return headers
+
+        sheet = self.get_worksheet(sheet_name)
+        headers = sheet.row_values(1)  # re-read: another process may have added them
+        missing = [c for c in columns if c not in headers]
+        if missing:
+            start = len(headers) + 1
+            end = start + len(missing) - 1
+            if end > sheet.col_count:
+                sheet.add_cols(end - sheet.col_count)
+            sheet.batch_update([{'range': f"{rowcol_to_a1(1, start)}:{rowcol_to_a1(1, end)}", 'values': [missing]}],
+                               value_input_option=ValueInputOption.user_entered)
+            if self.mirror is not None and sheet_name in MIRRORED_SHEETS:
+                self.mirror.apply_cells(sheet_name, {(1, start + i): c for i, c in enumerate(missing)})
+            headers = headers + missing
+            self._forget_reads(sheet_name)
+        metadata_cache.bump(self.spreadsheet_id, sheet_name, headers)
+        return headers
+
+    def flush_writes(self) -> List[Dict]:
+        """Flush queued cell updates and buffered row appends. Returns flush reports."""
+        reports = self.writes.flush(on_report=self._cells_written)
+        self._flush_appends()
+        return reports
+
+    def _cells_written(self, report: Dict):
+        self._snapshots.pop(report['worksheet'], None)
+        self._forget_reads(report['worksheet'])
+        if self.mirror is not None and report['worksheet'] in MIRRORED_SHEETS:
+            self.mirror.apply_cells(report['worksheet'], report['written'])
+
+    def _flush_appends(self):
+        pending, self._pending_appends = self._pending_appends, {}
+        for sheet_name, rows in pending.items():
+            self.append_rows(sheet_name, rows)
+
+    def append_rows(self, sheet_name: str, rows: List[List], progress=None) -> Dict:
+        """Append rows (ordered like the header row) in chunked append_rows calls.
+
+        ``progress(done, total)`` is called after each chunk. Returns a report
+        with row/chunk/retry counts and latency.
+        """
+        sheet = self.get_worksheet(sheet_name)
+
+        def written(chunk):
+            if self.mirror is not None and sheet_name in MIRRORED_SHEETS:
+                self.mirror.append_rows(sheet_name, chunk)
+
         try:
-            return self.workbook.worksheet(sheet_name)
-        except gspread.WorksheetNotFound:
-            return self.workbook.add_worksheet(title=sheet_name, rows=1000, cols=20)
-    
-    def get_customers(self, status: Optional[str] = None) -> List[Dict]:
-        """Get customer list from sheet"""
-        sheet = self.get_worksheet('Customers')
-        records = sheet.get_all_records()
-        
-        if status:
-            return [r for r in records if r.get('research_status') == status]
+            return append_rows_chunked(sheet, rows, progress=progress, on_chunk=written)
+        finally:
+            self._snapshots.pop(sheet_name, None)
+            self._forget_reads(sheet_name)
+
+    def delete_row(self, sheet_name: str, row: int):
+        """Delete one row; the mirror copy is re-pulled since later rows shift up."""
+        self.flush_writes()
+        self.get_worksheet(sheet_name).delete_rows(row)
+        self._snapshots.pop(sheet_name, None)
+        self._forget_reads(sheet_name)
+        if self.mirror is not None and sheet_name in MIRRORED_SHEETS:
+            self.mirror.invalidate([sheet_name])
+
+    def attach_mirror(self, mirror):
+        """Serve Customers/Email_Tracking reads from a local SheetMirror."""
+        self.mirror = mirror
+
+    def sync_mirror(self, sheet_names=MIRRORED_SHEETS, force: bool = False) -> Dict:
+        """Pull changed sheets into the mirror.
+
+        Sheets are skipped when the spreadsheet's modifiedTime matches the last
+        pull, unless ``force`` is set. Returns per-sheet sync results.
+        """
+        if self.mirror is None:
+            return {}
+        remote_modified, _ = sheet_reads.do(self._read_key('modified'),
+                                            self.workbook.get_lastUpdateTime)
+        results = {}
+        for name in sheet_names:
+            meta = self.mirror.sheet_meta(name)
+            if not force and meta and meta['remote_modified'] == remote_modified:
+                self.mirror.mark_checked(name)
+                results[name] = {'skipped': True}
+                continue
+            start = time.time()
+            values = self._fetch_values(name)
+            results[name] = self.mirror.store_sheet(name, values, remote_modified)
+            results[name]['latency_ms'] = round((time.time() - start) * 1000, 1)
+        return results
+
+    def get_records(self, sheet_name: str, max_age: Optional[int] = None) -> List[Dict]:
+        """All records of a worksheet, served from the mirror when one is attached.
+
+        Callers that write back by row number pass ``max_age=0`` so the
+        mirror is checked against Sheets before the rows are used.
+        """
+        if self.mirror is None or sheet_name not in MIRRORED_SHEETS:
+            return self._fetch_records(sheet_name)
+        if self.mirror.needs_sync(sheet_name, max_age):
+            try:
+                self.sync_mirror([sheet_name])
+            except Exception as e:
+                print(f"Mirror sync failed for {sheet_name}: {e}")
+        records = self.mirror.get_records(sheet_name)
+        if records is None:
+            return self._fetch_records(sheet_name)
         return records
-    
-    def update_customer(self, customer_id: str, updates: Dict):
-        """Update customer record"""
-        sheet = self.get_worksheet('Customers')
-        cell = sheet.find(customer_id)
-        
-        if cell:
-            row = cell.row
-            headers = sheet.row_values(1)
-            
-            for key, value in updates.items():
-                if key in headers:
-                    col = headers.index(key) + 1
-                    sheet.update_cell(row, col, value)
+
+    def get_records_stale(self, sheet_name: str, max_staleness: int):
+        """Records served stale-while-revalidate. Returns ``(records, as_of)``.
+
+        A mirrored copy older than the normal freshness window but younger
+        than ``max_staleness`` seconds is returned at once while a background
+        thread refreshes it. Older copies (or none at all) are refreshed
+        before returning; if that refresh fails, an existing copy is still
+        served. ``as_of`` is when the copy was last confirmed against Sheets.
+        """
+        if self.mirror is None or sheet_name not in MIRRORED_SHEETS:
+            return self._fetch_records(sheet_name), time.time()
+        meta = self.mirror.sheet_meta(sheet_name)
+        if meta is not None and not self.mirror.needs_sync(sheet_name):
+            return self.mirror.get_records(sheet_name), meta['synced_at']
+        if meta is not None and time.time() - meta['synced_at'] <= max_staleness:
+            self.refresh_in_background(sheet_name)
+            return self.mirror.get_records(sheet_name), meta['synced_at']
+        try:
+            self.sync_mirror([sheet_name])
+        except Exception as e:
+            records = self.mirror.get_records(sheet_name) if meta is not None else None
+            if records is None:
+                raise
+            print(f"⚠️ Refresh of {sheet_name} failed, serving the copy from {meta['synced_at']:.0f}: {e}")
+            return records, meta['synced_at']
+        return self.mirror.get_records(sheet_name), time.time()
+
+    def refresh_in_background(self, sheet_name: str) -> bool:
+        """Start a mirror sync for one sheet unless one is already running."""
+        key = (self.spreadsheet_id, sheet_name)
+        with _refreshing_lock:
+            if key in _refreshing:
+                return False
+            _refreshing.add(key)
+
+        def run():
+            try:
+                self.sync_mirror([sheet_name])
+            except Exception as e:
+                print(f"Background refresh failed for {sheet_name}: {e}")
+            finally:
+                with _refreshing_lock:
+                    _refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True, name=f'refresh-{sheet_name}').start()
+        return True
+
+    # Remote reads go through sheet_reads, so concurrent requests for the same
+    # worksheet share one API call instead of each fetching it.
+    def _read_key(self, kind: str, *sheet_name: str) -> tuple:
+        """Single-flight key; only readers with the same credentials may share a fetch."""
+        return (kind, self.identity, self.spreadsheet_id, *sheet_name)
+
+    def _fetch_records(self, sheet_name: str) -> List[Dict]:
+        records, shared = sheet_reads.do(self._read_key('records', sheet_name),
+                                         lambda: self.get_worksheet(sheet_name).get_all_records())
+        return [dict(r) for r in records] if shared else records
+
+    def _fetch_values(self, sheet_name: str) -> List[List]:
+        values, _ = sheet_reads.do(self._read_key('values', sheet_name),
+                                   lambda: self.get_worksheet(sheet_name).get(pad_values=True))
+        return values
+
+    def _forget_reads(self, sheet_name: str):
+        """Keep reads issued after a write from joining a fetch that began before it."""
+        for kind in ('records', 'values'):
+            sheet_reads.forget(self._read_key(kind, sheet_name))
+        sheet_reads.forget(self._read_key('modified'))
+
+    def update_cell(self, sheet_name: str, row: int, col: int, value):
+        """Queue a single cell update (flushed immediately outside batch_writes)."""
+        self.writes.queue(self.get_worksheet(sheet_name), row, col, value)
+        if not self._batch_depth:
+            self.flush_writes()
+
+    def update_row(self, sheet_name: str, row: int, updates: Dict, headers: Optional[List] = None) -> int:
+        """Queue updates for one row keyed by column header. Returns the number of cells queued."""
+        sheet = self.get_worksheet(sheet_name)
+        if headers is None:
+            headers = self.get_headers(sheet_name)
+        queued = self.writes.queue_row(sheet, row, headers, updates)
+        if not self._batch_depth:
+            self.flush_writes()
+        return queued
     
     def log_email(self, email_data: Dict):
-        """Log sent email to tracking sheet"""
-        sheet = self.get_worksheet('Email_Tracking')
-        
+        """Log sent email to tracking sheet (buffered inside batch_writes)"""
         # Get headers
-        headers = sheet.row_values(1)
+        headers = self.get_headers('Email_Tracking')
         if not headers:
             headers = list(email_data.keys())
-            sheet.append_row(headers)
+            self.get_worksheet('Email_Tracking').append_row(headers)
+            metadata_cache.bump(self.spreadsheet_id, 'Email_Tracking', headers)
+            if self.mirror is not None:
+                self.mirror.invalidate(['Email_Tracking'])
         
         # Append email log
         row = [email_data.get(h, '') for h in headers]
-        sheet.append_row(row)
-    
-    def get_pending_reviews(self) -> List[Dict]:
-        """Get emails pending human review"""
-        sheet = self.get_worksheet('Email_Tracking')
-        records = sheet.get_all_records()
-        return [r for r in records if r.get('reviewed_by') == 'pending_review']
+        if not self._batch_depth:
+            self.append_rows('Email_Tracking', [row])
+            return
+        pending = self._pending_appends.setdefault('Email_Tracking', [])
+        pending.append(row)
+        if len(pending) >= APPEND_FLUSH_ROWS:
+            self._flush_appends()
 
 
 class AIResearchEngine:
     """AI-powered customer research"""
     
     def __init__(self, api_key: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.client = anthropic_client(api_key)
         
-    def research_company(self, company_name: str, website: str) -> Dict:
-        """Perform AI research on a company"""
+    def research_company(self, company_name: str, website: str, fresh: bool = False) -> Dict:
+        """Perform AI research on a company (``fresh`` skips the response cache)"""
         print(f"🔍 Researching: {company_name}")
         
         # Step 1: Scrape website
         website_content = self._scrape_website(website)
         
         # Step 2: AI Analysis
-        research_data = self._analyze_with_ai(company_name, website_content)
+        research_data = self._analyze_with_ai(company_name, website_content, fresh)
         
         return research_data
     
@@ -240,9 +469,30 @@ class AIResearchEngine:
             print(f"Website scraping failed: {e}")
             return ""
     
-    def _analyze_with_ai(self, company_name: str, website_content: str) -> Dict:
+    def _analyze_with_ai(self, company_name: str, website_content: str, fresh: bool = False) -> Dict:
         """Use Claude to analyze company and generate insights"""
-        
+        try:
+            # Same company and website text within the TTL: served from the cache
+            response_text = ai_cache.complete(
+                self.client, 'research', RESEARCH_TTL, bypass=fresh,
+                **self._research_request(company_name, website_content)
+            )
+            return self._parse_research(response_text)
+
+        except Exception as e:
+            print(f"⚠️ AI analysis failed: {e}")
+            return dict(RESEARCH_FAILED)
+
+    def research_job(self, key, company_name: str, website: str, fresh: bool = False, pace=None) -> AIJob:
+        """``research_company`` as a job for ``AsyncGenerationEngine``; ``pace()`` runs before the scrape"""
+        def prepare():
+            if pace:
+                pace()
+            return self._research_request(company_name, self._scrape_website(website))
+        return AIJob(key, prepare, self._parse_research, 'research', RESEARCH_TTL, fresh)
+
+    @staticmethod
+    def _research_request(company_name: str, website_content: str) -> Dict:
         prompt = f"""Analyze this company for B2B outreach in the high-purity quartz mining industry.
 
 Company: {company_name}
@@ -256,48 +506,42 @@ Please provide:
 5. Estimated company size (Small/Medium/Large)
 
 Format as JSON with keys: summary, industry, pain_points, outreach_approach, company_size"""
+        return {
+            'model': "claude-sonnet-4-5-20250929",
+            'max_tokens': 1000,
+            'messages': [{"role": "user", "content": prompt}],
+        }
 
-        try:
-            message = self.client.messages.create(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=1000,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            response_text = message.content[0].text
-            
-            # Try to extract JSON from response
-            if '{' in response_text and '}' in response_text:
-                json_start = response_text.index('{')
-                json_end = response_text.rindex('}') + 1
-                research_data = json.loads(response_text[json_start:json_end])
-            else:
-                research_data = {
-                    "summary": response_text[:200],
-                    "industry": "Unknown",
-                    "pain_points": "Requires manual review",
-                    "outreach_approach": "Standard introduction",
-                    "company_size": "Unknown"
-                }
-            
-            return research_data
-            
-        except Exception as e:
-            print(f"⚠️ AI analysis failed: {e}")
-            return {
-                "summary": "Research failed - manual review needed",
-                "industry": "Unknown",
-                "pain_points": "",
-                "outreach_approach": "Standard approach",
-                "company_size": "Unknown"
-            }
+    @staticmethod
+    def _parse_research(response_text: str) -> Dict:
+        # Try to extract JSON from response
+        if '{' in response_text and '}' in response_text:
+            json_start = response_text.index('{')
+            json_end = response_text.rindex('}') + 1
+            return json.loads(response_text[json_start:json_end])
+        return {
+            "summary": response_text[:200],
+            "industry": "Unknown",
+            "pain_points": "Requires manual review",
+            "outreach_approach": "Standard introduction",
+            "company_size": "Unknown"
+        }
+
+
+RESEARCH_FAILED = {
+    "summary": "Research failed - manual review needed",
+    "industry": "Unknown",
+    "pain_points": "",
+    "outreach_approach": "Standard approach",
+    "company_size": "Unknown"
+}
 
 
 class EmailPersonalizationEngine:
     """Generate personalized emails with AI"""
 
     def __init__(self, api_key: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.client = anthropic_client(api_key)
         self.sender_name = os.getenv('SENDER_NAME', 'Sales Team')
         self.sender_title = os.getenv('SENDER_TITLE', '')
         self.company_name = os.getenv('COMPANY_NAME', 'Lorh La Seng Commercial')
@@ -319,82 +563,187 @@ class EmailPersonalizationEngine:
             sig += f"\n{self.company_address}"
         return sig
 
-    def generate_email(self, customer: Dict, research: Dict, stage: int, context: str = "") -> Dict:
-        """Generate personalized email based on customer data and pipeline stage"""
+    def generate_email(self, customer: Dict, research: Dict, stage: int, context: str = "",
+                       fresh: bool = False) -> Dict:
+        """Generate personalized email based on customer data and pipeline stage
 
-        stage_name = PIPELINE_STAGES[stage]["name"]
-        signature = self._build_signature()
+        Identical inputs return the cached email; ``fresh`` writes a new version.
+        """
+        try:
+            response_text = ai_cache.complete(
+                self.client, 'email', EMAIL_TTL, bypass=fresh,
+                **self._email_request(customer, research, stage, context)
+            )
+            return self.parse_email(response_text, customer, stage)
 
-        prompt = f"""Generate a professional B2B sales email for a high-purity quartz export company.
+        except Exception as e:
+            print(f"⚠️ Email generation failed: {e}")
+            return None
 
-Customer Details:
-- Company: {customer.get('company_name')}
-- Contact: {customer.get('contact_name')}
-- Industry: {research.get('industry', 'Manufacturing')}
-- Pain Points: {research.get('pain_points', 'Need reliable quartz supplier')}
+    def email_job(self, key, customer: Dict, research: Dict, stage: int, context: str = "",
+                  fresh: bool = False) -> AIJob:
+        """``generate_email`` as a job for ``AsyncGenerationEngine``"""
+        return AIJob(key, lambda: self._email_request(customer, research, stage, context),
+                     lambda text: self.parse_email(text, customer, stage), 'email', EMAIL_TTL, fresh)
 
-Pipeline Stage: {stage_name} (Stage {stage})
-Company Research: {research.get('summary', '')}
-Additional Context: {context}
+    def email_batch_request(self, custom_id: str, customer: Dict, research: Dict, stage: int,
+                            context: str = "") -> Dict:
+        """``generate_email`` as one Message Batches request; parse its text with ``parse_email``"""
+        return {'custom_id': custom_id, 'params': self._email_request(customer, research, stage, context)}
+
+    def _email_instructions(self) -> str:
+        """Static part of every email prompt: role, sender, stages, requirements and signature"""
+        stages = '\n'.join(f"- Stage {n}: {info['name']} (attachments: {', '.join(info['attachments']) or 'none'})"
+                           for n, info in sorted(PIPELINE_STAGES.items()))
+        return f"""You write professional B2B sales emails for a high-purity quartz export company.
 
 Sender Information:
 - Name: {self.sender_name}
 - Title: {self.sender_title}
 - Company: {self.company_name}
 
+Pipeline Stages:
+{stages}
+
 Email Requirements:
 1. Professional B2B tone
-2. Personalized to their industry and pain points
+2. Personalized to the customer's industry and pain points
 3. Clear value proposition for high-purity quartz
-4. Appropriate for {stage_name} stage
+4. Appropriate for the customer's pipeline stage
 5. Include relevant call-to-action
 6. Keep it concise (150-250 words)
 7. End the email body with this EXACT signature:
 
-{signature}
+{self._build_signature()}
 
 Generate:
 - Subject line
 - Email body (MUST end with the signature above)
-- Suggested attachments (from: {', '.join(PIPELINE_STAGES[stage]['attachments'])})
+- Suggested attachments (from the attachments of the customer's stage)
 
 Format as JSON with keys: subject, body, attachments, confidence_score"""
 
+    def _email_request(self, customer: Dict, research: Dict, stage: int, context: str) -> Dict:
+        stage_name = PIPELINE_STAGES[stage]["name"]
+
+        # Only this part changes per customer; the instructions are a cached prefix
+        prompt = f"""Generate the email for this customer.
+
+Customer Details:
+- Company: {customer.get('company_name')}
+- Contact: {customer.get('contact_name')}
+- Industry: {research.get('industry', 'Manufacturing')}
+- Pain Points: {research.get('pain_points', 'Need reliable quartz supplier')}
+
+Pipeline Stage: {stage_name} (Stage {stage})
+Attachments for this stage: {', '.join(PIPELINE_STAGES[stage]['attachments'])}
+Company Research: {research.get('summary', '')}
+Additional Context: {context}"""
+        return {
+            'model': "claude-sonnet-4-5-20250929",
+            'max_tokens': 1500,
+            'system': cached_prefix(self._email_instructions()),
+            'messages': [{"role": "user", "content": prompt}],
+        }
+
+    def generate_template(self, stage: int, industry: str, fresh: bool = False) -> Optional[Dict]:
+        """One email for every customer of ``industry`` at ``stage``, with ``{{slot}}`` placeholders
+
+        Filled in per customer by ``services.segment_templates.fill_template``.
+        """
         try:
-            message = self.client.messages.create(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=1500,
-                messages=[{"role": "user", "content": prompt}]
+            response_text = ai_cache.complete(
+                self.client, 'template', EMAIL_TTL, bypass=fresh,
+                **self._template_request(stage, industry)
             )
-            
-            response_text = message.content[0].text
-            
-            # Extract JSON
-            if '{' in response_text and '}' in response_text:
-                json_start = response_text.index('{')
-                json_end = response_text.rindex('}') + 1
-                email_data = json.loads(response_text[json_start:json_end])
-            else:
-                email_data = {
-                    "subject": f"High-Purity Quartz Solutions for {customer.get('company_name')}",
-                    "body": response_text,
-                    "attachments": PIPELINE_STAGES[stage]["attachments"],
-                    "confidence_score": 0.5
-                }
-            
-            return email_data
-            
+            return self.parse_email(response_text, {'company_name': '{{company_name}}'}, stage)
+
         except Exception as e:
-            print(f"⚠️ Email generation failed: {e}")
+            print(f"⚠️ Template generation failed: {e}")
             return None
 
+    def template_job(self, key, stage: int, industry: str, fresh: bool = False) -> AIJob:
+        """``generate_template`` as a job for ``AsyncGenerationEngine``"""
+        return AIJob(key, lambda: self._template_request(stage, industry),
+                     lambda text: self.parse_email(text, {'company_name': '{{company_name}}'}, stage),
+                     'template', EMAIL_TTL, fresh)
+
+    def _template_request(self, stage: int, industry: str) -> Dict:
+        stage_name = PIPELINE_STAGES[stage]["name"]
+        prompt = f"""Generate one email that will be sent to every customer in this segment.
+
+Segment:
+- Industry: {industry}
+- Pipeline Stage: {stage_name} (Stage {stage})
+- Attachments for this stage: {', '.join(PIPELINE_STAGES[stage]['attachments'])}
+
+It is filled in per customer, so it must read as personal once these placeholders are replaced. Use them exactly as written, with double braces:
+- {{{{contact_name}}}}: the contact's first name, in the greeting
+- {{{{company_name}}}}: the customer's company
+- {{{{personal_line}}}}: one sentence about this customer, on its own line after the greeting (it may be left empty)
+
+Do not use any other placeholders, and do not state facts about any single company."""
+        return {
+            'model': "claude-sonnet-4-5-20250929",
+            'max_tokens': 1500,
+            'system': cached_prefix(self._email_instructions()),
+            'messages': [{"role": "user", "content": prompt}],
+        }
+
+    def generate_personal_line(self, customer: Dict, research: Dict, stage: int) -> str:
+        """One personalised sentence for a template email, from a small model ('' if it fails)"""
+        try:
+            line = ai_cache.complete(self.client, 'email_line', EMAIL_TTL,
+                                     **self._personal_line_request(customer, research, stage))
+            return line.strip().strip('"')
+        except Exception as e:
+            print(f"⚠️ Personal line generation failed: {e}")
+            return ""
+
+    @staticmethod
+    def _personal_line_request(customer: Dict, research: Dict, stage: int) -> Dict:
+        prompt = f"""Write one sentence (at most 30 words) for a B2B email from a high-purity quartz supplier that connects our quartz to this customer's situation. Return only the sentence.
+
+Company: {customer.get('company_name')}
+Industry: {research.get('industry', 'Manufacturing')}
+Pain Points: {research.get('pain_points', '')}
+Company Research: {research.get('summary', '')}
+Pipeline Stage: {PIPELINE_STAGES[stage]["name"]}"""
+        return {
+            'model': PERSONAL_LINE_MODEL,
+            'max_tokens': 120,
+            'messages': [{"role": "user", "content": prompt}],
+        }
+
+    @staticmethod
+    def parse_email(response_text: str, customer: Dict, stage: int) -> Dict:
+        # Extract JSON
+        if '{' in response_text and '}' in response_text:
+            json_start = response_text.index('{')
+            json_end = response_text.rindex('}') + 1
+            return json.loads(response_text[json_start:json_end])
+        return {
+            "subject": f"High-Purity Quartz Solutions for {customer.get('company_name')}",
+            "body": response_text,
+            "attachments": PIPELINE_STAGES[stage]["attachments"],
+            "confidence_score": 0.5
+        }
+
 
 class EmailTracker:
     """Monitor and track email responses"""
     
-    def __init__(self, credentials_path: str):
+    def __init__(self, credentials_path: str, limit_key: Optional[str] = None):
         self.credentials_path = credentials_path
         self.service = None
+        self.limit_key = limit_key
+
+    @classmethod
+    def from_service(cls, service, limit_key: Optional[str] = None):
+        """Tracker around an already-authenticated Gmail service."""
+        tracker = cls('', limit_key)
+        tracker.service = service
+        return tracker
         
     def authenticate(self):
         """Authenticate with Gmail API"""
@@ -415,10 +764,14 @@ class EmailTracker:
             with open('token.json', 'w') as token:
                 token.write(creds.to_json())
         
-        self.service = build('gmail', 'v1', credentials=creds)
+        self.service = build('gmail', 'v1', http=authorized_http(creds))
     
-    def check_new_replies(self, since_hours: int = 24) -> List[Dict]:
-        """Check for new customer replies"""
+    def check_new_replies(self, since_hours: int = 24, keep=None) -> List[Dict]:
+        """Check for new customer replies
+
+        ``keep(metadata_message)`` filters on headers before any body is
+        downloaded (see services/gmail_fetch.fetch_relevant_messages).
+        """
         if not self.service:
             self.authenticate()
         
@@ -427,35 +780,44 @@ class EmailTracker:
         query = f'is:unread after:{time_threshold.strftime("%Y/%m/%d")}'
         
         try:
-            results = self.service.users().messages().list(userId='me', q=query).execute()
-            messages = results.get('messages', [])
-            
-            replies = []
-            for msg in messages:
-                msg_data = self.service.users().messages().get(userId='me', id=msg['id']).execute()
-                
-                # Extract email details
-                headers = msg_data['payload']['headers']
-                subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
-                sender = next((h['value'] for h in headers if h['name'] == 'From'), '')
-                
-                # Get email body
-                body = self._get_email_body(msg_data)
-                
-                replies.append({
-                    'message_id': msg['id'],
-                    'subject': subject,
-                    'from': sender,
-                    'body': body,
-                    'date': msg_data['internalDate']
-                })
+            # Every page of results, fetched in batches of up to 100 messages
+            ids = list_message_ids(self.service, query, limit_key=self.limit_key)
+            if keep is not None:
+                messages, failures = fetch_relevant_messages(self.service, ids, keep, limit_key=self.limit_key)
+            else:
+                messages, failures = batch_get_messages(self.service, ids, limit_key=self.limit_key)
+            if failures:
+                print(f"⚠️ Skipped {len(failures)} messages that could not be fetched")
             
-            return replies
+            return [self.parse_reply(msg_data) for msg_data in messages]
             
         except Exception as e:
             print(f"⚠️ Error checking emails: {e}")
             return []
     
+    def inbox_sync(self, consumer: str, mailbox: str, resync_query: str) -> InboxSync:
+        """Incremental history-id sync of the inbox for one consumer (see services/inbox_sync.py)."""
+        if not self.service:
+            self.authenticate()
+        return InboxSync(self.service, f'{consumer}:{mailbox}', resync_query=resync_query,
+                         limit_key=self.limit_key)
+
+    def parse_reply(self, msg_data: Dict) -> Dict:
+        """Reply dict (message_id, subject, from, body, date, thread_id, message_ids) from a message resource"""
+        headers = msg_data['payload']['headers']
+        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
+        sender = next((h['value'] for h in headers if h['name'] == 'From'), '')
+
+        return {
+            'message_id': msg_data['id'],
+            'subject': subject,
+            'from': sender,
+            # Oversized messages are fetched as metadata only; the snippet stands in
+            'body': self._get_email_body(msg_data) or msg_data.get('snippet', ''),
+            'date': msg_data['internalDate'],
+            **reply_match_keys(msg_data),
+        }
+
     def _get_email_body(self, msg_data: Dict) -> str:
         """Extract email body from message"""
         try:
@@ -478,7 +840,7 @@ class AutoReplyEngine:
     """Generate automatic reply suggestions"""
     
     def __init__(self, api_key: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.client = anthropic_client(api_key)
         self.email_engine = EmailPersonalizationEngine(api_key)
     
     def analyze_and_generate_reply(self, customer: Dict, reply_email: Dict) -> Dict:
@@ -582,7 +944,6 @@ def main_workflow():
         })
         
         print(f"✅ Research completed for {customer['company_name']}")
-        time.sleep(2)  # Rate limiting
     
     # PHASE 2: Check for new email replies
     print("\n📧 PHASE 2: Email Tracking")
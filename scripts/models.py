@@ -62,10 +62,15 @@ def decrypt_value(encrypted_bytes):
 
 
 @contextmanager
-def get_db():
-    """Get a database connection with WAL mode for concurrent access."""
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH, timeout=10)
+def get_db(path=None):
+    """Get a database connection with WAL mode for concurrent access.
+
+    Defaults to the main app database; pass ``path`` for auxiliary
+    databases kept alongside it in ``data/``.
+    """
+    path = path or DB_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA journal_mode=WAL")
     conn.execute("PRAGMA foreign_keys=ON")
@@ -115,15 +120,32 @@ def init_db(app=None):
                 max_research_per_run INTEGER DEFAULT 5,
                 followup_days INTEGER DEFAULT 3,
                 auto_reply_confidence REAL DEFAULT 0.8,
+                storage_backend TEXT NOT NULL DEFAULT 'sheets',
 
                 setup_complete INTEGER NOT NULL DEFAULT 0
             );
         ''')
+        _migrate_columns(db)
 
     # Seed admin from env vars if no users exist
     _seed_admin()
 
 
+# Columns added after the first release: name -> column definition
+_ADDED_USER_COLUMNS = {
+    'storage_backend': "TEXT NOT NULL DEFAULT 'sheets'",
+}
+
+
+def _migrate_columns(db):
+    """Add columns introduced after a database was created."""
+    existing = {row['name'] for row in db.execute("PRAGMA table_info(users)")}
+    for name, definition in _ADDED_USER_COLUMNS.items():
+        if name not in existing:
+            db.execute(f"ALTER TABLE users ADD COLUMN {name} {definition}")
+            logger.info(f"Added users.{name} column")
+
+
 def _seed_admin():
     """Create admin user from environment variables if no users exist."""
     import base64
@@ -268,7 +290,7 @@ class User:
             'max_emails_per_day', 'research_delay_seconds', 'max_research_per_run',
             'followup_days', 'auto_reply_confidence', 'setup_complete',
             'display_name', 'is_active', 'role', 'email_verified',
-            'verification_token', 'verification_token_expires',
+            'verification_token', 'verification_token_expires', 'storage_backend',
         }
         if field not in allowed:
             raise ValueError(f"Cannot update field: {field}")
@@ -381,6 +403,7 @@ class User:
             'max_research_per_run': self.max_research_per_run,
             'followup_days': self.followup_days,
             'auto_reply_confidence': self.auto_reply_confidence,
+            'storage_backend': self.storage_backend,
             'setup_complete': self.setup_complete,
         }
 
@@ -16,6 +16,7 @@ from .ai_insights import ai_insights_bp
 from .setup import setup_bp
 from .admin import admin_bp
 from .smart_setup import smart_setup_bp
+from .webhooks import webhooks_bp
 
 ALL_BLUEPRINTS = [
     auth_bp,
@@ -34,4 +35,5 @@ ALL_BLUEPRINTS = [
     setup_bp,
     admin_bp,
     smart_setup_bp,
+    webhooks_bp,
 ]
@@ -2,7 +2,14 @@
 
 from datetime import datetime
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from app_core import login_required, admin_required, get_current_user, logger, safe_flash_error
+from app_core import (login_required, admin_required, get_current_user, logger, safe_flash_error,
+                      shared_cache, build_sheets_manager)
+from services.storage import STORAGE_BACKENDS
+from services.rate_limit import rate_limiter
+from services.attachment_cache import attachment_cache
+from services.retry import retry_stats
+from services.ai_cache import ai_cache
+from services.sqlite_storage import SQLiteStorage
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -37,6 +44,12 @@ def admin_dashboard():
             active_page='admin',
             users=users,
             total_users=len(users),
+            cache_stats=shared_cache.stats(),
+            attachment_stats=attachment_cache.stats(),
+            rate_buckets=rate_limiter.usage(),
+            retry_counts=retry_stats.snapshot(),
+            ai_cache_stats=ai_cache.stats(),
+            prompt_usage=ai_cache.prompt_usage(),
         )
 
     except Exception as e:
@@ -98,19 +111,27 @@ def edit_user(user_id):
     try:
         display_name = request.form.get('display_name', '').strip()
         role = request.form.get('role', '').strip()
+        storage_backend = request.form.get('storage_backend', user.storage_backend).strip()
 
         if role not in ('user', 'admin'):
             flash('Invalid role. Must be "user" or "admin".', 'danger')
             return redirect(url_for('admin.user_detail', user_id=user_id))
+        if storage_backend not in STORAGE_BACKENDS:
+            flash('Invalid storage backend.', 'danger')
+            return redirect(url_for('admin.user_detail', user_id=user_id))
+
+        if storage_backend == 'sqlite' and user.storage_backend != 'sqlite':
+            _copy_sheets_to_local(user)
 
         with get_db() as db:
             db.execute('''
                 UPDATE users
-                SET display_name = ?, role = ?
+                SET display_name = ?, role = ?, storage_backend = ?
                 WHERE id = ?
-            ''', (display_name, role, user_id))
+            ''', (display_name, role, storage_backend, user_id))
 
-        logger.info(f"Admin {current_user.email} updated user {user.email}: role={role}, display_name={display_name}")
+        logger.info(f"Admin {current_user.email} updated user {user.email}: role={role}, "
+                    f"display_name={display_name}, storage={storage_backend}")
         flash('User updated successfully!', 'success')
 
     except Exception as e:
@@ -120,6 +141,21 @@ def edit_user(user_id):
     return redirect(url_for('admin.user_detail', user_id=user_id))
 
 
+def _copy_sheets_to_local(user):
+    """Seed a user's empty local store from their spreadsheet before switching backends."""
+    local = SQLiteStorage.for_user(user.id)
+    if local.row_count('Customers') or not user.google_sheets_id:
+        return
+    try:
+        results = local.import_from(build_sheets_manager(user))
+        logger.info(f"Copied Sheets data to local storage for user {user.email}: {results}")
+        summary = ', '.join(f"{name}: {r['rows']} rows" for name, r in results.items())
+        flash(f'Copied {summary} to local storage.', 'info')
+    except Exception as e:
+        logger.warning(f"Could not copy Sheets data for user {user.email}: {e}")
+        flash('Switched to local storage, but existing Sheets data could not be copied.', 'warning')
+
+
 @admin_bp.route('/admin/users/<int:user_id>/delete', methods=['POST'])
 @login_required
 @admin_required
@@ -16,8 +16,7 @@ def insights_page():
     try:
         customers = cached_get_customers()
         sheets = get_sheets()
-        sheet_emails = sheets.get_worksheet('Email_Tracking')
-        emails = sheet_emails.get_all_records()
+        emails = sheets.get_records('Email_Tracking')
     except Exception as e:
         return render_template('ai_insights.html', active_page='ai_insights',
                                error=str(e), hot_leads=[], upsell_ready=[],
@@ -131,8 +130,8 @@ def discover_prospects():
         return redirect(url_for('ai_insights.insights_page'))
 
     try:
-        import anthropic
-        client = anthropic.Anthropic(api_key=get_api_key())
+        from services.retry import anthropic_client
+        client = anthropic_client(api_key=get_api_key())
 
         prompt = f"""You are a B2B sales intelligence assistant for a high-purity quartz mining and export company (Lorh La Seng Commercial).
 
@@ -191,15 +190,14 @@ def import_prospects():
 
     try:
         sheets = get_sheets()
-        sheet = sheets.get_worksheet('Customers')
-        headers = sheet.row_values(1)
-        count = 0
+        headers = sheets.get_headers('Customers')
+        new_rows = []
 
         for idx_str in selected_indices:
             idx = int(idx_str)
             if idx < len(prospects):
                 p = prospects[idx]
-                customer_id = f"CUST{int(time.time())}_{count}"
+                customer_id = f"CUST{int(time.time())}_{len(new_rows)}"
                 row_data = {
                     'id': customer_id,
                     'company_name': p.get('example_name', p.get('company_type', '')),
@@ -217,10 +215,9 @@ def import_prospects():
                     'response_status': 'no_contact',
                     'notes': f"AI-discovered prospect for: {session.get('discover_keyword', '')}",
                 }
-                sheet.append_row([str(row_data.get(h, '')) for h in headers])
-                count += 1
-                time.sleep(0.5)
+                new_rows.append({k: str(v) for k, v in row_data.items()})
 
+        count = sheets.append_records('Customers', new_rows, headers)['rows']
         invalidate_cache()
         session.pop('discovered_prospects', None)
         session.pop('discover_keyword', None)
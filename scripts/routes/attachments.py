@@ -6,6 +6,7 @@ from datetime import datetime
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
 from werkzeug.utils import secure_filename
 from app_core import (login_required, PIPELINE_STAGES, PROJECT_ROOT, safe_attachment_path, logger)
+from services.attachment_cache import attachment_cache
 
 attachments_bp = Blueprint('attachments', __name__)
 
@@ -78,6 +79,7 @@ def upload_attachment():
     attachments_dir = os.path.join(PROJECT_ROOT, 'attachments')
     os.makedirs(attachments_dir, exist_ok=True)
     file.save(os.path.join(attachments_dir, safe_name))
+    attachment_cache.invalidate(os.path.join(attachments_dir, safe_name))
 
     logger.info(f"Uploaded attachment: {safe_name}")
     flash(f'Successfully uploaded {safe_name}', 'success')
@@ -109,6 +111,7 @@ def delete_attachment(filename):
     try:
         if os.path.exists(file_path):
             os.remove(file_path)
+            attachment_cache.invalidate(file_path)
             logger.info(f"Deleted attachment: {filename}")
             return jsonify({'success': True})
         else:
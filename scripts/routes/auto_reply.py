@@ -7,7 +7,8 @@ from datetime import datetime, timedelta
 from flask import Blueprint, render_template, redirect, url_for, flash, jsonify, request
 from app_core import (login_required, PIPELINE_STAGES, get_sheets, get_user_config,
                       SPAM_DOMAINS, classify_reply, classify_reply_smart, logger,
-                      safe_flash_error, get_gmail_service_for_user, EmailTracker)
+                      safe_flash_error, get_gmail_service_for_user, EmailTracker, get_sender_info)
+from services.gmail_fetch import sender_address, reply_match_keys
 
 auto_reply_bp = Blueprint('auto_reply', __name__)
 
@@ -47,8 +48,7 @@ def auto_reply_page():
     reply_stats = {'total_replies': 0, 'needs_action': 0, 'hot_leads': 0, 'declined': 0}
     try:
         sheets = get_sheets()
-        tracking_sheet = sheets.get_worksheet('Email_Tracking')
-        emails = tracking_sheet.get_all_records()
+        emails = sheets.get_records('Email_Tracking')
         customers = sheets.get_customers()
         customer_map = {str(c.get('id', '')): c for c in customers}
 
@@ -139,82 +139,79 @@ def check_replies_now():
     """Manually trigger a reply check."""
     try:
         gmail_service = get_gmail_service_for_user()
-        tracker = EmailTracker.__new__(EmailTracker)
-        tracker.service = gmail_service
+        tracker = EmailTracker.from_service(gmail_service, f"gmail:{get_sender_info()['sender_email'] or 'me'}")
 
-        replies = tracker.check_new_replies(since_hours=48)
+        sheets = get_sheets()
+        tracking = sheets.get_snapshot('Email_Tracking', max_age=0)
+
+        def keep(message):
+            # Decided on headers alone: only tracked, non-spam senders get their bodies downloaded
+            sender = sender_address(message)
+            return not any(d in sender for d in SPAM_DOMAINS) and \
+                tracking.for_reply(sender=sender, **reply_match_keys(message)) is not None
+
+        replies = tracker.check_new_replies(since_hours=48, keep=keep)
 
         if not replies:
             flash('No new replies found in the last 48 hours.', 'info')
             return redirect(url_for('auto_reply.auto_reply_page'))
 
-        sheets = get_sheets()
-        tracking_sheet = sheets.get_worksheet('Email_Tracking')
-        tracking_records = tracking_sheet.get_all_records()
-        headers = tracking_sheet.row_values(1)
-
-        for col_name in ['replied', 'reply_date', 'reply_content_summary', 'next_action', 'detected_stage']:
-            if col_name not in headers:
-                tracking_sheet.update_cell(1, len(headers) + 1, col_name)
-                headers.append(col_name)
-
-        updated = 0
-        for reply in replies:
-            from_email = reply['from']
-            if '<' in from_email:
-                from_email = from_email.split('<')[1].split('>')[0].strip()
-
-            if any(d in from_email.lower() for d in SPAM_DOMAINS):
-                continue
+        headers = sheets.ensure_columns('Email_Tracking', ['replied', 'reply_date', 'reply_content_summary',
+                                                           'next_action', 'detected_stage'])
 
-            reply_body = reply.get('body', '')
-
-            # Find matching customer record for AI context
-            matched_record = None
-            for record in tracking_records:
-                record_email = record.get('contact_email', '').lower()
-                if record_email and record_email == from_email.lower():
-                    matched_record = record
-                    break
-
-            # Use AI-powered classification
-            if matched_record:
-                customer_context = {
-                    'company_name': matched_record.get('company_name', ''),
-                    'industry': matched_record.get('industry', ''),
-                }
-                current_stage = int(matched_record.get('pipeline_stage', 1)) if str(matched_record.get('pipeline_stage', '')).isdigit() else 1
-
-                classification = classify_reply_smart(
-                    reply_body=reply_body,
-                    subject=reply.get('subject', ''),
-                    current_stage=current_stage,
-                    customer_context=customer_context,
-                    use_ai=True
-                )
-
-                req_type = classification['intent']
-                detected_stage = classification['stage']
-                urgency = classification.get('urgency_level', 'medium')
-                sentiment = classification.get('sentiment', 'neutral')
-                buying_signals = classification.get('buying_signals', [])
-
-                # Enhanced summary with AI metadata
-                summary_parts = [f'[{req_type}]']
-                if urgency == 'high':
-                    summary_parts.append('[URGENT]')
-                if buying_signals:
-                    summary_parts.append(f'[Signals: {len(buying_signals)}]')
-                summary_parts.append(reply_body[:150])
-                summary = ' '.join(summary_parts)
-            else:
-                req_type, detected_stage = classify_reply(reply_body)
-                summary = f'[{req_type}] {reply_body[:200]}'
-
-            import time as time_mod
-            for idx, record in enumerate(tracking_records, start=2):
-                record_email = record.get('contact_email', '').lower()
-                if record_email and record_email == from_email.lower():
+        with sheets.batch_writes():
+            updated = 0
+            for reply in replies:
+                from_email = reply['from']
+                if '<' in from_email:
+                    from_email = from_email.split('<')[1].split('>')[0].strip()
+
+                if any(d in from_email.lower() for d in SPAM_DOMAINS):
+                    continue
+
+                reply_body = reply.get('body', '')
+
+                # Find matching customer record for AI context
+                matched = tracking.for_reply(reply.get('thread_id', ''), reply.get('message_ids', ()), from_email)
+                matched_record = matched[1] if matched else None
+
+                # Use AI-powered classification
+                if matched_record:
+                    customer_context = {
+                        'company_name': matched_record.get('company_name', ''),
+                        'industry': matched_record.get('industry', ''),
+                    }
+                    current_stage = int(matched_record.get('pipeline_stage', 1)) if str(matched_record.get('pipeline_stage', '')).isdigit() else 1
+
+                    classification = classify_reply_smart(
+                        reply_body=reply_body,
+                        subject=reply.get('subject', ''),
+                        current_stage=current_stage,
+                        customer_context=customer_context,
+                        use_ai=True
+                    )
+
+                    req_type = classification['intent']
+                    detected_stage = classification['stage']
+                    urgency = classification.get('urgency_level', 'medium')
+                    sentiment = classification.get('sentiment', 'neutral')
+                    buying_signals = classification.get('buying_signals', [])
+
+                    # Enhanced summary with AI metadata
+                    summary_parts = [f'[{req_type}]']
+                    if urgency == 'high':
+                        summary_parts.append('[URGENT]')
+                    if buying_signals:
+                        summary_parts.append(f'[Signals: {len(buying_signals)}]')
+                    summary_parts.append(reply_body[:150])
+                    summary = ' '.join(summary_parts)
+                else:
+                    req_type, detected_stage = classify_reply(reply_body)
+                    summary = f'[{req_type}] {reply_body[:200]}'
+
+                import time as time_mod
+                if matched:
+                    idx, record = matched
                     current_stage = int(record.get('pipeline_stage', 1)) if str(record.get('pipeline_stage', '')).isdigit() else 1
                     if detected_stage is None:
                         detected_stage = min(current_stage + 1, max(PIPELINE_STAGES.keys()))
@@ -228,13 +225,10 @@ def check_replies_now():
                         'detected_stage': str(detected_stage),
                     }
 
-                    for key, val in updates.items():
-                        if key in headers:
-                            tracking_sheet.update_cell(idx, headers.index(key) + 1, val)
+                    sheets.update_row('Email_Tracking', idx, updates, headers)
 
                     updated += 1
                     time_mod.sleep(0.5)
-                    break
 
         try:
             from daemon_integration import _load_activities, ACTIVITY_FILE
@@ -400,8 +394,7 @@ def daemon_status_api():
 
     try:
         sheets = get_sheets()
-        tracking_sheet = sheets.get_worksheet('Email_Tracking')
-        emails = tracking_sheet.get_all_records()
+        emails = sheets.get_records('Email_Tracking')
         customers = sheets.get_customers()
         customer_map = {str(c.get('id', '')): c for c in customers}
 
@@ -1,17 +1,70 @@
 """Batch send routes."""
 
 import time
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+import uuid
+import threading
+from datetime import datetime
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from app_core import (login_required, get_sheets, cached_get_customers,
                       EmailPersonalizationEngine, get_api_key, PIPELINE_STAGES,
                       get_sender_info,
                       SPAM_DOMAINS, create_email_log, is_valid_email, logger,
-                      get_gmail_service_for_user)
-from services.email_service import send_email_via_gmail
+                      get_gmail_service_for_user, get_current_user, get_user_config, enqueue_email,
+                      get_generation_engine)
+from services.batch_send import BatchSendEngine, batch_jobs, workers_for_stage
+from services.outbox import outbox
+from services.ai_batches import ai_batches, batch_client, submit_batch
+from services.segment_templates import industry_segment, fill_template
 
 batch_send_bp = Blueprint('batch_send', __name__)
 
 
+def _selected_ids():
+    customer_ids = request.form.getlist('customer_ids')
+    if len(customer_ids) == 1 and ',' in customer_ids[0]:
+        customer_ids = [cid.strip() for cid in customer_ids[0].split(',') if cid.strip()]
+    return customer_ids
+
+
+def _sendable(customers, customer_ids):
+    """``[(id, customer)]`` that can be mailed, and the names of those skipped for a bad address."""
+    queue, failures = [], []
+    for cid in customer_ids:
+        customer = customers.by_id(cid)
+        if not customer:
+            continue
+
+        to_email = customer.get('contact_email', '')
+        if not to_email or not is_valid_email(to_email):
+            logger.warning(f"Skipped {customer.get('company_name', cid)}: missing or invalid email '{to_email}'")
+            failures.append(customer.get('company_name', cid))
+            continue
+        if any(d in to_email.lower() for d in SPAM_DOMAINS):
+            logger.warning(f"Skipped {customer.get('company_name', cid)}: spam domain ({to_email})")
+            failures.append(customer.get('company_name', cid))
+            continue
+        queue.append((cid, customer))
+    return queue, failures
+
+
+def _segment_templates(engine, generator, stage, queue):
+    """Template per industry segment of ``queue``, generated concurrently on ``generator`` (None where it failed)."""
+    segments = sorted({industry_segment(customer) for _, customer in queue})
+    templates = {}
+    for result in generator.run(engine.template_job(segment, stage, segment) for segment in segments):
+        templates[result['key']] = result['value']
+    logger.info(f"Segment templates: {len(segments)} for {len(queue)} customers at stage {stage}")
+    return templates
+
+
+def _research(customer):
+    return {
+        'summary': customer.get('research_summary', ''),
+        'industry': customer.get('tags', 'Manufacturing'),
+        'pain_points': customer.get('pain_points', '')
+    }
+
+
 @batch_send_bp.route('/batch_send')
 @login_required
 def batch_send_page():
@@ -29,6 +82,7 @@ def batch_send_page():
         stage = int(c.get('pipeline_stage', 1)) if str(c.get('pipeline_stage', '1')).isdigit() else 1
         stage_groups.setdefault(stage, []).append(c)
 
+    user = get_current_user()
     return render_template('batch_send.html',
         active_page='batch_send',
         pipeline_stages=PIPELINE_STAGES,
@@ -37,88 +91,161 @@ def batch_send_page():
         sender_name=sender['sender_name'],
         sender_title=sender['sender_title'],
         company_name=sender['company_name'],
+        generation_batches=ai_batches.recent(user.id) if user else [],
+        send_job=batch_jobs.latest(user.id) if user else None,
+        max_per_day=get_user_config('max_emails_per_day', 50),
     )
 
 
+def _run_batch(job_id, engine, generator, queue, failures, stage, mode, attachment_files,
+               user, sender, workers, daily_remaining):
+    """Generate and queue ``queue`` off the request, recording progress on job ``job_id``."""
+    try:
+        if generator:
+            # One generation per industry segment, filled in per customer
+            templates = _segment_templates(engine, generator, stage, queue)
+
+            def generate(customer):
+                line = engine.generate_personal_line(customer, _research(customer), stage) \
+                    if mode == 'personalized' else ''
+                return fill_template(templates.get(industry_segment(customer)), customer, line)
+        else:
+            def generate(customer):
+                return engine.generate_email(customer, _research(customer), stage)
+
+        def send(customer, email_data):
+            cid = customer.get('id', '')
+            email_log = create_email_log(cid, customer, email_data.get('subject', ''), email_data.get('body', ''),
+                                         stage, attachments=';'.join(attachment_files),
+                                         status='sent', reviewed_by='auto_approved',
+                                         confidence=email_data.get('confidence_score', ''))
+            email_log['email_id'] = f"EMAIL{int(time.time())}_{cid}_{uuid.uuid4().hex[:4]}"
+            item = enqueue_email(cid, stage, email_log['email_id'], customer.get('contact_email', ''),
+                                 email_data.get('subject', ''), email_data.get('body', ''), attachment_files,
+                                 effects={'log': email_log}, user=user, sender=sender)
+            return f"outbox:{item['id']}", None
+
+        counts = {'sent': 0, 'failed': len(failures), 'skipped': 0}
+
+        def record(result):
+            cid, customer = result['customer_id'], result['customer']
+            counts[result['status']] += 1
+            if result['status'] != 'sent':
+                logger.warning(f"Send {result['status']} for {customer.get('company_name', cid)} "
+                               f"({customer.get('contact_email', '')}): {result['error']}")
+                if result['status'] == 'failed':
+                    failures.append(customer.get('company_name', cid))
+            batch_jobs.progress(job_id, counts['sent'], counts['failed'], counts['skipped'], failures)
+
+        # Generation overlaps on the pool; each email is queued in the outbox
+        # and the drainer sends it and logs its tracking row
+        batch = BatchSendEngine(generate, send, workers=workers, daily_remaining=daily_remaining)
+        report = batch.run(queue, on_result=record)
+        logger.info(f"Batch send job {job_id}: {report['sent']} queued, {counts['failed']} failed, "
+                    f"{report['skipped']} over the daily limit ({report['elapsed']}s, {report['workers']} workers)")
+        batch_jobs.finish(job_id)
+    except Exception as e:
+        logger.error(f"Batch send job {job_id} error: {e}")
+        batch_jobs.finish(job_id, error=str(e))
+
+
 @batch_send_bp.route('/batch_send/run', methods=['POST'])
 @login_required
 def batch_send_run():
     stage = int(request.form.get('stage', 1))
-    customer_ids = request.form.getlist('customer_ids')
-    if len(customer_ids) == 1 and ',' in customer_ids[0]:
-        customer_ids = [cid.strip() for cid in customer_ids[0].split(',') if cid.strip()]
-
+    customer_ids = _selected_ids()
     if not customer_ids:
         flash('No customers selected.', 'warning')
         return redirect(url_for('batch_send.batch_send_page'))
 
+    user = get_current_user()
+    if batch_jobs.running(user.id):
+        flash('A batch send is already running. Wait for it to finish before starting another.', 'warning')
+        return redirect(url_for('batch_send.batch_send_page'))
+
     try:
+        # Everything that needs the request (session, user config, API key)
+        # is resolved here; the worker thread only generates and queues
         sheets = get_sheets()
-        customers = sheets.get_customers()
+        customers = sheets.get_snapshot('Customers')
         engine = EmailPersonalizationEngine(get_api_key())
         stage_info = PIPELINE_STAGES.get(stage, {})
-        attachment_files = stage_info.get('attachments', [])
         sender = get_sender_info()
-        gmail_service = get_gmail_service_for_user()
-
-        sent_count = 0
-        fail_count = 0
-
-        for cid in customer_ids:
-            customer = next((c for c in customers if str(c.get('id')) == cid), None)
-            if not customer:
-                continue
-
-            to_email = customer.get('contact_email', '')
-            if not to_email or not is_valid_email(to_email):
-                logger.warning(f"Skipped {customer.get('company_name', cid)}: missing or invalid email '{to_email}'")
-                fail_count += 1
-                continue
-            if any(d in to_email.lower() for d in SPAM_DOMAINS):
-                logger.warning(f"Skipped {customer.get('company_name', cid)}: spam domain ({to_email})")
-                fail_count += 1
-                continue
-
-            research = {
-                'summary': customer.get('research_summary', ''),
-                'industry': customer.get('tags', 'Manufacturing'),
-                'pain_points': customer.get('pain_points', '')
-            }
-            email_data = engine.generate_email(customer, research, stage)
-
-            if not email_data:
-                fail_count += 1
-                continue
-
-            subject = email_data.get('subject', '')
-            body = email_data.get('body', '')
-
-            msg_id, error = send_email_via_gmail(to_email, subject, body, attachment_files,
-                                                  sender_name=sender['sender_name'],
-                                                  sender_email=sender['sender_email'],
-                                                  gmail_service=gmail_service)
-            if error:
-                logger.warning(f"Send failed for {customer.get('company_name', cid)} ({to_email}): {error}")
-                fail_count += 1
-                continue
-
-            email_log = create_email_log(cid, customer, subject, body, stage,
-                                         attachments=';'.join(attachment_files),
-                                         status='sent', reviewed_by='auto_approved',
-                                         gmail_msg_id=msg_id or '',
-                                         confidence=email_data.get('confidence_score', ''))
-            import uuid
-            email_log['email_id'] = f"EMAIL{int(time.time())}_{cid}_{uuid.uuid4().hex[:4]}"
-            sheets.log_email(email_log)
-            sent_count += 1
-            time.sleep(1)
+        get_gmail_service_for_user(user)  # fail fast before any AI call if Gmail isn't set up
+
+        queue, failures = _sendable(customers, customer_ids)
+
+        today = datetime.now().strftime('%Y-%m-%d')
+        sent_today = len([e for e in sheets.get_records('Email_Tracking')
+                          if e.get('sent_date') == today and e.get('status') == 'sent'])
+        # Mail still waiting in the outbox goes out today too
+        sent_today += outbox.unsent_count(user.id)
+        daily_remaining = max(0, int(get_user_config('max_emails_per_day', 50)) - sent_today)
+
+        mode = request.form.get('generation_mode', 'full')
+        generator = get_generation_engine() if mode in ('personalized', 'template') else None
+
+        job_id = batch_jobs.start(user.id, stage, mode, len(queue), failures)
+        threading.Thread(target=_run_batch, name=f'batch-send-{job_id}', daemon=True,
+                         args=(job_id, engine, generator, queue, list(failures), stage, mode,
+                               stage_info.get('attachments', []), user, sender,
+                               workers_for_stage(stage_info), daily_remaining)).start()
 
-        logger.info(f"Batch send: {sent_count} sent, {fail_count} failed")
-        flash(f'Batch complete! Sent: {sent_count}, Failed: {fail_count}',
-              'success' if fail_count == 0 else 'warning')
+        message = f'Generating {len(queue)} Stage {stage} emails in the background. Progress is shown below.'
+        if failures:
+            message += f" Skipped (bad address): {', '.join(str(f) for f in failures[:5])}{' …' if len(failures) > 5 else ''}"
+        flash(message, 'info' if not failures else 'warning')
 
     except Exception as e:
         logger.error(f"Batch send error: {e}")
         flash(f'Batch send error: {e}', 'danger')
 
-    return redirect(url_for('tracking.tracking_page'))
+    return redirect(url_for('batch_send.batch_send_page'))
+
+
+@batch_send_bp.route('/batch_send/status')
+@login_required
+def batch_send_status():
+    """JSON progress of the user's latest batch send, polled by the batch send page."""
+    user = get_current_user()
+    return jsonify({'job': batch_jobs.latest(user.id) if user else None})
+
+
+@batch_send_bp.route('/batch_send/queue_batch', methods=['POST'])
+@login_required
+def batch_generate():
+    """Submit the selected customers' emails as one Message Batches job; results become drafts."""
+    stage = int(request.form.get('stage', 1))
+    customer_ids = _selected_ids()
+    if not customer_ids:
+        flash('No customers selected.', 'warning')
+        return redirect(url_for('batch_send.batch_send_page'))
+
+    try:
+        customers = get_sheets().get_snapshot('Customers')
+        queue, failures = _sendable(customers, customer_ids)
+        if not queue:
+            flash('None of the selected customers has a usable email address.', 'warning')
+            return redirect(url_for('batch_send.batch_send_page'))
+
+        api_key = get_api_key()
+        engine = EmailPersonalizationEngine(api_key)
+        requests, jobs = [], {}
+        for n, (cid, customer) in enumerate(queue):
+            custom_id = f'c{n}'
+            requests.append(engine.email_batch_request(custom_id, customer, _research(customer), stage))
+            jobs[custom_id] = {'customer': {k: customer.get(k, '') for k in ('id', 'company_name', 'contact_email')}}
+        batch_id = submit_batch(batch_client(api_key), requests)
+        ai_batches.record(get_current_user().id, batch_id, stage, jobs)
+
+        logger.info(f"Generation batch {batch_id}: {len(requests)} Stage {stage} emails submitted")
+        message = (f'{len(requests)} emails queued for batch generation. '
+                   f'They will appear as drafts for review when the batch finishes.')
+        if failures:
+            message += f" Skipped (bad address): {', '.join(str(f) for f in failures[:5])}{' …' if len(failures) > 5 else ''}"
+        flash(message, 'success' if not failures else 'warning')
+    except Exception as e:
+        logger.error(f"Batch generation submit failed: {e}")
+        flash(f'Batch generation failed: {e}', 'danger')
+
+    return redirect(url_for('batch_send.batch_send_page'))
@@ -3,11 +3,10 @@
 import time
 from datetime import datetime
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from app_core import (login_required, get_sheets, cached_get_customers,
+from app_core import (login_required, get_sheets, cached_get_customers, cached_customer_snapshot,
                       EmailPersonalizationEngine, get_api_key, PIPELINE_STAGES, create_email_log,
                       get_sender_info, is_valid_email, logger,
-                      safe_flash_error, get_gmail_service_for_user)
-from services.email_service import send_email_via_gmail
+                      safe_flash_error, get_gmail_service_for_user, enqueue_email)
 
 compose_bp = Blueprint('compose', __name__)
 
@@ -60,8 +59,8 @@ def generate_email():
     context = request.form.get('context', '')
 
     try:
-        customers = cached_get_customers()
-        customer = next((c for c in customers if str(c.get('id')) == customer_id), None)
+        customers = cached_customer_snapshot()
+        customer = customers.by_id(customer_id)
 
         if not customer:
             flash('Customer not found.', 'danger')
@@ -74,7 +73,7 @@ def generate_email():
         }
 
         engine = EmailPersonalizationEngine(get_api_key())
-        email = engine.generate_email(customer, research, stage, context)
+        email = engine.generate_email(customer, research, stage, context, fresh=bool(request.form.get('fresh')))
 
         if email:
             session['generated_email'] = email
@@ -101,8 +100,8 @@ def approve_email():
 
     try:
         sheets = get_sheets()
-        customers = sheets.get_customers()
-        customer = next((c for c in customers if str(c.get('id')) == customer_id), None)
+        customers = sheets.get_snapshot('Customers')
+        customer = customers.by_id(customer_id)
 
         scheduled_date = request.form.get('scheduled_date', '')
         email_log = create_email_log(customer_id, customer, subject, body, stage,
@@ -132,8 +131,8 @@ def send_now():
 
     try:
         sheets = get_sheets()
-        customers = sheets.get_customers()
-        customer = next((c for c in customers if str(c.get('id')) == customer_id), None)
+        customers = sheets.get_snapshot('Customers')
+        customer = customers.by_id(customer_id)
 
         if not customer:
             flash('Customer not found.', 'danger')
@@ -145,24 +144,14 @@ def send_now():
             flash(f'{company_name}: invalid email address "{to_email}". Please fix it in Google Sheets (Customers tab, contact_email column).', 'danger')
             return redirect(url_for('compose.compose_page', id=customer_id))
 
-        sender = get_sender_info()
-        gmail_service = get_gmail_service_for_user()
+        get_gmail_service_for_user()  # fail before queueing if Gmail isn't set up
         attachment_files = [a.strip() for a in attachments_str.split(';') if a.strip()] if attachments_str else []
-        msg_id, error = send_email_via_gmail(to_email, subject, body, attachment_files,
-                                              sender_name=sender['sender_name'],
-                                              sender_email=sender['sender_email'],
-                                              gmail_service=gmail_service)
-
-        if error:
-            flash(f'Failed to send: {error}', 'danger')
-            return redirect(url_for('compose.compose_page', id=customer_id))
-
         email_log = create_email_log(customer_id, customer, subject, body, stage,
-                                     attachments=attachments_str, status='sent',
-                                     gmail_msg_id=msg_id or '')
-        sheets.log_email(email_log)
-        logger.info(f"Email sent to {to_email}")
-        flash(f'Email sent to {to_email} successfully!', 'success')
+                                     attachments=attachments_str, status='sent')
+        enqueue_email(customer_id, stage, email_log['email_id'], to_email, subject, body, attachment_files,
+                      effects={'log': email_log})
+        logger.info(f"Email to {to_email} queued")
+        flash(f'Email to {to_email} queued for sending.', 'success')
 
     except Exception as e:
         safe_flash_error(e, 'Email operation')
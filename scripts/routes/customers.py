@@ -7,7 +7,8 @@ from datetime import datetime
 from flask import Blueprint, render_template, request, redirect, url_for, flash, Response
 from app_core import (login_required, get_sheets, invalidate_cache, cached_get_customers,
                       ENGAGEMENT_COLORS, PIPELINE_STAGES, AIResearchEngine, get_api_key,
-                      is_valid_email, get_segmentation_engine, logger, safe_flash_error)
+                      is_valid_email, get_segmentation_engine, get_generation_engine, logger,
+                      safe_flash_error)
 
 customers_bp = Blueprint('customers', __name__)
 
@@ -116,14 +117,13 @@ def import_csv():
         stream = io.StringIO(file.stream.read().decode('utf-8'))
         reader = csv.DictReader(stream)
         sheets = get_sheets()
-        sheet = sheets.get_worksheet('Customers')
-        headers = sheet.row_values(1)
+        headers = sheets.get_headers('Customers')
 
         existing = sheets.get_customers()
         existing_emails = {c.get('contact_email', '').lower() for c in existing if c.get('contact_email')}
         existing_companies = {c.get('company_name', '').lower() for c in existing if c.get('company_name')}
 
-        count = 0
+        new_rows = []
         skipped = 0
         duplicates = 0
         for row in reader:
@@ -140,7 +140,7 @@ def import_csv():
                 continue
             existing_emails.add(row_email)
             existing_companies.add(row_company)
-            customer_id = f"CUST{int(time.time())}_{count}"
+            customer_id = f"CUST{int(time.time())}_{len(new_rows)}"
             row_data = {
                 'id': customer_id,
                 'company_name': row.get('company_name', ''),
@@ -156,10 +156,13 @@ def import_csv():
                 'last_contact_date': datetime.now().strftime('%Y-%m-%d'),
                 'response_status': 'no_contact', 'notes': ''
             }
-            sheet.append_row([row_data.get(h, '') for h in headers])
-            count += 1
-            time.sleep(0.5)
+            new_rows.append(row_data)
 
+        def log_progress(done, total):
+            logger.info(f"CSV import: {done}/{total} rows written")
+
+        report = sheets.append_records('Customers', new_rows, headers, progress=log_progress)
+        count = report['rows']
         invalidate_cache()
         logger.info(f"Imported {count} customers from CSV, skipped {skipped}, duplicates {duplicates}")
         msg = f'Successfully imported {count} customers from CSV!'
@@ -185,8 +188,7 @@ def add_customer():
 
     try:
         sheets = get_sheets()
-        sheet = sheets.get_worksheet('Customers')
-        headers = sheet.row_values(1)
+        headers = sheets.get_headers('Customers')
 
         existing = sheets.get_customers()
         company_name = request.form.get('company_name', '').strip()
@@ -219,7 +221,7 @@ def add_customer():
             'last_contact_date': datetime.now().strftime('%Y-%m-%d'),
             'response_status': 'no_contact', 'notes': ''
         }
-        sheet.append_row([row_data.get(h, '') for h in headers])
+        sheets.append_records('Customers', [row_data], headers)
         invalidate_cache()
         logger.info(f"Added customer: {row_data['company_name']}")
 
@@ -251,33 +253,23 @@ def add_customer():
 def customer_detail(customer_id):
     try:
         sheets = get_sheets()
-        customers = sheets.get_customers()
-        customer = next((c for c in customers if str(c.get('id')) == customer_id), None)
+        customers = sheets.get_snapshot('Customers')
+        customer = customers.by_id(customer_id)
 
         if not customer:
             flash('Customer not found.', 'danger')
             return redirect(url_for('customers.customers_page'))
 
-        sheet_emails = sheets.get_worksheet('Email_Tracking')
-        all_emails = sheet_emails.get_all_records()
-        customer_emails = [e for e in all_emails
-                          if str(e.get('customer_id')) == customer_id
-                          or e.get('contact_email') == customer.get('contact_email', '')]
+        emails = sheets.get_snapshot('Email_Tracking')
+        customer_emails = emails.for_customer(customer_id, customer.get('contact_email', ''))
         customer_emails.sort(key=lambda e: e.get('sent_date', ''), reverse=True)
 
-        this_email = customer.get('contact_email', '').lower()
-        this_company = customer.get('company_name', '').lower()
-        duplicates = []
-        for c in customers:
-            if str(c.get('id')) == customer_id:
-                continue
-            match_reasons = []
-            if this_email and c.get('contact_email', '').lower() == this_email:
-                match_reasons.append('same email')
-            if this_company and c.get('company_name', '').lower() == this_company:
-                match_reasons.append('same company name')
-            if match_reasons:
-                duplicates.append({'customer': c, 'reasons': match_reasons})
+        matches = {}
+        for reason, field in (('same email', 'contact_email'), ('same company name', 'company_name')):
+            for row, c in customers.find_all(field, customer.get(field, '')):
+                if str(c.get('id')) != customer_id:
+                    matches.setdefault(row, {'customer': c, 'reasons': []})['reasons'].append(reason)
+        duplicates = [matches[row] for row in sorted(matches)]
 
         return render_template('customer_detail.html',
             active_page='customers',
@@ -325,29 +317,25 @@ def delete_customer(customer_id):
     """Delete a customer from the spreadsheet."""
     try:
         sheets = get_sheets()
-        sheet = sheets.get_worksheet('Customers')
-        records = sheet.get_all_records()
-
-        for idx, record in enumerate(records, start=2):
-            if str(record.get('id')) == customer_id:
-                try:
-                    email_sheet = sheets.get_worksheet('Email_Tracking')
-                    all_emails = email_sheet.get_all_records()
-                    linked = [e for e in all_emails
-                              if str(e.get('customer_id')) == customer_id
-                              or e.get('contact_email', '').lower() == record.get('contact_email', '').lower()]
-                    linked_count = len(linked)
-                except Exception:
-                    linked_count = 0
-
-                sheet.delete_rows(idx)
-                invalidate_cache()
-                logger.info(f"Deleted customer {customer_id} (had {linked_count} email records)")
-                msg = f'Customer "{record.get("company_name", customer_id)}" deleted successfully!'
-                if linked_count:
-                    msg += f' Note: {linked_count} email record(s) in tracking still reference this customer.'
-                flash(msg, 'success' if linked_count == 0 else 'warning')
-                return redirect(url_for('customers.customers_page'))
+        hit = sheets.get_snapshot('Customers', max_age=0).find('id', customer_id)
+
+        if hit:
+            idx, record = hit
+            try:
+                linked = sheets.get_snapshot('Email_Tracking').for_customer(
+                    customer_id, record.get('contact_email', ''))
+                linked_count = len(linked)
+            except Exception:
+                linked_count = 0
+
+            sheets.delete_row('Customers', idx)
+            invalidate_cache()
+            logger.info(f"Deleted customer {customer_id} (had {linked_count} email records)")
+            msg = f'Customer "{record.get("company_name", customer_id)}" deleted successfully!'
+            if linked_count:
+                msg += f' Note: {linked_count} email record(s) in tracking still reference this customer.'
+            flash(msg, 'success' if linked_count == 0 else 'warning')
+            return redirect(url_for('customers.customers_page'))
 
         flash('Customer not found.', 'danger')
     except Exception as e:
@@ -362,17 +350,14 @@ def analyze_customer(customer_id):
     """Run AI engagement analysis on a single customer."""
     try:
         sheets = get_sheets()
-        customers = sheets.get_customers()
-        customer = next((c for c in customers if str(c.get('id')) == customer_id), None)
+        customers = sheets.get_snapshot('Customers')
+        customer = customers.by_id(customer_id)
         if not customer:
             flash('Customer not found.', 'danger')
             return redirect(url_for('customers.customers_page'))
 
-        sheet_emails = sheets.get_worksheet('Email_Tracking')
-        all_emails = sheet_emails.get_all_records()
-        customer_emails = [e for e in all_emails
-                          if str(e.get('customer_id')) == customer_id
-                          or e.get('contact_email') == customer.get('contact_email', '')]
+        customer_emails = sheets.get_snapshot('Email_Tracking').for_customer(
+            customer_id, customer.get('contact_email', ''))
 
         engine = get_segmentation_engine()
         analysis = engine.analyze_customer_engagement(customer, customer_emails)
@@ -407,20 +392,22 @@ def analyze_all_customers():
     try:
         sheets = get_sheets()
         customers = sheets.get_customers()
-        sheet_emails = sheets.get_worksheet('Email_Tracking')
-        all_emails = sheet_emails.get_all_records()
+        emails = sheets.get_snapshot('Email_Tracking')
         engine = get_segmentation_engine()
 
-        count = 0
+        generator = get_generation_engine()
+
         max_batch = 10
+        jobs = []
         for customer in customers[:max_batch]:
             customer_id = str(customer.get('id', ''))
-            customer_emails = [e for e in all_emails
-                              if str(e.get('customer_id')) == customer_id
-                              or e.get('contact_email') == customer.get('contact_email', '')]
+            customer_emails = emails.for_customer(customer_id, customer.get('contact_email', ''))
+            jobs.append(engine.engagement_job(customer_id, customer, customer_emails))
 
-            analysis = engine.analyze_customer_engagement(customer, customer_emails)
-            sheets.update_customer(customer_id, {
+        count = 0
+        for result in generator.run(jobs):
+            analysis = result['value'] or engine.default_analysis()
+            sheets.update_customer(result['key'], {
                 'engagement_level': str(analysis.get('engagement_level', '')),
                 'buying_intent': str(analysis.get('buying_intent', '')),
                 'urgency_score': str(analysis.get('urgency_score', '')),
@@ -428,7 +415,6 @@ def analyze_all_customers():
                 'last_analyzed': datetime.now().strftime('%Y-%m-%d %H:%M'),
             })
             count += 1
-            time.sleep(1)
 
         invalidate_cache()
         logger.info(f"Batch AI analysis completed for {count} customers")
@@ -4,7 +4,8 @@ import json
 from collections import Counter
 from datetime import datetime, timedelta
 from flask import Blueprint, render_template
-from app_core import login_required, cached_get_customers, get_sheets, PIPELINE_STAGES, get_user_config
+from app_core import (login_required, cached_get_customers, get_stale_records, PIPELINE_STAGES,
+                      get_user_config, ROUTE_MAX_STALENESS)
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -14,10 +15,9 @@ dashboard_bp = Blueprint('dashboard', __name__)
 def dashboard():
     max_emails = get_user_config('max_emails_per_day', 50)
     try:
-        sheets = get_sheets()
-        customers = cached_get_customers()
-        sheet_emails = sheets.get_worksheet('Email_Tracking')
-        emails = sheet_emails.get_all_records()
+        # Slow or rate-limited Sheets degrades to slightly stale numbers
+        customers = cached_get_customers(ROUTE_MAX_STALENESS['dashboard'])
+        emails = get_stale_records('Email_Tracking', 'dashboard')
     except Exception as e:
         return render_template('dashboard.html', active_page='dashboard', error=str(e),
                                total_customers=0, emails_sent=0, response_rate=0, hot=0,
@@ -6,6 +6,7 @@ import secrets
 from flask import Blueprint, request, redirect, url_for, flash, session
 from google_auth_oauthlib.flow import Flow
 from app_core import login_required, get_current_user, logger, PROJECT_ROOT
+from services.gmail_pool import gmail_pool
 
 # Allow HTTP for local development (required for OAuth on localhost)
 if os.getenv('FLASK_ENV', 'development') != 'production':
@@ -141,6 +142,7 @@ def oauth_callback():
 
         # Save to encrypted database
         user.set_credential('gmail_token', json.dumps(token_data))
+        gmail_pool.invalidate(user.id)
 
         # Clear session state
         session.pop('oauth_state', None)
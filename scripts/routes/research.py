@@ -1,9 +1,10 @@
 """Research routes."""
 
-import time
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from app_core import (login_required, get_sheets, cached_get_customers, invalidate_cache,
-                      AIResearchEngine, get_api_key, get_user_config, logger)
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from app_core import (login_required, get_sheets, cached_customer_snapshot, invalidate_cache,
+                      AIResearchEngine, RESEARCH_FAILED, get_api_key, get_user_config, get_generation_engine,
+                      logger)
+from services.rate_limit import rate_limiter
 
 research_bp = Blueprint('research', __name__)
 
@@ -12,17 +13,17 @@ research_bp = Blueprint('research', __name__)
 @login_required
 def research_page():
     try:
-        customers = cached_get_customers()
+        customers = cached_customer_snapshot()
     except Exception as e:
         return render_template('research.html', active_page='research', error=str(e),
                                customers=[], selected=None, selected_id='')
 
     selected_id = request.args.get('id', '')
-    selected = next((c for c in customers if str(c.get('id')) == selected_id), None) if selected_id else None
+    selected = customers.by_id(selected_id) if selected_id else None
 
     return render_template('research.html',
         active_page='research',
-        customers=customers,
+        customers=customers.records,
         selected=selected,
         selected_id=selected_id,
     )
@@ -34,15 +35,16 @@ def run_research():
     customer_id = request.form.get('customer_id', '')
     try:
         sheets = get_sheets()
-        customers = sheets.get_customers()
-        customer = next((c for c in customers if str(c.get('id')) == customer_id), None)
+        customers = sheets.get_snapshot('Customers')
+        customer = customers.by_id(customer_id)
 
         if not customer:
             flash('Customer not found.', 'danger')
             return redirect(url_for('research.research_page'))
 
         engine = AIResearchEngine(get_api_key())
-        research = engine.research_company(customer.get('company_name', ''), customer.get('company_website', ''))
+        research = engine.research_company(customer.get('company_name', ''), customer.get('company_website', ''),
+                                           fresh=bool(request.form.get('fresh')))
 
         sheets.update_customer(customer_id, {
             'research_status': 'completed',
@@ -74,16 +76,31 @@ def run_research_all():
         delay = get_user_config('research_delay_seconds', 2)
 
         engine = AIResearchEngine(get_api_key())
+        generator = get_generation_engine()
+        # The delay is a minimum spacing between runs, shared with other workers
+        limit_key = f"research:{session.get('user_id', 'default')}"
+        pace = lambda: rate_limiter.acquire(limit_key, rate=1.0 / max(delay, 1), capacity=1)
+        batch = {}
+        for c in pending:
+            customer_id = str(c.get('id', '')).strip()
+            if not customer_id or customer_id in batch:
+                # Results are written back by id, so such rows cannot be researched
+                logger.warning(f"Skipped research for {c.get('company_name', '?')}: missing or duplicate id '{customer_id}'")
+                continue
+            batch[customer_id] = c
+            if len(batch) >= max_per_run:
+                break
+        jobs = [engine.research_job(customer_id, c.get('company_name', ''), c.get('company_website', ''), pace=pace)
+                for customer_id, c in batch.items()]
         count = 0
-        for customer in pending[:max_per_run]:
-            research = engine.research_company(customer.get('company_name', ''), customer.get('company_website', ''))
-            sheets.update_customer(str(customer.get('id', '')), {
+        for result in generator.run(jobs):
+            research = result['value'] or dict(RESEARCH_FAILED)
+            sheets.update_customer(result['key'], {
                 'research_status': 'completed',
                 'research_summary': research.get('summary', ''),
                 'pain_points': research.get('pain_points', '')
             })
             count += 1
-            time.sleep(delay)
 
         invalidate_cache()
         logger.info(f"Batch research completed for {count} customers")
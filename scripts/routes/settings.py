@@ -222,8 +222,8 @@ def test_api_key():
             return redirect(url_for('settings.settings_page'))
 
         # Test API connection
-        import anthropic
-        client = anthropic.Anthropic(api_key=api_key)
+        from services.retry import anthropic_client
+        client = anthropic_client(api_key=api_key)
 
         message = client.messages.create(
             model="claude-sonnet-4-20250514",
@@ -285,6 +285,30 @@ def test_sheets():
     return redirect(url_for('settings.settings_page'))
 
 
+@settings_bp.route('/settings/resync-sheets', methods=['POST'])
+@login_required
+def resync_sheets():
+    """Force a full re-pull of the local Sheets mirror."""
+    user = get_current_user()
+    if not user:
+        flash('Session expired. Please log in again.', 'warning')
+        return redirect(url_for('auth.login'))
+
+    try:
+        from app_core import get_sheets, invalidate_cache
+        sheets = get_sheets()
+        results = sheets.sync_mirror(force=True)
+        invalidate_cache()
+        summary = ', '.join(f"{name}: {r.get('rows', 0)} rows ({r.get('changed', 0)} changed)"
+                            for name, r in results.items())
+        flash(f'✅ Local mirror resynced. {summary}', 'success')
+        logger.info(f"Mirror resync for user {user.email}: {results}")
+    except Exception as e:
+        safe_flash_error(e, 'Resync Sheets')
+
+    return redirect(url_for('settings.settings_page'))
+
+
 @settings_bp.route('/settings/test-gmail', methods=['POST'])
 @login_required
 def test_gmail():
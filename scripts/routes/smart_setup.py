@@ -169,9 +169,9 @@ def auto_complete_setup():
         # Step 2: Test connections for configured items
         if user.has_credential('anthropic_api_key'):
             try:
-                import anthropic
+                from services.retry import anthropic_client
                 api_key = user.get_credential('anthropic_api_key')
-                client = anthropic.Anthropic(api_key=api_key)
+                client = anthropic_client(api_key=api_key)
                 message = client.messages.create(
                     model="claude-sonnet-4-20250514",
                     max_tokens=10,
@@ -319,9 +319,9 @@ def test_all_credentials():
     # Test Anthropic API
     if user.has_credential('anthropic_api_key'):
         try:
-            import anthropic
+            from services.retry import anthropic_client
             api_key = user.get_credential('anthropic_api_key')
-            client = anthropic.Anthropic(api_key=api_key)
+            client = anthropic_client(api_key=api_key)
             message = client.messages.create(
                 model="claude-sonnet-4-20250514",
                 max_tokens=10,
@@ -3,14 +3,17 @@
 import csv
 import io
 import time
+import uuid
 from datetime import datetime, timedelta
 from flask import Blueprint, render_template, request, redirect, url_for, flash, Response
 from app_core import (login_required, get_sheets, PIPELINE_STAGES, SPAM_DOMAINS,
                       EmailTracker, EmailPersonalizationEngine, get_api_key,
                       get_sender_info, get_user_config, create_email_log,
                       classify_reply, classify_reply_smart, logger, safe_flash_error,
-                      get_gmail_service_for_user)
-from services.email_service import send_email_via_gmail
+                      get_gmail_service_for_user, get_stale_records, enqueue_email, is_valid_email,
+                      get_current_user, wake_outbox_drain, get_generation_engine)
+from services.outbox import outbox, idempotency_key
+from services.gmail_fetch import sender_address, reply_match_keys
 
 tracking_bp = Blueprint('tracking', __name__)
 
@@ -22,9 +25,7 @@ PER_PAGE = 25
 def tracking_page():
     followup_days = get_user_config('followup_days', 3)
     try:
-        sheets = get_sheets()
-        sheet_emails = sheets.get_worksheet('Email_Tracking')
-        emails = sheet_emails.get_all_records()
+        emails = get_stale_records('Email_Tracking', 'tracking')
     except Exception as e:
         return render_template('tracking.html', active_page='tracking', error=str(e),
                                emails=[], tab='all', total_count=0,
@@ -77,6 +78,10 @@ def tracking_page():
     start = (page - 1) * PER_PAGE
     paginated = filtered[start:start + PER_PAGE]
 
+    user = get_current_user()
+    outbox_counts = outbox.counts(user.id) if user else {}
+    outbox_dead = outbox.items(user.id, statuses=('dead',), limit=10) if user else []
+
     return render_template('tracking.html',
         active_page='tracking',
         emails=paginated,
@@ -88,90 +93,101 @@ def tracking_page():
         pipeline_stages=PIPELINE_STAGES,
         page=page,
         total_pages=total_pages,
+        outbox_counts=outbox_counts,
+        outbox_dead=outbox_dead,
     )
 
 
+@tracking_bp.route('/tracking/outbox/<int:item_id>/retry', methods=['POST'])
+@login_required
+def outbox_retry(item_id):
+    """Give a dead outbox item a fresh set of send attempts."""
+    if outbox.retry(item_id, user_id=get_current_user().id):
+        wake_outbox_drain()
+        flash('Email queued for another attempt.', 'success')
+    else:
+        flash('That email is no longer waiting for a retry.', 'warning')
+    return redirect(url_for('tracking.tracking_page'))
+
+
 @tracking_bp.route('/tracking/check_replies')
 @login_required
 def check_replies_now():
     try:
         gmail_service = get_gmail_service_for_user()
-        tracker = EmailTracker.__new__(EmailTracker)
-        tracker.service = gmail_service
+        tracker = EmailTracker.from_service(gmail_service, f"gmail:{get_sender_info()['sender_email'] or 'me'}")
 
-        replies = tracker.check_new_replies(since_hours=24)
+        sheets = get_sheets()
+        tracking = sheets.get_snapshot('Email_Tracking', max_age=0)
+
+        def keep(message):
+            # Decided on headers alone: only tracked, non-spam senders get their bodies downloaded
+            sender = sender_address(message)
+            return not any(d in sender for d in SPAM_DOMAINS) and \
+                tracking.for_reply(sender=sender, **reply_match_keys(message)) is not None
+
+        replies = tracker.check_new_replies(since_hours=24, keep=keep)
 
         if not replies:
             flash('No new replies found.', 'info')
             return redirect(url_for('tracking.tracking_page'))
 
-        sheets = get_sheets()
-        tracking_sheet = sheets.get_worksheet('Email_Tracking')
-        tracking_records = tracking_sheet.get_all_records()
-        headers = tracking_sheet.row_values(1)
-
-        for col_name in ['replied', 'reply_date', 'reply_content_summary', 'next_action', 'detected_stage']:
-            if col_name not in headers:
-                tracking_sheet.update_cell(1, len(headers) + 1, col_name)
-                headers.append(col_name)
-
-        updated = 0
-        for reply in replies:
-            from_email = reply['from']
-            if '<' in from_email:
-                from_email = from_email.split('<')[1].split('>')[0].strip()
-
-            if any(d in from_email.lower() for d in SPAM_DOMAINS):
-                continue
+        headers = sheets.ensure_columns('Email_Tracking', ['replied', 'reply_date', 'reply_content_summary',
+                                                           'next_action', 'detected_stage'])
+
+        with sheets.batch_writes():
+            updated = 0
+            for reply in replies:
+                from_email = reply['from']
+                if '<' in from_email:
+                    from_email = from_email.split('<')[1].split('>')[0].strip()
 
-            reply_body = reply.get('body', '')
-
-            # Find matching customer record first for context
-            matched_record = None
-            for record in tracking_records:
-                record_email = record.get('contact_email', '').lower()
-                if record_email and record_email == from_email.lower():
-                    matched_record = record
-                    break
-
-            # Use AI-powered classification with customer context
-            if matched_record:
-                customer_context = {
-                    'company_name': matched_record.get('company_name', ''),
-                    'industry': matched_record.get('industry', ''),
-                }
-                current_stage = int(matched_record.get('pipeline_stage', 1)) if str(matched_record.get('pipeline_stage', '')).isdigit() else 1
-
-                classification = classify_reply_smart(
-                    reply_body=reply_body,
-                    subject=reply.get('subject', ''),
-                    current_stage=current_stage,
-                    customer_context=customer_context,
-                    use_ai=True
-                )
-
-                req_type = classification['intent']
-                detected_stage = classification['stage']
-                confidence = classification['confidence']
-                urgency = classification.get('urgency_level', 'medium')
-                sentiment = classification.get('sentiment', 'neutral')
-                buying_signals = classification.get('buying_signals', [])
-
-                logger.info(f"AI Classification: {req_type} (stage {detected_stage}, confidence {confidence:.2f}, urgency {urgency}, sentiment {sentiment})")
-
-                if buying_signals:
-                    logger.info(f"Buying signals detected: {buying_signals}")
-            else:
-                # Fallback to simple keyword classification
-                req_type, detected_stage = classify_reply(reply_body)
-                confidence = 0.5
-
-            if detected_stage is None:
-                detected_stage = 2
-
-            for idx, record in enumerate(tracking_records, start=2):
-                record_email = record.get('contact_email', '').lower()
-                if record_email and record_email == from_email.lower():
+                if any(d in from_email.lower() for d in SPAM_DOMAINS):
+                    continue
+
+                reply_body = reply.get('body', '')
+
+                # Find matching customer record first for context
+                matched = tracking.for_reply(reply.get('thread_id', ''), reply.get('message_ids', ()), from_email)
+                matched_record = matched[1] if matched else None
+
+                # Use AI-powered classification with customer context
+                if matched_record:
+                    customer_context = {
+                        'company_name': matched_record.get('company_name', ''),
+                        'industry': matched_record.get('industry', ''),
+                    }
+                    current_stage = int(matched_record.get('pipeline_stage', 1)) if str(matched_record.get('pipeline_stage', '')).isdigit() else 1
+
+                    classification = classify_reply_smart(
+                        reply_body=reply_body,
+                        subject=reply.get('subject', ''),
+                        current_stage=current_stage,
+                        customer_context=customer_context,
+                        use_ai=True
+                    )
+
+                    req_type = classification['intent']
+                    detected_stage = classification['stage']
+                    confidence = classification['confidence']
+                    urgency = classification.get('urgency_level', 'medium')
+                    sentiment = classification.get('sentiment', 'neutral')
+                    buying_signals = classification.get('buying_signals', [])
+
+                    logger.info(f"AI Classification: {req_type} (stage {detected_stage}, confidence {confidence:.2f}, urgency {urgency}, sentiment {sentiment})")
+
+                    if buying_signals:
+                        logger.info(f"Buying signals detected: {buying_signals}")
+                else:
+                    # Fallback to simple keyword classification
+                    req_type, detected_stage = classify_reply(reply_body)
+                    confidence = 0.5
+
+                if detected_stage is None:
+                    detected_stage = 2
+
+                if matched:
+                    idx, record = matched
                     current_stage = int(record.get('pipeline_stage', 1)) if str(record.get('pipeline_stage', '')).isdigit() else 1
                     if detected_stage is None:
                         detected_stage = min(current_stage + 1, max(PIPELINE_STAGES.keys()))
@@ -185,13 +201,9 @@ def check_replies_now():
                         'detected_stage': str(detected_stage),
                     }
 
-                    for key, val in updates.items():
-                        if key in headers:
-                            tracking_sheet.update_cell(idx, headers.index(key) + 1, val)
+                    sheets.update_row('Email_Tracking', idx, updates, headers)
 
                     updated += 1
-                    time.sleep(0.5)
-                    break
 
         logger.info(f"Checked replies: {updated} updated")
         flash(f'Found and processed {updated} replies!', 'success')
@@ -212,8 +224,8 @@ def follow_up_send():
 
     try:
         sheets = get_sheets()
-        customers = sheets.get_customers()
-        customer = next((c for c in customers if str(c.get('id')) == customer_id), None)
+        customers = sheets.get_snapshot('Customers')
+        customer = customers.by_id(customer_id)
 
         if not customer:
             flash('Customer not found.', 'danger')
@@ -224,6 +236,10 @@ def follow_up_send():
             flash('Customer has no email.', 'danger')
             return redirect(url_for('tracking.tracking_page'))
 
+        if outbox.get(idempotency_key(customer_id, stage, email_id)):
+            flash(f'A Stage {stage} follow-up to {to_email} is already queued.', 'info')
+            return redirect(url_for('tracking.tracking_page'))
+
         stage_info = PIPELINE_STAGES.get(stage, {})
         attachment_files = stage_info.get('attachments', [])
 
@@ -244,42 +260,22 @@ def follow_up_send():
         subject = email_data.get('subject', '')
         body = email_data.get('body', '')
 
-        sender = get_sender_info()
-        gmail_service = get_gmail_service_for_user()
-        msg_id, error = send_email_via_gmail(to_email, subject, body, attachment_files,
-                                              sender_name=sender['sender_name'],
-                                              sender_email=sender['sender_email'],
-                                              gmail_service=gmail_service)
-        if error:
-            flash(f'Failed to send: {error}', 'danger')
-            return redirect(url_for('tracking.tracking_page'))
-
+        get_gmail_service_for_user()  # fail before queueing if Gmail isn't set up
         email_log = create_email_log(customer_id, customer, subject, body, stage,
                                      attachments=';'.join(attachment_files),
                                      status='sent', email_type='follow_up',
                                      reviewed_by='auto_approved',
-                                     gmail_msg_id=msg_id or '',
                                      confidence=email_data.get('confidence_score', ''))
-        import uuid
         email_log['email_id'] = f"FU{int(time.time())}_{uuid.uuid4().hex[:6]}"
         email_log['reply_content_summary'] = f'Follow-up to {email_id}'
-        sheets.log_email(email_log)
+        enqueue_email(customer_id, stage, email_id, to_email, subject, body, attachment_files, effects={
+            'log': email_log,
+            'tracking': {email_id: {'status': 'followed_up', 'next_action': f'Sent Stage {stage} follow-up'}},
+            'customer': {customer_id: {'pipeline_stage': stage}},
+        })
 
-        tracking_sheet = sheets.get_worksheet('Email_Tracking')
-        records = tracking_sheet.get_all_records()
-        headers = tracking_sheet.row_values(1)
-        for idx, record in enumerate(records, start=2):
-            if record.get('email_id') == email_id:
-                if 'status' in headers:
-                    tracking_sheet.update_cell(idx, headers.index('status') + 1, 'followed_up')
-                if 'next_action' in headers:
-                    tracking_sheet.update_cell(idx, headers.index('next_action') + 1, f'Sent Stage {stage} follow-up')
-                break
-
-        sheets.update_customer(customer_id, {'pipeline_stage': stage})
-
-        logger.info(f"Follow-up sent to {to_email} at stage {stage}")
-        flash(f'Follow-up sent to {to_email}! Stage {stage} ({stage_info.get("name", "")}) with {", ".join(attachment_files)}', 'success')
+        logger.info(f"Follow-up to {to_email} at stage {stage} queued")
+        flash(f'Follow-up to {to_email} queued! Stage {stage} ({stage_info.get("name", "")}) with {", ".join(attachment_files)}', 'success')
 
     except Exception as e:
         logger.error(f"Follow-up failed: {e}")
@@ -295,10 +291,8 @@ def auto_followup():
     followup_days = get_user_config('followup_days', 3)
     try:
         sheets = get_sheets()
-        tracking_sheet = sheets.get_worksheet('Email_Tracking')
-        emails = tracking_sheet.get_all_records()
-        headers = tracking_sheet.row_values(1)
-        customers = sheets.get_customers()
+        emails = sheets.get_records('Email_Tracking', max_age=0)
+        customers = sheets.get_snapshot('Customers')
 
         now = datetime.now()
 
@@ -320,21 +314,26 @@ def auto_followup():
                 continue
 
             if (now - sent_date).days >= delay_days:
-                stale.append((idx, e))
+                next_stage = min(current_stage + 1, max(PIPELINE_STAGES.keys()))
+                if not outbox.get(idempotency_key(e.get('customer_id', ''), next_stage, e.get('email_id', ''))):
+                    stale.append((idx, e))
 
         if not stale:
             flash('No stale emails found (all within their stage delay or already replied).', 'info')
             return redirect(url_for('tracking.tracking_page'))
 
         engine = EmailPersonalizationEngine(get_api_key())
-        sender = get_sender_info()
-        gmail_service = get_gmail_service_for_user()
+        generator = get_generation_engine()
+        get_gmail_service_for_user()  # fail before queueing if Gmail isn't set up
         sent_count = 0
         fail_count = 0
 
+        # Drafts are generated concurrently; each is queued as soon as it arrives
+        jobs = []
+        pending = {}
         for idx, e in stale:
             customer_id = e.get('customer_id', '')
-            customer = next((c for c in customers if str(c.get('id')) == customer_id), None)
+            customer = customers.by_id(customer_id)
             if not customer:
                 continue
 
@@ -345,7 +344,6 @@ def auto_followup():
             current_stage = int(e.get('pipeline_stage', 1)) if str(e.get('pipeline_stage', '1')).isdigit() else 1
             next_stage = min(current_stage + 1, max(PIPELINE_STAGES.keys()))
             stage_info = PIPELINE_STAGES.get(next_stage, {})
-            attachment_files = stage_info.get('attachments', [])
 
             research = {
                 'summary': customer.get('research_summary', ''),
@@ -355,47 +353,43 @@ def auto_followup():
             delay_days = PIPELINE_STAGES.get(current_stage, {}).get('followup_days', followup_days)
             context = f"This is an automated follow-up. The previous email (Stage {current_stage}) was sent {delay_days}+ days ago with no reply. Now sending Stage {next_stage} ({stage_info.get('name', '')})."
 
+            pending[idx] = (e, customer, to_email, next_stage, stage_info.get('attachments', []))
+            jobs.append(engine.email_job(idx, customer, research, next_stage, context))
+
+        for result in generator.run(jobs):
+            e, customer, to_email, next_stage, attachment_files = pending[result['key']]
+            customer_id = e.get('customer_id', '')
             try:
-                email_data = engine.generate_email(customer, research, next_stage, context)
+                email_data = result['value']
                 if not email_data:
                     fail_count += 1
                     continue
 
                 subject = email_data.get('subject', '')
                 body = email_data.get('body', '')
-                msg_id, error = send_email_via_gmail(to_email, subject, body, attachment_files,
-                                                      sender_name=sender['sender_name'],
-                                                      sender_email=sender['sender_email'],
-                                                      gmail_service=gmail_service)
-                if error:
-                    fail_count += 1
-                    continue
-
                 email_log = create_email_log(customer_id, customer, subject, body, next_stage,
                                              attachments=';'.join(attachment_files),
                                              status='sent', email_type='auto_followup',
                                              reviewed_by='auto_approved',
-                                             gmail_msg_id=msg_id or '',
                                              confidence=email_data.get('confidence_score', ''))
-                import uuid as _uuid
-                email_log['email_id'] = f"AFU{int(time.time())}_{customer_id}_{_uuid.uuid4().hex[:4]}"
+                email_log['email_id'] = f"AFU{int(time.time())}_{customer_id}_{uuid.uuid4().hex[:4]}"
                 email_log['reply_content_summary'] = f'Auto follow-up to {e.get("email_id", "")}'
-                sheets.log_email(email_log)
-
-                if 'status' in headers:
-                    tracking_sheet.update_cell(idx, headers.index('status') + 1, 'followed_up')
-                if 'next_action' in headers:
-                    tracking_sheet.update_cell(idx, headers.index('next_action') + 1, f'Auto follow-up sent (Stage {next_stage})')
-
-                sheets.update_customer(customer_id, {'pipeline_stage': next_stage})
+                enqueue_email(customer_id, next_stage, e.get('email_id', ''), to_email, subject, body,
+                              attachment_files, effects={
+                                  'log': email_log,
+                                  'tracking': {e.get('email_id', ''): {
+                                      'status': 'followed_up',
+                                      'next_action': f'Auto follow-up sent (Stage {next_stage})',
+                                  }},
+                                  'customer': {customer_id: {'pipeline_stage': next_stage}},
+                              })
                 sent_count += 1
-                time.sleep(1)
             except Exception as inner_e:
                 logger.error(f"Auto follow-up failed for {to_email}: {inner_e}")
                 fail_count += 1
 
-        logger.info(f"Auto follow-up: {sent_count} sent, {fail_count} failed out of {len(stale)} stale")
-        flash(f'Auto follow-up complete! Sent: {sent_count}, Failed: {fail_count} (from {len(stale)} stale emails)',
+        logger.info(f"Auto follow-up: {sent_count} queued, {fail_count} failed out of {len(stale)} stale")
+        flash(f'Auto follow-up complete! Queued: {sent_count}, Failed: {fail_count} (from {len(stale)} stale emails)',
               'success' if fail_count == 0 else 'warning')
 
     except Exception as e:
@@ -411,57 +405,46 @@ def send_scheduled():
     """Send all queued emails whose scheduled_date has arrived."""
     try:
         sheets = get_sheets()
-        tracking_sheet = sheets.get_worksheet('Email_Tracking')
-        emails = tracking_sheet.get_all_records()
-        headers = tracking_sheet.row_values(1)
-        customers = sheets.get_customers()
+        emails = sheets.get_records('Email_Tracking', max_age=0)
+        customers = sheets.get_snapshot('Customers')
         today = datetime.now().strftime('%Y-%m-%d')
 
         scheduled = []
         for idx, e in enumerate(emails, start=2):
             sched_date = str(e.get('scheduled_date', '')).strip()
-            if (e.get('status') == 'queued' and sched_date and sched_date <= today):
+            if (e.get('status') == 'queued' and sched_date and sched_date <= today
+                    and not outbox.get(idempotency_key(e.get('customer_id', ''), e.get('pipeline_stage', ''),
+                                                       e.get('email_id', '')))):
                 scheduled.append((idx, e))
 
         if not scheduled:
             flash('No scheduled emails ready to send.', 'info')
             return redirect(url_for('tracking.tracking_page'))
 
-        sender = get_sender_info()
-        gmail_service = get_gmail_service_for_user()
+        get_gmail_service_for_user()  # fail before queueing if Gmail isn't set up
         sent_count = 0
         fail_count = 0
         for idx, e in scheduled:
             customer_id = e.get('customer_id', '')
-            customer = next((c for c in customers if str(c.get('id')) == customer_id), None)
+            customer = customers.by_id(customer_id)
             if not customer:
                 fail_count += 1
                 continue
 
             to_email = customer.get('contact_email', '')
-            subject = e.get('subject', '')
-            body = e.get('body', '')
-            att_str = e.get('attachments', '')
-            attachment_files = [a.strip() for a in str(att_str).split(';') if a.strip()] if att_str else []
-
-            msg_id, error = send_email_via_gmail(to_email, subject, body, attachment_files,
-                                                  sender_name=sender['sender_name'],
-                                                  sender_email=sender['sender_email'],
-                                                  gmail_service=gmail_service)
-            if error:
-                logger.warning(f"Scheduled send failed for {customer.get('company_name', '')}: {error}")
+            if not is_valid_email(to_email):
+                logger.warning(f"Scheduled send skipped for {customer.get('company_name', '')}: "
+                               f"invalid email '{to_email}'")
                 fail_count += 1
                 continue
-
-            updates = {'status': 'sent', 'sent_time': datetime.now().strftime('%H:%M:%S'),
-                       'gmail_msg_id': msg_id or ''}
-            for key, val in updates.items():
-                if key in headers:
-                    tracking_sheet.update_cell(idx, headers.index(key) + 1, val)
+            att_str = e.get('attachments', '')
+            attachment_files = [a.strip() for a in str(att_str).split(';') if a.strip()] if att_str else []
+            enqueue_email(customer_id, e.get('pipeline_stage', ''), e.get('email_id', ''), to_email,
+                          e.get('subject', ''), e.get('body', ''), attachment_files,
+                          effects={'mark_sent': e.get('email_id', '')})
             sent_count += 1
-            time.sleep(1)
 
-        flash(f'Scheduled send complete! Sent: {sent_count}, Failed: {fail_count}',
+        flash(f'Scheduled send complete! Queued: {sent_count}, Failed: {fail_count}',
               'success' if fail_count == 0 else 'warning')
 
     except Exception as e:
@@ -478,9 +461,8 @@ def followup_queue():
     followup_days = get_user_config('followup_days', 3)
     try:
         sheets = get_sheets()
-        tracking_sheet = sheets.get_worksheet('Email_Tracking')
-        emails = tracking_sheet.get_all_records()
-        customers = sheets.get_customers()
+        emails = sheets.get_records('Email_Tracking')
+        customers = sheets.get_snapshot('Customers')
 
         queue = []
         now = datetime.now()
@@ -507,7 +489,7 @@ def followup_queue():
 
             if days_overdue >= 0:
                 customer_id = e.get('customer_id', '')
-                customer = next((c for c in customers if str(c.get('id')) == customer_id), None)
+                customer = customers.by_id(customer_id)
                 next_stage = min(current_stage + 1, max(PIPELINE_STAGES.keys()))
                 next_info = PIPELINE_STAGES.get(next_stage, {})
 
@@ -561,35 +543,33 @@ def snooze_followup():
 
     try:
         sheets = get_sheets()
-        tracking_sheet = sheets.get_worksheet('Email_Tracking')
-        records = tracking_sheet.get_all_records()
-        headers = tracking_sheet.row_values(1)
-
-        for idx, record in enumerate(records, start=2):
-            if record.get('email_id') == email_id:
-                old_date_str = record.get('sent_date', '')
-                try:
-                    old_date = datetime.strptime(old_date_str, '%Y-%m-%d')
-                except ValueError:
-                    flash(f'Cannot snooze: invalid sent_date for email {email_id}.', 'danger')
-                    break
+        hit = sheets.get_snapshot('Email_Tracking', max_age=0).find('email_id', email_id)
+        headers = sheets.get_headers('Email_Tracking')
+
+        if not hit:
+            flash('Email not found.', 'danger')
+        else:
+            idx, record = hit
+            old_date_str = record.get('sent_date', '')
+            try:
+                old_date = datetime.strptime(old_date_str, '%Y-%m-%d')
+            except ValueError:
+                old_date = None
+                flash(f'Cannot snooze: invalid sent_date for email {email_id}.', 'danger')
+            if old_date:
                 new_date = (old_date + timedelta(days=snooze_days)).strftime('%Y-%m-%d')
                 current_stage = int(record.get('pipeline_stage', 1)) if str(record.get('pipeline_stage', '1')).isdigit() else 1
                 delay = PIPELINE_STAGES.get(current_stage, {}).get('followup_days', followup_days)
                 new_due = (datetime.strptime(new_date, '%Y-%m-%d') + timedelta(days=delay)).strftime('%Y-%m-%d')
 
-                if 'sent_date' in headers:
-                    tracking_sheet.update_cell(idx, headers.index('sent_date') + 1, new_date)
-                if 'next_action' in headers:
-                    tracking_sheet.update_cell(idx, headers.index('next_action') + 1,
-                                               f'Snoozed {snooze_days}d (original: {old_date_str})')
+                sheets.update_row('Email_Tracking', idx, {
+                    'sent_date': new_date,
+                    'next_action': f'Snoozed {snooze_days}d (original: {old_date_str})',
+                }, headers)
 
                 label = f' for {company_name}' if company_name else ''
                 logger.info(f"Snoozed follow-up {email_id} by {snooze_days} days")
                 flash(f'Snoozed{label} by {snooze_days} days. New due date: {new_due}', 'info')
-                break
-        else:
-            flash('Email not found.', 'danger')
 
     except Exception as e:
         logger.error(f"Snooze error: {e}")
@@ -609,20 +589,17 @@ def skip_followup():
 
     try:
         sheets = get_sheets()
-        tracking_sheet = sheets.get_worksheet('Email_Tracking')
-        records = tracking_sheet.get_all_records()
-        headers = tracking_sheet.row_values(1)
-
-        for idx, record in enumerate(records, start=2):
-            if record.get('email_id') == email_id:
-                if 'status' in headers:
-                    tracking_sheet.update_cell(idx, headers.index('status') + 1, 'skipped')
-                if 'next_action' in headers:
-                    tracking_sheet.update_cell(idx, headers.index('next_action') + 1, 'Follow-up skipped by user')
-
-                logger.info(f"Skipped follow-up for {email_id}")
-                flash('Follow-up skipped. This email will no longer appear in the queue.', 'warning')
-                break
+        hit = sheets.get_snapshot('Email_Tracking', max_age=0).find('email_id', email_id)
+        headers = sheets.get_headers('Email_Tracking')
+
+        if hit:
+            sheets.update_row('Email_Tracking', hit[0], {
+                'status': 'skipped',
+                'next_action': 'Follow-up skipped by user',
+            }, headers)
+
+            logger.info(f"Skipped follow-up for {email_id}")
+            flash('Follow-up skipped. This email will no longer appear in the queue.', 'warning')
         else:
             flash('Email not found.', 'danger')
 
@@ -642,8 +619,7 @@ def pipeline_view():
     followup_days = get_user_config('followup_days', 3)
     try:
         sheets = get_sheets()
-        sheet_emails = sheets.get_worksheet('Email_Tracking')
-        emails = sheet_emails.get_all_records()
+        emails = sheets.get_records('Email_Tracking')
         customers = sheets.get_customers()
         customer_map = {str(c.get('id', '')): c for c in customers}
     except Exception as e:
@@ -775,8 +751,7 @@ def export_tracking_csv():
     """Export email tracking data as CSV."""
     try:
         sheets = get_sheets()
-        tracking_sheet = sheets.get_worksheet('Email_Tracking')
-        emails = tracking_sheet.get_all_records()
+        emails = sheets.get_records('Email_Tracking')
 
         output = io.StringIO()
         if emails:
@@ -0,0 +1,28 @@
+"""Inbound webhooks - Gmail push notifications delivered by Pub/Sub."""
+
+import hmac
+from flask import Blueprint, request, abort
+from app_core import logger
+from services import inbox_push
+from services.inbox_push import decode_push, push_notifications
+
+webhooks_bp = Blueprint('webhooks', __name__)
+
+
+@webhooks_bp.route('/webhooks/gmail', methods=['POST'])
+def gmail_push():
+    """Record a Gmail change notification; inbox consumers sync on their next wakeup."""
+    token = inbox_push.PUSH_TOKEN
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.args.get('token', ''), token):
+        abort(403)
+    try:
+        mailbox, history_id = decode_push(request.get_json(silent=True))
+    except ValueError as e:
+        # Acknowledged anyway: Pub/Sub would redeliver a malformed message forever
+        logger.warning(f"Ignored Gmail push: {e}")
+        return '', 204
+    push_notifications.record(mailbox, history_id)
+    logger.debug(f"Gmail push for {mailbox} at history {history_id}")
+    return '', 204
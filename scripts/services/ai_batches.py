@@ -0,0 +1,200 @@
+"""Offline email generation through the Message Batches API.
+
+Submitted batches are recorded in ``data/ai_batches.db``; ``poll_ai_batches``
+turns their results into drafts for review.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import itertools
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from models import get_db, PROJECT_ROOT
+from services.retry import call, anthropic_client
+from services.ai_cache import ai_cache
+
+logger = logging.getLogger('quartz_web')
+
+BATCH_BACKEND = os.getenv('AI_BATCH_BACKEND', 'anthropic')
+POLL_SECONDS = int(os.getenv('AI_BATCH_POLL_SECONDS', '60'))
+
+STATUSES = ('in_progress', 'imported', 'failed')
+
+_initialized_paths = set()
+
+
+def ai_batches_path():
+    return os.path.join(PROJECT_ROOT, 'data', 'ai_batches.db')
+
+
+def batch_client(api_key: str):
+    """Client whose ``messages.batches`` the configured backend answers."""
+    client = anthropic_client(api_key)
+    return LocalBatchClient(client) if BATCH_BACKEND == 'local' else client
+
+
+def submit_batch(client, requests: List[Dict]) -> str:
+    """Submit ``[{'custom_id', 'params'}]`` as one batch. Returns the batch id."""
+    batch = call('anthropic', client.messages.batches.create, requests=requests, idempotent=False)
+    return batch.id
+
+
+def collect_batch(client, batch_id: str) -> Optional[Dict[str, Optional[str]]]:
+    """``{custom_id: text}`` once the batch has ended (None for requests that failed), else None."""
+    batch = call('anthropic', client.messages.batches.retrieve, batch_id)
+    if batch.processing_status != 'ended':
+        return None
+    results = {}
+    for entry in call('anthropic', client.messages.batches.results, batch_id):
+        result = entry.result
+        if result.type == 'succeeded':
+            ai_cache.record_usage('email_batch', result.message)
+            results[entry.custom_id] = result.message.content[0].text
+        else:
+            results[entry.custom_id] = None
+    return results
+
+
+class AIBatchStore:
+    """Submitted generation batches and the customers their requests belong to."""
+
+    def __init__(self, path=None):
+        self.path = path or ai_batches_path()
+        if self.path not in _initialized_paths:
+            self._init_schema()
+            _initialized_paths.add(self.path)
+
+    def _init_schema(self):
+        with get_db(self.path) as db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS ai_batches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    batch_id TEXT NOT NULL UNIQUE,
+                    stage INTEGER NOT NULL,
+                    jobs TEXT NOT NULL DEFAULT '{}',
+                    status TEXT NOT NULL DEFAULT 'in_progress',
+                    succeeded INTEGER NOT NULL DEFAULT 0,
+                    errored INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    next_poll_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            db.execute("CREATE INDEX IF NOT EXISTS idx_ai_batches_due ON ai_batches(status, next_poll_at)")
+
+    @contextmanager
+    def _locked(self):
+        """Connection holding the database write lock for the whole block."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _batch(row) -> Dict:
+        batch = dict(row)
+        batch['jobs'] = json.loads(batch['jobs'] or '{}')
+        return batch
+
+    def record(self, user_id: int, batch_id: str, stage: int, jobs: Dict[str, Dict]) -> Dict:
+        """Remember a submitted batch; ``jobs`` maps custom_id to what its draft needs."""
+        now = time.time()
+        with get_db(self.path) as db:
+            cursor = db.execute(
+                "INSERT INTO ai_batches (user_id, batch_id, stage, jobs, next_poll_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, batch_id, stage, json.dumps(jobs), now + POLL_SECONDS, now, now),
+            )
+            return self._batch(db.execute("SELECT * FROM ai_batches WHERE id = ?", (cursor.lastrowid,)).fetchone())
+
+    def claim_due(self, interval: float = POLL_SECONDS) -> List[Dict]:
+        """In-progress batches due for a check; the next check is pushed back ``interval`` seconds."""
+        now = time.time()
+        with self._locked() as db:
+            rows = db.execute("SELECT * FROM ai_batches WHERE status = 'in_progress' AND next_poll_at <= ? "
+                              "ORDER BY next_poll_at", (now,)).fetchall()
+            for row in rows:
+                db.execute("UPDATE ai_batches SET next_poll_at = ? WHERE id = ?", (now + interval, row['id']))
+        return [self._batch(row) for row in rows]
+
+    def finish(self, row_id: int, status: str, succeeded: int = 0, errored: int = 0, error: Optional[str] = None):
+        with get_db(self.path) as db:
+            db.execute("UPDATE ai_batches SET status = ?, succeeded = ?, errored = ?, last_error = ?, updated_at = ? "
+                       "WHERE id = ?", (status, succeeded, errored, error, time.time(), row_id))
+
+    def note_error(self, row_id: int, error: str):
+        with get_db(self.path) as db:
+            db.execute("UPDATE ai_batches SET last_error = ?, updated_at = ? WHERE id = ?",
+                       (error, time.time(), row_id))
+
+    def recent(self, user_id: int, limit: int = 5) -> List[Dict]:
+        with get_db(self.path) as db:
+            rows = db.execute("SELECT * FROM ai_batches WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                              (user_id, limit)).fetchall()
+        return [self._batch(row) for row in rows]
+
+
+class LocalBatches:
+    """In-memory stand-in for ``messages.batches`` that answers through ``messages.create``.
+
+    Batches are shared by every client in the process (the poller builds
+    its own), but not across processes.
+    """
+
+    _ids = itertools.count(1)
+    _batches = {}
+
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, requests):
+        batch_id = f'msgbatch_local_{next(self._ids)}'
+        self._batches[batch_id] = {'requests': list(requests), 'results': None}
+        return SimpleNamespace(id=batch_id, processing_status='in_progress')
+
+    def retrieve(self, batch_id):
+        batch = self._batches[batch_id]
+        if batch['results'] is None:
+            batch['results'] = [self._answer(request) for request in batch['requests']]
+        return SimpleNamespace(id=batch_id, processing_status='ended')
+
+    def results(self, batch_id):
+        return iter(self._batches[batch_id]['results'] or [])
+
+    def _answer(self, request):
+        try:
+            result = SimpleNamespace(type='succeeded', message=self._client.messages.create(**request['params']))
+        except Exception as e:
+            logger.warning(f"Local batch request {request['custom_id']} failed: {e}")
+            result = SimpleNamespace(type='errored', error=str(e))
+        return SimpleNamespace(custom_id=request['custom_id'], result=result)
+
+
+class LocalBatchClient:
+    """``client`` with ``messages.batches`` served by ``LocalBatches``."""
+
+    def __init__(self, client):
+        self._client = client
+        self.messages = SimpleNamespace(create=client.messages.create, batches=LocalBatches(client))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+ai_batches = AIBatchStore()
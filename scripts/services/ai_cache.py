@@ -0,0 +1,222 @@
+"""Persistent cache of Claude research and email responses.
+
+Entries expire per namespace and are evicted least recently used. The module
+also builds the prompt-cached system prefix and records API token usage.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+from models import get_db, PROJECT_ROOT
+
+logger = logging.getLogger('quartz_web')
+
+RESEARCH_TTL = int(os.getenv('AI_CACHE_RESEARCH_TTL_SECONDS', str(7 * 86400)))
+EMAIL_TTL = int(os.getenv('AI_CACHE_EMAIL_TTL_SECONDS', '86400'))
+MAX_BYTES = int(os.getenv('AI_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+# Last-access times are only rewritten when older than this
+TOUCH_INTERVAL = 5
+
+_initialized_paths = set()
+
+
+def ai_cache_path():
+    return os.path.join(PROJECT_ROOT, 'data', 'ai_cache.db')
+
+
+def cached_prefix(text: str) -> List[Dict]:
+    """``system`` content with Anthropic prompt caching enabled on ``text``."""
+    return [{'type': 'text', 'text': text, 'cache_control': {'type': 'ephemeral'}}]
+
+
+def request_key(params: Dict) -> str:
+    """Stable hash of a messages.create request (model, prompt and parameters)."""
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class AIResponseCache:
+    """Size-bounded LRU cache of Claude responses with per-entry TTL, stored in SQLite."""
+
+    def __init__(self, path=None, max_bytes=MAX_BYTES):
+        self.path = path or ai_cache_path()
+        self.max_bytes = max_bytes
+        if self.path not in _initialized_paths:
+            self._init_schema()
+            _initialized_paths.add(self.path)
+
+    def _init_schema(self):
+        with get_db(self.path) as db:
+            db.executescript('''
+                CREATE TABLE IF NOT EXISTS ai_responses (
+                    key TEXT PRIMARY KEY,
+                    namespace TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    input_tokens INTEGER NOT NULL DEFAULT 0,
+                    output_tokens INTEGER NOT NULL DEFAULT 0,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_ai_responses_accessed ON ai_responses(accessed_at);
+                CREATE TABLE IF NOT EXISTS ai_cache_stats (
+                    namespace TEXT PRIMARY KEY,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    misses INTEGER NOT NULL DEFAULT 0,
+                    evictions INTEGER NOT NULL DEFAULT 0,
+                    saved_input_tokens INTEGER NOT NULL DEFAULT 0,
+                    saved_output_tokens INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS prompt_usage (
+                    namespace TEXT PRIMARY KEY,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    input_tokens INTEGER NOT NULL DEFAULT 0,
+                    output_tokens INTEGER NOT NULL DEFAULT 0,
+                    cache_write_tokens INTEGER NOT NULL DEFAULT 0,
+                    cache_read_tokens INTEGER NOT NULL DEFAULT 0
+                );
+            ''')
+
+    @staticmethod
+    def _count(db, namespace, column, n=1):
+        db.execute(
+            f"INSERT INTO ai_cache_stats (namespace, {column}) VALUES (?, ?) "
+            f"ON CONFLICT(namespace) DO UPDATE SET {column} = {column} + excluded.{column}",
+            (namespace, n),
+        )
+
+    # ── Reads ─────────────────────────────────────────────
+    def get(self, namespace: str, key: str) -> Optional[Dict]:
+        """Cached ``{'text', 'input_tokens', 'output_tokens'}``, or None if missing or expired."""
+        now = time.time()
+        with get_db(self.path) as db:
+            row = db.execute("SELECT * FROM ai_responses WHERE key = ?", (key,)).fetchone()
+            if not row or row['expires_at'] <= now:
+                self._count(db, namespace, 'misses')
+                return None
+            self._count(db, namespace, 'hits')
+            self._count(db, namespace, 'saved_input_tokens', row['input_tokens'])
+            self._count(db, namespace, 'saved_output_tokens', row['output_tokens'])
+            if now - row['accessed_at'] > TOUCH_INTERVAL:
+                db.execute("UPDATE ai_responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return {'text': row['text'], 'input_tokens': row['input_tokens'], 'output_tokens': row['output_tokens']}
+
+    # ── Writes ────────────────────────────────────────────
+    def set(self, namespace: str, key: str, text: str, ttl: float, input_tokens: int = 0, output_tokens: int = 0):
+        """Store a response for ``ttl`` seconds, evicting LRU entries past the size cap."""
+        size = len(text.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with get_db(self.path) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO ai_responses (key, namespace, text, input_tokens, output_tokens, size, "
+                "created_at, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, namespace, text, input_tokens, output_tokens, size, now, now + ttl, now),
+            )
+            self._evict(db, now)
+
+    def _evict(self, db, now):
+        db.execute("DELETE FROM ai_responses WHERE expires_at <= ?", (now,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM ai_responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in db.execute("SELECT key, namespace, size FROM ai_responses ORDER BY accessed_at").fetchall():
+            db.execute("DELETE FROM ai_responses WHERE key = ?", (row['key'],))
+            self._count(db, row['namespace'], 'evictions')
+            total -= row['size']
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with get_db(self.path) as db:
+            db.execute("DELETE FROM ai_responses")
+
+    # ── Calling Claude ────────────────────────────────────
+    def complete(self, client, namespace: str, ttl: float, bypass: bool = False, **params) -> str:
+        """Text of ``client.messages.create(**params)``, served from the cache when possible.
+
+        ``bypass`` forces a fresh call; its response replaces the cached one.
+        API errors are raised and nothing is stored.
+        """
+        key = request_key(params)
+        if not bypass:
+            hit = self.get(namespace, key)
+            if hit is not None:
+                return hit['text']
+        return self._store(namespace, key, ttl, client.messages.create(**params))
+
+    async def complete_async(self, create, namespace: str, ttl: float, bypass: bool = False, **params) -> str:
+        """``complete`` for an async ``create(**params)`` coroutine function."""
+        key = request_key(params)
+        if not bypass:
+            hit = self.get(namespace, key)
+            if hit is not None:
+                return hit['text']
+        return self._store(namespace, key, ttl, await create(**params))
+
+    def _store(self, namespace, key, ttl, message) -> str:
+        self.record_usage(namespace, message)
+        text = message.content[0].text
+        usage = getattr(message, 'usage', None)
+        self.set(namespace, key, text, ttl,
+                 input_tokens=getattr(usage, 'input_tokens', 0) or 0,
+                 output_tokens=getattr(usage, 'output_tokens', 0) or 0)
+        return text
+
+    # ── Stats ─────────────────────────────────────────────
+    def record_usage(self, namespace: str, message):
+        """Count one API response's input, output and prompt-cache write/read tokens."""
+        usage = getattr(message, 'usage', None)
+        if usage is None:
+            return
+        counts = [getattr(usage, field, 0) or 0 for field in (
+            'input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')]
+        with get_db(self.path) as db:
+            db.execute(
+                "INSERT INTO prompt_usage (namespace, calls, input_tokens, output_tokens, cache_write_tokens, "
+                "cache_read_tokens) VALUES (?, 1, ?, ?, ?, ?) ON CONFLICT(namespace) DO UPDATE SET "
+                "calls = calls + 1, input_tokens = input_tokens + excluded.input_tokens, "
+                "output_tokens = output_tokens + excluded.output_tokens, "
+                "cache_write_tokens = cache_write_tokens + excluded.cache_write_tokens, "
+                "cache_read_tokens = cache_read_tokens + excluded.cache_read_tokens",
+                (namespace, *counts),
+            )
+
+    def prompt_usage(self) -> Dict[str, Dict]:
+        """Per-namespace API token counts; ``cache_read_rate`` is the share of input read from the prompt cache."""
+        with get_db(self.path) as db:
+            rows = db.execute("SELECT * FROM prompt_usage ORDER BY namespace").fetchall()
+        usage = {}
+        for row in rows:
+            entry = dict(row)
+            namespace = entry.pop('namespace')
+            total_input = entry['input_tokens'] + entry['cache_write_tokens'] + entry['cache_read_tokens']
+            entry['cache_read_rate'] = round(entry['cache_read_tokens'] / total_input, 3) if total_input else 0.0
+            usage[namespace] = entry
+        return usage
+
+    def stats(self) -> Dict:
+        """Hit rate, saved tokens and stored size, across all workers."""
+        with get_db(self.path) as db:
+            row = db.execute(
+                "SELECT COALESCE(SUM(hits), 0) AS hits, COALESCE(SUM(misses), 0) AS misses, "
+                "COALESCE(SUM(evictions), 0) AS evictions, "
+                "COALESCE(SUM(saved_input_tokens), 0) AS saved_input_tokens, "
+                "COALESCE(SUM(saved_output_tokens), 0) AS saved_output_tokens FROM ai_cache_stats"
+            ).fetchone()
+            usage = db.execute("SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS bytes "
+                               "FROM ai_responses").fetchone()
+        result = dict(row)
+        result.update(dict(usage))
+        lookups = result['hits'] + result['misses']
+        result['hit_rate'] = round(result['hits'] / lookups, 3) if lookups else 0.0
+        return result
+
+
+ai_cache = AIResponseCache()
@@ -0,0 +1,117 @@
+"""Bounded-concurrency Claude generation for batch operations.
+
+``AsyncGenerationEngine`` runs ``AIJob``s on the async Anthropic client with
+at most ``AI_CONCURRENCY`` requests in flight; ``run`` bridges it to Flask routes.
+"""
+
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, Optional
+
+from services.retry import call_async, async_anthropic_client
+from services.ai_cache import ai_cache
+
+logger = logging.getLogger('quartz_web')
+
+AI_CONCURRENCY = int(os.getenv('AI_CONCURRENCY', '4'))
+MAX_CONCURRENCY = 16
+
+
+class AIJob:
+    """One Claude request in a batch: build the request, call, parse the text."""
+
+    def __init__(self, key, prepare: Callable[[], Dict], parse: Optional[Callable[[str], Any]] = None,
+                 namespace: Optional[str] = None, ttl: float = 0, fresh: bool = False):
+        self.key = key
+        self.prepare = prepare
+        self.parse = parse
+        self.namespace = namespace
+        self.ttl = ttl
+        self.fresh = fresh
+
+
+class AsyncGenerationEngine:
+    """Runs ``AIJob``s on the async Anthropic client with bounded concurrency."""
+
+    def __init__(self, api_key: str = '', concurrency: int = AI_CONCURRENCY,
+                 limit_key: Optional[str] = None, client=None):
+        self.api_key = api_key
+        self.concurrency = max(1, min(int(concurrency), MAX_CONCURRENCY))
+        self.limit_key = limit_key
+        # Injected clients are not closed; one built here lives for a single stream()
+        self._client = client
+
+    async def _run_job(self, client, job: AIJob) -> Dict:
+        started = time.monotonic()
+        result = {'key': job.key, 'value': None, 'error': None}
+
+        async def create(**params):
+            return await call_async('anthropic', client.messages.create, limit_key=self.limit_key, **params)
+
+        try:
+            params = await asyncio.to_thread(job.prepare)
+            if job.namespace:
+                text = await ai_cache.complete_async(create, job.namespace, job.ttl, bypass=job.fresh, **params)
+            else:
+                text = (await create(**params)).content[0].text
+            result['value'] = job.parse(text) if job.parse else text
+        except Exception as e:
+            logger.warning(f"AI job {job.key} failed: {e}")
+            result['error'] = str(e) or type(e).__name__
+        result['elapsed'] = round(time.monotonic() - started, 2)
+        return result
+
+    async def stream(self, jobs: Iterable[AIJob]) -> AsyncIterator[Dict]:
+        """Yield ``{'key', 'value', 'error', 'elapsed'}`` per job, in completion order."""
+        client = self._client or async_anthropic_client(self.api_key)
+        jobs = iter(jobs)
+        in_flight = set()
+        try:
+            while True:
+                while len(in_flight) < self.concurrency:
+                    job = next(jobs, None)
+                    if job is None:
+                        break
+                    in_flight.add(asyncio.ensure_future(self._run_job(client, job)))
+                if not in_flight:
+                    return
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in in_flight:
+                task.cancel()
+            if self._client is None:
+                await client.close()
+
+    def run(self, jobs: Iterable[AIJob]) -> Iterator[Dict]:
+        """``stream`` for synchronous callers: results are yielded on the calling thread as they complete."""
+        results = queue.Queue()
+        finished = object()
+
+        async def pump():
+            async for result in self.stream(jobs):
+                results.put(result)
+
+        def worker():
+            try:
+                asyncio.run(pump())
+            except Exception as e:
+                results.put(e)
+            finally:
+                results.put(finished)
+
+        thread = threading.Thread(target=worker, name='ai-generation', daemon=True)
+        thread.start()
+        while True:
+            item = results.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        thread.join()
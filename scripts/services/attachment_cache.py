@@ -0,0 +1,101 @@
+"""In-process cache of base64-encoded attachment payloads.
+
+Entries are keyed by (real path, mtime, size) and evicted least recently
+used past ``ATTACHMENT_CACHE_MAX_BYTES``.
+"""
+
+import os
+import threading
+import base64
+from collections import OrderedDict
+from email.mime.base import MIMEBase
+from typing import Dict, Optional
+
+ATTACHMENT_CACHE_MAX_BYTES = int(os.getenv('ATTACHMENT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+
+def _encode(data: bytes) -> str:
+    """Base64 with 76-character lines, as email.encoders.encode_base64 writes it."""
+    return base64.encodebytes(data).decode('ascii')
+
+
+class AttachmentCache:
+    """Encoded attachment payloads keyed by (path, mtime, size), LRU-bounded."""
+
+    def __init__(self, max_bytes: int = ATTACHMENT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> encoded payload
+        self._keys_by_path = {}
+        self._bytes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _drop(self, key):
+        encoded = self._entries.pop(key, None)
+        if encoded is not None:
+            self._bytes -= len(encoded)
+            if self._keys_by_path.get(key[0]) == key:
+                del self._keys_by_path[key[0]]
+
+    def encoded(self, filepath: str) -> str:
+        """Base64 payload of the file, read from disk only when it changed."""
+        path = os.path.realpath(filepath)
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            encoded = self._entries.get(key)
+            if encoded is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return encoded
+            self._stats['misses'] += 1
+
+        with open(path, 'rb') as f:
+            encoded = _encode(f.read())
+
+        with self._lock:
+            stale = self._keys_by_path.get(path)
+            if stale is not None and stale != key:
+                self._drop(stale)
+            if len(encoded) <= self.max_bytes and key not in self._entries:
+                self._entries[key] = encoded
+                self._keys_by_path[path] = key
+                self._bytes += len(encoded)
+                while self._bytes > self.max_bytes:
+                    self._drop(next(iter(self._entries)))
+                    self._stats['evictions'] += 1
+        return encoded
+
+    def mime_part(self, filepath: str, filename: str, subtype: str = 'pdf') -> MIMEBase:
+        """Fresh application/<subtype> attachment part around the cached payload."""
+        part = MIMEBase('application', subtype)
+        part.set_payload(self.encoded(filepath))
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.add_header('Content-Disposition', f'attachment; filename={filename}')
+        return part
+
+    def invalidate(self, filepath: Optional[str] = None):
+        """Drop one file's entry, or everything."""
+        with self._lock:
+            if filepath is None:
+                self._entries.clear()
+                self._keys_by_path.clear()
+                self._bytes = 0
+                return
+            key = self._keys_by_path.get(os.path.realpath(filepath))
+            if key is not None:
+                self._drop(key)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hit_rate': round(self._stats['hits'] / lookups, 3) if lookups else 0.0,
+                **self._stats,
+            }
+
+
+attachment_cache = AttachmentCache()
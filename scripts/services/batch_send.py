@@ -0,0 +1,182 @@
+"""Concurrent batch sending on a bounded worker pool.
+
+``BatchSendEngine`` generates and queues each customer's email on worker
+threads; ``BatchSendJobs`` records the progress of background batch sends.
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from models import get_db, PROJECT_ROOT
+
+logger = logging.getLogger('quartz_web')
+
+BATCH_SEND_WORKERS = int(os.getenv('BATCH_SEND_WORKERS', '4'))
+MAX_WORKERS = 16
+# A running job with no progress for this long died with its web process
+STALE_JOB_SECONDS = int(os.getenv('BATCH_SEND_STALE_SECONDS', '600'))
+
+_initialized_paths = set()
+
+
+def batch_jobs_path():
+    return os.path.join(PROJECT_ROOT, 'data', 'batch_send.db')
+
+
+def workers_for_stage(stage_info: Dict) -> int:
+    """Worker count for a stage: ``send_concurrency`` in the pipeline config, else BATCH_SEND_WORKERS."""
+    try:
+        workers = int(stage_info.get('send_concurrency') or BATCH_SEND_WORKERS)
+    except (TypeError, ValueError):
+        workers = BATCH_SEND_WORKERS
+    return max(1, min(workers, MAX_WORKERS))
+
+
+class BatchSendEngine:
+    """Runs generate and send for many customers on a bounded thread pool.
+
+    ``generate(customer)`` returns the email dict (``subject``, ``body``, ...)
+    or None. ``send(customer, email)`` returns ``(msg_id, error)`` like
+    ``send_email_via_gmail``. Both run on worker threads.
+    """
+
+    def __init__(self, generate: Callable[[Dict], Optional[Dict]],
+                 send: Callable[[Dict, Dict], Tuple[Optional[str], Optional[str]]],
+                 workers: int = BATCH_SEND_WORKERS, daily_remaining: Optional[int] = None):
+        self.generate = generate
+        self.send = send
+        self.workers = max(1, min(workers, MAX_WORKERS))
+        self.daily_remaining = daily_remaining
+        self._lock = threading.Lock()
+        self._reserved = 0
+
+    def _reserve(self) -> bool:
+        with self._lock:
+            if self.daily_remaining is not None and self._reserved >= self.daily_remaining:
+                return False
+            self._reserved += 1
+            return True
+
+    def _release(self):
+        with self._lock:
+            self._reserved -= 1
+
+    def _process(self, customer_id, customer) -> Dict:
+        result = {'customer_id': customer_id, 'customer': customer, 'status': 'failed',
+                  'error': None, 'msg_id': None, 'email': None}
+        if not self._reserve():
+            result.update(status='skipped', error='daily sending limit reached')
+            return result
+        try:
+            email = self.generate(customer)
+            if not email:
+                result['error'] = 'email generation failed'
+                self._release()
+                return result
+            result['email'] = email
+            msg_id, error = self.send(customer, email)
+        except Exception as e:
+            msg_id, error = None, str(e)
+        if error:
+            result['error'] = error
+            self._release()
+            return result
+        result.update(status='sent', msg_id=msg_id)
+        return result
+
+    def run(self, customers: List[Tuple[str, Dict]],
+            on_result: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """Process ``(customer_id, customer)`` pairs. Returns a report with per-customer results."""
+        start = time.time()
+        report = {'sent': 0, 'failed': 0, 'skipped': 0, 'results': [], 'workers': self.workers}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='batch-send') as pool:
+            futures = [pool.submit(self._process, cid, customer) for cid, customer in customers]
+            for future in as_completed(futures):
+                result = future.result()
+                report[result['status']] += 1
+                report['results'].append(result)
+                if on_result:
+                    on_result(result)
+        report['elapsed'] = round(time.time() - start, 2)
+        logger.info(f"Batch send engine: {report['sent']} sent, {report['failed']} failed, "
+                    f"{report['skipped']} skipped in {report['elapsed']}s with {self.workers} workers")
+        return report
+
+
+class BatchSendJobs:
+    """Progress of batch sends running in the background, readable from any web worker."""
+
+    def __init__(self, path=None):
+        self.path = path or batch_jobs_path()
+        if self.path not in _initialized_paths:
+            self._init_schema()
+            _initialized_paths.add(self.path)
+
+    def _init_schema(self):
+        with get_db(self.path) as db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS batch_send_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    stage INTEGER NOT NULL,
+                    mode TEXT NOT NULL,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    queued INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    skipped INTEGER NOT NULL DEFAULT 0,
+                    failures TEXT NOT NULL DEFAULT '[]',
+                    status TEXT NOT NULL DEFAULT 'running',
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            db.execute("CREATE INDEX IF NOT EXISTS idx_batch_send_jobs_user ON batch_send_jobs(user_id, id)")
+
+    @staticmethod
+    def _job(row) -> Dict:
+        job = dict(row)
+        job['failures'] = json.loads(job['failures'] or '[]')
+        if job['status'] == 'running' and time.time() - job['updated_at'] > STALE_JOB_SECONDS:
+            job['status'] = 'interrupted'
+        job['done'] = job['queued'] + job['failed'] + job['skipped']
+        return job
+
+    def start(self, user_id: int, stage: int, mode: str, total: int, failures: List[str]) -> int:
+        """Record a new running job; ``failures`` are customers already skipped for a bad address."""
+        now = time.time()
+        with get_db(self.path) as db:
+            cursor = db.execute(
+                "INSERT INTO batch_send_jobs (user_id, stage, mode, total, failures, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, stage, mode, total, json.dumps(failures), now, now),
+            )
+            return cursor.lastrowid
+
+    def progress(self, job_id: int, queued: int, failed: int, skipped: int, failures: List[str]):
+        with get_db(self.path) as db:
+            db.execute("UPDATE batch_send_jobs SET queued = ?, failed = ?, skipped = ?, failures = ?, updated_at = ? "
+                       "WHERE id = ?", (queued, failed, skipped, json.dumps(failures), time.time(), job_id))
+
+    def finish(self, job_id: int, error: Optional[str] = None):
+        with get_db(self.path) as db:
+            db.execute("UPDATE batch_send_jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                       ('failed' if error else 'done', error, time.time(), job_id))
+
+    def latest(self, user_id: int) -> Optional[Dict]:
+        with get_db(self.path) as db:
+            row = db.execute("SELECT * FROM batch_send_jobs WHERE user_id = ? ORDER BY id DESC LIMIT 1",
+                             (user_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def running(self, user_id: int) -> bool:
+        job = self.latest(user_id)
+        return bool(job and job['status'] == 'running')
+
+
+batch_jobs = BatchSendJobs()
@@ -3,14 +3,15 @@
 import os
 import re
 import json
-import time
 import base64
 import pickle
 import logging
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
+
+from services.attachment_cache import attachment_cache
+from services.retry import (execute, authorized_http, classify, classify_status, status_of, retry_after_of,
+                            THROTTLED, TRANSIENT, PERMANENT)
 
 EMAIL_REGEX = re.compile(r'^[a-zA-Z0-9._%+\-]+@[a-zA-Z0-9.\-]+\.[a-zA-Z]{2,}$')
 
@@ -74,11 +75,11 @@ def get_gmail_service(token_json_str=None):
         if not creds or not creds.valid:
             if creds and creds.expired and creds.refresh_token:
                 creds.refresh(Request())
-                service = build('gmail', 'v1', credentials=creds)
+                service = build('gmail', 'v1', http=authorized_http(creds))
                 return service, creds
             else:
                 return None
-        return build('gmail', 'v1', credentials=creds)
+        return build('gmail', 'v1', http=authorized_http(creds))
 
     creds = _load_credentials()
 
@@ -88,25 +89,33 @@ def get_gmail_service(token_json_str=None):
             _save_credentials(creds)
         else:
             return None
-    return build('gmail', 'v1', credentials=creds)
+    return build('gmail', 'v1', http=authorized_http(creds))
 
 
-def send_email_via_gmail(to_email, subject, body, attachment_filenames=None,
-                          sender_name='', sender_email='', gmail_service=None):
-    """Send email with attachments via Gmail API. Returns (msg_id, error)."""
-    if not to_email or not EMAIL_REGEX.match(to_email.strip()):
-        return None, f"Invalid email address: '{to_email}'"
+class SendFailure(Exception):
+    """One failed delivery, with the HTTP status, Retry-After and retry classification."""
 
-    to_email = to_email.strip()
+    def __init__(self, message, status=None, retry_after=None, kind=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.kind = kind or (classify_status(status) if status is not None else TRANSIENT)
 
-    service = gmail_service or get_gmail_service()
-    if not service:
-        return None, "Gmail not authenticated. Please complete setup."
+    @property
+    def permanent(self):
+        """Retrying the same message will not help (4xx other than timeout or rate limit)."""
+        return self.kind == PERMANENT
 
+
+def build_raw_message(to_email, subject, body, attachment_filenames=None,
+                      sender_name='', sender_email='', message_id=None):
+    """MIME message with attachments, base64url-encoded for messages.send."""
     msg = MIMEMultipart()
     msg['To'] = to_email
     msg['From'] = f"{sender_name} <{sender_email}>"
     msg['Subject'] = subject
+    if message_id:
+        msg['Message-ID'] = message_id
     msg.attach(MIMEText(body, 'plain'))
 
     if attachment_filenames:
@@ -120,34 +129,60 @@ def send_email_via_gmail(to_email, subject, body, attachment_filenames=None,
             if not os.path.realpath(filepath).startswith(os.path.realpath(attachments_dir)):
                 continue
             if os.path.exists(filepath):
-                with open(filepath, 'rb') as f:
-                    part = MIMEBase('application', 'pdf')
-                    part.set_payload(f.read())
-                    encoders.encode_base64(part)
-                    part.add_header('Content-Disposition', f'attachment; filename={safe_name}')
-                    msg.attach(part)
-
-    raw = base64.urlsafe_b64encode(msg.as_bytes()).decode()
-
-    # Retry once on transient errors
-    last_error = None
-    for attempt in range(2):
-        try:
-            sent = service.users().messages().send(userId='me', body={'raw': raw}).execute()
-            logger.info(f"Email sent to {to_email}: {sent['id']}")
-            return sent['id'], None
-        except Exception as e:
-            last_error = e
-            error_str = str(e).lower()
-            # Don't retry on permanent errors (invalid address, auth, etc.)
-            if any(perm in error_str for perm in ['invalid', 'unauthorized', 'forbidden', 'not found']):
-                break
-            if attempt == 0:
-                logger.warning(f"Transient error sending to {to_email}, retrying in 2s: {e}")
-                time.sleep(2)
-
-    logger.error(f"Failed to send email to {to_email}: {last_error}")
-    return None, str(last_error)
+                # Encoded once per file version, reused across a batch of recipients
+                msg.attach(attachment_cache.mime_part(filepath, safe_name))
+
+    return base64.urlsafe_b64encode(msg.as_bytes()).decode()
+
+
+def deliver_raw(service, raw, sender_email=''):
+    """Send an encoded message, paced by the mailbox's token bucket.
+
+    Returns the sent message resource (``id``, ``threadId``, ``labelIds``) or
+    raises SendFailure. A throttled send was
+    refused by Gmail and is retried here; a 5xx or timeout may have been
+    delivered, so it is left to the caller (the outbox checks the Sent folder
+    before trying again).
+    """
+    from services.rate_limit import RateLimitTimeout
+    limit_key = f"gmail:{sender_email or 'me'}"
+    try:
+        request = service.users().messages().send(userId='me', body={'raw': raw})
+        return execute(request, limit_key=limit_key, idempotent=False)
+    except RateLimitTimeout as e:
+        raise SendFailure(str(e), kind=THROTTLED) from e
+    except Exception as e:
+        raise SendFailure(str(e), status=status_of(e), retry_after=retry_after_of(e), kind=classify(e)) from e
+
+
+def find_sent_message(service, message_id, sender_email=''):
+    """``{'id', 'threadId'}`` of an already sent message with this Message-ID header, or None."""
+    request = service.users().messages().list(
+        userId='me', q=f"in:sent rfc822msgid:{message_id.strip('<>')}", maxResults=1)
+    found = execute(request, limit_key=f"gmail:{sender_email or 'me'}").get('messages', [])
+    return found[0] if found else None
+
+
+def send_email_via_gmail(to_email, subject, body, attachment_filenames=None,
+                          sender_name='', sender_email='', gmail_service=None):
+    """Send email with attachments via Gmail API. Returns (msg_id, error)."""
+    if not to_email or not EMAIL_REGEX.match(to_email.strip()):
+        return None, f"Invalid email address: '{to_email}'"
+
+    to_email = to_email.strip()
+
+    service = gmail_service or get_gmail_service()
+    if not service:
+        return None, "Gmail not authenticated. Please complete setup."
+
+    raw = build_raw_message(to_email, subject, body, attachment_filenames, sender_name, sender_email)
+    try:
+        msg_id = deliver_raw(service, raw, sender_email)['id']
+    except SendFailure as e:
+        logger.error(f"Failed to send email to {to_email} ({e.kind}): {e}")
+        return None, str(e)
+    logger.info(f"Email sent to {to_email}: {msg_id}")
+    return msg_id, None
 
 
 def send_verification_email(to_email, display_name, verification_url):
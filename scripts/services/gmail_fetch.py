@@ -0,0 +1,152 @@
+"""Paginated listing and batched fetching of Gmail messages.
+
+Bodies are fetched with Gmail batch requests; throttled or transient
+failures are retried in a smaller batch and permanent ones returned.
+"""
+
+import os
+import time
+import logging
+from email.utils import parseaddr
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.rate_limit import rate_limiter
+from services.record_index import referenced_message_ids
+from services.retry import call, classify, execute, retry_stats, PERMANENT
+
+logger = logging.getLogger('quartz_web')
+
+GMAIL_BATCH_SIZE = min(int(os.getenv('GMAIL_BATCH_SIZE', '100')), 100)  # Gmail's hard cap
+LIST_PAGE_SIZE = 500  # maximum maxResults for messages.list
+BATCH_RETRIES = 3
+METADATA_HEADERS = ['From', 'Subject', 'In-Reply-To', 'References']
+MAX_BODY_BYTES = int(os.getenv('GMAIL_MAX_BODY_BYTES', str(2 * 1024 * 1024)))  # 0 = no cap
+
+
+def list_message_ids(service, query: str, max_messages: Optional[int] = None,
+                     limit_key: Optional[str] = None, label_ids: Optional[List[str]] = None) -> List[str]:
+    """Ids of every message matching ``query``, following nextPageToken across pages."""
+    ids = []
+    page_token = None
+    while True:
+        params = {'userId': 'me', 'q': query, 'maxResults': LIST_PAGE_SIZE}
+        if label_ids:
+            params['labelIds'] = label_ids
+        if page_token:
+            params['pageToken'] = page_token
+        response = execute(service.users().messages().list(**params), limit_key=limit_key)
+        ids.extend(m['id'] for m in response.get('messages', []))
+        page_token = response.get('nextPageToken')
+        if not page_token or (max_messages and len(ids) >= max_messages):
+            break
+    return ids[:max_messages] if max_messages else ids
+
+
+def batch_get_messages(service, message_ids: List[str], fmt: str = 'full',
+                       metadata_headers: Optional[List[str]] = None,
+                       batch_size: int = GMAIL_BATCH_SIZE, limit_key: Optional[str] = None,
+                       retries: int = BATCH_RETRIES) -> Tuple[List[Dict], Dict[str, Exception]]:
+    """Fetch messages with batch requests. Returns ``(messages, failures)``.
+
+    ``messages`` keeps the order of ``message_ids`` (minus failures);
+    ``failures`` maps message id to the error that could not be recovered.
+    """
+    results = {}
+    failures = {}
+    pending = list(dict.fromkeys(message_ids))
+    attempt = 0
+    stats = {'requests': 0, 'retried': 0}
+
+    while pending:
+        retry = []
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+
+            def callback(request_id, response, exception):
+                if exception is None:
+                    results[request_id] = response
+                elif classify(exception) != PERMANENT and attempt < retries:
+                    retry.append(request_id)
+                    failures.pop(request_id, None)
+                else:
+                    failures[request_id] = exception
+
+            batch = service.new_batch_http_request(callback=callback)
+            for msg_id in chunk:
+                kwargs = {'userId': 'me', 'id': msg_id, 'format': fmt}
+                if metadata_headers:
+                    kwargs['metadataHeaders'] = metadata_headers
+                batch.add(service.users().messages().get(**kwargs), request_id=msg_id)
+            call('gmail', batch.execute, limit_key=limit_key)
+            stats['requests'] += 1
+
+        if not retry:
+            break
+        attempt += 1
+        stats['retried'] += len(retry)
+        retry_stats.record('gmail', 'retries', len(retry))
+        if limit_key:
+            rate_limiter.penalize(limit_key)
+        wait = 2 ** attempt
+        logger.warning(f"Gmail batch: {len(retry)} calls throttled or failed, retrying in {wait}s")
+        time.sleep(wait)
+        # Smaller follow-up batches are less likely to be throttled again
+        pending, batch_size = retry, max(10, batch_size // 2)
+
+    if failures:
+        logger.warning(f"Gmail batch: {len(failures)} of {len(message_ids)} messages could not be fetched")
+    logger.debug(f"Gmail batch fetched {len(results)} messages in {stats['requests']} requests "
+                 f"({stats['retried']} retried)")
+    return [results[i] for i in dict.fromkeys(message_ids) if i in results], failures
+
+
+def header(message: Dict, name: str) -> str:
+    """Value of one header of a message resource ('' when absent)."""
+    name = name.lower()
+    for h in message.get('payload', {}).get('headers', []):
+        if h['name'].lower() == name:
+            return h['value']
+    return ''
+
+
+def sender_address(message: Dict) -> str:
+    """Lower-cased address from the From header."""
+    return parseaddr(header(message, 'From'))[1].lower()
+
+
+def reply_match_keys(message: Dict) -> Dict:
+    """``thread_id`` and referenced ``message_ids`` of a message, as taken by RecordSnapshot.for_reply."""
+    return {'thread_id': message.get('threadId', ''),
+            'message_ids': referenced_message_ids(header(message, 'In-Reply-To'), header(message, 'References'))}
+
+
+def fetch_relevant_messages(service, message_ids: List[str], keep: Callable[[Dict], bool],
+                            max_body_bytes: int = MAX_BODY_BYTES,
+                            limit_key: Optional[str] = None) -> Tuple[List[Dict], Dict[str, Exception]]:
+    """Two-phase fetch: metadata for every message, full payloads for the ones ``keep`` accepts.
+
+    ``keep`` receives the metadata resource (labelIds, sizeEstimate, snippet
+    and METADATA_HEADERS). Kept messages over ``max_body_bytes`` are
+    returned as metadata with ``body_skipped`` set. Ids missing from both
+    return values were filtered out.
+    """
+    headers_only, failures = batch_get_messages(service, message_ids, fmt='metadata',
+                                                metadata_headers=METADATA_HEADERS, limit_key=limit_key)
+    wanted = [m for m in headers_only if keep(m)]
+    within_cap = [m['id'] for m in wanted
+                  if not max_body_bytes or int(m.get('sizeEstimate', 0)) <= max_body_bytes]
+    full, body_failures = batch_get_messages(service, within_cap, limit_key=limit_key) \
+        if within_cap else ([], {})
+    failures.update(body_failures)
+
+    by_id = {m['id']: m for m in full}
+    messages = []
+    for message in wanted:
+        if message['id'] in by_id:
+            messages.append(by_id[message['id']])
+        elif message['id'] not in failures:
+            message['body_skipped'] = True
+            messages.append(message)
+    logger.debug(f"Gmail fetch: {len(headers_only)} headers, {len(wanted)} kept, "
+                 f"{len(full)} bodies downloaded")
+    return messages, failures
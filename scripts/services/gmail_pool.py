@@ -0,0 +1,162 @@
+"""Process-wide pool of Gmail API service objects.
+
+Credentials are shared per user and refreshed ahead of expiry; each thread
+gets its own service object, because ``httplib2.Http`` is not thread-safe.
+"""
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger('quartz_web')
+
+REFRESH_MARGIN = int(os.getenv('GMAIL_REFRESH_MARGIN_SECONDS', '300'))
+
+
+def serialize_credentials(creds) -> str:
+    """Token JSON in the format stored by ``User.set_credential('gmail_token', ...)``."""
+    return json.dumps({
+        'token': creds.token,
+        'refresh_token': creds.refresh_token,
+        'token_uri': creds.token_uri,
+        'client_id': creds.client_id,
+        'client_secret': creds.client_secret,
+        'scopes': list(creds.scopes) if creds.scopes else [],
+        'expiry': creds.expiry.isoformat() + 'Z' if creds.expiry else None,
+    })
+
+
+class GmailServicePool:
+    """Credentials per user, Gmail service objects per user and thread."""
+
+    def __init__(self, refresh_margin: int = REFRESH_MARGIN):
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._local = threading.local()
+        self._document = None
+        self.stats = {'builds': 0, 'hits': 0, 'refreshes': 0, 'loads': 0}
+
+    # ── Building blocks ───────────────────────────────────
+    def _discovery_document(self) -> Dict:
+        if self._document is None:
+            from googleapiclient.discovery_cache import get_static_doc
+            self._document = json.loads(get_static_doc('gmail', 'v1'))
+        return self._document
+
+    def _build(self, creds):
+        from googleapiclient.discovery import build_from_document
+        from services.retry import authorized_http
+        self.stats['builds'] += 1
+        # Timeouts on the transport; the credentials object stays shared
+        return build_from_document(self._discovery_document(), http=authorized_http(creds))
+
+    @staticmethod
+    def _load_credentials(token_json):
+        from google.oauth2.credentials import Credentials
+        token_data = json.loads(token_json) if isinstance(token_json, str) else token_json
+        if token_data.get('expiry') is None:
+            token_data.pop('expiry', None)
+        return Credentials.from_authorized_user_info(token_data)
+
+    def _needs_refresh(self, creds) -> bool:
+        if not creds.refresh_token:
+            return False
+        if creds.expiry is None:
+            return not creds.token
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (creds.expiry - now).total_seconds() < self.refresh_margin
+
+    def _entry(self, user_id, load_token):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = self._entries[user_id] = {'lock': threading.Lock(), 'creds': None,
+                                                  'token_json': None, 'generation': 0}
+        with entry['lock']:
+            if entry['creds'] is None:
+                token_json = load_token()
+                if not token_json:
+                    return None
+                self.stats['loads'] += 1
+                entry['creds'] = self._load_credentials(token_json)
+                entry['token_json'] = token_json
+                entry['generation'] += 1
+        return entry
+
+    def _refresh(self, entry, load_token):
+        from google.auth.transport.requests import Request
+        from google.auth.exceptions import RefreshError
+
+        creds = entry['creds']
+        try:
+            creds.refresh(Request())
+        except RefreshError:
+            # Re-authorized elsewhere? Retry once with whatever is stored now.
+            token_json = load_token()
+            if not token_json or token_json == entry['token_json']:
+                raise
+            logger.info("Gmail pool: refresh failed, retrying with the stored token")
+            creds = entry['creds'] = self._load_credentials(token_json)
+            entry['token_json'] = token_json
+            entry['generation'] += 1
+            creds.refresh(Request())
+        self.stats['refreshes'] += 1
+
+    def _write_back(self, entry, save_token):
+        creds = entry['creds']
+        if not save_token or not creds.token:
+            return
+        if json.loads(entry['token_json']).get('token') == creds.token:
+            return
+        token_json = serialize_credentials(creds)
+        save_token(token_json)
+        entry['token_json'] = token_json
+
+    # ── Public API ────────────────────────────────────────
+    def get(self, user_id, load_token: Callable[[], Optional[str]],
+            save_token: Optional[Callable[[str], None]] = None):
+        """Gmail service for ``user_id`` owned by the calling thread.
+
+        ``load_token`` returns the stored token JSON; it is only called when
+        the pool holds no credentials for the user. Returns None when the user
+        has no usable token.
+        """
+        entry = self._entry(user_id, load_token)
+        if entry is None:
+            return None
+
+        with entry['lock']:
+            creds = entry['creds']
+            if self._needs_refresh(creds):
+                self._refresh(entry, load_token)
+            elif not creds.valid and not creds.refresh_token:
+                return None
+            self._write_back(entry, save_token)
+            creds, generation = entry['creds'], entry['generation']
+
+        services = getattr(self._local, 'services', None)
+        if services is None:
+            services = self._local.services = {}
+        cached = services.get(user_id)
+        if cached and cached[0] == generation:
+            self.stats['hits'] += 1
+            return cached[1]
+        service = self._build(creds)
+        services[user_id] = (generation, service)
+        return service
+
+    def invalidate(self, user_id):
+        """Forget a user's credentials, e.g. after the account was re-authorized."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is not None:
+            with entry['lock']:
+                entry['creds'] = None
+                entry['token_json'] = None
+
+
+gmail_pool = GmailServicePool()
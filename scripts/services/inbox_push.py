@@ -0,0 +1,143 @@
+"""Gmail push notifications for inbox consumers.
+
+The webhook records each mailbox's newest history id, and consumers block in
+``PushNotifications.wait`` until it passes their sync cursor.
+"""
+
+import os
+import json
+import time
+import base64
+import logging
+import urllib.request
+from itertools import count
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from models import get_db
+from services.inbox_sync import sync_path
+from services.retry import execute
+
+logger = logging.getLogger('quartz_web')
+
+PUSH_TOPIC = os.getenv('GMAIL_PUSH_TOPIC', '')
+PUSH_TOKEN = os.getenv('GMAIL_PUSH_TOKEN', '')
+FALLBACK_POLL_SECONDS = int(os.getenv('INBOX_FALLBACK_POLL_SECONDS', '300'))
+WATCH_RENEW_SECONDS = 86400
+WAIT_STEP = 1.0  # how often a waiting consumer looks at the local database
+
+_initialized_paths = set()
+
+
+def push_envelope(email_address: str, history_id, message_id: Optional[str] = None) -> Dict:
+    """Pub/Sub push request body carrying a Gmail notification."""
+    data = json.dumps({'emailAddress': email_address, 'historyId': int(history_id)})
+    return {
+        'message': {
+            'data': base64.b64encode(data.encode('utf-8')).decode('ascii'),
+            'messageId': message_id or str(int(time.time() * 1000)),
+            'publishTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'subscription': 'local',
+    }
+
+
+def decode_push(envelope) -> Tuple[str, str]:
+    """``(mailbox, history_id)`` from a Pub/Sub push body. Raises ValueError if malformed."""
+    try:
+        data = json.loads(base64.b64decode(envelope['message']['data']))
+        mailbox = str(data['emailAddress']).strip().lower()
+        history_id = str(int(data['historyId']))
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f'Not a Gmail push notification: {e}') from e
+    if not mailbox:
+        raise ValueError('Gmail push notification without emailAddress')
+    return mailbox, history_id
+
+
+def watch_mailbox(service, topic: str = None, label_ids=('INBOX',), limit_key: Optional[str] = None) -> Dict:
+    """Start (or renew) Gmail push for a mailbox. Returns ``historyId`` and ``expiration``."""
+    body = {'topicName': topic or PUSH_TOPIC, 'labelIds': list(label_ids), 'labelFilterBehavior': 'include'}
+    return execute(service.users().watch(userId='me', body=body), limit_key=limit_key)
+
+
+class PushNotifications:
+    """Newest push notification per mailbox, shared between the web app and consumers."""
+
+    def __init__(self, path=None):
+        self.path = path or sync_path()
+        if self.path not in _initialized_paths:
+            self._init_schema()
+            _initialized_paths.add(self.path)
+
+    def _init_schema(self):
+        with get_db(self.path) as db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS inbox_push (
+                    mailbox TEXT PRIMARY KEY,
+                    history_id TEXT,
+                    seq INTEGER NOT NULL DEFAULT 0,
+                    received_at REAL NOT NULL
+                )
+            ''')
+
+    def record(self, mailbox: str, history_id) -> int:
+        """Store a notification. Returns the mailbox's new sequence number."""
+        mailbox = mailbox.strip().lower()
+        with get_db(self.path) as db:
+            db.execute(
+                "INSERT INTO inbox_push (mailbox, history_id, seq, received_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(mailbox) DO UPDATE SET seq = seq + 1, received_at = excluded.received_at, "
+                "history_id = CASE WHEN CAST(excluded.history_id AS INTEGER) > CAST(history_id AS INTEGER) "
+                "THEN excluded.history_id ELSE history_id END",
+                (mailbox, str(history_id), time.time()))
+            row = db.execute("SELECT seq FROM inbox_push WHERE mailbox = ?", (mailbox,)).fetchone()
+        return row['seq']
+
+    def latest(self, mailbox: str) -> Tuple[int, Optional[str]]:
+        """``(seq, history_id)`` of the newest notification, ``(0, None)`` if there was none."""
+        with get_db(self.path) as db:
+            row = db.execute("SELECT seq, history_id FROM inbox_push WHERE mailbox = ?",
+                             (mailbox.strip().lower(),)).fetchone()
+        return (row['seq'], row['history_id']) if row else (0, None)
+
+    def wait(self, mailbox: str, after_seq: int, timeout: float,
+             step: float = WAIT_STEP) -> Tuple[int, Optional[str]]:
+        """Block until a notification newer than ``after_seq`` arrives or ``timeout`` passes.
+
+        Returns ``(seq, history_id)``; on timeout the history id is None.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            seq, history_id = self.latest(mailbox)
+            if seq > after_seq:
+                return seq, history_id
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return after_seq, None
+            time.sleep(min(step, remaining))
+
+
+class LocalPublisher:
+    """Stand-in for Gmail + Pub/Sub: posts push envelopes to the webhook.
+
+    ``target`` is the endpoint URL, or a callable taking the envelope (a
+    Flask test client wrapper in tests).
+    """
+
+    def __init__(self, target: Union[str, Callable[[Dict], object]], token: str = None):
+        self.target = target
+        self.token = PUSH_TOKEN if token is None else token
+        self._ids = count(1)
+
+    def publish(self, email_address: str, history_id):
+        envelope = push_envelope(email_address, history_id, message_id=f'local-{next(self._ids)}')
+        if callable(self.target):
+            return self.target(envelope)
+        url = f"{self.target}{'&' if '?' in self.target else '?'}token={self.token}"
+        request = urllib.request.Request(url, data=json.dumps(envelope).encode('utf-8'), method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+
+
+push_notifications = PushNotifications()
@@ -0,0 +1,276 @@
+"""Incremental inbox sync driven by Gmail history ids.
+
+Each consumer keeps a ``historyId`` cursor and a log of handled messages in
+``data/inbox_sync.db``, and falls back to a full search when the cursor expires.
+"""
+
+import os
+import time
+import logging
+from typing import Callable, Dict, Iterable, Optional
+
+from models import get_db, PROJECT_ROOT
+from services.gmail_fetch import list_message_ids, batch_get_messages, fetch_relevant_messages, LIST_PAGE_SIZE
+from services.retry import execute, status_of, classify, PERMANENT
+
+logger = logging.getLogger('quartz_web')
+
+MAX_ATTEMPTS = 3
+RETENTION_DAYS = int(os.getenv('INBOX_SYNC_RETENTION_DAYS', '30'))
+IGNORED_LABELS = {'SENT', 'DRAFT', 'SPAM', 'TRASH'}
+
+_initialized_paths = set()
+
+
+def sync_path():
+    return os.path.join(PROJECT_ROOT, 'data', 'inbox_sync.db')
+
+
+class InboxSync:
+    """Cursor and processed-message log for one consumer of one mailbox.
+
+    Usage::
+
+        inbox = InboxSync(service, f'auto_reply_daemon:{mailbox}', resync_query='is:unread in:inbox')
+        inbox.run(handle_message)          # per message, or:
+
+        batch = inbox.fetch()              # process in bulk, then
+        inbox.commit(batch, failed=[...])
+    """
+
+    def __init__(self, service, cursor_key: str, resync_query: str = 'in:inbox',
+                 label_id: str = 'INBOX', limit_key: Optional[str] = None, path=None):
+        self.service = service
+        self.cursor_key = cursor_key
+        self.resync_query = resync_query
+        self.label_id = label_id
+        self.limit_key = limit_key
+        self.path = path or sync_path()
+        if self.path not in _initialized_paths:
+            self._init_schema()
+            _initialized_paths.add(self.path)
+
+    def _init_schema(self):
+        with get_db(self.path) as db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS inbox_sync_state (
+                    cursor_key TEXT PRIMARY KEY,
+                    history_id TEXT,
+                    updated_at REAL NOT NULL,
+                    full_syncs INTEGER NOT NULL DEFAULT 0,
+                    incremental_syncs INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS inbox_sync_messages (
+                    cursor_key TEXT NOT NULL,
+                    message_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (cursor_key, message_id)
+                )
+            ''')
+
+    # ── Cursor ────────────────────────────────────────────
+    @property
+    def history_id(self) -> Optional[str]:
+        with get_db(self.path) as db:
+            row = db.execute("SELECT history_id FROM inbox_sync_state WHERE cursor_key = ?",
+                             (self.cursor_key,)).fetchone()
+        return row['history_id'] if row else None
+
+    def needs_sync(self, history_id) -> bool:
+        """Whether a mailbox at ``history_id`` (from a push notification) has changes past the cursor."""
+        cursor = self.history_id
+        try:
+            return cursor is None or int(history_id) > int(cursor)
+        except (TypeError, ValueError):
+            return True
+
+    def reset(self):
+        """Drop the cursor so the next cycle runs a full resync."""
+        with get_db(self.path) as db:
+            db.execute("UPDATE inbox_sync_state SET history_id = NULL WHERE cursor_key = ?",
+                       (self.cursor_key,))
+
+    def _processed_ids(self, message_ids: Iterable[str]) -> set:
+        ids = list(message_ids)
+        done = set()
+        with get_db(self.path) as db:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = db.execute(
+                    f"SELECT message_id FROM inbox_sync_messages WHERE cursor_key = ? "
+                    f"AND status != 'failed' AND message_id IN ({','.join('?' * len(chunk))})",
+                    [self.cursor_key] + chunk,
+                ).fetchall()
+                done.update(r['message_id'] for r in rows)
+        return done
+
+    # ── Listing ───────────────────────────────────────────
+    def _history_since(self, start_history_id):
+        """Ids added since the cursor and the latest history id, or None if the cursor expired."""
+        ids = []
+        page_token = None
+        latest = start_history_id
+        while True:
+            params = {'userId': 'me', 'startHistoryId': start_history_id,
+                      'historyTypes': ['messageAdded'], 'maxResults': LIST_PAGE_SIZE}
+            if self.label_id:
+                params['labelId'] = self.label_id
+            if page_token:
+                params['pageToken'] = page_token
+            try:
+                response = execute(self.service.users().history().list(**params), limit_key=self.limit_key)
+            except Exception as e:
+                if status_of(e) == 404:
+                    return None, None
+                raise
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message = added.get('message', {})
+                    if IGNORED_LABELS & set(message.get('labelIds', [])):
+                        continue
+                    ids.append(message['id'])
+            latest = response.get('historyId', latest)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        return list(dict.fromkeys(ids)), latest
+
+    def _full_listing(self):
+        profile = execute(self.service.users().getProfile(userId='me'), limit_key=self.limit_key)
+        ids = list_message_ids(self.service, self.resync_query, limit_key=self.limit_key)
+        return ids, profile['historyId']
+
+    # ── Cycle ─────────────────────────────────────────────
+    def fetch(self, fmt: str = 'full', keep: Optional[Callable[[Dict], bool]] = None) -> Dict:
+        """New, not yet handled messages since the last committed cycle.
+
+        Returns a batch dict: ``messages`` (full message resources),
+        ``history_id`` to commit, ``full_resync``, ``missing`` (ids that
+        no longer exist), ``rejected`` (ids Gmail refused permanently) and
+        ``unreachable`` (ids still failing after the fetch's own retries).
+        Pass it to ``commit`` once the messages are handled.
+
+        With ``keep``, headers are fetched first and only messages it accepts
+        are downloaded (see fetch_relevant_messages); the rest are listed in
+        ``filtered`` and count as handled.
+        """
+        cursor = self.history_id
+        full_resync = cursor is None
+        ids = latest = None
+        if cursor is not None:
+            ids, latest = self._history_since(cursor)
+            if ids is None:
+                logger.info(f"Inbox sync {self.cursor_key}: history {cursor} expired, running a full resync")
+                full_resync = True
+        if full_resync:
+            ids, latest = self._full_listing()
+
+        done = self._processed_ids(ids)
+        new_ids = [i for i in ids if i not in done]
+        if not new_ids:
+            messages, failures = [], {}
+        elif keep is not None:
+            messages, failures = fetch_relevant_messages(self.service, new_ids, keep, limit_key=self.limit_key)
+        else:
+            messages, failures = batch_get_messages(self.service, new_ids, fmt=fmt, limit_key=self.limit_key)
+        fetched = {m['id'] for m in messages}
+        filtered = [i for i in new_ids if i not in fetched and i not in failures]
+        # Deleted before we got to it: nothing left to handle
+        missing = [i for i, e in failures.items() if status_of(e) == 404]
+        rejected = [i for i, e in failures.items() if i not in missing and classify(e) == PERMANENT]
+        unreachable = [i for i in failures if i not in missing and i not in rejected]
+        return {
+            'messages': messages,
+            'filtered': filtered,
+            'history_id': latest,
+            'full_resync': full_resync,
+            'missing': missing,
+            'rejected': rejected,
+            'unreachable': unreachable,
+        }
+
+    def commit(self, batch: Dict, failed: Iterable[str] = ()) -> Dict:
+        """Record the batch's messages as handled and advance the cursor.
+
+        Ids in ``failed``, and those the fetch could not reach, are retried
+        on later cycles until MAX_ATTEMPTS; while any message of the batch is
+        still pending the cursor stays put. Rejected ids are skipped at once.
+        """
+        failed = set(failed) | set(batch.get('unreachable', []))
+        now = time.time()
+        pending = []
+        with get_db(self.path) as db:
+            handled = [m['id'] for m in batch['messages'] if m['id'] not in failed]
+            db.executemany(
+                "INSERT OR REPLACE INTO inbox_sync_messages (cursor_key, message_id, status, attempts, updated_at) "
+                "VALUES (?, ?, 'done', 0, ?)", [(self.cursor_key, i, now) for i in handled])
+            db.executemany(
+                "INSERT OR REPLACE INTO inbox_sync_messages (cursor_key, message_id, status, attempts, updated_at) "
+                "VALUES (?, ?, 'missing', 0, ?)", [(self.cursor_key, i, now) for i in batch.get('missing', [])])
+            db.executemany(
+                "INSERT OR REPLACE INTO inbox_sync_messages (cursor_key, message_id, status, attempts, updated_at) "
+                "VALUES (?, ?, 'filtered', 0, ?)", [(self.cursor_key, i, now) for i in batch.get('filtered', [])])
+            for message_id in batch.get('rejected', []):
+                logger.warning(f"Inbox sync {self.cursor_key}: skipping message {message_id}, Gmail refused the fetch")
+            db.executemany(
+                "INSERT OR REPLACE INTO inbox_sync_messages (cursor_key, message_id, status, attempts, updated_at) "
+                "VALUES (?, ?, 'skipped', 1, ?)", [(self.cursor_key, i, now) for i in batch.get('rejected', [])])
+            for message_id in failed:
+                row = db.execute("SELECT attempts FROM inbox_sync_messages WHERE cursor_key = ? AND message_id = ?",
+                                 (self.cursor_key, message_id)).fetchone()
+                attempts = (row['attempts'] if row else 0) + 1
+                status = 'skipped' if attempts >= MAX_ATTEMPTS else 'failed'
+                if status == 'skipped':
+                    logger.warning(f"Inbox sync {self.cursor_key}: giving up on message {message_id} "
+                                   f"after {attempts} attempts")
+                else:
+                    pending.append(message_id)
+                db.execute(
+                    "INSERT OR REPLACE INTO inbox_sync_messages (cursor_key, message_id, status, attempts, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)", (self.cursor_key, message_id, status, attempts, now))
+
+            advanced = not pending and batch['history_id'] is not None
+            counter = 'full_syncs' if batch['full_resync'] else 'incremental_syncs'
+            if advanced:
+                db.execute(
+                    f"INSERT INTO inbox_sync_state (cursor_key, history_id, updated_at, {counter}) "
+                    f"VALUES (?, ?, ?, 1) ON CONFLICT(cursor_key) DO UPDATE SET "
+                    f"history_id = excluded.history_id, updated_at = excluded.updated_at, "
+                    f"{counter} = {counter} + 1",
+                    (self.cursor_key, str(batch['history_id']), now))
+            db.execute("DELETE FROM inbox_sync_messages WHERE cursor_key = ? AND updated_at < ?",
+                       (self.cursor_key, now - RETENTION_DAYS * 86400))
+        return {'handled': len(handled), 'pending': len(pending), 'advanced': advanced,
+                'full_resync': batch['full_resync']}
+
+    def run(self, handler: Callable[[Dict], None], fmt: str = 'full',
+            keep: Optional[Callable[[Dict], bool]] = None) -> Dict:
+        """One sync cycle calling ``handler(message)`` for each new message.
+
+        A handler that raises leaves its message for the next cycle.
+        """
+        batch = self.fetch(fmt, keep)
+        failed = []
+        for message in batch['messages']:
+            try:
+                handler(message)
+            except Exception as e:
+                logger.warning(f"Inbox sync {self.cursor_key}: handler failed for {message['id']}: {e}")
+                failed.append(message['id'])
+        summary = self.commit(batch, failed)
+        summary['fetched'] = len(batch['messages'])
+        return summary
+
+    def stats(self) -> Dict:
+        with get_db(self.path) as db:
+            state = db.execute("SELECT * FROM inbox_sync_state WHERE cursor_key = ?",
+                               (self.cursor_key,)).fetchone()
+            counts = db.execute("SELECT status, COUNT(*) AS n FROM inbox_sync_messages "
+                                "WHERE cursor_key = ? GROUP BY status", (self.cursor_key,)).fetchall()
+        result = dict(state) if state else {'cursor_key': self.cursor_key, 'history_id': None}
+        result['messages'] = {r['status']: r['n'] for r in counts}
+        return result
@@ -0,0 +1,298 @@
+"""Durable outbound email queue.
+
+Items are keyed for idempotency, claimed under leases and retried with
+backoff; the web process outbox thread or ``outbox_worker.py`` sends them.
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import sqlite3
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from models import get_db, PROJECT_ROOT
+
+logger = logging.getLogger('quartz_web')
+
+MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '6'))
+BACKOFF_BASE = float(os.getenv('OUTBOX_BACKOFF_BASE_SECONDS', '30'))
+BACKOFF_MAX = float(os.getenv('OUTBOX_BACKOFF_MAX_SECONDS', '3600'))
+LEASE_SECONDS = 300
+SENT_RETENTION_DAYS = 30
+
+STATUSES = ('pending', 'sending', 'sent', 'dead')
+
+# Columns added after the first release: name -> column definition
+_ADDED_COLUMNS = {
+    'gmail_thread_id': 'TEXT',
+}
+
+_initialized_paths = set()
+
+
+def outbox_path():
+    return os.path.join(PROJECT_ROOT, 'data', 'outbox.db')
+
+
+def idempotency_key(customer_id, stage, email_id) -> str:
+    return f'{customer_id}:{stage}:{email_id}'
+
+
+def message_id_for(idem_key: str, sender_email: str = '') -> str:
+    """Stable RFC 822 Message-ID for an outbox item."""
+    digest = hashlib.sha1(idem_key.encode('utf-8')).hexdigest()[:24]
+    domain = sender_email.rsplit('@', 1)[-1] if '@' in (sender_email or '') else 'quartz.local'
+    return f'<outbox.{digest}@{domain}>'
+
+
+def backoff_delay(attempts: int, retry_after: Optional[float] = None) -> float:
+    """Seconds before the next attempt: exponential with jitter, at least ``retry_after``."""
+    ceiling = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+    delay = random.uniform(ceiling / 2, ceiling)
+    return max(delay, retry_after or 0)
+
+
+class Outbox:
+    """SQLite-backed queue of outbound emails."""
+
+    def __init__(self, path=None):
+        self.path = path or outbox_path()
+        if self.path not in _initialized_paths:
+            self._init_schema()
+            _initialized_paths.add(self.path)
+
+    def _init_schema(self):
+        with get_db(self.path) as db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idem_key TEXT NOT NULL UNIQUE,
+                    user_id INTEGER,
+                    to_email TEXT NOT NULL,
+                    subject TEXT NOT NULL DEFAULT '',
+                    body TEXT NOT NULL DEFAULT '',
+                    attachments TEXT NOT NULL DEFAULT '[]',
+                    sender_name TEXT NOT NULL DEFAULT '',
+                    sender_email TEXT NOT NULL DEFAULT '',
+                    message_id TEXT NOT NULL,
+                    effects TEXT NOT NULL DEFAULT '{}',
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    lease_until REAL,
+                    last_error TEXT,
+                    gmail_msg_id TEXT,
+                    gmail_thread_id TEXT,
+                    effects_done INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_user ON outbox(user_id, status)")
+            existing = {row['name'] for row in db.execute("PRAGMA table_info(outbox)")}
+            for name, definition in _ADDED_COLUMNS.items():
+                if name not in existing:
+                    db.execute(f"ALTER TABLE outbox ADD COLUMN {name} {definition}")
+
+    @contextmanager
+    def _locked(self):
+        """Connection holding the database write lock for the whole block."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _item(row) -> Dict:
+        item = dict(row)
+        item['attachments'] = json.loads(item['attachments'] or '[]')
+        item['effects'] = json.loads(item['effects'] or '{}')
+        return item
+
+    # ── Producing ─────────────────────────────────────────
+    def enqueue(self, idem_key: str, to_email: str, subject: str, body: str,
+                attachments: Optional[List[str]] = None, sender_name: str = '', sender_email: str = '',
+                user_id: Optional[int] = None, effects: Optional[Dict] = None) -> Dict:
+        """Queue one email. Returns the item; ``created`` is False if the key was already queued."""
+        now = time.time()
+        with self._locked() as db:
+            existing = db.execute("SELECT * FROM outbox WHERE idem_key = ?", (idem_key,)).fetchone()
+            if existing is not None:
+                item = self._item(existing)
+                item['created'] = False
+                return item
+            cursor = db.execute(
+                "INSERT INTO outbox (idem_key, user_id, to_email, subject, body, attachments, sender_name, "
+                "sender_email, message_id, effects, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (idem_key, user_id, to_email, subject, body, json.dumps(list(attachments or [])),
+                 sender_name, sender_email, message_id_for(idem_key, sender_email),
+                 json.dumps(effects or {}), now, now, now),
+            )
+            item = self._item(db.execute("SELECT * FROM outbox WHERE id = ?", (cursor.lastrowid,)).fetchone())
+        item['created'] = True
+        return item
+
+    def get(self, idem_key: str) -> Optional[Dict]:
+        with get_db(self.path) as db:
+            row = db.execute("SELECT * FROM outbox WHERE idem_key = ?", (idem_key,)).fetchone()
+        return self._item(row) if row else None
+
+    # ── Draining ──────────────────────────────────────────
+    def claim(self, limit: int = 10, lease: float = LEASE_SECONDS) -> List[Dict]:
+        """Lease up to ``limit`` items that need work.
+
+        That is due pending items, sends whose drainer lost its lease
+        (``recovered`` is set on those), and sent items whose tracking
+        effects have not been applied yet.
+        """
+        now = time.time()
+        with self._locked() as db:
+            rows = db.execute(
+                "SELECT * FROM outbox WHERE "
+                "(status = 'pending' AND next_attempt_at <= :now) "
+                "OR (status = 'sending' AND lease_until < :now) "
+                "OR (status = 'sent' AND effects_done = 0 AND (lease_until IS NULL OR lease_until < :now)) "
+                "ORDER BY next_attempt_at LIMIT :limit", {'now': now, 'limit': limit},
+            ).fetchall()
+            items = []
+            for row in rows:
+                item = self._item(row)
+                item['recovered'] = row['status'] == 'sending'
+                if row['status'] != 'sent':
+                    item['status'] = 'sending'
+                db.execute("UPDATE outbox SET status = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                           (item['status'], now + lease, now, row['id']))
+                items.append(item)
+        return items
+
+    def mark_sent(self, item_id: int, gmail_msg_id: str, gmail_thread_id: Optional[str] = None):
+        """Record the send. The lease is kept so no other drainer applies the effects meanwhile."""
+        with get_db(self.path) as db:
+            db.execute("UPDATE outbox SET status = 'sent', gmail_msg_id = ?, gmail_thread_id = ?, "
+                       "attempts = attempts + 1, last_error = NULL, updated_at = ? WHERE id = ?",
+                       (gmail_msg_id, gmail_thread_id, time.time(), item_id))
+
+    def mark_effects_done(self, item_id: int, error: Optional[str] = None):
+        """Tracking writes applied; with ``error`` they are retried on a later claim instead."""
+        with get_db(self.path) as db:
+            if error:
+                db.execute("UPDATE outbox SET last_error = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                           (f'tracking update failed: {error}', time.time() + BACKOFF_BASE, time.time(), item_id))
+            else:
+                db.execute("UPDATE outbox SET effects_done = 1, lease_until = NULL, updated_at = ? WHERE id = ?",
+                           (time.time(), item_id))
+
+    def mark_failed(self, item_id: int, error: str, retry_after: Optional[float] = None,
+                    permanent: bool = False) -> str:
+        """Schedule a retry, or move the item to ``dead``. Returns the new status."""
+        now = time.time()
+        with self._locked() as db:
+            row = db.execute("SELECT attempts FROM outbox WHERE id = ?", (item_id,)).fetchone()
+            if row is None:
+                return 'missing'
+            attempts = row['attempts'] + 1
+            if permanent or attempts >= MAX_ATTEMPTS:
+                status, next_at = 'dead', now
+            else:
+                status, next_at = 'pending', now + backoff_delay(attempts, retry_after)
+            db.execute("UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, lease_until = NULL, "
+                       "last_error = ?, updated_at = ? WHERE id = ?",
+                       (status, attempts, next_at, str(error)[:500], now, item_id))
+        if status == 'dead':
+            logger.error(f"Outbox item {item_id} is dead after {attempts} attempt(s): {error}")
+        return status
+
+    def drain(self, deliver: Callable[[Dict], Dict], apply: Callable[[Dict], None], limit: int = 10) -> Dict:
+        """Claim due items, send them and apply their effects.
+
+        ``deliver(item)`` sends one message and returns the Gmail message
+        resource (``id`` and ``threadId``). Errors
+        with ``retry_after`` / ``permanent`` attributes (SendFailure) steer the
+        backoff. ``apply(item)`` performs the tracking writes.
+        """
+        summary = {'sent': 0, 'retrying': 0, 'dead': 0, 'applied': 0}
+        for item in self.claim(limit):
+            if item['status'] != 'sent':
+                try:
+                    sent = deliver(item)
+                except Exception as e:
+                    status = self.mark_failed(item['id'], e, getattr(e, 'retry_after', None),
+                                              getattr(e, 'permanent', False))
+                    summary['dead' if status == 'dead' else 'retrying'] += 1
+                    logger.warning(f"Outbox item {item['id']} to {item['to_email']} failed: {e}")
+                    continue
+                item['gmail_msg_id'], item['gmail_thread_id'] = sent['id'], sent.get('threadId')
+                self.mark_sent(item['id'], item['gmail_msg_id'], item['gmail_thread_id'])
+                summary['sent'] += 1
+            try:
+                apply(item)
+            except Exception as e:
+                logger.warning(f"Outbox item {item['id']}: tracking update failed: {e}")
+                self.mark_effects_done(item['id'], error=str(e))
+                continue
+            self.mark_effects_done(item['id'])
+            summary['applied'] += 1
+        return summary
+
+    def retry(self, item_id: int, user_id: Optional[int] = None) -> bool:
+        """Move a dead item back to pending with a fresh attempt budget."""
+        query = "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ? " \
+                "WHERE id = ? AND status = 'dead'"
+        params = [time.time(), time.time(), item_id]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        with get_db(self.path) as db:
+            return db.execute(query, params).rowcount > 0
+
+    def prune(self, days: int = SENT_RETENTION_DAYS) -> int:
+        with get_db(self.path) as db:
+            return db.execute("DELETE FROM outbox WHERE status = 'sent' AND effects_done = 1 AND updated_at < ?",
+                              (time.time() - days * 86400,)).rowcount
+
+    # ── Reporting ─────────────────────────────────────────
+    def counts(self, user_id: Optional[int] = None) -> Dict[str, int]:
+        query = "SELECT status, COUNT(*) AS n FROM outbox"
+        params = []
+        if user_id is not None:
+            query += " WHERE user_id = ?"
+            params.append(user_id)
+        with get_db(self.path) as db:
+            rows = db.execute(query + " GROUP BY status", params).fetchall()
+        counts = {status: 0 for status in STATUSES}
+        counts.update({r['status']: r['n'] for r in rows})
+        return counts
+
+    def unsent_count(self, user_id: int) -> int:
+        """Items still waiting to go out (counted against the daily cap)."""
+        counts = self.counts(user_id)
+        return counts['pending'] + counts['sending']
+
+    def items(self, user_id: Optional[int] = None, statuses=('pending', 'sending', 'dead'),
+              limit: int = 50) -> List[Dict]:
+        query = f"SELECT * FROM outbox WHERE status IN ({','.join('?' * len(statuses))})"
+        params = list(statuses)
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        with get_db(self.path) as db:
+            rows = db.execute(query + " ORDER BY created_at DESC LIMIT ?", params + [limit]).fetchall()
+        return [self._item(r) for r in rows]
+
+
+outbox = Outbox()
@@ -0,0 +1,248 @@
+"""Token-bucket rate limiting shared by every process on the host.
+
+Buckets live in ``data/ratelimit.db``. The web workers and
+``auto_reply_monitor.py`` therefore draw from the same budget. Each
+acquire runs in a ``BEGIN IMMEDIATE`` transaction, so two processes cannot
+spend the same token.
+
+Keys name the quota being spent:
+
+- ``sheets:<service account email>``: Sheets API requests (60/min per user by default).
+- ``gmail:<mailbox>``: Gmail API calls for one mailbox.
+- ``research:<user_id>``: company research runs, paced by the user's research delay.
+- ``anthropic:<user_id>``: Claude requests from batch generation (``services/ai_generation.py``).
+
+Callers ask for a token before each call instead of sleeping a fixed
+amount. When a bucket has headroom the call proceeds immediately.
+
+On a 429 the bucket's refill rate is halved and its tokens are drained
+(``penalize``). Each successful acquire then adds back a small share of the
+base rate until the configured rate is reached again (AIMD).
+"""
+
+import os
+import time
+import sqlite3
+import logging
+from contextlib import contextmanager
+
+from gspread.http_client import HTTPClient
+
+from models import get_db, PROJECT_ROOT
+from services.retry import call, classify, THROTTLED, CONNECT_TIMEOUT, READ_TIMEOUT
+
+logger = logging.getLogger('quartz_web')
+
+SHEETS_RATE_PER_MINUTE = float(os.getenv('SHEETS_RATE_PER_MINUTE', '60'))
+GMAIL_RATE_PER_SECOND = float(os.getenv('GMAIL_RATE_PER_SECOND', '2'))
+ANTHROPIC_RATE_PER_MINUTE = float(os.getenv('ANTHROPIC_RATE_PER_MINUTE', '50'))
+ACQUIRE_TIMEOUT = float(os.getenv('RATE_LIMIT_TIMEOUT_SECONDS', '120'))
+
+# key prefix -> (tokens per second, bucket capacity)
+DEFAULT_LIMITS = {
+    'sheets': (SHEETS_RATE_PER_MINUTE / 60.0, 10),
+    'gmail': (GMAIL_RATE_PER_SECOND, 5),
+    'anthropic': (ANTHROPIC_RATE_PER_MINUTE / 60.0, 5),
+}
+FALLBACK_LIMIT = (1.0, 1)
+
+# AIMD tuning
+DECREASE_FACTOR = 0.5
+INCREASE_SHARE = 0.05   # of the base rate, per successful acquire
+MIN_RATE_SHARE = 0.05   # floor, as a share of the base rate
+
+_initialized_paths = set()
+
+
+class RateLimitTimeout(RuntimeError):
+    """Raised when no token became available within the timeout."""
+
+
+def limiter_path():
+    return os.path.join(PROJECT_ROOT, 'data', 'ratelimit.db')
+
+
+class RateLimiter:
+    """Cross-process token buckets stored in SQLite."""
+
+    def __init__(self, path=None):
+        self.path = path or limiter_path()
+        if self.path not in _initialized_paths:
+            self._init_schema()
+            _initialized_paths.add(self.path)
+
+    def _init_schema(self):
+        with get_db(self.path) as db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    capacity REAL NOT NULL,
+                    rate REAL NOT NULL,
+                    base_rate REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    acquired INTEGER NOT NULL DEFAULT 0,
+                    throttled INTEGER NOT NULL DEFAULT 0,
+                    waited_ms REAL NOT NULL DEFAULT 0
+                )
+            ''')
+
+    @contextmanager
+    def _locked(self):
+        """Connection holding the database write lock for the whole block."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _limits(key, rate, capacity):
+        default_rate, default_capacity = DEFAULT_LIMITS.get(key.split(':', 1)[0], FALLBACK_LIMIT)
+        return (default_rate if rate is None else rate,
+                default_capacity if capacity is None else capacity)
+
+    @staticmethod
+    def _refill(bucket, now):
+        elapsed = max(0.0, now - bucket['updated_at'])
+        return min(bucket['capacity'], bucket['tokens'] + elapsed * bucket['rate'])
+
+    def _load(self, db, key, rate, capacity, now):
+        bucket = db.execute("SELECT * FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+        if bucket is None or bucket['base_rate'] != rate or bucket['capacity'] != capacity:
+            # New bucket, or its configured limits changed
+            current = dict(bucket) if bucket else {}
+            bucket = {
+                'key': key, 'tokens': min(current.get('tokens', capacity), capacity),
+                'capacity': capacity, 'rate': rate, 'base_rate': rate, 'updated_at': now,
+                'acquired': current.get('acquired', 0), 'throttled': current.get('throttled', 0),
+                'waited_ms': current.get('waited_ms', 0.0),
+            }
+            db.execute(
+                "INSERT OR REPLACE INTO rate_buckets "
+                "(key, tokens, capacity, rate, base_rate, updated_at, acquired, throttled, waited_ms) "
+                "VALUES (:key, :tokens, :capacity, :rate, :base_rate, :updated_at, :acquired, :throttled, :waited_ms)",
+                bucket,
+            )
+        return dict(bucket)
+
+    # ── Spending ──────────────────────────────────────────
+    def try_acquire(self, key, tokens=1, rate=None, capacity=None):
+        """Take tokens if available. Returns 0 on success, else seconds until they will be."""
+        rate, capacity = self._limits(key, rate, capacity)
+        now = time.time()
+        with self._locked() as db:
+            bucket = self._load(db, key, rate, capacity, now)
+            available = self._refill(bucket, now)
+            if available >= tokens:
+                new_rate = min(bucket['base_rate'], bucket['rate'] + bucket['base_rate'] * INCREASE_SHARE)
+                db.execute(
+                    "UPDATE rate_buckets SET tokens = ?, rate = ?, updated_at = ?, acquired = acquired + 1 "
+                    "WHERE key = ?", (available - tokens, new_rate, now, key),
+                )
+                return 0.0
+            db.execute("UPDATE rate_buckets SET tokens = ?, updated_at = ? WHERE key = ?",
+                       (available, now, key))
+            return (tokens - available) / bucket['rate']
+
+    def acquire(self, key, tokens=1, rate=None, capacity=None, timeout=ACQUIRE_TIMEOUT):
+        """Block until tokens are available. Returns seconds waited.
+
+        Raises RateLimitTimeout if the wait would exceed ``timeout``.
+        """
+        start = time.time()
+        while True:
+            wait = self.try_acquire(key, tokens, rate, capacity)
+            waited = time.time() - start
+            if wait == 0:
+                if waited > 0.05:
+                    with get_db(self.path) as db:
+                        db.execute("UPDATE rate_buckets SET waited_ms = waited_ms + ? WHERE key = ?",
+                                   (waited * 1000, key))
+                return waited
+            if waited + wait > timeout:
+                raise RateLimitTimeout(f'Rate limit for {key}: no capacity within {timeout:.0f}s')
+            time.sleep(min(wait, 5.0))
+
+    def penalize(self, key, retry_after=None):
+        """Back off after a 429: halve the refill rate and drain the bucket.
+
+        ``retry_after`` (seconds, from the response) pushes the next token out
+        at least that far.
+        """
+        now = time.time()
+        with self._locked() as db:
+            bucket = db.execute("SELECT * FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            if bucket is None:
+                return
+            rate = max(bucket['base_rate'] * MIN_RATE_SHARE, bucket['rate'] * DECREASE_FACTOR)
+            tokens = -rate * retry_after if retry_after else 0.0
+            db.execute(
+                "UPDATE rate_buckets SET tokens = ?, rate = ?, updated_at = ?, throttled = throttled + 1 "
+                "WHERE key = ?", (tokens, rate, now, key),
+            )
+        logger.warning(f"Rate limited on {key}; refill rate now {rate:.3f}/s")
+
+    # ── Reporting ─────────────────────────────────────────
+    def usage(self, prefix=None):
+        """Current budget per bucket: tokens left, effective vs configured rate, counters."""
+        now = time.time()
+        with get_db(self.path) as db:
+            if prefix:
+                rows = db.execute("SELECT * FROM rate_buckets WHERE key LIKE ? ORDER BY key",
+                                  (f'{prefix}%',)).fetchall()
+            else:
+                rows = db.execute("SELECT * FROM rate_buckets ORDER BY key").fetchall()
+        result = []
+        for row in rows:
+            bucket = dict(row)
+            bucket['tokens'] = round(self._refill(bucket, now), 2)
+            bucket['utilization'] = round(1 - max(bucket['tokens'], 0) / bucket['capacity'], 2)
+            bucket['backed_off'] = bucket['rate'] < bucket['base_rate']
+            result.append(bucket)
+        return result
+
+
+def is_rate_limit_error(error):
+    """True for 429s and rate-limit 403s from gspread or googleapiclient."""
+    return classify(error) == THROTTLED
+
+
+rate_limiter = RateLimiter()
+
+
+class RateLimitedHTTPClient(HTTPClient):
+    """gspread HTTP client that spends a ``sheets:<service account>`` token per request.
+
+    Pass it to ``gspread.authorize(creds, http_client=RateLimitedHTTPClient)``.
+    Requests get connect/read timeouts and are retried under the ``sheets``
+    retry policy. A 429 backs the bucket off and waits for the next token.
+    Appends and other writes that are not idempotent are retried only when
+    they were throttled.
+    """
+
+    IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE'}
+    # POSTs that set values rather than add them
+    IDEMPOTENT_ENDPOINTS = ('/values:batchGet', '/values:batchUpdate', '/values:batchClear', ':clear')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_timeout((CONNECT_TIMEOUT, READ_TIMEOUT))
+
+    @property
+    def limit_key(self):
+        return f"sheets:{getattr(self.auth, 'service_account_email', None) or 'default'}"
+
+    def request(self, method, endpoint, *args, **kwargs):
+        idempotent = (method.upper() in self.IDEMPOTENT_METHODS
+                      or endpoint.split('?')[0].endswith(self.IDEMPOTENT_ENDPOINTS))
+        return call('sheets', super().request, method, endpoint, *args,
+                    limit_key=self.limit_key, idempotent=idempotent, **kwargs)
@@ -0,0 +1,107 @@
+"""Indexed snapshot of worksheet records.
+
+Lookups by field are O(1) hash lookups that carry the sheet row number, and
+``for_reply`` matches a reply to the tracking row of the email it answers.
+"""
+
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Fields compared case-insensitively
+CASE_INSENSITIVE_FIELDS = {'contact_email', 'email', 'company_name'}
+
+# Email_Tracking columns written when an email is sent, used to match replies
+REPLY_MATCH_COLUMNS = ('gmail_msg_id', 'gmail_thread_id', 'rfc_message_id')
+
+_MESSAGE_ID = re.compile(r'<[^<>\s]+>')
+
+
+def normalize_key(field, value):
+    text = str(value).strip() if value is not None else ''
+    if field in CASE_INSENSITIVE_FIELDS:
+        text = text.lower()
+    return text
+
+
+def referenced_message_ids(in_reply_to: str = '', references: str = '') -> List[str]:
+    """Message-IDs a reply points at, most specific first (In-Reply-To, then References newest first)."""
+    ids = _MESSAGE_ID.findall(in_reply_to or '') + _MESSAGE_ID.findall(references or '')[::-1]
+    return list(dict.fromkeys(ids))
+
+
+class RecordSnapshot:
+    """Records of one worksheet with lazily built per-field indexes."""
+
+    def __init__(self, records: List[Dict], first_row: int = 2):
+        self.records = records
+        self.first_row = first_row
+        self._indexes = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def rows(self):
+        """Iterate (sheet_row, record) pairs in sheet order."""
+        return enumerate(self.records, start=self.first_row)
+
+    def _index(self, field):
+        index = self._indexes.get(field)
+        if index is None:
+            index = {}
+            for row, record in self.rows():
+                key = normalize_key(field, record.get(field))
+                if key:
+                    index.setdefault(key, []).append((row, record))
+            self._indexes[field] = index
+        return index
+
+    def find_all(self, field: str, value) -> List[Tuple[int, Dict]]:
+        """All (row, record) pairs whose field matches value, in sheet order."""
+        key = normalize_key(field, value)
+        if not key:
+            return []
+        return self._index(field).get(key, [])
+
+    def find(self, field: str, value) -> Optional[Tuple[int, Dict]]:
+        """First (row, record) pair whose field matches value, or None."""
+        hits = self.find_all(field, value)
+        return hits[0] if hits else None
+
+    def get(self, field: str, value) -> Optional[Dict]:
+        """First record whose field matches value, or None."""
+        hit = self.find(field, value)
+        return hit[1] if hit else None
+
+    def by_id(self, customer_id) -> Optional[Dict]:
+        """Customer record by its ``id`` column."""
+        return self.get('id', customer_id)
+
+    def for_reply(self, thread_id: str = '', message_ids: Iterable[str] = (), sender: str = '',
+                  where: Optional[Callable[[Dict], bool]] = None) -> Optional[Tuple[int, Dict]]:
+        """Tracking (row, record) a reply answers, or None.
+
+        Tried in order: a row whose ``rfc_message_id`` the reply references,
+        the latest row in the reply's Gmail thread, then the first row for
+        the sender's address. ``where`` filters candidates at every step.
+        """
+        where = where or (lambda record: True)
+        for message_id in message_ids:
+            for hit in self.find_all('rfc_message_id', message_id):
+                if where(hit[1]):
+                    return hit
+        for hit in reversed(self.find_all('gmail_thread_id', thread_id)):
+            if where(hit[1]):
+                return hit
+        for hit in self.find_all('contact_email', sender):
+            if where(hit[1]):
+                return hit
+        return None
+
+    def for_customer(self, customer_id, contact_email='') -> List[Dict]:
+        """Tracking records linked to a customer by customer_id or contact_email, in sheet order."""
+        hits = dict(self.find_all('customer_id', customer_id))
+        hits.update(self.find_all('contact_email', contact_email))
+        return [hits[row] for row in sorted(hits)]
@@ -0,0 +1,38 @@
+"""Spam senders and keyword reply classification, shared by the web app and the reply daemons."""
+
+import os
+import re
+
+# Senders never treated as customer replies (substring match on the address)
+SPAM_DOMAINS = [d.strip().lower() for d in os.getenv('SPAM_DOMAINS',
+    '@accounts.google.com,@indeed.com,@pinterest.com,@discover.pinterest.com,@email.shopify.com,@englishgrammar.org,@360alumni.com,@inspire.pinterest.com,mailer-daemon@,noreply@,no-reply@,@shutterstock.com,@coursera.org,@discord.com,@malwarebytes.com,@dropbox.com'
+).split(',')]
+
+# (label, pipeline stage, patterns); the first rule with a matching pattern wins
+REPLY_RULES = [
+    ('Declined', 10, ['not interested', 'unsubscribe', 'remove me', 'stop email',
+                       'no thank', 'no thanks', 'pass on', r'\bdecline\b']),
+    ('Quotation Request', 5, ['price', 'quote', 'quotation', r'\bcost\b', r'\bfob\b',
+                               r'\bcif\b', 'pricing']),
+    ('Sample Request', 4, ['sample', 'trial', r'\btest\b', r'\blab\b', '2-5kg', 'testing']),
+    ('Technical Info Request', 3, ['specification', 'technical', 'data sheet', 'purity',
+                                    r'\bsio2\b', 'boron', 'analysis', r'\bicp\b']),
+    ('Contract Request', 6, ['contract', 'agreement', r'\bterms\b', 'payment']),
+    ('Repeat Order', 9, ['repeat', 'reorder', 'bulk order', 'container']),
+    ('Shipping Inquiry', 7, ['delivery', 'shipping', 'invoice', r'\bcoa\b']),
+    ('Info Request', 2, ['interested', 'more info', 'tell me more', 'brochure']),
+]
+
+
+def classify_reply(reply_body):
+    """Classify a customer reply by type and detect pipeline stage (keyword-based)."""
+    text = reply_body.lower()
+    for label, stage, patterns in REPLY_RULES:
+        for p in patterns:
+            if p.startswith(r'\b'):
+                if re.search(p, text):
+                    return label, stage
+            else:
+                if p in text:
+                    return label, stage
+    return 'General Reply', None
@@ -0,0 +1,282 @@
+"""Status-aware retries, deadlines and timeouts for outbound API calls.
+
+``classify`` sorts an error into throttled, transient or permanent, and
+``call``/``call_async`` retry under a per-service ``RetryPolicy``.
+"""
+
+import os
+import json
+import time
+import asyncio
+import random
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger('quartz_web')
+
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT_SECONDS', '10'))
+READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT_SECONDS', '60'))
+
+THROTTLED = 'throttled'
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+# Google error reasons that mean "slow down" even though the status is 403
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'RATE_LIMIT_EXCEEDED', 'RESOURCE_EXHAUSTED'}
+# Exceptions without a status that mean the request never completed
+TRANSIENT_ERROR_NAMES = {'APIConnectionError', 'APITimeoutError', 'ServerNotFoundError', 'ConnectionError',
+                         'ConnectTimeout', 'ReadTimeout', 'Timeout', 'RemoteDisconnected', 'IncompleteRead',
+                         'ProtocolError', 'ChunkedEncodingError', 'SSLError'}
+
+
+class RetryPolicy:
+    """Backoff budget for one service."""
+
+    def __init__(self, attempts: int, base: float, cap: float, deadline: float):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.deadline = deadline
+
+    @classmethod
+    def from_env(cls, service: str, attempts: int, base: float, cap: float, deadline: float):
+        prefix = f'RETRY_{service.upper()}'
+        return cls(int(os.getenv(f'{prefix}_ATTEMPTS', str(attempts))), base, cap,
+                   float(os.getenv(f'{prefix}_DEADLINE_SECONDS', str(deadline))))
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential delay after the ``attempt``-th failure, at least ``retry_after``."""
+        ceiling = min(self.cap, self.base * (2 ** (attempt - 1)))
+        return max(random.uniform(ceiling / 2, ceiling), retry_after or 0)
+
+
+POLICIES = {
+    'gmail': RetryPolicy.from_env('gmail', attempts=5, base=1, cap=32, deadline=120),
+    'sheets': RetryPolicy.from_env('sheets', attempts=5, base=1, cap=32, deadline=120),
+    'anthropic': RetryPolicy.from_env('anthropic', attempts=4, base=2, cap=30, deadline=180),
+}
+
+
+# ── Classification ────────────────────────────────────
+def status_of(error) -> Optional[int]:
+    """HTTP status attached to an error by googleapiclient, gspread, requests or anthropic."""
+    for status in (getattr(getattr(error, 'resp', None), 'status', None),
+                   getattr(error, 'status_code', None),
+                   getattr(getattr(error, 'response', None), 'status_code', None),
+                   getattr(error, 'code', None)):
+        try:
+            if status is not None:
+                return int(status)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _reasons(error) -> set:
+    """Structured Google error reasons (``errors[].reason`` / ``status``)."""
+    reasons = set()
+    details = getattr(error, 'error_details', None)     # googleapiclient HttpError
+    if isinstance(details, list):
+        reasons.update(d.get('reason') for d in details if isinstance(d, dict))
+    body = getattr(error, 'error', None)                 # gspread APIError
+    if not isinstance(body, dict):
+        content = getattr(error, 'content', None)
+        try:
+            body = json.loads(content).get('error', {}) if content else {}
+        except (TypeError, ValueError, AttributeError):
+            body = {}
+    if isinstance(body, dict):
+        reasons.add(body.get('status'))
+        reasons.update(e.get('reason') for e in body.get('errors', []) if isinstance(e, dict))
+    reasons.discard(None)
+    return reasons
+
+
+def classify_status(status: Optional[int], reasons=()) -> str:
+    if status == 429 or (status == 403 and RATE_LIMIT_REASONS & set(reasons)):
+        return THROTTLED
+    if status == 408 or (status is not None and status >= 500):
+        return TRANSIENT
+    return PERMANENT
+
+
+def classify(error) -> str:
+    """``throttled``, ``transient`` or ``permanent`` for an exception from an API client."""
+    status = status_of(error)
+    if status is not None:
+        return classify_status(status, _reasons(error))
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return TRANSIENT
+    if {cls.__name__ for cls in type(error).__mro__} & TRANSIENT_ERROR_NAMES:
+        return TRANSIENT
+    return PERMANENT
+
+
+def retry_after_of(error) -> Optional[float]:
+    """Seconds from a Retry-After header, when the response carried one."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    resp = getattr(error, 'resp', None)
+    for source in (headers, resp):
+        value = source.get('retry-after') or source.get('Retry-After') if hasattr(source, 'get') else None
+        if value:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+# ── Counters ──────────────────────────────────────────
+class RetryStats:
+    """Per-service counters of calls, retries and give-ups (this process)."""
+
+    FIELDS = ('calls', 'retries', 'throttled', 'gave_up', 'deadline_exceeded')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, service: str, field: str, n: int = 1):
+        with self._lock:
+            counts = self._counts.setdefault(service, dict.fromkeys(self.FIELDS, 0))
+            counts[field] += n
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {service: dict(counts) for service, counts in self._counts.items()}
+
+
+retry_stats = RetryStats()
+
+
+# ── Retrying ──────────────────────────────────────────
+def _retry_delay(service: str, policy: RetryPolicy, error: Exception, attempt: int, started: float,
+                 idempotent: bool, limit_key: Optional[str]) -> Optional[float]:
+    """Seconds to wait before retrying after ``error``, or None to give up. Records the counters."""
+    kind = classify(error)
+    if kind == PERMANENT or (kind == TRANSIENT and not idempotent) or attempt >= policy.attempts:
+        if kind != PERMANENT:
+            retry_stats.record(service, 'gave_up')
+        return None
+    retry_after = retry_after_of(error)
+    delay = policy.delay(attempt, retry_after)
+    if kind == THROTTLED:
+        retry_stats.record(service, 'throttled')
+        if limit_key:
+            # The penalized bucket paces the next attempt
+            from services.rate_limit import rate_limiter
+            rate_limiter.penalize(limit_key, retry_after)
+            delay = 0
+    if time.monotonic() - started + delay > policy.deadline:
+        retry_stats.record(service, 'deadline_exceeded')
+        return None
+    retry_stats.record(service, 'retries')
+    logger.warning(f"{service} call {kind} ({status_of(error) or type(error).__name__}), "
+                   f"attempt {attempt}/{policy.attempts}, retrying in {delay:.1f}s")
+    return delay
+
+
+def call(service: str, fn: Callable, *args, limit_key: Optional[str] = None, idempotent: bool = True,
+         policy: Optional[RetryPolicy] = None, **kwargs):
+    """Run ``fn(*args, **kwargs)``, retrying throttled and transient failures under the service's policy.
+
+    With ``limit_key`` a token is taken from that rate-limit bucket before each
+    attempt. A non-idempotent call is retried only when it was throttled.
+    """
+    policy = policy or POLICIES[service]
+    started = time.monotonic()
+    retry_stats.record(service, 'calls')
+    attempt = 0
+    while True:
+        attempt += 1
+        if limit_key:
+            from services.rate_limit import rate_limiter
+            rate_limiter.acquire(limit_key)
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            delay = _retry_delay(service, policy, e, attempt, started, idempotent, limit_key)
+            if delay is None:
+                raise
+            if delay:
+                time.sleep(delay)
+
+
+async def call_async(service: str, fn: Callable, *args, limit_key: Optional[str] = None, idempotent: bool = True,
+                     policy: Optional[RetryPolicy] = None, **kwargs):
+    """``call`` for coroutine functions: awaits ``fn`` and backs off without blocking the event loop."""
+    policy = policy or POLICIES[service]
+    started = time.monotonic()
+    retry_stats.record(service, 'calls')
+    attempt = 0
+    while True:
+        attempt += 1
+        if limit_key:
+            from services.rate_limit import rate_limiter
+            await asyncio.to_thread(rate_limiter.acquire, limit_key)
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            delay = _retry_delay(service, policy, e, attempt, started, idempotent, limit_key)
+            if delay is None:
+                raise
+            if delay:
+                await asyncio.sleep(delay)
+
+
+def execute(request, service: str = 'gmail', limit_key: Optional[str] = None, idempotent: bool = True):
+    """``request.execute()`` for a googleapiclient request, with retries."""
+    return call(service, request.execute, limit_key=limit_key, idempotent=idempotent)
+
+
+# ── Clients with timeouts ─────────────────────────────
+def authorized_http(creds):
+    """httplib2 transport for googleapiclient with a socket timeout."""
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    return AuthorizedHttp(creds, http=httplib2.Http(timeout=READ_TIMEOUT))
+
+
+class _RetryingResource:
+    """Wraps an SDK resource so ``create`` goes through ``call``."""
+
+    def __init__(self, resource, service):
+        self._resource = resource
+        self._service = service
+
+    def create(self, *args, **kwargs):
+        return call(self._service, self._resource.create, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._resource, name)
+
+
+class RetryingAnthropic:
+    """``anthropic.Anthropic`` with timeouts and ``messages.create`` retried under the anthropic policy.
+
+    The SDK's own retries are turned off so attempts are counted and
+    budgeted in one place.
+    """
+
+    def __init__(self, api_key: str, **kwargs):
+        import anthropic
+        import httpx
+        self._client = anthropic.Anthropic(api_key=api_key, max_retries=0,
+                                           timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT), **kwargs)
+        self.messages = _RetryingResource(self._client.messages, 'anthropic')
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def anthropic_client(api_key: str) -> RetryingAnthropic:
+    return RetryingAnthropic(api_key)
+
+
+def async_anthropic_client(api_key: str):
+    """``anthropic.AsyncAnthropic`` with timeouts and SDK retries off; call it through ``call_async``."""
+    import anthropic
+    import httpx
+    return anthropic.AsyncAnthropic(api_key=api_key, max_retries=0,
+                                    timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT))
@@ -0,0 +1,48 @@
+"""Segment templates: one generated email per (stage, industry), filled in per customer.
+
+Slots such as ``{{company_name}}`` and ``{{personal_line}}`` are filled locally.
+"""
+
+import re
+from typing import Dict, Optional
+
+# Slots a template may use; anything else in double braces is dropped
+SLOTS = ('contact_name', 'company_name', 'industry', 'pain_points', 'personal_line')
+MODES = ('full', 'personalized', 'template')
+
+_SLOT = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+_BLANK_LINES = re.compile(r'\n[ \t]*\n([ \t]*\n)+')
+
+
+def industry_segment(customer: Dict) -> str:
+    """Industry a customer's template is shared by: the first tag, or 'General'."""
+    tag = re.split(r'[,;/]', str(customer.get('tags', '') or ''))[0].strip()
+    return tag.title() if tag else 'General'
+
+
+def slot_values(customer: Dict, personal_line: str = '') -> Dict[str, str]:
+    contact = str(customer.get('contact_name', '') or '').strip()
+    return {
+        'contact_name': contact.split()[0] if contact else 'there',
+        'company_name': str(customer.get('company_name', '') or '').strip() or 'your company',
+        'industry': industry_segment(customer),
+        'pain_points': str(customer.get('pain_points', '') or '').strip(),
+        'personal_line': personal_line.strip(),
+    }
+
+
+def fill(text: str, values: Dict[str, str]) -> str:
+    """Substitute ``{{slot}}`` placeholders; unknown or empty slots leave no gap behind."""
+    filled = _SLOT.sub(lambda m: values.get(m.group(1), ''), text)
+    return _BLANK_LINES.sub('\n\n', filled).strip()
+
+
+def fill_template(template: Dict, customer: Dict, personal_line: str = '') -> Optional[Dict]:
+    """A customer's email from a segment template, shaped like ``generate_email``'s result."""
+    if not template:
+        return None
+    values = slot_values(customer, personal_line)
+    email = dict(template)
+    email['subject'] = fill(str(template.get('subject', '')), values)
+    email['body'] = fill(str(template.get('body', '')), values)
+    return email
@@ -0,0 +1,191 @@
+"""SQLite-backed cache shared by every worker process on a host.
+
+Each namespace carries a version; bumping it invalidates the namespace for
+every worker at once.
+"""
+
+import os
+import json
+import time
+import logging
+
+from models import get_db, PROJECT_ROOT
+
+logger = logging.getLogger('quartz_web')
+
+DEFAULT_TTL = int(os.getenv('SHARED_CACHE_TTL_SECONDS', '60'))
+MAX_BYTES = int(os.getenv('SHARED_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# Last-access times are only rewritten when older than this, so hot keys do
+# not turn every read into a write.
+TOUCH_INTERVAL = 5
+
+_initialized_paths = set()
+
+
+def cache_path():
+    """Path of the shared cache database."""
+    return os.path.join(PROJECT_ROOT, 'data', 'cache.db')
+
+
+class SharedCache:
+    """Namespaced, size-bounded LRU cache stored in SQLite."""
+
+    def __init__(self, path=None, max_bytes=MAX_BYTES, ttl=DEFAULT_TTL):
+        self.path = path or cache_path()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        if self.path not in _initialized_paths:
+            self._init_schema()
+            _initialized_paths.add(self.path)
+
+    def _init_schema(self):
+        with get_db(self.path) as db:
+            db.executescript('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    version INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                );
+                CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache_entries(accessed_at);
+                CREATE TABLE IF NOT EXISTS cache_namespaces (
+                    namespace TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    misses INTEGER NOT NULL DEFAULT 0,
+                    evictions INTEGER NOT NULL DEFAULT 0
+                );
+            ''')
+
+    @staticmethod
+    def _version(db, namespace):
+        row = db.execute("SELECT version FROM cache_namespaces WHERE namespace = ?", (namespace,)).fetchone()
+        return row['version'] if row else 0
+
+    @staticmethod
+    def _count(db, namespace, column):
+        db.execute(
+            f"INSERT INTO cache_namespaces (namespace, {column}) VALUES (?, 1) "
+            f"ON CONFLICT(namespace) DO UPDATE SET {column} = {column} + 1",
+            (namespace,),
+        )
+
+    # ── Reads ─────────────────────────────────────────────
+    def get(self, namespace, key, ttl=None):
+        """Cached value, or None if missing, expired or invalidated."""
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        with get_db(self.path) as db:
+            row = db.execute(
+                "SELECT e.value, e.version, e.created_at, e.accessed_at, "
+                "COALESCE(n.version, 0) AS current FROM cache_entries e "
+                "LEFT JOIN cache_namespaces n ON n.namespace = e.namespace "
+                "WHERE e.namespace = ? AND e.key = ?",
+                (namespace, key),
+            ).fetchone()
+            if not row or row['version'] != row['current'] or now - row['created_at'] >= ttl:
+                self._count(db, namespace, 'misses')
+                return None
+            self._count(db, namespace, 'hits')
+            if now - row['accessed_at'] > TOUCH_INTERVAL:
+                db.execute("UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                           (now, namespace, key))
+        return json.loads(row['value'])
+
+    def get_or_load(self, namespace, key, loader, ttl=None):
+        """Cached value, calling ``loader()`` and storing its result on a miss.
+
+        The namespace version is read before the loader runs. If the
+        namespace is invalidated while the loader is running, the result is
+        stored under the old version and is never served.
+        """
+        value = self.get(namespace, key, ttl)
+        if value is not None:
+            return value
+        version = self.version(namespace)
+        value = loader()
+        self.set(namespace, key, value, version=version)
+        return value
+
+    # ── Writes ────────────────────────────────────────────
+    def set(self, namespace, key, value, version=None):
+        """Store a JSON-serialisable value, evicting LRU entries past the size cap."""
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        size = len(payload.encode('utf-8'))
+        if size > self.max_bytes:
+            logger.warning('Shared cache: %s/%s is %d bytes, larger than the cache; not stored',
+                           namespace, key, size)
+            return
+        now = time.time()
+        with get_db(self.path) as db:
+            if version is None:
+                version = self._version(db, namespace)
+            db.execute(
+                "INSERT OR REPLACE INTO cache_entries "
+                "(namespace, key, value, size, version, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (namespace, key, payload, size, version, now, now),
+            )
+            self._evict(db)
+
+    def _evict(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in db.execute(
+            "SELECT namespace, key, size FROM cache_entries ORDER BY accessed_at"
+        ).fetchall():
+            db.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                       (row['namespace'], row['key']))
+            self._count(db, row['namespace'], 'evictions')
+            total -= row['size']
+            if total <= self.max_bytes:
+                break
+
+    def version(self, namespace):
+        with get_db(self.path) as db:
+            return self._version(db, namespace)
+
+    def invalidate(self, namespace):
+        """Bump the namespace version so every worker drops its entries."""
+        with get_db(self.path) as db:
+            db.execute(
+                "INSERT INTO cache_namespaces (namespace, version) VALUES (?, 1) "
+                "ON CONFLICT(namespace) DO UPDATE SET version = version + 1",
+                (namespace,),
+            )
+            db.execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+            return self._version(db, namespace)
+
+    def clear(self):
+        with get_db(self.path) as db:
+            db.execute("DELETE FROM cache_entries")
+
+    # ── Stats ─────────────────────────────────────────────
+    def stats(self, namespace=None):
+        """Hit/miss/eviction counters and stored bytes, across all workers."""
+        with get_db(self.path) as db:
+            if namespace is None:
+                row = db.execute(
+                    "SELECT COALESCE(SUM(hits), 0) AS hits, COALESCE(SUM(misses), 0) AS misses, "
+                    "COALESCE(SUM(evictions), 0) AS evictions FROM cache_namespaces"
+                ).fetchone()
+                usage = db.execute(
+                    "SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS bytes FROM cache_entries"
+                ).fetchone()
+            else:
+                row = db.execute(
+                    "SELECT hits, misses, evictions FROM cache_namespaces WHERE namespace = ?", (namespace,)
+                ).fetchone()
+                usage = db.execute(
+                    "SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS bytes "
+                    "FROM cache_entries WHERE namespace = ?", (namespace,)
+                ).fetchone()
+        result = dict(row) if row else {'hits': 0, 'misses': 0, 'evictions': 0}
+        result.update(dict(usage))
+        lookups = result['hits'] + result['misses']
+        result['hit_rate'] = round(result['hits'] / lookups, 3) if lookups else 0.0
+        return result
@@ -0,0 +1,104 @@
+"""Process-wide cache of worksheet properties and header rows.
+
+``Spreadsheet.worksheet(title)`` re-fetches the spreadsheet metadata on every
+call, and most write paths then read ``row_values(1)`` to map column names.
+Both rarely change, so they are cached per spreadsheet id and shared by every
+GoogleSheetsManager in the process.
+
+Header rows carry a version number. Adding a column through
+``GoogleSheetsManager.ensure_columns`` bumps the version, which invalidates
+the cached row for every manager at once. Entries also expire after a TTL so
+edits made directly in the Sheets UI (or by another process) are picked up.
+"""
+
+import os
+import time
+import threading
+
+METADATA_TTL = int(os.getenv('SHEETS_METADATA_TTL_SECONDS', '600'))
+HEADER_TTL = int(os.getenv('SHEETS_HEADER_TTL_SECONDS', '300'))
+
+
+class SheetMetadataCache:
+    """Worksheet properties and header rows keyed by (spreadsheet_id, title)."""
+
+    def __init__(self, metadata_ttl=METADATA_TTL, header_ttl=HEADER_TTL):
+        self.metadata_ttl = metadata_ttl
+        self.header_ttl = header_ttl
+        self._lock = threading.Lock()
+        self._properties = {}   # spreadsheet_id -> {'sheets': {title: props}, 'time': t}
+        self._headers = {}      # (spreadsheet_id, title) -> {'headers': [...], 'version': n, 'time': t}
+        self._versions = {}     # (spreadsheet_id, title) -> n
+        self.stats = {'property_hits': 0, 'property_misses': 0, 'header_hits': 0, 'header_misses': 0}
+
+    # ── Worksheet properties ──────────────────────────────
+    def get_properties(self, spreadsheet_id, title):
+        """Cached worksheet properties, or None if missing or expired."""
+        with self._lock:
+            entry = self._properties.get(spreadsheet_id)
+            if entry and time.time() - entry['time'] < self.metadata_ttl and title in entry['sheets']:
+                self.stats['property_hits'] += 1
+                return entry['sheets'][title]
+            self.stats['property_misses'] += 1
+            return None
+
+    def set_metadata(self, spreadsheet_id, metadata):
+        """Store properties for every worksheet from one ``fetch_sheet_metadata()`` result."""
+        sheets = {s['properties']['title']: s['properties'] for s in metadata.get('sheets', [])}
+        with self._lock:
+            self._properties[spreadsheet_id] = {'sheets': sheets, 'time': time.time()}
+
+    def add_properties(self, spreadsheet_id, properties):
+        """Record a worksheet created after the last metadata fetch."""
+        with self._lock:
+            entry = self._properties.setdefault(spreadsheet_id, {'sheets': {}, 'time': time.time()})
+            entry['sheets'][properties['title']] = properties
+
+    # ── Header rows ───────────────────────────────────────
+    def get_headers(self, spreadsheet_id, title):
+        """Copy of the cached header row, or None if missing, stale or superseded."""
+        key = (spreadsheet_id, title)
+        with self._lock:
+            entry = self._headers.get(key)
+            if (entry and entry['version'] == self._versions.get(key, 0)
+                    and time.time() - entry['time'] < self.header_ttl):
+                self.stats['header_hits'] += 1
+                return list(entry['headers'])
+            self.stats['header_misses'] += 1
+            return None
+
+    def set_headers(self, spreadsheet_id, title, headers):
+        key = (spreadsheet_id, title)
+        with self._lock:
+            self._headers[key] = {'headers': list(headers), 'version': self._versions.get(key, 0),
+                                  'time': time.time()}
+
+    def version(self, spreadsheet_id, title):
+        with self._lock:
+            return self._versions.get((spreadsheet_id, title), 0)
+
+    def bump(self, spreadsheet_id, title, headers=None):
+        """Invalidate a header row after a column change; optionally store the new row."""
+        key = (spreadsheet_id, title)
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            if headers is None:
+                self._headers.pop(key, None)
+            else:
+                self._headers[key] = {'headers': list(headers), 'version': self._versions[key],
+                                      'time': time.time()}
+            return self._versions[key]
+
+    def clear(self, spreadsheet_id=None):
+        """Drop everything cached for one spreadsheet (or all of them)."""
+        with self._lock:
+            if spreadsheet_id is None:
+                self._properties.clear()
+                self._headers.clear()
+                return
+            self._properties.pop(spreadsheet_id, None)
+            for key in [k for k in self._headers if k[0] == spreadsheet_id]:
+                del self._headers[key]
+
+
+metadata_cache = SheetMetadataCache()
@@ -0,0 +1,223 @@
+"""Local SQLite mirror of the Customers and Email_Tracking worksheets.
+
+Each user gets ``data/mirror_<user_id>.db`` next to ``quartz.db``. Page
+reads are served from the mirror. A sync first compares the spreadsheet's
+Drive ``modifiedTime`` with the value recorded at the last pull and skips
+the sheet entirely when nothing changed; otherwise the sheet is pulled once
+and rows are diffed by hash so only changed rows are rewritten locally.
+
+Writes still go to Google Sheets first (through GoogleSheetsManager) and are
+then applied to the mirror, so a page that writes and then reads sees its
+own changes without waiting for the next sync.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+
+from gspread.utils import numericise_all, to_records
+
+from models import get_db, PROJECT_ROOT
+
+logger = logging.getLogger('quartz_web')
+
+MIRRORED_SHEETS = ('Customers', 'Email_Tracking')
+
+# Background sync interval; 0 disables the sync thread.
+SYNC_INTERVAL = int(os.getenv('SHEETS_MIRROR_SYNC_SECONDS', '120'))
+# A read older than this triggers an on-demand freshness check.
+MAX_AGE = int(os.getenv('SHEETS_MIRROR_MAX_AGE_SECONDS', '300'))
+
+_initialized_paths = set()
+
+
+def mirror_path(user_id):
+    """Path of the mirror database for a user."""
+    return os.path.join(PROJECT_ROOT, 'data', f'mirror_{user_id}.db')
+
+
+def _row_hash(row):
+    return hashlib.sha1(json.dumps(row, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _cell_text(value):
+    return '' if value is None else str(value)
+
+
+class SheetMirror:
+    """Row-level SQLite copy of selected worksheets."""
+
+    def __init__(self, path):
+        self.path = path
+        if path not in _initialized_paths:
+            self._init_schema()
+            _initialized_paths.add(path)
+
+    @classmethod
+    def for_user(cls, user_id):
+        return cls(mirror_path(user_id))
+
+    def _init_schema(self):
+        with get_db(self.path) as db:
+            db.executescript('''
+                CREATE TABLE IF NOT EXISTS mirror_sheets (
+                    name TEXT PRIMARY KEY,
+                    headers TEXT NOT NULL DEFAULT '[]',
+                    row_count INTEGER NOT NULL DEFAULT 0,
+                    remote_modified TEXT NOT NULL DEFAULT '',
+                    synced_at REAL NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS mirror_rows (
+                    sheet TEXT NOT NULL,
+                    row_num INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    row_hash TEXT NOT NULL,
+                    PRIMARY KEY (sheet, row_num)
+                );
+            ''')
+
+    # ── Reads ─────────────────────────────────────────────
+    def sheet_meta(self, name):
+        """Sync metadata for a sheet, or None if it was never pulled."""
+        with get_db(self.path) as db:
+            row = db.execute("SELECT * FROM mirror_sheets WHERE name = ?", (name,)).fetchone()
+        if not row:
+            return None
+        meta = dict(row)
+        meta['headers'] = json.loads(meta['headers'])
+        return meta
+
+    def needs_sync(self, name, max_age=None):
+        """True if the sheet was never pulled or the last check is older than max_age seconds."""
+        meta = self.sheet_meta(name)
+        if not meta:
+            return True
+        max_age = MAX_AGE if max_age is None else max_age
+        return time.time() - meta['synced_at'] > max_age
+
+    def get_headers(self, name):
+        meta = self.sheet_meta(name)
+        return meta['headers'] if meta else None
+
+    def get_records(self, name):
+        """Records in the same shape as ``Worksheet.get_all_records()``, or None if not mirrored."""
+        meta = self.sheet_meta(name)
+        if meta is None:
+            return None
+        with get_db(self.path) as db:
+            rows = db.execute(
+                "SELECT data FROM mirror_rows WHERE sheet = ? ORDER BY row_num", (name,)
+            ).fetchall()
+        values = [numericise_all(json.loads(r['data'])) for r in rows]
+        return to_records(meta['headers'], values)
+
+    # ── Sync ──────────────────────────────────────────────
+    def store_sheet(self, name, values, remote_modified=''):
+        """Replace the mirrored copy of a sheet with freshly pulled values.
+
+        ``values`` is the padded grid returned by ``Worksheet.get(pad_values=True)``.
+        Rows whose hash is unchanged are left alone. Returns counts of
+        changed and deleted rows.
+        """
+        values = [list(r) for r in values if r is not None]
+        if values == [[]]:
+            values = []
+        headers = values[0] if values else []
+        rows = values[1:]
+
+        changed = 0
+        with get_db(self.path) as db:
+            existing = {
+                r['row_num']: r['row_hash']
+                for r in db.execute("SELECT row_num, row_hash FROM mirror_rows WHERE sheet = ?", (name,))
+            }
+            for offset, row in enumerate(rows):
+                row_num = offset + 2
+                row_hash = _row_hash(row)
+                if existing.get(row_num) != row_hash:
+                    db.execute(
+                        "INSERT OR REPLACE INTO mirror_rows (sheet, row_num, data, row_hash) VALUES (?, ?, ?, ?)",
+                        (name, row_num, json.dumps(row, ensure_ascii=False), row_hash),
+                    )
+                    changed += 1
+            deleted = db.execute(
+                "DELETE FROM mirror_rows WHERE sheet = ? AND row_num > ?", (name, len(rows) + 1)
+            ).rowcount
+            db.execute(
+                "INSERT OR REPLACE INTO mirror_sheets (name, headers, row_count, remote_modified, synced_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (name, json.dumps(headers, ensure_ascii=False), len(rows), remote_modified or '', time.time()),
+            )
+        return {'rows': len(rows), 'changed': changed, 'deleted': deleted}
+
+    def mark_checked(self, name):
+        """Record that the remote copy was checked and found unchanged."""
+        with get_db(self.path) as db:
+            db.execute("UPDATE mirror_sheets SET synced_at = ? WHERE name = ?", (time.time(), name))
+
+    def invalidate(self, names=MIRRORED_SHEETS):
+        """Force the next read of these sheets to re-pull from Sheets."""
+        with get_db(self.path) as db:
+            for name in names:
+                db.execute(
+                    "UPDATE mirror_sheets SET synced_at = 0, remote_modified = '' WHERE name = ?", (name,)
+                )
+
+    # ── Write-through ─────────────────────────────────────
+    def apply_cells(self, name, cells):
+        """Apply {(row, col): value} writes that were already pushed to Sheets."""
+        meta = self.sheet_meta(name)
+        if meta is None:
+            return
+        headers = meta['headers']
+        by_row = {}
+        for (row, col), value in cells.items():
+            by_row.setdefault(row, {})[col] = _cell_text(value)
+
+        with get_db(self.path) as db:
+            if 1 in by_row:
+                for col, value in by_row.pop(1).items():
+                    if len(headers) < col:
+                        headers.extend([''] * (col - len(headers)))
+                    headers[col - 1] = value
+                db.execute("UPDATE mirror_sheets SET headers = ? WHERE name = ?",
+                           (json.dumps(headers, ensure_ascii=False), name))
+
+            for row_num, cols in by_row.items():
+                current = db.execute(
+                    "SELECT data FROM mirror_rows WHERE sheet = ? AND row_num = ?", (name, row_num)
+                ).fetchone()
+                data = json.loads(current['data']) if current else []
+                width = max(len(data), len(headers), max(cols))
+                data.extend([''] * (width - len(data)))
+                for col, value in cols.items():
+                    data[col - 1] = value
+                db.execute(
+                    "INSERT OR REPLACE INTO mirror_rows (sheet, row_num, data, row_hash) VALUES (?, ?, ?, ?)",
+                    (name, row_num, json.dumps(data, ensure_ascii=False), _row_hash(data)),
+                )
+            db.execute(
+                "UPDATE mirror_sheets SET row_count = "
+                "(SELECT COUNT(*) FROM mirror_rows WHERE sheet = ?) WHERE name = ?", (name, name)
+            )
+
+    def append_rows(self, name, rows):
+        """Append rows that were already appended in Sheets."""
+        meta = self.sheet_meta(name)
+        if meta is None:
+            return
+        width = len(meta['headers'])
+        with get_db(self.path) as db:
+            last = db.execute(
+                "SELECT MAX(row_num) FROM mirror_rows WHERE sheet = ?", (name,)
+            ).fetchone()[0] or 1
+            for offset, row in enumerate(rows, start=1):
+                data = [_cell_text(v) for v in row]
+                data.extend([''] * (width - len(data)))
+                db.execute(
+                    "INSERT OR REPLACE INTO mirror_rows (sheet, row_num, data, row_hash) VALUES (?, ?, ?, ?)",
+                    (name, last + offset, json.dumps(data, ensure_ascii=False), _row_hash(data)),
+                )
+            db.execute("UPDATE mirror_sheets SET row_count = row_count + ? WHERE name = ?", (len(rows), name))
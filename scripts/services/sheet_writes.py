@@ -0,0 +1,199 @@
+"""Write coalescing for Google Sheets cell updates and row appends.
+
+Cell changes are collected per worksheet and flushed as a single
+``batch_update`` call with A1 ranges, instead of one ``update_cell``
+round-trip per field. Row appends go out through ``append_rows`` in
+chunks sized to stay well under the API request limits.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+from gspread.utils import rowcol_to_a1, ValueInputOption
+
+logger = logging.getLogger('quartz_web')
+
+APPEND_CHUNK_ROWS = int(os.getenv('SHEETS_APPEND_CHUNK_ROWS', '500'))
+APPEND_CHUNK_BYTES = 1_000_000  # Sheets recommends payloads of ~2 MB or less
+
+
+class SheetWriteBuffer:
+    """Collects pending cell writes per worksheet and flushes them in one request each."""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'flushes': 0,
+            'requests': 0,
+            'cells': 0,
+            'ranges': 0,
+            'last_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def queue(self, worksheet, row, col, value):
+        """Queue a single cell write. Later writes to the same cell win."""
+        with self._lock:
+            entry = self._pending.setdefault(worksheet.title, {'worksheet': worksheet, 'cells': {}})
+            entry['cells'][(row, col)] = value
+
+    def queue_row(self, worksheet, row, headers, updates):
+        """Queue writes for one row, mapping update keys to columns via headers.
+
+        Keys that are not present in headers are ignored, matching the
+        behaviour of the old per-cell update loops. Returns the number of
+        cells queued.
+        """
+        queued = 0
+        for key, value in updates.items():
+            if key in headers:
+                self.queue(worksheet, row, headers.index(key) + 1, value)
+                queued += 1
+        return queued
+
+    def pending_count(self):
+        """Number of cells waiting to be flushed."""
+        with self._lock:
+            return sum(len(e['cells']) for e in self._pending.values())
+
+    def flush(self, on_report=None):
+        """Write all pending cells, one batch_update per worksheet.
+
+        Returns a list of per-worksheet reports with cell/range counts, latency
+        and the ``{(row, col): value}`` cells that were written; ``on_report``
+        is called with each one as soon as its worksheet is written. If a
+        write fails, the cells not yet written are queued again before the
+        error is raised.
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+
+        reports = []
+        titles = list(pending)
+        for n, title in enumerate(titles):
+            entry = pending[title]
+            cells = entry['cells']
+            if not cells:
+                continue
+            data = _build_ranges(cells)
+            start = time.time()
+            try:
+                entry['worksheet'].batch_update(data, value_input_option=ValueInputOption.user_entered)
+            except Exception:
+                self._requeue({t: pending[t] for t in titles[n:]})
+                raise
+            elapsed_ms = (time.time() - start) * 1000
+
+            report = {'worksheet': title, 'cells': len(cells), 'ranges': len(data),
+                      'latency_ms': round(elapsed_ms, 1), 'written': cells}
+            reports.append(report)
+            with self._lock:
+                self.stats['requests'] += 1
+                self.stats['cells'] += len(cells)
+                self.stats['ranges'] += len(data)
+                self.stats['last_flush_ms'] = report['latency_ms']
+                self.stats['total_flush_ms'] += elapsed_ms
+            logger.info(f"Sheets flush: {title} {len(cells)} cell(s) in {len(data)} range(s), {elapsed_ms:.0f}ms")
+            if on_report:
+                try:
+                    on_report(report)
+                except Exception:
+                    self._requeue({t: pending[t] for t in titles[n + 1:]})
+                    raise
+
+        if reports:
+            with self._lock:
+                self.stats['flushes'] += 1
+        return reports
+
+    def _requeue(self, failed):
+        """Put unwritten entries back; cells queued since the flush began win."""
+        with self._lock:
+            for title, entry in failed.items():
+                current = self._pending.setdefault(title, {'worksheet': entry['worksheet'], 'cells': {}})
+                current['cells'] = {**entry['cells'], **current['cells']}
+
+
+def _build_ranges(cells):
+    """Turn {(row, col): value} into batch_update data, merging adjacent cells in a row."""
+    data = []
+    by_row = {}
+    for (row, col), value in cells.items():
+        by_row.setdefault(row, {})[col] = value
+
+    for row in sorted(by_row):
+        cols = by_row[row]
+        run_start = None
+        run_values = []
+        prev = None
+        for col in sorted(cols):
+            if run_start is not None and col == prev + 1:
+                run_values.append(cols[col])
+            else:
+                if run_start is not None:
+                    data.append(_range_entry(row, run_start, run_values))
+                run_start = col
+                run_values = [cols[col]]
+            prev = col
+        if run_start is not None:
+            data.append(_range_entry(row, run_start, run_values))
+    return data
+
+
+def _range_entry(row, start_col, values):
+    start = rowcol_to_a1(row, start_col)
+    if len(values) == 1:
+        a1 = start
+    else:
+        a1 = f"{start}:{rowcol_to_a1(row, start_col + len(values) - 1)}"
+    return {'range': a1, 'values': [values]}
+
+
+def chunk_rows(rows, max_rows=APPEND_CHUNK_ROWS, max_bytes=APPEND_CHUNK_BYTES):
+    """Split rows into chunks capped by row count and approximate JSON payload size."""
+    chunk, size = [], 0
+    for row in rows:
+        row_size = len(json.dumps(row, default=str))
+        if chunk and (len(chunk) >= max_rows or size + row_size > max_bytes):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(row)
+        size += row_size
+    if chunk:
+        yield chunk
+
+
+def append_rows_chunked(worksheet, rows, progress=None, max_rows=APPEND_CHUNK_ROWS,
+                        max_bytes=APPEND_CHUNK_BYTES, on_chunk=None):
+    """Append rows with one ``append_rows`` call per chunk.
+
+    Chunks are not retried here. An append is not idempotent, and the
+    worksheet's ``RateLimitedHTTPClient`` already retries it when it was
+    throttled (never after a 5xx or timeout that may have been applied).
+    Errors propagate. ``progress`` is called as ``progress(done, total)``
+    after each chunk and ``on_chunk`` with the rows of every chunk that was
+    written.
+    """
+    total = len(rows)
+    done = 0
+    report = {'rows': 0, 'chunks': 0, 'latency_ms': 0.0}
+    start = time.time()
+    for chunk in chunk_rows(rows, max_rows, max_bytes):
+        worksheet.append_rows(chunk, value_input_option=ValueInputOption.raw)
+        done += len(chunk)
+        report['rows'] = done
+        report['chunks'] += 1
+        if on_chunk:
+            on_chunk(chunk)
+        if progress:
+            progress(done, total)
+    report['latency_ms'] = round((time.time() - start) * 1000, 1)
+    if total:
+        logger.info(f"Sheets append: {worksheet.title} {done} row(s) in {report['chunks']} chunk(s), "
+                    f"{report['latency_ms']:.0f}ms")
+    return report
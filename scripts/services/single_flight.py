@@ -0,0 +1,88 @@
+"""Single-flight coalescing of identical concurrent reads.
+
+When several requests load the same worksheet at the same moment, only the
+first one (the leader) calls the Sheets API. The others wait for that call
+and receive its result, or its exception. Once the call finishes the key is
+released, so the next read starts a fresh fetch; nothing is cached here.
+
+Writers call ``forget(key)`` after changing a sheet, so a reader that arrives
+after the write never joins a fetch that started before it.
+"""
+
+import time
+import threading
+import logging
+
+logger = logging.getLogger('quartz_web')
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {'calls': 0, 'shared': 0}
+
+    def do(self, key, fn):
+        """Run ``fn()`` for key, or wait for the call already in flight.
+
+        Returns ``(result, shared)``. ``shared`` is True for callers that
+        received another caller's result; they should copy it before
+        mutating it.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats['shared'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.stats['calls'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        start = time.time()
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                logger.debug('Single-flight %s served %d waiting callers in %.0f ms',
+                             key, call.waiters, (time.time() - start) * 1000)
+        return call.result, False
+
+    def forget(self, key):
+        """Stop new callers from joining the call currently in flight for key."""
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+# Process-wide coalescer for Sheets reads, keyed by (kind, credentials, spreadsheet_id, sheet)
+sheet_reads = SingleFlight()
@@ -0,0 +1,322 @@
+"""Local SQLite implementation of the storage backend.
+
+Each user on the ``sqlite`` backend gets ``data/storage_<user_id>.db``. Rows
+are stored as JSON lists of cell text, exactly as Sheets returns them, so
+records come out in the same numericised ``get_all_records()`` shape and the
+routes cannot tell the backends apart.
+
+The columns routes look rows up by (id, email_id, contact_email,
+customer_id, status) are copied into indexed key columns on every write.
+Single-record lookups such as ``update_customer`` or ``find`` therefore use
+an index instead of loading the whole sheet.
+"""
+
+import os
+import json
+import time
+from typing import Dict, List, Optional
+
+from gspread.utils import numericise_all, to_records
+
+from models import get_db, PROJECT_ROOT
+from services.record_index import normalize_key
+from services.sheet_mirror import MIRRORED_SHEETS
+from services.storage import StorageBackend
+
+# Record field -> indexed key column
+INDEXED_FIELDS = {
+    'id': 'k_id',
+    'email_id': 'k_email_id',
+    'contact_email': 'k_contact_email',
+    'customer_id': 'k_customer_id',
+    'status': 'k_status',
+}
+
+_initialized_paths = set()
+
+
+def storage_path(user_id):
+    """Path of the local storage database for a user."""
+    return os.path.join(PROJECT_ROOT, 'data', f'storage_{user_id}.db')
+
+
+def _cell_text(value):
+    return '' if value is None else str(value)
+
+
+class LocalWorksheet:
+    """The subset of the gspread Worksheet API routes use, over SQLiteStorage."""
+
+    def __init__(self, storage, title):
+        self.storage = storage
+        self.title = title
+
+    @property
+    def col_count(self):
+        return len(self.storage.get_headers(self.title))
+
+    def row_values(self, row):
+        if row == 1:
+            return self.storage.get_headers(self.title)
+        values = self.storage.get_row(self.title, row)
+        while values and values[-1] == '':
+            values.pop()
+        return values
+
+    def get(self, pad_values=False):
+        return self.storage.get_values(self.title)
+
+    def get_all_records(self):
+        return self.storage.get_records(self.title)
+
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values])
+
+    def append_rows(self, values, **kwargs):
+        if not self.storage.get_headers(self.title) and values:
+            self.storage.ensure_columns(self.title, [_cell_text(v) for v in values[0]])
+            values = values[1:]
+        return self.storage.append_rows(self.title, values)
+
+    def update_cell(self, row, col, value):
+        self.storage.update_cell(self.title, row, col, value)
+
+    def delete_rows(self, start_index, end_index=None):
+        for row in range(end_index or start_index, start_index - 1, -1):
+            self.storage.delete_row(self.title, row)
+
+
+class SQLiteStorage(StorageBackend):
+    """Per-user worksheets in an indexed SQLite database."""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        if path not in _initialized_paths:
+            self._init_schema()
+            _initialized_paths.add(path)
+
+    @classmethod
+    def for_user(cls, user_id):
+        return cls(storage_path(user_id))
+
+    def _init_schema(self):
+        key_columns = ',\n'.join(f'{col} TEXT' for col in INDEXED_FIELDS.values())
+        key_indexes = '\n'.join(
+            f'CREATE INDEX IF NOT EXISTS idx_storage_{col} ON storage_rows(sheet, {col});'
+            for col in INDEXED_FIELDS.values()
+        )
+        with get_db(self.path) as db:
+            db.executescript(f'''
+                CREATE TABLE IF NOT EXISTS storage_sheets (
+                    name TEXT PRIMARY KEY,
+                    headers TEXT NOT NULL DEFAULT '[]'
+                );
+                CREATE TABLE IF NOT EXISTS storage_rows (
+                    sheet TEXT NOT NULL,
+                    row_num INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    {key_columns}
+                );
+                CREATE INDEX IF NOT EXISTS idx_storage_rows ON storage_rows(sheet, row_num);
+                {key_indexes}
+            ''')
+
+    # ── Helpers ───────────────────────────────────────────
+    @staticmethod
+    def _headers(db, sheet_name):
+        row = db.execute("SELECT headers FROM storage_sheets WHERE name = ?", (sheet_name,)).fetchone()
+        return json.loads(row['headers']) if row else []
+
+    @staticmethod
+    def _set_headers(db, sheet_name, headers):
+        db.execute("INSERT OR REPLACE INTO storage_sheets (name, headers) VALUES (?, ?)",
+                   (sheet_name, json.dumps(headers, ensure_ascii=False)))
+
+    @staticmethod
+    def _keys(headers, data):
+        keys = []
+        for field in INDEXED_FIELDS:
+            value = data[headers.index(field)] if field in headers and headers.index(field) < len(data) else ''
+            keys.append(normalize_key(field, value) or None)
+        return keys
+
+    def _write_row(self, db, sheet_name, headers, row_num, data):
+        columns = ', '.join(INDEXED_FIELDS.values())
+        placeholders = ', '.join('?' * len(INDEXED_FIELDS))
+        db.execute("DELETE FROM storage_rows WHERE sheet = ? AND row_num = ?", (sheet_name, row_num))
+        db.execute(
+            f"INSERT INTO storage_rows (sheet, row_num, data, {columns}) VALUES (?, ?, ?, {placeholders})",
+            (sheet_name, row_num, json.dumps(data, ensure_ascii=False), *self._keys(headers, data)),
+        )
+
+    def _reindex(self, db, sheet_name, headers):
+        """Recompute key columns after the header row changed."""
+        rows = db.execute("SELECT row_num, data FROM storage_rows WHERE sheet = ?", (sheet_name,)).fetchall()
+        for row in rows:
+            self._write_row(db, sheet_name, headers, row['row_num'], json.loads(row['data']))
+
+    def _touched(self, sheet_name):
+        self._snapshots.pop(sheet_name, None)
+
+    # ── Reads ─────────────────────────────────────────────
+    def get_worksheet(self, sheet_name: str):
+        return LocalWorksheet(self, sheet_name)
+
+    def get_headers(self, sheet_name: str) -> List[str]:
+        with get_db(self.path) as db:
+            return self._headers(db, sheet_name)
+
+    def get_row(self, sheet_name: str, row: int) -> List[str]:
+        with get_db(self.path) as db:
+            found = db.execute("SELECT data FROM storage_rows WHERE sheet = ? AND row_num = ?",
+                               (sheet_name, row)).fetchone()
+        return json.loads(found['data']) if found else []
+
+    def get_values(self, sheet_name: str) -> List[List[str]]:
+        """Header row plus every data row, padded to a rectangle like ``Worksheet.get(pad_values=True)``."""
+        with get_db(self.path) as db:
+            headers = self._headers(db, sheet_name)
+            rows = db.execute("SELECT row_num, data FROM storage_rows WHERE sheet = ? ORDER BY row_num",
+                              (sheet_name,)).fetchall()
+        values = [list(headers)]
+        for row in rows:
+            while len(values) < row['row_num'] - 1:
+                values.append([])
+            values.append(json.loads(row['data']))
+        width = max((len(v) for v in values), default=0)
+        return [v + [''] * (width - len(v)) for v in values] if width else []
+
+    def get_records(self, sheet_name: str, max_age: Optional[int] = None) -> List[Dict]:
+        values = self.get_values(sheet_name)
+        if not values or not values[0]:
+            return []
+        return to_records(values[0], [numericise_all(v) for v in values[1:]])
+
+    def find(self, sheet_name: str, field: str, value) -> List[tuple]:
+        """(row, record) pairs whose field matches value, using the key index where there is one."""
+        if field not in INDEXED_FIELDS:
+            return self.get_snapshot(sheet_name).find_all(field, value)
+        key = normalize_key(field, value)
+        if not key:
+            return []
+        with get_db(self.path) as db:
+            headers = self._headers(db, sheet_name)
+            rows = db.execute(
+                f"SELECT row_num, data FROM storage_rows WHERE sheet = ? AND {INDEXED_FIELDS[field]} = ? "
+                "ORDER BY row_num", (sheet_name, key),
+            ).fetchall()
+        return [(r['row_num'], to_records(headers, [numericise_all(json.loads(r['data']))])[0]) for r in rows]
+
+    # ── Writes ────────────────────────────────────────────
+    def ensure_columns(self, sheet_name: str, columns: List[str]) -> List[str]:
+        with get_db(self.path) as db:
+            headers = self._headers(db, sheet_name)
+            missing = [c for c in columns if c not in headers]
+            if missing:
+                headers = headers + missing
+                self._set_headers(db, sheet_name, headers)
+                if any(c in INDEXED_FIELDS for c in missing):
+                    self._reindex(db, sheet_name, headers)
+        if missing:
+            self._touched(sheet_name)
+        return headers
+
+    def update_cell(self, sheet_name: str, row: int, col: int, value):
+        with get_db(self.path) as db:
+            headers = self._headers(db, sheet_name)
+            if row == 1:
+                headers.extend([''] * (col - len(headers)))
+                headers[col - 1] = _cell_text(value)
+                self._set_headers(db, sheet_name, headers)
+                self._reindex(db, sheet_name, headers)
+            else:
+                found = db.execute("SELECT data FROM storage_rows WHERE sheet = ? AND row_num = ?",
+                                   (sheet_name, row)).fetchone()
+                data = json.loads(found['data']) if found else []
+                data.extend([''] * (col - len(data)))
+                data[col - 1] = _cell_text(value)
+                self._write_row(db, sheet_name, headers, row, data)
+        self._touched(sheet_name)
+
+    def update_row(self, sheet_name: str, row: int, updates: Dict, headers: Optional[List] = None) -> int:
+        written = 0
+        with get_db(self.path) as db:
+            stored = self._headers(db, sheet_name)
+            headers = headers or stored
+            found = db.execute("SELECT data FROM storage_rows WHERE sheet = ? AND row_num = ?",
+                               (sheet_name, row)).fetchone()
+            data = json.loads(found['data']) if found else []
+            for key, value in updates.items():
+                if key not in headers:
+                    continue
+                col = headers.index(key) + 1
+                data.extend([''] * (col - len(data)))
+                data[col - 1] = _cell_text(value)
+                written += 1
+            if written:
+                self._write_row(db, sheet_name, stored, row, data)
+        if written:
+            self._touched(sheet_name)
+        return written
+
+    def append_rows(self, sheet_name: str, rows: List[List], progress=None) -> Dict:
+        """Append rows in one transaction. Reports match ``append_rows_chunked``."""
+        start = time.time()
+        rows = [[_cell_text(v) for v in row] for row in rows]
+        with get_db(self.path) as db:
+            headers = self._headers(db, sheet_name)
+            last = db.execute("SELECT COALESCE(MAX(row_num), 1) FROM storage_rows WHERE sheet = ?",
+                              (sheet_name,)).fetchone()[0]
+            for offset, data in enumerate(rows, start=1):
+                self._write_row(db, sheet_name, headers, last + offset, data)
+        self._touched(sheet_name)
+        if progress and rows:
+            progress(len(rows), len(rows))
+        return {'rows': len(rows), 'chunks': 1 if rows else 0,
+                'latency_ms': round((time.time() - start) * 1000, 1)}
+
+    def delete_row(self, sheet_name: str, row: int):
+        with get_db(self.path) as db:
+            db.execute("DELETE FROM storage_rows WHERE sheet = ? AND row_num = ?", (sheet_name, row))
+            db.execute("UPDATE storage_rows SET row_num = row_num - 1 WHERE sheet = ? AND row_num > ?",
+                       (sheet_name, row))
+        self._touched(sheet_name)
+
+    def log_email(self, email_data: Dict):
+        headers = self.ensure_columns('Email_Tracking', list(email_data.keys()))
+        self.append_rows('Email_Tracking', [[email_data.get(h, '') for h in headers]])
+
+    def flush_writes(self) -> List[Dict]:
+        # Writes are committed as they are made
+        return []
+
+    def update_customer(self, customer_id: str, updates: Dict):
+        """Update customer record"""
+        hits = self.find('Customers', 'id', customer_id)
+        if hits:
+            self.update_row('Customers', hits[0][0], updates)
+
+    # ── Bulk ──────────────────────────────────────────────
+    def load_values(self, sheet_name: str, values: List[List]):
+        """Replace a whole worksheet with a grid whose first row is the header row."""
+        values = [[_cell_text(v) for v in row] for row in values if row is not None]
+        headers = values[0] if values else []
+        with get_db(self.path) as db:
+            db.execute("DELETE FROM storage_rows WHERE sheet = ?", (sheet_name,))
+            self._set_headers(db, sheet_name, headers)
+            for offset, data in enumerate(values[1:], start=2):
+                self._write_row(db, sheet_name, headers, offset, data)
+        self._touched(sheet_name)
+        return {'rows': max(len(values) - 1, 0)}
+
+    def import_from(self, backend: StorageBackend, sheet_names=MIRRORED_SHEETS) -> Dict:
+        """Copy worksheets from another backend (e.g. when moving a tenant off Sheets)."""
+        return {name: self.load_values(name, backend.get_worksheet(name).get(pad_values=True))
+                for name in sheet_names}
+
+    def row_count(self, sheet_name: str) -> int:
+        with get_db(self.path) as db:
+            return db.execute("SELECT COUNT(*) FROM storage_rows WHERE sheet = ?", (sheet_name,)).fetchone()[0]
@@ -0,0 +1,137 @@
+"""Storage backend interface behind ``get_sheets()``.
+
+Routes talk to customer and tracking data through this interface rather than
+to gspread directly. Two implementations ship with the app:
+
+- ``GoogleSheetsManager`` (main_automation.py): the user's Google
+  spreadsheet, with the local mirror, caches and write coalescing.
+- ``SQLiteStorage`` (services/sqlite_storage.py): a per-user indexed SQLite
+  database for tenants that run fully local, and for tests and benchmarks
+  that must not touch the network.
+
+Worksheets keep Sheets semantics in both: row 1 holds the headers, records
+start at row 2, and row numbers shift up when a row is deleted.
+"""
+
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from services.record_index import RecordSnapshot
+
+SNAPSHOT_TTL = 30  # seconds an indexed record snapshot is reused by one backend
+STORAGE_BACKENDS = ('sheets', 'sqlite')
+
+
+class StorageBackend(ABC):
+    """Row-oriented access to the Customers, Email_Tracking and other worksheets."""
+
+    name = ''
+
+    def __init__(self):
+        self._batch_depth = 0
+        self._snapshots = {}
+
+    # ── Primitives each backend implements ────────────────
+    @abstractmethod
+    def get_worksheet(self, sheet_name: str):
+        """Worksheet handle supporting row_values, get_all_records, append_row(s) and delete_rows."""
+
+    @abstractmethod
+    def get_headers(self, sheet_name: str) -> List[str]:
+        """Header row of a worksheet ([] when empty)."""
+
+    @abstractmethod
+    def ensure_columns(self, sheet_name: str, columns: List[str]) -> List[str]:
+        """Append missing header columns and return the header row."""
+
+    @abstractmethod
+    def get_records(self, sheet_name: str, max_age: Optional[int] = None) -> List[Dict]:
+        """All records of a worksheet, shaped like ``Worksheet.get_all_records()``."""
+
+    @abstractmethod
+    def update_cell(self, sheet_name: str, row: int, col: int, value):
+        """Write one cell (1-based row and column)."""
+
+    @abstractmethod
+    def update_row(self, sheet_name: str, row: int, updates: Dict, headers: Optional[List] = None) -> int:
+        """Write the columns named in ``updates`` on one row. Returns the number of cells written."""
+
+    @abstractmethod
+    def append_rows(self, sheet_name: str, rows: List[List], progress=None) -> Dict:
+        """Append rows ordered like the header row. Returns a report with a ``rows`` count."""
+
+    @abstractmethod
+    def delete_row(self, sheet_name: str, row: int):
+        """Delete one row; rows below it move up."""
+
+    @abstractmethod
+    def log_email(self, email_data: Dict):
+        """Append an Email_Tracking record, creating the header row if needed."""
+
+    @abstractmethod
+    def flush_writes(self) -> List[Dict]:
+        """Push writes deferred inside ``batch_writes()``. Returns flush reports."""
+
+    # ── Shared behaviour ──────────────────────────────────
+    @contextmanager
+    def batch_writes(self):
+        """Defer writes made inside the block and flush them once at the end."""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.flush_writes()
+
+    def sync_mirror(self, sheet_names=None, force: bool = False) -> Dict:
+        """Refresh any local copy of remote data. Backends without one have nothing to do."""
+        return {}
+
+    def get_records_stale(self, sheet_name: str, max_staleness: int):
+        """Records plus the time they were last confirmed current. See GoogleSheetsManager."""
+        return self.get_records(sheet_name), time.time()
+
+    def get_snapshot(self, sheet_name: str, max_age: Optional[int] = None) -> RecordSnapshot:
+        """Indexed snapshot of a worksheet (lookups by id, contact_email, email_id).
+
+        Reused for SNAPSHOT_TTL seconds or until a write touches the sheet, so
+        long-running daemons holding one backend still see fresh rows.
+        """
+        cached = self._snapshots.get(sheet_name)
+        if cached:
+            snapshot, fresh, created = cached
+            if time.time() - created <= SNAPSHOT_TTL and (max_age is None or fresh):
+                return snapshot
+        snapshot = RecordSnapshot(self.get_records(sheet_name, max_age))
+        self._snapshots[sheet_name] = (snapshot, max_age == 0, time.time())
+        return snapshot
+
+    def append_records(self, sheet_name: str, records: List[Dict], headers: Optional[List] = None,
+                       progress=None) -> Dict:
+        """Append dict records mapped onto the header row. See append_rows."""
+        if headers is None:
+            headers = self.get_headers(sheet_name)
+        return self.append_rows(sheet_name, [[r.get(h, '') for h in headers] for r in records], progress)
+
+    def get_customers(self, status: Optional[str] = None) -> List[Dict]:
+        """Get customer list from sheet"""
+        records = self.get_snapshot('Customers').records
+
+        if status:
+            return [r for r in records if r.get('research_status') == status]
+        return records
+
+    def update_customer(self, customer_id: str, updates: Dict):
+        """Update customer record"""
+        hit = self.get_snapshot('Customers', max_age=0).find('id', customer_id)
+
+        if hit:
+            self.update_row('Customers', hit[0], updates)
+
+    def get_pending_reviews(self) -> List[Dict]:
+        """Get emails pending human review"""
+        records = self.get_records('Email_Tracking')
+        return [r for r in records if r.get('reviewed_by') == 'pending_review']
@@ -20,8 +20,8 @@ from flask_limiter.util import get_remote_address
 
 # Import app core (shared state, config, helpers)
 from app_core import (
-    PROJECT_ROOT, APP_USERNAME, APP_PASSWORD,
-    engagement_badge, stage_badge, SENDER_NAME, logger
+    PROJECT_ROOT, APP_USERNAME, APP_PASSWORD, BACKGROUND_THREADS,
+    engagement_badge, stage_badge, data_age, SENDER_NAME, logger
 )
 
 # Import route blueprints
@@ -32,8 +32,8 @@ csrf = CSRFProtect()
 limiter = Limiter(key_func=get_remote_address, default_limits=["200 per minute"])
 
 
-def create_app():
-    """Application factory."""
+def create_app(config=None):
+    """Application factory. ``config`` overrides app.config before anything starts."""
     app = Flask(__name__,
                 template_folder=os.path.join(PROJECT_ROOT, 'templates'),
                 static_folder=os.path.join(PROJECT_ROOT, 'static'))
@@ -56,6 +56,8 @@ def create_app():
     app.config['APP_USERNAME'] = APP_USERNAME
     app.config['APP_PASSWORD'] = APP_PASSWORD
     app.config['SENDER_NAME'] = SENDER_NAME
+    app.config['BACKGROUND_THREADS'] = BACKGROUND_THREADS
+    app.config.update(config or {})
 
     # ── Session Security (A07) ────────────────────────────
     app.config['SESSION_COOKIE_HTTPONLY'] = True
@@ -74,10 +76,17 @@ def create_app():
     init_db(app)
     logger.info("Database initialized")
 
+    # Mirror sync, outbox drain (also run by outbox_worker.py) and Message
+    # Batches polling, in one web process per host and never under tests
+    if app.config['BACKGROUND_THREADS'] and not app.config['TESTING']:
+        from app_core import start_background_threads
+        start_background_threads()
+
     # Register Jinja2 global functions
     app.jinja_env.globals['engagement_badge'] = engagement_badge
     app.jinja_env.globals['stage_badge'] = stage_badge
     app.jinja_env.globals['config'] = app.config
+    app.jinja_env.globals['data_age'] = data_age
 
     # Custom Jinja2 filter for splitting attachment strings
     app.jinja_env.filters['split_semi'] = lambda s: [x.strip() for x in str(s).split(';') if x.strip()]
@@ -87,6 +96,12 @@ def create_app():
     for bp in ALL_BLUEPRINTS:
         app.register_blueprint(bp)
 
+    # Pub/Sub pushes carry a shared token instead of a session or CSRF token,
+    # and arrive from many Google addresses
+    from routes.webhooks import webhooks_bp
+    csrf.exempt(webhooks_bp)
+    limiter.exempt(webhooks_bp)
+
     # Request logging
     @app.before_request
     def log_request_start():
@@ -14,8 +14,7 @@ os.chdir(PROJECT_ROOT)
 def app():
     """Create Flask test app."""
     from web_app import create_app
-    app = create_app()
-    app.config['TESTING'] = True
+    app = create_app({'TESTING': True})
     app.config['SECRET_KEY'] = 'test-secret'
     return app
 
@@ -0,0 +1,170 @@
+"""Fakes of the Claude, Gmail and Sheets clients shared by the tests."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from types import SimpleNamespace
+
+from services.inbox_sync import InboxSync
+
+
+# ── Claude ────────────────────────────────────────────
+class FakeClaude:
+    """Just enough of anthropic.Anthropic for messages.create."""
+
+    def __init__(self):
+        self.calls = []
+        self.messages = self
+
+    def create(self, **params):
+        self.calls.append(params)
+        return SimpleNamespace(content=[SimpleNamespace(text=f'reply {len(self.calls)}')],
+                               usage=SimpleNamespace(input_tokens=100, output_tokens=40))
+
+
+class StatusError(Exception):
+    """Shaped like anthropic.APIStatusError."""
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f'status {status_code}')
+        self.status_code = status_code
+        self.response = type('Response', (), {'status_code': status_code,
+                                              'headers': {'retry-after': retry_after} if retry_after else {}})()
+
+
+# ── Sheets ────────────────────────────────────────────
+class FakeResponse:
+    def __init__(self, code):
+        self.code = code
+        self.text = ''
+
+    def json(self):
+        return {'error': {'code': self.code, 'message': 'err', 'status': 'ERR'}}
+
+
+# ── Gmail ─────────────────────────────────────────────
+class FakeHttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f'HTTP {status}')
+        self.resp = type('Resp', (), {'status': status})()
+
+
+class FakeRequest:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def execute(self):
+        return self.fn()
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.calls = []
+
+    def add(self, request, request_id):
+        self.calls.append((request_id, request))
+
+    def execute(self):
+        self.service.batches.append([rid for rid, _ in self.calls])
+        for rid, request in self.calls:
+            try:
+                self.callback(rid, request.execute(), None)
+            except Exception as e:
+                self.callback(rid, None, e)
+
+
+class FakeGmail:
+    """Minimal users().messages() surface with paging and scripted failures."""
+
+    def __init__(self, ids, page_size=3, fail_once=(), missing=(), senders=None, sizes=None):
+        self.ids = ids
+        self.senders = senders or {}
+        self.sizes = sizes or {}
+        self.gets = []
+        self.page_size = page_size
+        self.fail_once = set(fail_once)
+        self.missing = set(missing)
+        self.batches = []
+        self.list_calls = 0
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, userId, q, maxResults, pageToken=None, **kwargs):
+        start = int(pageToken or 0)
+        self.list_calls += 1
+
+        def run():
+            page = {'messages': [{'id': i} for i in self.ids[start:start + self.page_size]]}
+            if start + self.page_size < len(self.ids):
+                page['nextPageToken'] = str(start + self.page_size)
+            return page
+        return FakeRequest(run)
+
+    def get(self, userId, id, format='full', **kwargs):
+        def run():
+            if id in self.missing:
+                raise FakeHttpError(404)
+            if id in self.fail_once:
+                self.fail_once.discard(id)
+                raise FakeHttpError(429)
+            self.gets.append((id, format))
+            return {'id': id, 'format': format, 'sizeEstimate': self.sizes.get(id, 1000),
+                    'payload': {'headers': [{'name': 'From', 'value': self.senders.get(id, '')}]}}
+        return FakeRequest(run)
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+
+class FakeMailbox(FakeGmail):
+    """FakeGmail plus getProfile and history().list over an append-only log."""
+
+    def __init__(self, inbox, page_size=2):
+        super().__init__(list(inbox), page_size=page_size)
+        self.log = []           # (history_id, message_id, labels)
+        self.history_id = 100
+        self.expired_before = 0
+        self.history_calls = 0
+
+    def deliver(self, message_id, labels=('INBOX', 'UNREAD')):
+        self.history_id += 1
+        self.log.append((self.history_id, message_id, list(labels)))
+        self.ids.append(message_id)
+
+    def getProfile(self, userId):
+        return FakeRequest(lambda: {'historyId': str(self.history_id)})
+
+    def history(self):
+        return self
+
+    def list(self, userId, q=None, maxResults=100, pageToken=None, startHistoryId=None, **kwargs):
+        if startHistoryId is None:
+            return super().list(userId, q, maxResults, pageToken)
+        self.history_calls += 1
+        start = int(pageToken or 0)
+
+        def run():
+            if int(startHistoryId) < self.expired_before:
+                raise FakeHttpError(404)
+            entries = [e for e in self.log if e[0] > int(startHistoryId)]
+            page = entries[start:start + self.page_size]
+            response = {'historyId': str(self.history_id), 'history': [
+                {'id': str(h), 'messagesAdded': [{'message': {'id': m, 'labelIds': labels}}]}
+                for h, m, labels in page]}
+            if start + self.page_size < len(entries):
+                response['nextPageToken'] = str(start + self.page_size)
+            return response
+        return FakeRequest(run)
+
+
+def inbox_sync_for(service, tmp_path):
+    """InboxSync for a test consumer, stored under ``tmp_path``."""
+    return InboxSync(service, 'test:me@example.com', resync_query='is:unread',
+                     path=str(tmp_path / 'inbox_sync.db'))
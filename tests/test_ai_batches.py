@@ -0,0 +1,78 @@
+"""Tests for offline email generation through Message Batches."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import json
+import time
+
+from models import get_db
+from services.ai_batches import AIBatchStore, LocalBatchClient, submit_batch, collect_batch
+from tests.fakes import FakeClaude
+
+
+class PickyClaude(FakeClaude):
+    """Answers with an email as JSON; fails prompts that mention 'Broken'."""
+
+    def create(self, **params):
+        prompt = params['messages'][0]['content']
+        if 'Broken' in prompt:
+            raise RuntimeError('overloaded')
+        message = super().create(**params)
+        message.content[0].text = json.dumps({'subject': f'For {prompt}', 'body': 'Hello', 'confidence_score': 0.9})
+        return message
+
+
+def _request(custom_id, prompt):
+    return {'custom_id': custom_id,
+            'params': {'model': 'm', 'max_tokens': 100, 'messages': [{'role': 'user', 'content': prompt}]}}
+
+
+def test_local_batches_answer_each_request_once():
+    claude = PickyClaude()
+    batch_id = submit_batch(LocalBatchClient(claude), [_request('c0', 'Acme'), _request('c1', 'Broken Co')])
+    assert claude.calls == []  # nothing is generated while the web request waits
+
+    # The poller builds its own client, as it does in the web process
+    results = collect_batch(LocalBatchClient(claude), batch_id)
+    assert json.loads(results['c0'])['subject'] == 'For Acme'
+    assert results['c1'] is None
+    assert collect_batch(LocalBatchClient(claude), batch_id) == results and len(claude.calls) == 1
+
+
+def test_batches_are_claimed_once_per_poll_interval(tmp_path):
+    store = AIBatchStore(str(tmp_path / 'ai_batches.db'))
+    batch = store.record(7, 'msgbatch_1', 2, {'c0': {'customer': {'id': 'C1'}}})
+    assert store.claim_due() == []  # first check after one poll interval
+
+    with get_db(store.path) as db:
+        db.execute("UPDATE ai_batches SET next_poll_at = ?", (time.time() - 1,))
+    claimed = store.claim_due(interval=60)
+    assert [b['batch_id'] for b in claimed] == ['msgbatch_1'] and claimed[0]['jobs']['c0']['customer']['id'] == 'C1'
+    assert store.claim_due() == []  # another worker polling now finds nothing due
+
+    store.finish(batch['id'], 'imported', succeeded=1)
+    assert store.recent(7)[0]['status'] == 'imported'
+
+
+def test_ended_batch_becomes_review_drafts_once(tmp_path):
+    from app_core import import_batch_drafts
+    from services.sqlite_storage import SQLiteStorage
+
+    storage = SQLiteStorage(str(tmp_path / 'storage.db'))
+    storage.load_values('Email_Tracking', [['email_id', 'customer_id', 'status'], ['EMAIL0', 'C9', 'sent']])
+    batch = {'id': 3, 'stage': 1, 'jobs': {
+        'c0': {'customer': {'id': 'C1', 'company_name': 'Acme', 'contact_email': 'a@acme.com'}},
+        'c1': {'customer': {'id': 'C2', 'company_name': 'Globex', 'contact_email': 'g@globex.com'}},
+    }}
+    results = {'c0': json.dumps({'subject': 'Quartz for Acme', 'body': 'Hello Acme', 'confidence_score': 0.8}),
+               'c1': None}
+
+    assert import_batch_drafts(storage, batch, results) == (1, 1)
+    assert import_batch_drafts(storage, batch, results) == (1, 1)
+    rows = storage.get_records('Email_Tracking')
+    assert [r['email_id'] for r in rows] == ['EMAIL0', 'BATCH3_c0']
+    draft = rows[1]
+    assert (draft['status'], draft['reviewed_by'], draft['email_type']) == ('draft', 'pending_review', 'batch_generated')
+    assert draft['subject'] == 'Quartz for Acme' and draft['body'] == 'Hello Acme' and draft['customer_id'] == 'C1'
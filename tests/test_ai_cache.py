@@ -0,0 +1,75 @@
+"""Tests for the Claude response cache."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import time
+from types import SimpleNamespace
+
+from models import get_db
+from services.ai_cache import AIResponseCache
+from tests.fakes import FakeClaude
+
+
+def _ask(cache, client, prompt='About Acme', ttl=60, **kwargs):
+    return cache.complete(client, 'research', ttl, model='m', max_tokens=1000,
+                          messages=[{'role': 'user', 'content': prompt}], **kwargs)
+
+
+def test_repeat_request_is_served_from_cache(tmp_path):
+    cache = AIResponseCache(str(tmp_path / 'ai.db'))
+    client = FakeClaude()
+    assert _ask(cache, client) == _ask(cache, client) == 'reply 1'
+    assert _ask(cache, client, prompt='About Globex') == 'reply 2'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 2)
+    assert stats['saved_input_tokens'] == 100 and stats['saved_output_tokens'] == 40
+    assert stats['hit_rate'] == 0.333
+
+
+def test_bypass_refreshes_and_ttl_expires(tmp_path, monkeypatch):
+    cache = AIResponseCache(str(tmp_path / 'ai.db'))
+    client = FakeClaude()
+    _ask(cache, client)
+    assert _ask(cache, client, bypass=True) == 'reply 2'
+    assert _ask(cache, client) == 'reply 2'  # the fresh response replaced the old one
+
+    now = time.time()
+    monkeypatch.setattr('services.ai_cache.time.time', lambda: now + 61)
+    assert _ask(cache, client) == 'reply 3'
+
+
+def test_size_cap_evicts_least_recently_used(tmp_path):
+    cache = AIResponseCache(str(tmp_path / 'ai.db'), max_bytes=25)
+    cache.set('email', 'a', 'x' * 10, ttl=60)
+    cache.set('email', 'b', 'y' * 10, ttl=60)
+    with get_db(cache.path) as db:
+        db.execute("UPDATE ai_responses SET accessed_at = accessed_at - 100 WHERE key = 'a'")
+    cache.set('email', 'c', 'z' * 10, ttl=60)
+    assert cache.get('email', 'a') is None
+    assert cache.get('email', 'b')['text'] == 'y' * 10
+    assert cache.stats()['evictions'] == 1
+
+
+def test_prompt_cache_tokens_are_counted(tmp_path):
+    cache = AIResponseCache(str(tmp_path / 'ai.db'))
+    for written, read in ((1200, 0), (0, 1200), (0, 1200)):
+        cache.record_usage('intent', SimpleNamespace(usage=SimpleNamespace(
+            input_tokens=200, output_tokens=50, cache_creation_input_tokens=written, cache_read_input_tokens=read)))
+    cache.record_usage('intent', SimpleNamespace(usage=None))
+    usage = cache.prompt_usage()['intent']
+    assert (usage['calls'], usage['cache_write_tokens'], usage['cache_read_tokens']) == (3, 1200, 2400)
+    assert usage['cache_read_rate'] == round(2400 / 4200, 3)
+
+
+def test_email_prompt_keeps_instructions_in_a_cached_prefix(monkeypatch):
+    import main_automation
+    monkeypatch.setattr(main_automation, 'anthropic_client', lambda api_key: FakeClaude())
+    engine = main_automation.EmailPersonalizationEngine('key')
+    acme = engine._email_request({'company_name': 'Acme'}, {'summary': 'Makes solar glass'}, 3, '')
+    globex = engine._email_request({'company_name': 'Globex'}, {}, 5, 'Asked for a quote')
+    assert acme['system'] == globex['system']
+    assert acme['system'][0]['cache_control'] == {'type': 'ephemeral'}
+    assert engine._build_signature() in acme['system'][0]['text']
+    assert 'Acme' in acme['messages'][0]['content'] and 'Acme' not in acme['system'][0]['text']
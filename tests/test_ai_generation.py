@@ -0,0 +1,104 @@
+"""Tests for bounded-concurrency AI generation."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services import ai_generation, retry
+from services.ai_cache import AIResponseCache
+from services.ai_generation import AIJob, AsyncGenerationEngine
+from services.retry import RetryStats
+from tests.fakes import StatusError
+
+
+class FakeAsyncClaude:
+    """Just enough of anthropic.AsyncAnthropic; the prompt text sets the latency."""
+
+    def __init__(self, failures=None):
+        self.messages = self
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+        self.failures = failures or {}  # prompt -> errors to raise first
+
+    async def create(self, **params):
+        self.calls += 1
+        prompt = params['messages'][0]['content']
+        if self.failures.get(prompt):
+            raise self.failures[prompt].pop(0)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(float(prompt.split()[-1]))
+        self.in_flight -= 1
+        return SimpleNamespace(content=[SimpleNamespace(text=f'answer to {prompt}')],
+                               usage=SimpleNamespace(input_tokens=10, output_tokens=5))
+
+
+def _job(key, delay, **kwargs):
+    request = {'model': 'm', 'max_tokens': 100, 'messages': [{'role': 'user', 'content': f'{key} {delay}'}]}
+    return AIJob(key, lambda: request, **kwargs)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = AIResponseCache(str(tmp_path / 'ai.db'))
+    monkeypatch.setattr(ai_generation, 'ai_cache', cache)
+    monkeypatch.setattr(retry, 'retry_stats', RetryStats())
+    return cache
+
+
+def test_concurrency_is_bounded_and_beats_serial(cache):
+    client = FakeAsyncClaude()
+    engine = AsyncGenerationEngine(concurrency=4, client=client)
+
+    start = time.time()
+    results = list(engine.run(_job(i, 0.05) for i in range(12)))
+    elapsed = time.time() - start
+
+    assert sorted(r['key'] for r in results) == list(range(12))
+    assert client.peak == 4
+    assert elapsed < 12 * 0.05 / 2  # serial would take 0.6s
+
+
+def test_results_stream_in_completion_order_with_cache_and_errors(cache):
+    client = FakeAsyncClaude()
+    engine = AsyncGenerationEngine(concurrency=3, client=client)
+
+    def bad_parse(text):
+        raise ValueError('not JSON')
+
+    jobs = [_job('slow', 0.2), _job('fast', 0.01, parse=str.upper), _job('broken', 0.05, parse=bad_parse)]
+    results = list(engine.run(jobs))
+    assert [r['key'] for r in results] == ['fast', 'broken', 'slow']
+    assert results[0]['value'] == 'ANSWER TO FAST 0.01'
+    assert results[1]['error'] == 'not JSON' and results[1]['value'] is None
+
+    for _ in range(2):
+        cached = list(engine.run([_job('slow', 0.2, namespace='email', ttl=60)]))
+        assert cached[0]['value'] == 'answer to slow 0.2'
+    assert client.calls == 4
+    refreshed = list(engine.run([_job('slow', 0.2, namespace='email', ttl=60, fresh=True)]))
+    assert refreshed[0]['value'] == 'answer to slow 0.2' and client.calls == 5
+
+
+def test_throttled_calls_are_retried_without_blocking_the_loop(cache, monkeypatch):
+    slept = []
+
+    async def fake_sleep(delay):
+        slept.append(delay)
+
+    monkeypatch.setattr(retry.asyncio, 'sleep', fake_sleep)
+    client = FakeAsyncClaude(failures={'a 0': [StatusError(429, retry_after='2')], 'b 0': [StatusError(400)]})
+    engine = AsyncGenerationEngine(concurrency=1, client=client)
+
+    results = list(engine.run([_job('a', 0), _job('b', 0)]))
+    assert results[0]['value'] == 'answer to a 0' and slept[0] == 2.0
+    assert results[1]['error'] == 'status 400'
+    stats = retry.retry_stats.snapshot()['anthropic']
+    assert stats['throttled'] == 1 and stats['retries'] == 1
@@ -0,0 +1,55 @@
+"""Tests for the encoded attachment cache."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import email
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+
+from services.attachment_cache import AttachmentCache
+
+
+def test_payload_matches_encode_base64_and_is_reused(tmp_path):
+    pdf = tmp_path / 'brochure.pdf'
+    pdf.write_bytes(os.urandom(5000))
+    cache = AttachmentCache()
+
+    reference = MIMEBase('application', 'pdf')
+    reference.set_payload(pdf.read_bytes())
+    encoders.encode_base64(reference)
+
+    first = cache.mime_part(str(pdf), 'brochure.pdf')
+    second = cache.mime_part(str(pdf), 'brochure.pdf')
+    assert first is not second
+    assert first.get_payload() == reference.get_payload()
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+    msg = MIMEMultipart()
+    msg.attach(second)
+    parsed = email.message_from_bytes(msg.as_bytes())
+    assert parsed.get_payload()[0].get_payload(decode=True) == pdf.read_bytes()
+
+
+def test_changed_file_replaces_entry(tmp_path):
+    pdf = tmp_path / 'quote.pdf'
+    pdf.write_bytes(b'old')
+    cache = AttachmentCache()
+    cache.encoded(str(pdf))
+    pdf.write_bytes(b'new contents')
+    assert cache.encoded(str(pdf)) == 'bmV3IGNvbnRlbnRz\n'
+    assert cache.stats()['entries'] == 1 and cache.stats()['bytes'] == 17
+
+    cache.invalidate(str(pdf))
+    assert cache.stats()['entries'] == 0
+
+
+def test_lru_eviction_respects_byte_budget(tmp_path):
+    cache = AttachmentCache(max_bytes=2000)
+    for name in ('a', 'b', 'c'):
+        (tmp_path / f'{name}.pdf').write_bytes(os.urandom(600))  # ~800 encoded bytes each
+        cache.encoded(str(tmp_path / f'{name}.pdf'))
+    stats = cache.stats()
+    assert stats['entries'] == 2 and stats['evictions'] == 1 and stats['bytes'] <= 2000
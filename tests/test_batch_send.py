@@ -0,0 +1,108 @@
+"""Tests for the concurrent batch send engine."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import time
+import threading
+
+import services.batch_send as batch_send
+from services.batch_send import BatchSendEngine, BatchSendJobs, workers_for_stage
+
+
+def _customers(n):
+    return [(f'C{i}', {'company_name': f'Co {i}', 'contact_email': f'c{i}@example.com'}) for i in range(n)]
+
+
+def _slow_generate(customer):
+    time.sleep(0.05)
+    return {'subject': 'Hi', 'body': customer['company_name']}
+
+
+def test_pool_overlaps_work_and_beats_serial():
+    sends = []
+    send = lambda c, e: (sends.append(c['contact_email']) or f"id-{c['contact_email']}", None)
+
+    start = time.time()
+    report = BatchSendEngine(_slow_generate, send, workers=8).run(_customers(16))
+    elapsed = time.time() - start
+
+    assert report['sent'] == 16 and report['failed'] == 0 and len(sends) == 16
+    assert elapsed < 16 * 0.05 / 2  # serial would take 0.8s
+
+
+def test_daily_limit_reserves_slots_and_returns_failed_ones():
+    """A failed send frees its slot; customers past the cap never reach generate."""
+    generated = []
+    lock = threading.Lock()
+
+    def generate(customer):
+        with lock:
+            generated.append(customer['company_name'])
+        return {'subject': 's', 'body': 'b'}
+
+    def send(customer, email):
+        return (None, 'boom') if customer['company_name'] == 'Co 0' else ('ok', None)
+
+    results = []
+    report = BatchSendEngine(generate, send, workers=1, daily_remaining=3).run(
+        _customers(6), on_result=results.append)
+    assert report['sent'] == 3 and report['failed'] == 1 and report['skipped'] == 2
+    assert len(generated) == 4
+    assert {r['customer_id']: r['status'] for r in results}['C0'] == 'failed'
+
+
+def test_generation_errors_are_reported_per_customer():
+    def generate(customer):
+        if customer['company_name'] == 'Co 1':
+            raise RuntimeError('model overloaded')
+        return {'subject': 's', 'body': 'b'} if customer['company_name'] != 'Co 2' else None
+
+    report = BatchSendEngine(generate, lambda c, e: ('ok', None), workers=3).run(_customers(3))
+    errors = {r['customer_id']: r['error'] for r in report['results']}
+    assert errors == {'C0': None, 'C1': 'model overloaded', 'C2': 'email generation failed'}
+
+
+def test_workers_for_stage():
+    assert workers_for_stage({'send_concurrency': 2}) == 2
+    assert workers_for_stage({'send_concurrency': 500}) == 16
+    assert workers_for_stage({}) >= 1
+
+
+def test_job_progress_is_recorded_and_stale_jobs_show_interrupted(tmp_path, monkeypatch):
+    jobs = BatchSendJobs(str(tmp_path / 'batch_send.db'))
+    assert jobs.latest(1) is None
+
+    job_id = jobs.start(1, 2, 'full', 5, ['Bad Address Co'])
+    jobs.progress(job_id, 3, 2, 0, ['Bad Address Co', 'Co 4'])
+    job = jobs.latest(1)
+    assert job['status'] == 'running' and job['done'] == 5 and job['failures'] == ['Bad Address Co', 'Co 4']
+    assert jobs.running(1) and not jobs.running(2)
+
+    monkeypatch.setattr(batch_send, 'STALE_JOB_SECONDS', -1)
+    assert jobs.latest(1)['status'] == 'interrupted' and not jobs.running(1)
+
+    jobs.finish(job_id, error='sheet unavailable')
+    assert jobs.latest(1)['status'] == 'failed'
+
+
+def test_background_run_queues_emails_and_reports_progress(tmp_path, monkeypatch):
+    from routes import batch_send as routes
+
+    jobs = BatchSendJobs(str(tmp_path / 'batch_send.db'))
+    monkeypatch.setattr(routes, 'batch_jobs', jobs)
+    queued = []
+    monkeypatch.setattr(routes, 'enqueue_email', lambda cid, *args, **kwargs: queued.append(cid) or {'id': len(queued)})
+
+    class Engine:
+        def generate_email(self, customer, research, stage):
+            return None if customer['company_name'] == 'Co 1' else {'subject': 's', 'body': 'b'}
+
+    customers = [(cid, dict(c, id=cid)) for cid, c in _customers(4)]
+    job_id = jobs.start(1, 1, 'full', 4, [])
+    routes._run_batch(job_id, Engine(), None, customers, [], 1, 'full', [], None, {}, 2, 2)
+
+    job = jobs.latest(1)
+    assert job['status'] == 'done' and job['queued'] == 2 and job['failed'] == 1 and job['skipped'] == 1
+    assert job['failures'] == ['Co 1'] and len(queued) == 2
@@ -0,0 +1,47 @@
+"""Tests for paginated, batched Gmail fetching."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from unittest.mock import patch
+
+from services.gmail_fetch import list_message_ids, batch_get_messages, fetch_relevant_messages, sender_address
+from tests.fakes import FakeGmail
+
+
+def test_list_follows_every_page():
+    """All pages should be read, not just the first."""
+    service = FakeGmail([f'm{i}' for i in range(8)])
+    assert list_message_ids(service, 'is:unread') == [f'm{i}' for i in range(8)]
+    assert service.list_calls == 3
+
+
+def test_batches_are_capped_and_ordered():
+    """Messages are fetched in batches of at most batch_size, in list order."""
+    ids = [f'm{i}' for i in range(250)]
+    service = FakeGmail(ids)
+    messages, failures = batch_get_messages(service, ids)
+    assert [len(b) for b in service.batches] == [100, 100, 50]
+    assert [m['id'] for m in messages] == ids and failures == {}
+
+
+def test_partial_failures_retry_throttled_calls_only():
+    """429s are retried in a follow-up batch; 404s are reported, not retried."""
+    service = FakeGmail([], fail_once={'b'}, missing={'c'})
+    with patch('services.gmail_fetch.time.sleep'):
+        messages, failures = batch_get_messages(service, ['a', 'b', 'c'])
+    assert [m['id'] for m in messages] == ['a', 'b']
+    assert list(failures) == ['c']
+    assert service.batches == [['a', 'b', 'c'], ['b']]
+
+
+def test_bodies_only_for_kept_messages():
+    """Headers are fetched for all; full payloads only for kept, small messages."""
+    senders = {'a': 'Buyer <buyer@acme.com>', 'b': 'noreply@shop.com', 'c': 'Big <big@acme.com>'}
+    service = FakeGmail([], senders=senders, sizes={'c': 50_000_000})
+    messages, failures = fetch_relevant_messages(
+        service, ['a', 'b', 'c'], keep=lambda m: sender_address(m).endswith('@acme.com'))
+    assert [(m['id'], m['format']) for m in messages] == [('a', 'full'), ('c', 'metadata')]
+    assert messages[1]['body_skipped'] and failures == {}
+    assert [g for g in service.gets if g[1] == 'full'] == [('a', 'full')]
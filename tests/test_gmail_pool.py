@@ -0,0 +1,62 @@
+"""Tests for the per-user Gmail service pool."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from services.gmail_pool import GmailServicePool
+
+
+def _token(token='access-1', expires_in=3600):
+    expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=expires_in)
+    return json.dumps({
+        'token': token, 'refresh_token': 'refresh', 'token_uri': 'https://oauth2.googleapis.com/token',
+        'client_id': 'client', 'client_secret': 'secret',
+        'scopes': ['https://www.googleapis.com/auth/gmail.send'],
+        'expiry': expiry.isoformat() + 'Z',
+    })
+
+
+def _fake_refresh(self, request):
+    self.token = 'access-2'
+    self.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=1)
+
+
+def test_service_reused_and_token_loaded_once():
+    """Repeat calls on one thread reuse the service without touching storage."""
+    pool = GmailServicePool()
+    loads = []
+    first = pool.get(1, lambda: loads.append(1) or _token())
+    second = pool.get(1, lambda: loads.append(1) or _token())
+    assert first is second and loads == [1]
+    assert first.users().messages().list(userId='me').uri.startswith('https://gmail.googleapis.com/')
+
+
+def test_each_thread_gets_its_own_service():
+    pool = GmailServicePool()
+    services = [pool.get(1, _token)]
+    thread = threading.Thread(target=lambda: services.append(pool.get(1, _token)))
+    thread.start()
+    thread.join()
+    assert services[0] is not services[1]
+    assert pool.stats['loads'] == 1 and pool.stats['builds'] == 2
+
+
+def test_refresh_before_expiry_writes_back_only_on_change():
+    """Tokens close to expiry are refreshed up front and saved once."""
+    pool = GmailServicePool(refresh_margin=300)
+    saved = []
+    with patch('google.oauth2.credentials.Credentials.refresh', _fake_refresh):
+        pool.get(1, lambda: _token(expires_in=60), saved.append)
+        pool.get(1, lambda: _token(expires_in=60), saved.append)
+    assert len(saved) == 1 and json.loads(saved[0])['token'] == 'access-2'
+    assert pool.stats['refreshes'] == 1
+
+    fresh = GmailServicePool()
+    fresh.get(2, _token, saved.append)
+    assert len(saved) == 1
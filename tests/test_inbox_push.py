@@ -0,0 +1,56 @@
+"""Tests for Gmail push notifications."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import pytest
+
+from services import inbox_push
+from services.inbox_push import PushNotifications, LocalPublisher, push_envelope, decode_push
+from tests.fakes import FakeMailbox, inbox_sync_for
+
+
+def test_envelope_round_trip_and_malformed_pushes():
+    assert decode_push(push_envelope('Me@Example.com', 4242)) == ('me@example.com', '4242')
+    for bad in (None, {}, {'message': {'data': 'not base64 json'}}, {'message': {}}):
+        with pytest.raises(ValueError):
+            decode_push(bad)
+
+
+def test_notifications_keep_newest_history_and_wake_waiters(tmp_path):
+    pushes = PushNotifications(str(tmp_path / 'inbox_sync.db'))
+    assert pushes.latest('me@example.com') == (0, None)
+    pushes.record('Me@example.com', 120)
+    pushes.record('me@example.com', 110)  # Pub/Sub does not guarantee order
+    assert pushes.latest('me@example.com') == (2, '120')
+    assert pushes.wait('me@example.com', 0, timeout=5) == (2, '120')
+    assert pushes.wait('me@example.com', 2, timeout=0.05, step=0.01) == (2, None)
+
+
+def test_webhook_records_pushes_from_local_publisher(app, tmp_path, monkeypatch):
+    import routes.webhooks
+    pushes = PushNotifications(str(tmp_path / 'inbox_sync.db'))
+    monkeypatch.setattr(routes.webhooks, 'push_notifications', pushes)
+    client = app.test_client()
+
+    monkeypatch.setattr(inbox_push, 'PUSH_TOKEN', '')
+    assert client.post('/webhooks/gmail', json=push_envelope('me@example.com', 1)).status_code == 404
+
+    monkeypatch.setattr(inbox_push, 'PUSH_TOKEN', 'secret')
+    post = lambda token: lambda envelope: client.post(f'/webhooks/gmail?token={token}', json=envelope).status_code
+    assert LocalPublisher(post('wrong')).publish('me@example.com', 7) == 403
+    assert LocalPublisher(post('secret')).publish('me@example.com', 7) == 204
+    assert client.post('/webhooks/gmail?token=secret', json={'message': {}}).status_code == 204
+    assert pushes.latest('me@example.com') == (1, '7')
+
+
+def test_push_at_or_before_cursor_needs_no_sync(tmp_path):
+    """Notifications already covered by the last cycle cost no API call."""
+    service = FakeMailbox(['a'])
+    inbox = inbox_sync_for(service, tmp_path)
+    assert inbox.needs_sync('100')  # no cursor yet
+    inbox.run(lambda m: None)
+    assert not inbox.needs_sync('100')
+    service.deliver('b')
+    assert inbox.needs_sync(service.history_id)
@@ -0,0 +1,119 @@
+"""Tests for history-id based incremental inbox sync."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from services.inbox_sync import MAX_ATTEMPTS
+from tests.fakes import FakeHttpError, FakeMailbox, FakeRequest, inbox_sync_for
+
+
+def test_first_run_resyncs_then_only_new_messages(tmp_path):
+    """The first cycle lists the inbox; later cycles read history only."""
+    service = FakeMailbox(['a', 'b', 'c'])
+    inbox = inbox_sync_for(service, tmp_path)
+    seen = []
+
+    first = inbox.run(lambda m: seen.append(m['id']))
+    assert first['full_resync'] and first['advanced']
+    assert seen == ['a', 'b', 'c'] and inbox.history_id == '100'
+
+    for msg in ('d', 'e', 'f'):
+        service.deliver(msg)
+    service.deliver('s', labels=('SENT',))
+    searches = service.list_calls
+    inbox.run(lambda m: seen.append(m['id']))
+    assert seen == ['a', 'b', 'c', 'd', 'e', 'f']
+    assert service.history_calls == 2  # two history pages, no search
+    assert service.list_calls == searches
+
+    # Idle poll: one history request, nothing fetched
+    batches = len(service.batches)
+    idle = inbox.run(lambda m: seen.append(m['id']))
+    assert idle['fetched'] == 0 and service.history_calls == 3
+    assert len(service.batches) == batches
+
+
+def test_expired_cursor_falls_back_without_reprocessing(tmp_path):
+    """A 404 from history.list triggers a resync that skips handled messages."""
+    service = FakeMailbox(['a', 'b'])
+    inbox = inbox_sync_for(service, tmp_path)
+    seen = []
+    inbox.run(lambda m: seen.append(m['id']))
+
+    service.deliver('c')
+    service.expired_before = 10 ** 6
+    summary = inbox.run(lambda m: seen.append(m['id']))
+    assert summary['full_resync']
+    assert seen == ['a', 'b', 'c']
+    assert inbox.history_id == '101'
+
+
+def test_failed_messages_hold_the_cursor_until_skipped(tmp_path):
+    """A failing handler is retried on later cycles, then given up on."""
+    service = FakeMailbox([])
+    inbox = inbox_sync_for(service, tmp_path)
+    inbox.run(lambda m: None)
+    service.deliver('ok')
+    service.deliver('bad')
+    seen = []
+
+    def handler(message):
+        if message['id'] == 'bad':
+            raise ValueError('boom')
+        seen.append(message['id'])
+
+    summary = inbox.run(handler)
+    assert not summary['advanced'] and inbox.history_id == '100'
+    for _ in range(MAX_ATTEMPTS - 1):
+        summary = inbox.run(handler)
+    assert seen == ['ok']
+    assert summary['advanced'] and inbox.history_id == '102'
+    assert inbox.stats()['messages'] == {'done': 1, 'skipped': 1}
+
+
+def test_filtered_messages_count_as_handled(tmp_path):
+    """Messages rejected on headers are never downloaded and never offered again."""
+    service = FakeMailbox([])
+    service.senders = {'keep': 'a@acme.com', 'drop': 'noreply@shop.com'}
+    inbox = inbox_sync_for(service, tmp_path)
+    inbox.run(lambda m: None)
+    service.deliver('keep')
+    service.deliver('drop')
+    keep = lambda m: 'acme' in m['payload']['headers'][0]['value']
+
+    batch = inbox.fetch(keep=keep)
+    assert [m['id'] for m in batch['messages']] == ['keep'] and batch['filtered'] == ['drop']
+    assert ('drop', 'full') not in service.gets
+    assert inbox.commit(batch)['advanced']
+    assert inbox.stats()['messages'] == {'done': 1, 'filtered': 1}
+
+
+def test_unfetchable_messages_do_not_hold_the_cursor(tmp_path, monkeypatch):
+    """A refused fetch is skipped at once; one that keeps failing is skipped after MAX_ATTEMPTS."""
+    from services import gmail_fetch
+    monkeypatch.setattr(gmail_fetch.time, 'sleep', lambda s: None)
+
+    class Refusing(FakeMailbox):
+        def get(self, userId, id, format='full', **kwargs):
+            if id not in ('forbidden', 'down'):
+                return super().get(userId, id, format, **kwargs)
+
+            def run():
+                raise FakeHttpError(403 if id == 'forbidden' else 503)
+            return FakeRequest(run)
+
+    service = Refusing([])
+    inbox = inbox_sync_for(service, tmp_path)
+    inbox.run(lambda m: None)
+    service.deliver('ok')
+    service.deliver('forbidden')
+    summary = inbox.run(lambda m: None)
+    assert summary['advanced'] and inbox.history_id == '102'
+    assert inbox.stats()['messages'] == {'done': 1, 'skipped': 1}
+
+    service.deliver('down')
+    for _ in range(MAX_ATTEMPTS - 1):
+        assert not inbox.run(lambda m: None)['advanced']
+    assert inbox.run(lambda m: None)['advanced'] and inbox.history_id == '103'
+    assert inbox.stats()['messages'] == {'done': 1, 'skipped': 2}
@@ -0,0 +1,125 @@
+"""Tests for the durable outbound email queue."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import time
+
+from services import outbox as outbox_mod
+from services.outbox import Outbox, idempotency_key, backoff_delay
+from services.email_service import SendFailure
+
+
+def _queue(box, key='C1:1:EMAIL1', **kwargs):
+    return box.enqueue(key, 'buyer@example.com', 'Hello', 'Body', ['a.pdf'],
+                       sender_name='Sam', sender_email='sam@quartz.com', user_id=1, **kwargs)
+
+
+def test_enqueue_is_idempotent(tmp_path):
+    """The same (customer, stage, email_id) is queued once."""
+    box = Outbox(str(tmp_path / 'outbox.db'))
+    key = idempotency_key('C1', 2, 'EMAIL1')
+    first = _queue(box, key, effects={'log': {'email_id': 'EMAIL1'}})
+    second = _queue(box, key)
+    assert first['created'] and not second['created']
+    assert second['id'] == first['id'] and second['effects'] == {'log': {'email_id': 'EMAIL1'}}
+    assert first['message_id'].endswith('@quartz.com>')
+    assert box.counts(1)['pending'] == 1
+
+
+def test_drain_sends_and_applies_effects_once(tmp_path):
+    box = Outbox(str(tmp_path / 'outbox.db'))
+    _queue(box)
+    sent, applied = [], []
+    summary = box.drain(lambda item: sent.append(item['to_email']) or {'id': 'gm1', 'threadId': 't1'},
+                        applied.append)
+    assert summary == {'sent': 1, 'retrying': 0, 'dead': 0, 'applied': 1}
+    assert applied[0]['gmail_msg_id'] == 'gm1' and applied[0]['gmail_thread_id'] == 't1'
+    assert box.drain(lambda item: {'id': 'again'}, applied.append)['sent'] == 0
+    assert sent == ['buyer@example.com'] and box.counts()['sent'] == 1
+
+
+def test_failures_back_off_honour_retry_after_and_go_dead(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox_mod, 'MAX_ATTEMPTS', 3)
+    box = Outbox(str(tmp_path / 'outbox.db'))
+    item = _queue(box)
+    box.claim()
+    assert box.mark_failed(item['id'], 'quota', retry_after=120) == 'pending'
+    row = box.items(statuses=('pending',))[0]
+    assert row['next_attempt_at'] - time.time() >= 119
+    assert box.claim() == []  # not due yet
+    assert box.mark_failed(item['id'], '503') == 'pending'
+    assert box.mark_failed(item['id'], '503') == 'dead'
+    assert box.retry(item['id'], user_id=1) and box.counts()['pending'] == 1
+
+
+def test_permanent_error_is_dead_immediately(tmp_path):
+    box = Outbox(str(tmp_path / 'outbox.db'))
+    _queue(box)
+
+    def reject(item):
+        raise SendFailure('Invalid To header', status=400)
+
+    assert box.drain(reject, lambda item: None)['dead'] == 1
+    assert SendFailure('rate', status=429).permanent is False
+
+
+def test_backoff_is_exponential_with_jitter(monkeypatch):
+    monkeypatch.setattr(outbox_mod, 'BACKOFF_BASE', 10)
+    monkeypatch.setattr(outbox_mod, 'BACKOFF_MAX', 100)
+    assert 5 <= backoff_delay(1) <= 10
+    assert 20 <= backoff_delay(3) <= 40
+    assert 50 <= backoff_delay(10) <= 100
+    assert backoff_delay(1, retry_after=300) == 300
+
+
+def test_expired_lease_is_recovered(tmp_path):
+    """A send whose drainer died is claimed again and flagged for a Sent-folder check."""
+    box = Outbox(str(tmp_path / 'outbox.db'))
+    _queue(box)
+    assert len(box.claim(lease=-1)) == 1
+    reclaimed = box.claim()
+    assert len(reclaimed) == 1 and reclaimed[0]['recovered']
+    assert box.claim() == []  # leased again
+
+
+def test_failed_effects_are_retried_without_resending(tmp_path):
+    box = Outbox(str(tmp_path / 'outbox.db'))
+    item = _queue(box)
+    sends = []
+
+    def broken(item):
+        raise RuntimeError('Sheets down')
+
+    box.drain(lambda i: sends.append(i) or {'id': 'gm1', 'threadId': 't1'}, broken)
+    assert box.counts()['sent'] == 1
+    with outbox_mod.get_db(box.path) as db:
+        db.execute("UPDATE outbox SET lease_until = 0 WHERE id = ?", (item['id'],))
+    applied = []
+    assert box.drain(lambda i: sends.append(i) or {'id': 'gm2'}, applied.append)['applied'] == 1
+    assert len(sends) == 1 and applied[0]['gmail_msg_id'] == 'gm1' and applied[0]['gmail_thread_id'] == 't1'
+
+
+def test_apply_effects_is_safe_to_repeat(tmp_path):
+    """Effects applied twice (crash before mark_effects_done) log one row."""
+    from app_core import apply_outbox_effects
+    from services.sqlite_storage import SQLiteStorage
+
+    storage = SQLiteStorage(str(tmp_path / 'storage.db'))
+    storage.load_values('Customers', [['id', 'company_name', 'pipeline_stage'], ['C1', 'Acme', '1']])
+    storage.load_values('Email_Tracking', [['email_id', 'customer_id', 'status', 'sent_time', 'gmail_msg_id'],
+                                           ['EMAIL0', 'C1', 'queued', '', '']])
+    item = {'gmail_msg_id': 'gm1', 'gmail_thread_id': 't1', 'message_id': '<outbox.a@quartz.com>', 'effects': {
+        'log': {'email_id': 'FU1', 'customer_id': 'C1', 'status': 'sent'},
+        'mark_sent': 'EMAIL0',
+        'customer': {'C1': {'pipeline_stage': 2}},
+    }}
+    apply_outbox_effects(storage, item)
+    apply_outbox_effects(storage, item)
+    rows = storage.get_records('Email_Tracking')
+    assert [r['email_id'] for r in rows] == ['EMAIL0', 'FU1']
+    assert rows[0]['status'] == 'sent' and rows[0]['gmail_msg_id'] == 'gm1' and rows[1]['gmail_msg_id'] == 'gm1'
+    assert rows[0]['gmail_thread_id'] == rows[1]['gmail_thread_id'] == 't1'
+    assert storage.get_snapshot('Email_Tracking').for_reply(message_ids=['<outbox.a@quartz.com>'])[0] == 2
+    assert storage.get_snapshot('Customers').by_id('C1')['pipeline_stage'] == 2
@@ -0,0 +1,63 @@
+"""Tests for the shared token-bucket rate limiter."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import pytest
+
+from services.rate_limit import RateLimiter, RateLimitTimeout, is_rate_limit_error
+
+
+def test_bucket_allows_burst_then_reports_wait(tmp_path):
+    """Capacity tokens are available at once; the next one waits for a refill."""
+    limiter = RateLimiter(str(tmp_path / 'rl.db'))
+    assert [limiter.try_acquire('gmail:a', rate=1, capacity=3) for _ in range(3)] == [0, 0, 0]
+    wait = limiter.try_acquire('gmail:a', rate=1, capacity=3)
+    assert 0 < wait <= 1
+
+
+def test_buckets_are_shared_between_instances(tmp_path):
+    """Two limiter objects on one file (two processes) spend the same budget."""
+    path = str(tmp_path / 'rl.db')
+    assert RateLimiter(path).try_acquire('sheets:sa', rate=0.01, capacity=1) == 0
+    assert RateLimiter(path).try_acquire('sheets:sa', rate=0.01, capacity=1) > 0
+
+
+def test_penalize_halves_rate_and_recovers(tmp_path):
+    """A 429 halves the refill rate; successful acquires restore it gradually."""
+    limiter = RateLimiter(str(tmp_path / 'rl.db'))
+    limiter.try_acquire('sheets:sa', rate=100, capacity=100)
+    limiter.penalize('sheets:sa')
+    bucket = limiter.usage('sheets:')[0]
+    assert bucket['rate'] == 50 and bucket['backed_off'] and bucket['throttled'] == 1
+    limiter.acquire('sheets:sa', rate=100, capacity=100)
+    assert limiter.usage('sheets:')[0]['rate'] == 55
+
+
+def test_acquire_times_out(tmp_path):
+    """Waits longer than the timeout raise instead of blocking."""
+    limiter = RateLimiter(str(tmp_path / 'rl.db'))
+    limiter.try_acquire('research:1', rate=0.001, capacity=1)
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire('research:1', rate=0.001, capacity=1, timeout=1)
+
+
+def test_rate_limit_error_detection():
+    class Resp:
+        status = 429
+
+    class HttpError(Exception):
+        resp = Resp()
+
+    class Forbidden(Exception):
+        def __init__(self, reason):
+            super().__init__(reason)
+            self.resp = type('Resp', (), {'status': 403})()
+            self.error_details = [{'reason': reason}]
+
+    assert is_rate_limit_error(HttpError('x'))
+    assert is_rate_limit_error(Forbidden('userRateLimitExceeded'))
+    assert not is_rate_limit_error(Forbidden('insufficientPermissions'))
+    # Decided by status and reason, not by words in the message
+    assert not is_rate_limit_error(Exception('User-rate limit exceeded'))
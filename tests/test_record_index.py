@@ -0,0 +1,72 @@
+"""Tests for indexed record snapshots."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from services.record_index import RecordSnapshot, referenced_message_ids
+
+
+CUSTOMERS = [
+    {'id': 1, 'company_name': 'Acme', 'contact_email': 'Buyer@Acme.com'},
+    {'id': 2, 'company_name': 'Globex', 'contact_email': 'ops@globex.com'},
+    {'id': 3, 'company_name': 'ACME', 'contact_email': 'buyer@acme.com'},
+]
+
+EMAILS = [
+    {'email_id': 'E1', 'customer_id': 1, 'contact_email': 'buyer@acme.com'},
+    {'email_id': 'E2', 'customer_id': 2, 'contact_email': 'ops@globex.com'},
+    {'email_id': 'E3', 'customer_id': '', 'contact_email': 'BUYER@acme.com'},
+]
+
+
+def test_lookup_by_id_returns_record_and_row():
+    """Numeric ids should match their string form and report the sheet row."""
+    snap = RecordSnapshot(CUSTOMERS)
+    assert snap.by_id('2')['company_name'] == 'Globex'
+    assert snap.find('id', 3) == (4, CUSTOMERS[2])
+    assert snap.by_id('99') is None
+    assert snap.by_id('') is None
+
+
+def test_email_lookup_is_case_insensitive():
+    """Contact email matches should ignore case and keep sheet order."""
+    snap = RecordSnapshot(CUSTOMERS)
+    hits = snap.find_all('contact_email', ' buyer@ACME.com ')
+    assert [row for row, _ in hits] == [2, 4]
+
+
+def test_email_id_lookup():
+    """Tracking rows should be found by email_id."""
+    snap = RecordSnapshot(EMAILS)
+    assert snap.find('email_id', 'E2') == (3, EMAILS[1])
+    assert snap.find('email_id', 'missing') is None
+
+
+def test_for_customer_merges_id_and_email_matches():
+    """Linked emails are matched by customer_id or contact email without duplicates."""
+    snap = RecordSnapshot(EMAILS)
+    linked = snap.for_customer('1', 'buyer@acme.com')
+    assert [e['email_id'] for e in linked] == ['E1', 'E3']
+
+
+def test_reply_matches_the_email_it_answers():
+    """Message-ID and thread beat the sender's first tracked email; the address is the fallback."""
+    emails = [
+        {'email_id': 'E1', 'contact_email': 'buyer@acme.com', 'status': 'replied',
+         'gmail_thread_id': 't1', 'rfc_message_id': '<outbox.a@quartz.com>'},
+        {'email_id': 'E2', 'contact_email': 'buyer@acme.com', 'status': 'sent',
+         'gmail_thread_id': 't2', 'rfc_message_id': '<outbox.b@quartz.com>'},
+        {'email_id': 'E3', 'contact_email': 'buyer@acme.com', 'status': 'sent',
+         'gmail_thread_id': 't2', 'rfc_message_id': '<outbox.c@quartz.com>'},
+    ]
+    snap = RecordSnapshot(emails)
+    ids = referenced_message_ids('<outbox.b@quartz.com>', '<x@mail.com> <outbox.b@quartz.com>')
+    assert ids == ['<outbox.b@quartz.com>', '<x@mail.com>']
+    assert snap.for_reply('t2', ids, 'buyer@acme.com')[1]['email_id'] == 'E2'
+    # A colleague replying in the thread, without In-Reply-To: latest row of the thread
+    assert snap.for_reply('t2', [], 'cfo@acme.com')[1]['email_id'] == 'E3'
+    assert snap.for_reply('', [], 'BUYER@acme.com')[1]['email_id'] == 'E1'
+    is_open = lambda r: r['status'] == 'sent'
+    assert snap.for_reply('t1', [], 'buyer@acme.com', where=is_open)[1]['email_id'] == 'E2'
+    assert snap.for_reply('t9', [], 'nobody@acme.com') is None
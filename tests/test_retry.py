@@ -0,0 +1,91 @@
+"""Tests for status-aware retries."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import pytest
+
+from gspread.exceptions import APIError
+
+from services import retry
+from services.retry import RetryPolicy, RetryStats, classify, call, THROTTLED, TRANSIENT, PERMANENT
+from tests.fakes import FakeHttpError, FakeResponse, StatusError
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+def test_classify_by_status_not_message():
+    assert classify(FakeHttpError(429)) == THROTTLED
+    assert classify(FakeHttpError(503)) == TRANSIENT
+    assert classify(FakeHttpError(404)) == PERMANENT
+    assert classify(APIError(FakeResponse(500))) == TRANSIENT
+    assert classify(APIError(FakeResponse(400))) == PERMANENT
+    assert classify(StatusError(529)) == TRANSIENT
+    assert classify(APIConnectionError('reset')) == TRANSIENT
+    assert classify(TimeoutError()) == TRANSIENT
+    assert classify(ValueError('invalid json, try again later')) == PERMANENT
+
+
+def test_rate_limit_403_is_throttled():
+    error = FakeHttpError(403)
+    error.error_details = [{'reason': 'userRateLimitExceeded'}]
+    assert classify(error) == THROTTLED
+    error.error_details = [{'reason': 'forbidden'}]
+    assert classify(error) == PERMANENT
+
+
+@pytest.fixture
+def fast(monkeypatch):
+    """No real sleeping; records the delays instead."""
+    slept = []
+    monkeypatch.setattr(retry.time, 'sleep', slept.append)
+    monkeypatch.setattr(retry, 'retry_stats', RetryStats())
+    return slept
+
+
+def _flaky(errors, result='ok'):
+    errors = list(errors)
+
+    def fn():
+        if errors:
+            raise errors.pop(0)
+        return result
+    return fn
+
+
+def test_call_retries_transient_then_succeeds(fast):
+    policy = RetryPolicy(attempts=4, base=1, cap=8, deadline=60)
+    assert call('sheets', _flaky([APIError(FakeResponse(503)), TimeoutError()]), policy=policy) == 'ok'
+    assert len(fast) == 2 and 0.5 <= fast[0] <= 1 and 1 <= fast[1] <= 2
+    assert retry.retry_stats.snapshot()['sheets'] == {
+        'calls': 1, 'retries': 2, 'throttled': 0, 'gave_up': 0, 'deadline_exceeded': 0}
+
+
+def test_call_honours_retry_after_and_gives_up(fast):
+    policy = RetryPolicy(attempts=2, base=1, cap=8, deadline=60)
+    with pytest.raises(StatusError):
+        call('anthropic', _flaky([StatusError(429, retry_after='7'), StatusError(429)]), policy=policy)
+    assert fast == [7.0]
+    assert retry.retry_stats.snapshot()['anthropic']['gave_up'] == 1
+
+
+def test_permanent_and_non_idempotent_transient_are_not_retried(fast):
+    policy = RetryPolicy(attempts=5, base=1, cap=8, deadline=60)
+    with pytest.raises(FakeHttpError):
+        call('gmail', _flaky([FakeHttpError(400)]), policy=policy)
+    with pytest.raises(FakeHttpError):
+        call('gmail', _flaky([FakeHttpError(502)]), idempotent=False, policy=policy)
+    # A throttled send was refused, so retrying it is safe
+    assert call('gmail', _flaky([FakeHttpError(429)]), idempotent=False, policy=policy) == 'ok'
+    assert len(fast) == 1
+
+
+def test_deadline_stops_retries(fast):
+    policy = RetryPolicy(attempts=10, base=1, cap=8, deadline=5)
+    with pytest.raises(StatusError):
+        call('anthropic', _flaky([StatusError(503, retry_after='30')]), policy=policy)
+    assert fast == []
+    assert retry.retry_stats.snapshot()['anthropic']['deadline_exceeded'] == 1
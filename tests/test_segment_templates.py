@@ -0,0 +1,58 @@
+"""Tests for segment templates filled in per customer."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import json
+
+from services.ai_cache import AIResponseCache
+from services.segment_templates import industry_segment, fill, fill_template
+from tests.fakes import FakeClaude
+
+TEMPLATE = {
+    'subject': 'High-purity quartz for {{company_name}}',
+    'body': 'Hi {{contact_name}},\n\n{{personal_line}}\n\nOur quartz suits {{industry}} makers. {{discount_code}}\n\nBest regards',
+    'attachments': ['01_Brochure.pdf'],
+    'confidence_score': 0.8,
+}
+
+
+def test_fill_replaces_slots_and_leaves_no_gaps():
+    customer = {'company_name': 'Acme Solar', 'contact_name': 'Jane Doe', 'tags': 'solar, glass'}
+    email = fill_template(TEMPLATE, customer, 'Your new wafer line needs 4N quartz.')
+    assert email['subject'] == 'High-purity quartz for Acme Solar'
+    assert email['body'] == ('Hi Jane,\n\nYour new wafer line needs 4N quartz.\n\n'
+                             'Our quartz suits Solar makers. \n\nBest regards')
+    assert email['attachments'] == ['01_Brochure.pdf']
+
+    assert fill('Hi {{contact_name}},\n\n{{ personal_line }}\n\nThanks', {'contact_name': 'there'}) == 'Hi there,\n\nThanks'
+    assert fill_template(None, customer) is None
+
+
+def test_industry_segments():
+    assert industry_segment({'tags': 'solar; glass'}) == industry_segment({'tags': 'Solar'}) == 'Solar'
+    assert industry_segment({'tags': ''}) == industry_segment({}) == 'General'
+
+
+def test_campaign_costs_one_generation_per_segment(tmp_path, monkeypatch):
+    import main_automation
+
+    class TemplateClaude(FakeClaude):
+        def create(self, **params):
+            message = super().create(**params)
+            message.content[0].text = json.dumps(TEMPLATE)
+            return message
+
+    claude = TemplateClaude()
+    monkeypatch.setattr(main_automation, 'anthropic_client', lambda api_key: claude)
+    monkeypatch.setattr(main_automation, 'ai_cache', AIResponseCache(str(tmp_path / 'ai.db')))
+    engine = main_automation.EmailPersonalizationEngine('key')
+
+    customers = [{'company_name': f'Co {i}', 'contact_name': f'Pat {i}', 'tags': ('Solar', 'Optics', 'Semiconductor')[i % 3]}
+                 for i in range(30)]
+    emails = [fill_template(engine.generate_template(2, industry_segment(c)), c) for c in customers]
+
+    assert len(claude.calls) == 3
+    assert '{{' not in claude.calls[0]['system'][0]['text'] and '{{company_name}}' in claude.calls[0]['messages'][0]['content']
+    assert emails[4]['subject'] == 'High-purity quartz for Co 4' and emails[4]['body'].startswith('Hi Pat,')
@@ -0,0 +1,57 @@
+"""Tests for the cross-worker shared cache."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from services.shared_cache import SharedCache
+
+
+def test_values_are_shared_between_instances(tmp_path):
+    """Two cache objects on one file behave like two workers sharing entries."""
+    path = str(tmp_path / 'cache.db')
+    worker_a, worker_b = SharedCache(path), SharedCache(path)
+    worker_a.set('user_1', 'customers', [{'id': 1}])
+    assert worker_b.get('user_1', 'customers') == [{'id': 1}]
+    assert worker_b.get('user_2', 'customers') is None
+
+
+def test_invalidate_reaches_every_worker(tmp_path):
+    """Bumping the namespace version drops entries for all instances."""
+    path = str(tmp_path / 'cache.db')
+    worker_a, worker_b = SharedCache(path), SharedCache(path)
+    worker_a.set('user_1', 'customers', ['old'])
+    worker_b.invalidate('user_1')
+    assert worker_a.get('user_1', 'customers') is None
+
+
+def test_load_racing_an_invalidation_is_not_served(tmp_path):
+    """A loader that started before an invalidation must not repopulate the cache."""
+    cache = SharedCache(str(tmp_path / 'cache.db'))
+
+    def loader():
+        cache.invalidate('user_1')
+        return ['stale']
+
+    assert cache.get_or_load('user_1', 'customers', loader) == ['stale']
+    assert cache.get('user_1', 'customers') is None
+
+
+def test_lru_eviction_and_counters(tmp_path):
+    """Entries past the byte cap are evicted least-recently-used first."""
+    cache = SharedCache(str(tmp_path / 'cache.db'), max_bytes=60)
+    cache.set('ns', 'a', 'x' * 20)
+    cache.set('ns', 'b', 'y' * 20)
+    cache.set('ns', 'c', 'z' * 20)
+    assert cache.get('ns', 'a') is None
+    assert cache.get('ns', 'c') == 'z' * 20
+    stats = cache.stats('ns')
+    assert stats['evictions'] == 1
+    assert stats['hits'] == 1 and stats['misses'] == 1
+    assert stats['entries'] == 2
+
+
+def test_expired_entries_miss(tmp_path):
+    cache = SharedCache(str(tmp_path / 'cache.db'), ttl=0)
+    cache.set('ns', 'a', 1)
+    assert cache.get('ns', 'a') is None
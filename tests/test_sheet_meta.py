@@ -0,0 +1,42 @@
+"""Tests for the worksheet metadata and header cache."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from services.sheet_meta import SheetMetadataCache
+
+
+def test_properties_cached_from_one_metadata_fetch():
+    """One metadata result should serve every worksheet in the spreadsheet."""
+    cache = SheetMetadataCache()
+    assert cache.get_properties('sid', 'Customers') is None
+    cache.set_metadata('sid', {'sheets': [
+        {'properties': {'title': 'Customers', 'sheetId': 1}},
+        {'properties': {'title': 'Email_Tracking', 'sheetId': 2}},
+    ]})
+    assert cache.get_properties('sid', 'Email_Tracking')['sheetId'] == 2
+    assert cache.get_properties('other', 'Customers') is None
+
+
+def test_header_version_bump_invalidates():
+    """Bumping the version should supersede headers stored under the old version."""
+    cache = SheetMetadataCache()
+    cache.set_headers('sid', 'Email_Tracking', ['email_id', 'status'])
+    headers = cache.get_headers('sid', 'Email_Tracking')
+    headers.append('mutated')
+    assert cache.get_headers('sid', 'Email_Tracking') == ['email_id', 'status']
+
+    cache.bump('sid', 'Email_Tracking')
+    assert cache.get_headers('sid', 'Email_Tracking') is None
+
+    cache.bump('sid', 'Email_Tracking', ['email_id', 'status', 'replied'])
+    assert cache.get_headers('sid', 'Email_Tracking') == ['email_id', 'status', 'replied']
+    assert cache.version('sid', 'Email_Tracking') == 2
+
+
+def test_header_ttl_expiry():
+    """Expired header rows should be re-read."""
+    cache = SheetMetadataCache(header_ttl=0)
+    cache.set_headers('sid', 'Customers', ['id'])
+    assert cache.get_headers('sid', 'Customers') is None
@@ -0,0 +1,130 @@
+"""Tests for the local Sheets mirror."""
+
+import sys
+import os
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import pytest
+
+from models import get_db
+from services.sheet_mirror import SheetMirror
+
+
+GRID = [
+    ['id', 'company_name', 'pipeline_stage'],
+    ['1', 'Acme', '2'],
+    ['2', 'Globex', ''],
+]
+
+
+def test_records_match_get_all_records_shape(tmp_path):
+    """Mirrored records should be numericised dicts keyed by header."""
+    mirror = SheetMirror(str(tmp_path / 'mirror.db'))
+    assert mirror.get_records('Customers') is None
+
+    mirror.store_sheet('Customers', GRID, '2024-01-01T00:00:00Z')
+    assert mirror.get_records('Customers') == [
+        {'id': 1, 'company_name': 'Acme', 'pipeline_stage': 2},
+        {'id': 2, 'company_name': 'Globex', 'pipeline_stage': ''},
+    ]
+
+
+def test_store_only_rewrites_changed_rows(tmp_path):
+    """A re-pull should only touch rows whose content changed and drop removed rows."""
+    mirror = SheetMirror(str(tmp_path / 'mirror.db'))
+    first = mirror.store_sheet('Customers', GRID + [['3', 'Initech', '1']], 't1')
+    assert first['changed'] == 3
+
+    updated = [list(r) for r in GRID]
+    updated[2][2] = '4'
+    second = mirror.store_sheet('Customers', updated, 't2')
+    assert second == {'rows': 2, 'changed': 1, 'deleted': 1}
+    assert mirror.sheet_meta('Customers')['remote_modified'] == 't2'
+
+
+def test_write_through_cells_and_appends(tmp_path):
+    """Flushed cell writes and appended rows should be visible on the next read."""
+    mirror = SheetMirror(str(tmp_path / 'mirror.db'))
+    mirror.store_sheet('Email_Tracking', GRID, 't1')
+
+    mirror.apply_cells('Email_Tracking', {(1, 4): 'replied', (3, 2): 'Globex Ltd', (3, 4): 'yes'})
+    mirror.append_rows('Email_Tracking', [['3', 'Initech', 1]])
+
+    records = mirror.get_records('Email_Tracking')
+    assert records[1] == {'id': 2, 'company_name': 'Globex Ltd', 'pipeline_stage': '', 'replied': 'yes'}
+    assert records[2]['company_name'] == 'Initech'
+    assert records[2]['replied'] == ''
+
+
+def test_invalidate_forces_sync(tmp_path):
+    """Invalidated sheets should report that they need a sync."""
+    mirror = SheetMirror(str(tmp_path / 'mirror.db'))
+    mirror.store_sheet('Customers', GRID, 't1')
+    assert not mirror.needs_sync('Customers')
+    mirror.invalidate(['Customers'])
+    assert mirror.needs_sync('Customers')
+    assert mirror.sheet_meta('Customers')['remote_modified'] == ''
+
+
+def _stale_manager(tmp_path, synced_ago):
+    from main_automation import GoogleSheetsManager
+    manager = GoogleSheetsManager('sid')
+    manager.attach_mirror(SheetMirror(str(tmp_path / 'mirror.db')))
+    manager.mirror.store_sheet('Email_Tracking', [['email_id'], ['E1']], 'v1')
+    with get_db(manager.mirror.path) as db:
+        db.execute("UPDATE mirror_sheets SET synced_at = ?", (time.time() - synced_ago,))
+    manager.sync_calls = []
+    manager.refreshes = []
+    manager.sync_mirror = lambda names: manager.sync_calls.append(names)
+    manager.refresh_in_background = lambda name: manager.refreshes.append(name)
+    return manager
+
+
+def test_stale_copy_is_served_while_refreshing(tmp_path):
+    """A copy within max_staleness is returned at once and refreshed in the background."""
+    manager = _stale_manager(tmp_path, synced_ago=400)
+    records, as_of = manager.get_records_stale('Email_Tracking', max_staleness=900)
+    assert records == [{'email_id': 'E1'}]
+    assert time.time() - as_of >= 400
+    assert manager.refreshes == ['Email_Tracking'] and manager.sync_calls == []
+
+
+def test_copy_past_max_staleness_blocks_on_refresh(tmp_path):
+    """Copies older than max_staleness are refreshed before returning."""
+    manager = _stale_manager(tmp_path, synced_ago=2000)
+    manager.get_records_stale('Email_Tracking', max_staleness=900)
+    assert manager.sync_calls == [['Email_Tracking']] and manager.refreshes == []
+
+
+def test_failed_refresh_serves_the_existing_copy(tmp_path):
+    """Sheets being unreachable is no reason to fail a read that has a local copy."""
+    manager = _stale_manager(tmp_path, synced_ago=2000)
+
+    def unreachable(names):
+        raise ConnectionError('Sheets down')
+    manager.sync_mirror = unreachable
+    records, as_of = manager.get_records_stale('Email_Tracking', max_staleness=900)
+    assert records == [{'email_id': 'E1'}] and time.time() - as_of >= 2000
+
+    with pytest.raises(ConnectionError):  # no local copy of Customers
+        manager.get_records_stale('Customers', max_staleness=900)
+
+
+def test_cache_invalidation_keeps_the_mirror_unless_asked(tmp_path, monkeypatch, app):
+    """Route writes already reach the mirror; only an out-of-band edit resets it."""
+    import app_core
+    from flask import session
+    from services.shared_cache import SharedCache
+
+    mirror = SheetMirror(str(tmp_path / 'mirror.db'))
+    mirror.store_sheet('Customers', GRID, 't1')
+    monkeypatch.setattr(app_core.SheetMirror, 'for_user', classmethod(lambda cls, user_id: mirror))
+    monkeypatch.setattr(app_core, 'shared_cache', SharedCache(str(tmp_path / 'cache.db')))
+
+    with app.test_request_context():
+        session['user_id'] = 7
+        app_core.invalidate_cache()
+        assert not mirror.needs_sync('Customers')
+        app_core.invalidate_cache(mirror=True)
+        assert mirror.needs_sync('Customers')
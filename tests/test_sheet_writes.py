@@ -0,0 +1,171 @@
+"""Tests for Sheets write coalescing."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from unittest.mock import patch
+
+import pytest
+
+from gspread.exceptions import APIError
+
+from services.sheet_writes import SheetWriteBuffer, _build_ranges, chunk_rows, append_rows_chunked
+from tests.fakes import FakeResponse
+
+
+class FakeWorksheet:
+    def __init__(self, title):
+        self.title = title
+        self.calls = []
+
+    def batch_update(self, data, value_input_option=None):
+        self.calls.append(data)
+
+    def append_rows(self, rows, value_input_option=None):
+        self.calls.append(rows)
+
+
+class FlakyWorksheet(FakeWorksheet):
+    """Fails the first append with the given status code."""
+
+    def __init__(self, title, code):
+        super().__init__(title)
+        self.code = code
+        self.failed = False
+
+    def append_rows(self, rows, value_input_option=None):
+        if not self.failed:
+            self.failed = True
+            raise APIError(FakeResponse(self.code))
+        super().append_rows(rows, value_input_option)
+
+
+def test_build_ranges_merges_adjacent_columns():
+    """Adjacent cells in a row should collapse into one A1 range."""
+    data = _build_ranges({(2, 1): 'a', (2, 2): 'b', (2, 3): 'c', (2, 5): 'e', (4, 1): 'x'})
+    assert data == [
+        {'range': 'A2:C2', 'values': [['a', 'b', 'c']]},
+        {'range': 'E2', 'values': [['e']]},
+        {'range': 'A4', 'values': [['x']]},
+    ]
+
+
+def test_queue_row_ignores_unknown_columns():
+    """Only keys present in headers should be queued."""
+    buf = SheetWriteBuffer()
+    ws = FakeWorksheet('Email_Tracking')
+    queued = buf.queue_row(ws, 3, ['status', 'replied'], {'status': 'replied', 'missing': 'x'})
+    assert queued == 1
+    assert buf.pending_count() == 1
+
+
+def test_flush_sends_one_request_per_worksheet():
+    """Many cell writes should become a single batch_update per worksheet."""
+    buf = SheetWriteBuffer()
+    tracking = FakeWorksheet('Email_Tracking')
+    customers = FakeWorksheet('Customers')
+    for row in range(2, 12):
+        buf.queue_row(tracking, row, ['status', 'replied', 'reply_date'],
+                      {'status': 'replied', 'replied': 'yes', 'reply_date': '2024-01-01'})
+    buf.queue(customers, 5, 4, 'Hot')
+
+    reports = buf.flush()
+
+    assert len(tracking.calls) == 1
+    assert len(customers.calls) == 1
+    assert len(tracking.calls[0]) == 10
+    assert {r['worksheet'] for r in reports} == {'Email_Tracking', 'Customers'}
+    assert buf.pending_count() == 0
+    assert buf.stats['requests'] == 2
+    assert buf.stats['cells'] == 31
+
+
+def test_later_write_to_same_cell_wins():
+    """Re-queueing a cell should overwrite the pending value."""
+    buf = SheetWriteBuffer()
+    ws = FakeWorksheet('Customers')
+    buf.queue(ws, 2, 1, 'old')
+    buf.queue(ws, 2, 1, 'new')
+    buf.flush()
+    assert ws.calls == [[{'range': 'A2', 'values': [['new']]}]]
+
+
+def test_failed_flush_keeps_unwritten_cells():
+    """A failed batch_update must not drop the coalesced cells; the next flush writes them."""
+    buf = SheetWriteBuffer()
+    ok, down = FakeWorksheet('Customers'), FakeWorksheet('Email_Tracking')
+
+    def fail(data, value_input_option=None):
+        raise APIError(FakeResponse(503))
+    down.batch_update = fail
+    buf.queue(ok, 2, 1, 'a')
+    buf.queue(down, 3, 1, 'b')
+    with pytest.raises(APIError):
+        buf.flush()
+    assert ok.calls == [[{'range': 'A2', 'values': [['a']]}]]
+    assert buf.pending_count() == 1
+
+    del down.batch_update
+    buf.queue(down, 3, 2, 'c')
+    buf.flush()
+    assert down.calls == [[{'range': 'A3:B3', 'values': [['b', 'c']]}]]
+    assert buf.pending_count() == 0
+
+
+def test_chunk_rows_respects_row_and_byte_caps():
+    """Chunks should split on whichever of the row or byte limit is hit first."""
+    rows = [['x' * 10] for _ in range(7)]
+    assert [len(c) for c in chunk_rows(rows, max_rows=3)] == [3, 3, 1]
+    assert [len(c) for c in chunk_rows(rows, max_rows=100, max_bytes=40)] == [2, 2, 2, 1]
+
+
+def test_append_reports_progress_per_chunk():
+    """Each chunk should be one append_rows call with progress reported."""
+    ws = FakeWorksheet('Customers')
+    seen = []
+    report = append_rows_chunked(ws, [[i] for i in range(1200)], progress=lambda d, t: seen.append((d, t)))
+    assert [len(c) for c in ws.calls] == [500, 500, 200]
+    assert seen == [(500, 1200), (1000, 1200), (1200, 1200)]
+    assert report['rows'] == 1200 and report['chunks'] == 3
+
+
+def test_append_does_not_resend_chunk_after_server_error():
+    """A 5xx may have been applied, so the chunk must not be appended a second time."""
+    ws = FlakyWorksheet('Customers', 503)
+    with patch('time.sleep') as sleep, pytest.raises(APIError):
+        append_rows_chunked(ws, [[1], [2]])
+    assert ws.calls == [] and not sleep.called
+
+
+def test_append_does_not_retry_client_errors():
+    """Non-retryable errors should propagate immediately."""
+    ws = FlakyWorksheet('Customers', 400)
+    with pytest.raises(APIError):
+        append_rows_chunked(ws, [[1]])
+    assert ws.calls == []
+
+
+def test_client_retries_throttled_append_but_not_server_error(monkeypatch):
+    """Retrying an append is left to the HTTP client, which only retries a throttled one."""
+    from services import retry
+    from services.rate_limit import RateLimitedHTTPClient
+
+    monkeypatch.setattr(retry.time, 'sleep', lambda s: None)
+    monkeypatch.setattr(RateLimitedHTTPClient, 'limit_key', None)
+    for code, attempts in ((429, 2), (503, 1)):
+        client = RateLimitedHTTPClient.__new__(RateLimitedHTTPClient)
+        sent = []
+
+        def request(self, method, endpoint, *args, **kwargs):
+            sent.append(endpoint)
+            if len(sent) == 1:
+                raise APIError(FakeResponse(code))
+            return 'ok'
+
+        monkeypatch.setattr('gspread.http_client.HTTPClient.request', request)
+        try:
+            client.request('post', 'spreadsheets/abc/values/Customers:append')
+        except APIError:
+            pass
+        assert len(sent) == attempts
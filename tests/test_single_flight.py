@@ -0,0 +1,107 @@
+"""Tests for single-flight read coalescing."""
+
+import sys
+import os
+import time
+import threading
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+def _run_concurrently(flight, key, fn, callers):
+    results, errors = [], []
+
+    def worker():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(callers)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def test_concurrent_callers_share_one_call():
+    """Callers arriving while a fetch is in flight should get its result."""
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return ['row']
+
+    threads, results, errors = _run_concurrently(flight, ('records', 'sa@x', 'sid', 'Customers'), fetch, 5)
+    while flight.stats['calls'] + flight.stats['shared'] < 5:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1 and not errors
+    assert [r for r, _ in results] == [['row']] * 5
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert flight.in_flight() == 0
+
+
+def test_errors_propagate_to_waiters():
+    """Every caller sharing a failed fetch should see the exception."""
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise RuntimeError('quota')
+
+    threads, results, errors = _run_concurrently(flight, 'k', fetch, 3)
+    while flight.stats['calls'] + flight.stats['shared'] < 3:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join()
+    assert not results
+    assert len(errors) == 3 and all(isinstance(e, RuntimeError) for e in errors)
+
+
+def test_sequential_calls_are_not_cached():
+    """Once a call finishes the next one fetches again."""
+    flight = SingleFlight()
+    assert flight.do('k', lambda: 1) == (1, False)
+    assert flight.do('k', lambda: 2) == (2, False)
+    with pytest.raises(ValueError):
+        flight.do('k', lambda: int('x'))
+
+
+def test_managers_with_different_credentials_never_share_a_read(monkeypatch):
+    """A reader must not receive rows fetched with another account's credentials."""
+    import main_automation
+    from main_automation import GoogleSheetsManager
+
+    flight = SingleFlight()
+    monkeypatch.setattr(main_automation, 'sheet_reads', flight)
+    release = threading.Event()
+    results = {}
+
+    def reader(identity):
+        manager = GoogleSheetsManager('sid')
+        manager.identity = identity
+        worksheet = type('Worksheet', (), {'get_all_records': lambda self: release.wait(5) and [{'owner': identity}]})()
+        manager.get_worksheet = lambda name: worksheet
+        results[identity] = manager._fetch_records('Customers')
+
+    threads = [threading.Thread(target=reader, args=(who,)) for who in ('a@x', 'b@x')]
+    for t in threads:
+        t.start()
+    while flight.in_flight() < 2:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join()
+    assert results == {'a@x': [{'owner': 'a@x'}], 'b@x': [{'owner': 'b@x'}]}
+    assert flight.stats['shared'] == 0
@@ -0,0 +1,64 @@
+"""Tests for the local SQLite storage backend."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from services.sqlite_storage import SQLiteStorage
+
+
+def _storage(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / 'storage.db'))
+    storage.load_values('Customers', [
+        ['id', 'company_name', 'contact_email', 'pipeline_stage'],
+        ['C1', 'Acme', 'Buyer@Acme.com', '1'],
+        ['C2', 'Globex', 'ops@globex.com', '3'],
+        ['C3', 'Initech', 'it@initech.com', ''],
+    ])
+    return storage
+
+
+def test_records_match_sheets_shape(tmp_path):
+    """Records should be numericised dicts keyed by header, like get_all_records()."""
+    storage = _storage(tmp_path)
+    assert storage.get_records('Customers')[1] == {
+        'id': 'C2', 'company_name': 'Globex', 'contact_email': 'ops@globex.com', 'pipeline_stage': 3,
+    }
+    assert storage.get_records('Missing') == []
+
+
+def test_indexed_find_and_update_customer(tmp_path):
+    """Lookups by indexed fields should return sheet row numbers and see updates."""
+    storage = _storage(tmp_path)
+    assert storage.find('Customers', 'contact_email', 'buyer@acme.com')[0][0] == 2
+    storage.update_customer('C2', {'pipeline_stage': 4, 'unknown': 'x'})
+    assert storage.get_snapshot('Customers').by_id('C2')['pipeline_stage'] == 4
+
+
+def test_delete_row_shifts_following_rows(tmp_path):
+    """Deleting a row should move the rows below it up, as in Sheets."""
+    storage = _storage(tmp_path)
+    storage.delete_row('Customers', 2)
+    assert [r['id'] for r in storage.get_records('Customers')] == ['C2', 'C3']
+    assert storage.find('Customers', 'id', 'C3')[0][0] == 3
+
+
+def test_log_email_creates_and_extends_headers(tmp_path):
+    """The first log should create the header row; later keys add columns."""
+    storage = SQLiteStorage(str(tmp_path / 'storage.db'))
+    storage.log_email({'email_id': 'E1', 'status': 'sent'})
+    storage.log_email({'email_id': 'E2', 'status': 'queued', 'subject': 'Hi'})
+    assert storage.get_headers('Email_Tracking') == ['email_id', 'status', 'subject']
+    assert storage.find('Email_Tracking', 'status', 'queued')[0][1]['subject'] == 'Hi'
+
+
+def test_worksheet_handle_supports_row_access(tmp_path):
+    """Routes that use worksheet handles should work against local storage."""
+    storage = SQLiteStorage(str(tmp_path / 'storage.db'))
+    sheet = storage.get_worksheet('Hot_Leads_Alert')
+    sheet.append_row(['company', 'score'])
+    sheet.append_rows([['Acme', 9], ['Globex', 7]])
+    assert sheet.row_values(1) == ['company', 'score']
+    assert sheet.row_values(3) == ['Globex', '7']
+    sheet.delete_rows(2)
+    assert sheet.get_all_records() == [{'company': 'Globex', 'score': 7}]